@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Parallel Applier for Split SQL Shards
+Runs a directory of chunk files written by split_sql_file.py against Postgres
+with several concurrent connections, instead of pasting them into the Supabase
+SQL editor one by one.
+
+Each shard carries its own BEGIN/COMMIT and its rows are keyed by name with
+ON CONFLICT, so shards are independent and can be applied in any order.
+Results are recorded in a ledger file; re-running the command skips shards
+that already succeeded and only re-runs the ones that failed or never ran.
+Shards written with split_sql_file.py --compress (.sql.gz / .sql.zst) are
+decompressed in memory as they are read. With --delta-manifest, the pending
+manifest of the delta run that produced the shards is promoted once every
+shard has succeeded (see delta_manifest.py). Shards split from a copy-format
+script carry COPY ... FROM STDIN data, which is sent with COPY instead of
+being executed as SQL.
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from compressed_io import SUFFIXES, open_stream
+from delta_manifest import pending_path, promote_manifest
+from pg_retry import is_retryable
+from split_sql_file import (COPY_DATA, COPY_FROM_STDIN, STATEMENT, is_copy_from_stdin,
+                            iter_sql_items)
+
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+except ImportError:
+    psycopg2 = None
+    pg_pool = None
+
+
+DEFAULT_PATTERN = '*_part_*_of_*.sql'
+DEFAULT_LEDGER_NAME = '.applied_shards.json'
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of a shard's contents, so an edited shard is applied again"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ShardLedger:
+    """
+    Records the outcome of each shard so an interrupted or partly failed run
+    can be resumed.
+
+    The ledger is a JSON file ({"version", "updated", "shards"}) mapping shard
+    file name -> {"status", "sha256", "seconds", "finished", "attempts" | "error"}.
+    It is rewritten atomically after every shard, so a killed run loses at
+    most the shards that were in flight. A missing file means nothing has run.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.shards = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                raise ValueError(f"Unsupported ledger version in {path}: {data.get('version')}")
+            self.shards = data.get('shards', {})
+        self._lock = threading.Lock()
+
+    def succeeded(self, name: str, digest: str) -> bool:
+        """Whether this exact shard content has already been applied"""
+        entry = self.shards.get(name)
+        return bool(entry) and entry.get('status') == 'ok' and entry.get('sha256') == digest
+
+    def failed(self, name: str) -> bool:
+        entry = self.shards.get(name)
+        return bool(entry) and entry.get('status') == 'failed'
+
+    def record(self, name: str, digest: str, seconds: float, attempts: Optional[int] = None,
+               error: Optional[str] = None):
+        """Record one shard's outcome and persist the ledger"""
+        entry = {
+            'status': 'failed' if error else 'ok',
+            'sha256': digest,
+            'seconds': round(seconds, 3),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+        }
+        if attempts is not None:
+            entry['attempts'] = attempts
+        if error:
+            entry['error'] = error
+        with self._lock:
+            self.shards[name] = entry
+            self._save()
+
+    def _save(self):
+        data = {
+            'version': self.VERSION,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'shards': self.shards,
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def copy_steps(sql: str) -> Optional[List[Tuple[str, Optional[str]]]]:
+    """
+    Break a shard holding COPY ... FROM STDIN data into (statement, data)
+    steps, data being a COPY's inline rows and None for other statements.
+    Returns None for a shard without COPY data, which runs as one execute().
+    """
+    if not COPY_FROM_STDIN.search(sql):
+        return None
+    steps = []
+    for kind, text in iter_sql_items(io.StringIO(sql)):
+        if kind == STATEMENT:
+            steps.append((text, [] if is_copy_from_stdin(text) else None))
+        elif kind == COPY_DATA:
+            steps[-1][1].append(text)
+    if all(data is None for _, data in steps):
+        return None
+    return [(statement, None if data is None else ''.join(data)) for statement, data in steps]
+
+
+class ShardApplier:
+    """
+    Executes whole shard files on pooled autocommit connections.
+
+    A shard's own BEGIN/COMMIT delimit its transaction. If any statement
+    fails, the connection is discarded rather than returned to the pool, so
+    the aborted transaction is rolled back by the server and nothing from the
+    shard is kept. Transient failures are retried with exponential backoff.
+    COPY ... FROM STDIN data in a shard is sent with copy_expert() inside the
+    same transaction.
+    """
+
+    def __init__(self, dsn: str, concurrency: int = 4, retries: int = 3,
+                 retry_delay: float = 0.5):
+        if psycopg2 is None:
+            print("Error: psycopg2 is required (pip install psycopg2-binary)")
+            sys.exit(1)
+
+        self.pool = pg_pool.ThreadedConnectionPool(1, concurrency, dsn)
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def apply(self, sql: str) -> int:
+        """Run one shard's SQL, returning the number of attempts it took"""
+        attempt = 0
+        steps = copy_steps(sql)
+
+        while True:
+            conn = self.pool.getconn()
+            conn.autocommit = True
+            broken = False
+            try:
+                with conn.cursor() as cur:
+                    if steps is None:
+                        cur.execute(sql)
+                    else:
+                        for statement, data in steps:
+                            if data is None:
+                                cur.execute(statement)
+                            else:
+                                cur.copy_expert(statement, io.StringIO(data))
+            except Exception as e:
+                broken = True
+                attempt += 1
+                if attempt > self.retries or not is_retryable(e):
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1)) * (1 + random.random())
+                print(f"Warning: Shard failed ({e.__class__.__name__}: {str(e).strip()}), "
+                      f"retry {attempt}/{self.retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            finally:
+                self.pool.putconn(conn, close=broken)
+
+            return attempt + 1
+
+    def close(self):
+        self.pool.closeall()
+
+
+def find_shards(shard_dir: Path, pattern: str = DEFAULT_PATTERN) -> List[Path]:
+    """
+    Shard files in the directory, in name order (part numbers are zero-padded).
+    Compressed shards matching pattern plus .gz/.zst are included.
+    """
+    paths = set(shard_dir.glob(pattern))
+    for suffix in SUFFIXES.values():
+        paths.update(shard_dir.glob(pattern + suffix))
+    return sorted(path for path in paths if path.is_file())
+
+
+def apply_shards(shard_dir: str, dsn: str, concurrency: int = 4, retries: int = 3,
+                 ledger_path: Optional[str] = None, pattern: str = DEFAULT_PATTERN,
+                 failed_only: bool = False, force: bool = False,
+                 delta_manifest: Optional[str] = None):
+    """
+    Apply a directory of SQL shards concurrently
+
+    Args:
+        shard_dir: Directory holding the *_part_NN_of_MM.sql files
+        dsn: PostgreSQL connection string
+        concurrency: Shards applied at once, one pooled connection each (default: 4)
+        retries: Attempts per failed shard before giving up (default: 3)
+        ledger_path: Resumable ledger file (default: <shard_dir>/.applied_shards.json)
+        pattern: Glob selecting shard files within shard_dir
+        failed_only: Only re-run shards the ledger records as failed
+        force: Ignore the ledger and apply every shard again
+        delta_manifest: Manifest of the delta run that wrote the shards; its
+            .pending version replaces it once every shard has succeeded
+    """
+    shard_path = Path(shard_dir)
+    if not shard_path.is_dir():
+        print(f"Error: Shard directory not found: {shard_dir}")
+        sys.exit(1)
+
+    shards = find_shards(shard_path, pattern)
+    if not shards:
+        print(f"Error: No shard files matching {pattern} in {shard_dir}")
+        sys.exit(1)
+
+    ledger_path = ledger_path or str(shard_path / DEFAULT_LEDGER_NAME)
+    try:
+        ledger = ShardLedger(ledger_path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading ledger: {e}")
+        sys.exit(1)
+
+    todo: List[Tuple[Path, str]] = []
+    already_applied = 0
+    digests = {}
+    for path in shards:
+        digest = digests[path.name] = file_digest(path)
+        if not force and ledger.succeeded(path.name, digest):
+            already_applied += 1
+            continue
+        if failed_only and not ledger.failed(path.name):
+            continue
+        todo.append((path, digest))
+
+    print(f"Shard directory: {shard_dir}")
+    print(f"Ledger: {ledger_path}")
+    print(f"Concurrency: {concurrency} connections")
+    print(f"Shards: {len(shards)} found, {already_applied} already applied, {len(todo)} to run")
+    print("-" * 60)
+
+    if not todo:
+        print("Nothing to do")
+        if delta_manifest and all(ledger.succeeded(name, digest) for name, digest in digests.items()):
+            commit_delta_manifest(delta_manifest)
+        return
+
+    applier = ShardApplier(dsn, concurrency=concurrency, retries=retries)
+    start = time.perf_counter()
+    timings: List[Tuple[str, float]] = []
+    failed: List[str] = []
+
+    def run(path: Path, digest: str) -> Tuple[float, int]:
+        with open_stream(path, 'r') as f:
+            sql = f.read()
+        shard_start = time.perf_counter()
+        try:
+            attempts = applier.apply(sql)
+        except Exception as e:
+            seconds = time.perf_counter() - shard_start
+            ledger.record(path.name, digest, seconds,
+                          error=f"{e.__class__.__name__}: {str(e).strip()}")
+            raise
+        seconds = time.perf_counter() - shard_start
+        ledger.record(path.name, digest, seconds, attempts)
+        return seconds, attempts
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(run, path, digest): path for path, digest in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future].name
+                error = future.exception()
+                if error is not None:
+                    failed.append(name)
+                    print(f"[{done}/{len(todo)}] FAILED {name}: {str(error).strip()}")
+                    continue
+                seconds, attempts = future.result()
+                timings.append((name, seconds))
+                retried = f", {attempts - 1} retries" if attempts > 1 else ""
+                print(f"[{done}/{len(todo)}] Applied {name} in {seconds:.2f}s{retried}")
+    finally:
+        applier.close()
+
+    elapsed = time.perf_counter() - start
+
+    print("-" * 60)
+    print(f"Apply {'complete' if not failed else 'finished with errors'}!")
+    print(f"Shards applied: {len(timings)}")
+    if timings:
+        shard_seconds = sum(seconds for _, seconds in timings)
+        print(f"Shard time: {shard_seconds:.2f}s total, "
+              f"{shard_seconds / len(timings):.2f}s average")
+        print("Slowest shards:")
+        for name, seconds in sorted(timings, key=lambda item: item[1], reverse=True)[:5]:
+            print(f"  {name}: {seconds:.2f}s")
+    print(f"Elapsed: {elapsed:.2f}s")
+
+    if failed:
+        print(f"Failed shards: {len(failed)}")
+        for name in sorted(failed):
+            print(f"  {name}")
+        print("Re-run the same command to retry only the shards that have not succeeded")
+        if delta_manifest:
+            print(f"Manifest not updated: {delta_manifest}")
+        sys.exit(1)
+
+    if delta_manifest:
+        if all(ledger.succeeded(name, digest) for name, digest in digests.items()):
+            commit_delta_manifest(delta_manifest)
+        else:
+            print(f"Manifest not updated: {delta_manifest} (some shards have not been applied)")
+
+
+def commit_delta_manifest(path: str):
+    """Promote the pending manifest of the delta run whose shards are now all applied"""
+    if promote_manifest(path):
+        print(f"Manifest updated: {path}")
+    else:
+        print(f"No pending manifest to promote: {pending_path(path)}")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Apply split SQL shards to Postgres with concurrent workers",
+        epilog="Example:\n  python apply_sql_shards.py /tmp/split_sql "
+               "--dsn postgresql://localhost/caloriescience --jobs 8",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('shard_dir', help="Directory of *_part_NN_of_MM.sql files")
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'),
+                        help="PostgreSQL connection string (default: $DATABASE_URL)")
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                        help="Shards applied concurrently (default: 4)")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="Retries per shard on transient errors (default: 3)")
+    parser.add_argument('--ledger', metavar='PATH',
+                        help=f"Ledger file (default: <shard_dir>/{DEFAULT_LEDGER_NAME})")
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN,
+                        help=f"Glob selecting shard files (default: {DEFAULT_PATTERN})")
+    parser.add_argument('--failed-only', action='store_true',
+                        help="Only re-run shards the ledger records as failed")
+    parser.add_argument('--force', action='store_true',
+                        help="Ignore the ledger and apply every shard again")
+    parser.add_argument('--delta-manifest', metavar='PATH',
+                        help="Replace PATH with PATH.pending once every shard has succeeded")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("no connection string: pass --dsn or set DATABASE_URL")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.failed_only and args.force:
+        parser.error("--failed-only and --force are mutually exclusive")
+
+    apply_shards(args.shard_dir, args.dsn, concurrency=args.jobs, retries=args.retries,
+                 ledger_path=args.ledger, pattern=args.pattern,
+                 failed_only=args.failed_only, force=args.force,
+                 delta_manifest=args.delta_manifest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Batch Backfill for Cached Recipe Nutrition
+Rebuilds nutrition_details for cached_recipes rows whose macros are missing or
+all zero, ahead of time, so the read path never has to.
+
+RecipeCacheService.ensureNutritionDetails repairs such rows lazily: on every
+read it re-derives nutrition_details from original_api_response.nutrition
+and writes it back one recipe at a time, inside the user's request. This job
+does the same repair offline against a Postgres snapshot (or the live
+database): it walks cached_recipes in primary-key order with keyset
+pagination, transforms Edamam and Spoonacular payloads on a process pool
+with the same rules as NutritionMappingService, and writes each batch back
+with a single UPDATE ... FROM (VALUES ...).
+
+Rows whose payload yields no protein, carbs or fat either are left untouched
+and counted as unrecoverable; they are the rows the lazy path would rewrite
+with zeros on every read.
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from pipeline_metrics import Metrics, add_metrics_arguments, report
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values
+except ImportError:
+    psycopg2 = None
+    execute_values = None
+
+
+PROVIDERS = ('edamam', 'spoonacular')
+MACRO_KEYS = ('protein', 'carbs', 'fat')
+# Smallest UUID: keyset pagination starts after it
+FIRST_ID = '00000000-0000-0000-0000-000000000000'
+
+# Mirrors NutritionMappingService.getCompleteNutritionTemplate()
+MACRO_UNITS = {
+    'protein': 'g', 'carbs': 'g', 'fat': 'g', 'fiber': 'g', 'sugar': 'g', 'sodium': 'mg',
+    'cholesterol': 'mg', 'saturatedFat': 'g', 'transFat': 'g', 'monounsaturatedFat': 'g',
+    'polyunsaturatedFat': 'g',
+}
+VITAMIN_UNITS = {
+    'vitaminA': 'IU', 'vitaminC': 'mg', 'vitaminD': 'µg', 'vitaminE': 'mg', 'vitaminK': 'µg',
+    'thiamin': 'mg', 'riboflavin': 'mg', 'niacin': 'mg', 'vitaminB6': 'mg', 'folate': 'µg',
+    'vitaminB12': 'µg', 'biotin': 'µg', 'pantothenicAcid': 'mg',
+}
+MINERAL_UNITS = {
+    'calcium': 'mg', 'iron': 'mg', 'magnesium': 'mg', 'phosphorus': 'mg', 'potassium': 'mg',
+    'zinc': 'mg', 'copper': 'mg', 'manganese': 'mg', 'selenium': 'µg', 'iodine': 'µg',
+    'chromium': 'µg', 'molybdenum': 'µg',
+}
+
+# Mirrors NutritionMappingService.EDAMAM_NUTRIENT_MAP: code -> (category, key)
+EDAMAM_NUTRIENTS = {
+    'ENERC_KCAL': ('calories', 'calories'),
+    'PROCNT': ('macros', 'protein'), 'CHOCDF': ('macros', 'carbs'), 'FAT': ('macros', 'fat'),
+    'FIBTG': ('macros', 'fiber'), 'SUGAR': ('macros', 'sugar'), 'NA': ('macros', 'sodium'),
+    'CHOLE': ('macros', 'cholesterol'), 'FASAT': ('macros', 'saturatedFat'),
+    'FATRN': ('macros', 'transFat'), 'FAMS': ('macros', 'monounsaturatedFat'),
+    'FAPU': ('macros', 'polyunsaturatedFat'),
+    'VITA_RAE': ('vitamins', 'vitaminA'), 'VITC': ('vitamins', 'vitaminC'),
+    'VITD': ('vitamins', 'vitaminD'), 'TOCPHA': ('vitamins', 'vitaminE'),
+    'VITK1': ('vitamins', 'vitaminK'), 'THIA': ('vitamins', 'thiamin'),
+    'RIBF': ('vitamins', 'riboflavin'), 'NIA': ('vitamins', 'niacin'),
+    'VITB6A': ('vitamins', 'vitaminB6'), 'FOLDFE': ('vitamins', 'folate'),
+    'VITB12': ('vitamins', 'vitaminB12'), 'BIOT': ('vitamins', 'biotin'),
+    'PANTAC': ('vitamins', 'pantothenicAcid'),
+    'CA': ('minerals', 'calcium'), 'FE': ('minerals', 'iron'), 'MG': ('minerals', 'magnesium'),
+    'P': ('minerals', 'phosphorus'), 'K': ('minerals', 'potassium'), 'ZN': ('minerals', 'zinc'),
+    'CU': ('minerals', 'copper'), 'MN': ('minerals', 'manganese'),
+    'SE': ('minerals', 'selenium'), 'ID': ('minerals', 'iodine'),
+    'CR': ('minerals', 'chromium'), 'MO': ('minerals', 'molybdenum'),
+}
+
+# Mirrors NutritionMappingService.SPOONACULAR_NUTRIENT_MAP: name -> (category, key)
+SPOONACULAR_NUTRIENTS = {
+    'Calories': ('calories', 'calories'),
+    'Protein': ('macros', 'protein'), 'Carbohydrates': ('macros', 'carbs'),
+    'Fat': ('macros', 'fat'), 'Fiber': ('macros', 'fiber'), 'Sugar': ('macros', 'sugar'),
+    'Sodium': ('macros', 'sodium'), 'Cholesterol': ('macros', 'cholesterol'),
+    'Saturated Fat': ('macros', 'saturatedFat'), 'Trans Fat': ('macros', 'transFat'),
+    'Monounsaturated Fat': ('macros', 'monounsaturatedFat'),
+    'Polyunsaturated Fat': ('macros', 'polyunsaturatedFat'),
+    'Vitamin A': ('vitamins', 'vitaminA'), 'Vitamin C': ('vitamins', 'vitaminC'),
+    'Vitamin D': ('vitamins', 'vitaminD'), 'Vitamin E': ('vitamins', 'vitaminE'),
+    'Vitamin K': ('vitamins', 'vitaminK'), 'Thiamin': ('vitamins', 'thiamin'),
+    'Riboflavin': ('vitamins', 'riboflavin'), 'Niacin': ('vitamins', 'niacin'),
+    'Vitamin B6': ('vitamins', 'vitaminB6'), 'Folate': ('vitamins', 'folate'),
+    'Vitamin B12': ('vitamins', 'vitaminB12'), 'Biotin': ('vitamins', 'biotin'),
+    'Pantothenic Acid': ('vitamins', 'pantothenicAcid'),
+    'Calcium': ('minerals', 'calcium'), 'Iron': ('minerals', 'iron'),
+    'Magnesium': ('minerals', 'magnesium'), 'Phosphorus': ('minerals', 'phosphorus'),
+    'Potassium': ('minerals', 'potassium'), 'Zinc': ('minerals', 'zinc'),
+    'Copper': ('minerals', 'copper'), 'Manganese': ('minerals', 'manganese'),
+    'Selenium': ('minerals', 'selenium'), 'Iodine': ('minerals', 'iodine'),
+    'Chromium': ('minerals', 'chromium'), 'Molybdenum': ('minerals', 'molybdenum'),
+}
+
+
+def _sql_quantity(macro: str) -> str:
+    """nutrition_details.macros.<macro>.quantity as numeric, NULL unless it is a JSON number"""
+    path = f"'{{macros,{macro},quantity}}'"
+    return (f"CASE WHEN jsonb_typeof(nutrition_details #> {path}) = 'number' "
+            f"THEN (nutrition_details #>> {path})::numeric END")
+
+
+# A row needs repair when ensureNutritionDetails would repair it: the API
+# payload has a nutrition object but protein, carbs and fat are all missing or 0
+HAS_MACROS_SQL = 'COALESCE(' + ' OR '.join(f"{_sql_quantity(m)} > 0" for m in MACRO_KEYS) + ', FALSE)'
+
+SELECT_SQL = f"""
+SELECT id::text, provider::text, servings,
+       original_api_response ->> 'yield',
+       (original_api_response -> 'nutrition')::text
+FROM cached_recipes
+WHERE id > %s::uuid
+  AND provider::text = ANY(%s)
+  AND jsonb_typeof(original_api_response -> 'nutrition') = 'object'
+  AND NOT {HAS_MACROS_SQL}
+ORDER BY id
+LIMIT %s
+"""
+
+UPDATE_SQL = """
+UPDATE cached_recipes AS c
+SET nutrition_details = v.nutrition_details::jsonb, updated_at = NOW()
+FROM (VALUES %s) AS v(id, nutrition_details)
+WHERE c.id = v.id::uuid
+"""
+
+
+def _number(value, default: float = 0.0) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if math.isfinite(value) else default
+
+
+def _round2(value) -> float:
+    """Math.round(value * 100) / 100, keeping whole numbers integral as JSON.stringify does"""
+    rounded = math.floor(_number(value) * 100 + 0.5) / 100
+    return int(rounded) if rounded.is_integer() else rounded
+
+
+def nutrition_template() -> dict:
+    """Standardized nutrition with every nutrient at 0 (getCompleteNutritionTemplate)"""
+    return {
+        'calories': {'quantity': 0, 'unit': 'kcal'},
+        'macros': {key: {'quantity': 0, 'unit': unit} for key, unit in MACRO_UNITS.items()},
+        'micros': {
+            'vitamins': {key: {'quantity': 0, 'unit': unit} for key, unit in VITAMIN_UNITS.items()},
+            'minerals': {key: {'quantity': 0, 'unit': unit} for key, unit in MINERAL_UNITS.items()},
+        },
+    }
+
+
+def _set(nutrition: dict, category: str, key: str, quantity, unit: str):
+    if category == 'calories':
+        nutrition['calories'] = {'quantity': quantity, 'unit': unit}
+    elif category == 'macros':
+        nutrition['macros'][key] = {'quantity': quantity, 'unit': unit}
+    else:
+        nutrition['micros'][category][key] = {'quantity': quantity, 'unit': unit}
+
+
+def transform_edamam_nutrition(data: dict, servings: Optional[float] = None) -> dict:
+    """
+    Standardized per-serving nutrition from an Edamam payload, as
+    NutritionMappingService.transformEdamamNutrition builds it
+
+    Args:
+        data: Recipe nutrition ({"totalNutrients", "yield"}) or ingredient
+            nutrition ({"ingredients": [{"parsed": [{"nutrients"}]}]})
+        servings: Servings the totals are divided by (default: the payload's yield, else 1)
+    """
+    nutrition = nutrition_template()
+    if not data:
+        return nutrition
+
+    total_nutrients = None
+    recipe_servings = servings or 1
+    if data.get('totalNutrients'):
+        total_nutrients = data['totalNutrients']
+        if not servings and data.get('yield'):
+            recipe_servings = data['yield']
+    else:
+        ingredients = data.get('ingredients') or [{}]
+        parsed = (ingredients[0] or {}).get('parsed') or [{}]
+        if (parsed[0] or {}).get('nutrients'):
+            total_nutrients = parsed[0]['nutrients']
+            recipe_servings = 1
+    if not total_nutrients:
+        return nutrition
+
+    for code, (category, key) in EDAMAM_NUTRIENTS.items():
+        nutrient = total_nutrients.get(code)
+        if nutrient:
+            quantity = _round2(_number(nutrient.get('quantity')) / _number(recipe_servings, 1))
+            _set(nutrition, category, key, quantity, nutrient.get('unit') or 'g')
+    return nutrition
+
+
+def transform_spoonacular_nutrition(data: dict) -> dict:
+    """
+    Standardized nutrition from a Spoonacular payload, as
+    NutritionMappingService.transformSpoonacularNutrition builds it: payloads
+    already in standardized form are returned as they are, and a missing
+    fiber value falls back to Carbohydrates - Net Carbohydrates
+
+    Args:
+        data: Spoonacular nutrition ({"nutrients": [{"name", "amount", "unit"}]})
+    """
+    nutrition = nutrition_template()
+    if not data:
+        return nutrition
+    if data.get('macros') and data.get('calories'):
+        return data
+    if not data.get('nutrients'):
+        return nutrition
+
+    net_carbs = None
+    total_carbs = None
+    for nutrient in data['nutrients']:
+        name = nutrient.get('name')
+        mapping = SPOONACULAR_NUTRIENTS.get(name)
+        if mapping:
+            category, key = mapping
+            value = _round2(nutrient.get('amount'))
+            _set(nutrition, category, key, value, nutrient.get('unit') or 'g')
+            if key == 'carbs':
+                total_carbs = value
+        if name == 'Net Carbohydrates':
+            net_carbs = _round2(nutrient.get('amount'))
+
+    if (nutrition['macros']['fiber']['quantity'] == 0 and total_carbs is not None
+            and net_carbs is not None and total_carbs > net_carbs):
+        nutrition['macros']['fiber'] = {'quantity': _round2(total_carbs - net_carbs), 'unit': 'g'}
+    return nutrition
+
+
+def has_macros(nutrition: dict) -> bool:
+    """Whether protein, carbs or fat is above 0 (the check ensureNutritionDetails makes)"""
+    macros = (nutrition or {}).get('macros') or {}
+    if not isinstance(macros, dict):
+        return False
+    for key in MACRO_KEYS:
+        macro = macros.get(key)
+        quantity = macro.get('quantity') if isinstance(macro, dict) else None
+        if isinstance(quantity, (int, float)) and not isinstance(quantity, bool) and quantity > 0:
+            return True
+    return False
+
+
+def standardized_nutrition(provider: str, servings: Optional[int], recipe_yield: Optional[str],
+                           nutrition: dict) -> dict:
+    """nutrition_details for one recipe, derived the way ensureNutritionDetails derives it"""
+    if provider == 'spoonacular':
+        return transform_spoonacular_nutrition(nutrition)
+    return transform_edamam_nutrition(nutrition, servings or _number(recipe_yield) or 1)
+
+
+def transform_rows(rows: List[tuple]) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    Rebuild nutrition_details for a batch of selected rows
+
+    Args:
+        rows: (id, provider, servings, yield, nutrition JSON text) tuples
+
+    Returns:
+        ([(id, nutrition_details JSON text)] of the repaired rows, number of
+        rows whose payload gave no macros)
+    """
+    repaired = []
+    unrecoverable = 0
+    for recipe_id, provider, servings, recipe_yield, payload in rows:
+        try:
+            details = standardized_nutrition(provider, servings, recipe_yield, json.loads(payload))
+        except (ValueError, TypeError, AttributeError, IndexError):
+            details = None
+        if not has_macros(details):
+            unrecoverable += 1
+            continue
+        repaired.append((recipe_id, json.dumps(details, ensure_ascii=False, separators=(',', ':'))))
+    return repaired, unrecoverable
+
+
+def backfill_nutrition(dsn: str, batch_size: int = 500, workers: int = 1,
+                       providers: Tuple[str, ...] = PROVIDERS, after: str = FIRST_ID,
+                       dry_run: bool = False, metrics: Optional[Metrics] = None):
+    """
+    Repair nutrition_details for every cached recipe that needs it
+
+    Args:
+        dsn: PostgreSQL connection string
+        batch_size: Rows selected, transformed and updated together (default: 500)
+        workers: Processes transforming payloads (default: 1, 0 = all cores)
+        providers: Providers whose rows are repaired (default: edamam and spoonacular)
+        after: Only rows with a larger id, to resume an interrupted run
+            (default: from the start)
+        dry_run: Select and transform, but write nothing
+        metrics: Stage timings and counters of the run go here (see
+            pipeline_metrics.py)
+    """
+    if psycopg2 is None:
+        print("Error: psycopg2 is required (pip install psycopg2-binary)")
+        sys.exit(1)
+
+    workers = workers or os.cpu_count() or 1
+    if metrics is None:
+        metrics = Metrics('backfill_nutrition')
+
+    print(f"Providers: {', '.join(providers)}")
+    print(f"Batch size: {batch_size} rows per UPDATE")
+    print(f"Workers: {workers}")
+    if after != FIRST_ID:
+        print(f"Resuming after id: {after}")
+    if dry_run:
+        print("Dry run: nothing will be written")
+    print("-" * 60)
+
+    conn = psycopg2.connect(dsn)
+    start = time.perf_counter()
+    scanned = 0
+    repaired = 0
+    unrecoverable = 0
+    batches = 0
+    last_written = after
+
+    def write(batch_last_id: str, result: Tuple[List[Tuple[str, str]], int]):
+        nonlocal repaired, unrecoverable, batches, last_written
+        rows, failed = result
+        if rows and not dry_run:
+            with metrics.stage('write', histogram='batch_write_seconds'):
+                with conn.cursor() as cur:
+                    execute_values(cur, UPDATE_SQL, rows, page_size=len(rows))
+                conn.commit()
+        repaired += len(rows)
+        unrecoverable += failed
+        batches += 1
+        last_written = batch_last_id
+        elapsed = time.perf_counter() - start
+        print(f"Batch {batches}: {len(rows)} repaired, {failed} unrecoverable "
+              f"({scanned} scanned, {scanned / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    def pages():
+        nonlocal scanned
+        last_id = after
+        while True:
+            with metrics.stage('select'):
+                with conn.cursor() as cur:
+                    cur.execute(SELECT_SQL, (last_id, list(providers), batch_size))
+                    rows = cur.fetchall()
+                # Keep the snapshot of each page short-lived between batches
+                conn.commit()
+            if not rows:
+                return
+            scanned += len(rows)
+            last_id = rows[-1][0]
+            yield last_id, rows
+            if len(rows) < batch_size:
+                return
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = []
+                for last_id, rows in pages():
+                    in_flight.append((last_id, executor.submit(transform_rows, rows)))
+                    if len(in_flight) >= workers * 2:
+                        last_id, future = in_flight.pop(0)
+                        with metrics.stage('transform'):
+                            result = future.result()
+                        write(last_id, result)
+                while in_flight:
+                    last_id, future = in_flight.pop(0)
+                    with metrics.stage('transform'):
+                        result = future.result()
+                    write(last_id, result)
+        else:
+            for last_id, rows in pages():
+                with metrics.stage('transform'):
+                    result = transform_rows(rows)
+                write(last_id, result)
+    except psycopg2.Error as e:
+        print(f"Error: Backfill stopped: {str(e).strip()}")
+        print(f"Rows up to id {last_written} are done; resume with --after {last_written}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    metrics.count('rows_scanned', scanned)
+    metrics.count('rows_repaired', repaired)
+    metrics.count('rows_unrecoverable', unrecoverable)
+    metrics.count('batches', batches)
+
+    print("-" * 60)
+    print(f"Backfill {'checked' if dry_run else 'complete'}!")
+    print(f"Rows needing repair: {scanned}")
+    print(f"Rows {'repairable' if dry_run else 'repaired'}: {repaired}")
+    print(f"Rows unrecoverable (no macros in the API payload): {unrecoverable}")
+    print(f"Elapsed: {elapsed:.2f}s ({scanned / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Rebuild empty or zeroed nutrition_details in cached_recipes in bulk",
+        epilog="Example:\n  python3 backfill_recipe_nutrition.py "
+               "--dsn postgresql://localhost/caloriescience --workers 4",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'),
+                        help="PostgreSQL connection string (default: $DATABASE_URL)")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="Rows per SELECT page and UPDATE (default: 500)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Transform payloads on N processes (default: 1, 0 = all cores)")
+    parser.add_argument('--provider', action='append', choices=PROVIDERS,
+                        help="Only repair this provider's rows (repeatable; default: all)")
+    parser.add_argument('--after', default=FIRST_ID, metavar='ID',
+                        help="Only rows with a larger id, to resume an interrupted run")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report what would be repaired without writing")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("no connection string: pass --dsn or set DATABASE_URL")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    metrics = Metrics.from_args('backfill_nutrition', args)
+    backfill_nutrition(args.dsn, batch_size=args.batch_size, workers=args.workers,
+                       providers=tuple(args.provider or PROVIDERS), after=args.after,
+                       dry_run=args.dry_run, metrics=metrics)
+    report(metrics, args.metrics)
+
+
+if __name__ == '__main__':
+    main()
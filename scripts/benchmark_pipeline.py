@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for the Python Data Pipeline
+Measures csv_to_ingredients_sql.py, split_sql_file.py and the USDA fetcher's
+portion parsing on synthetic data, so changes to them can be checked for
+speed and memory regressions.
+
+A deterministic simple_ingredients CSV (10k to 10M rows, with realistic names,
+quotes, unicode, arrays, nulls, bad values and duplicate names) and mock USDA
+search payloads are generated once per size and seed. Each stage then runs in
+a fresh process and reports wall time, rows/sec, MB/sec and peak RSS.
+
+Results are written as JSON. With --baseline, each stage is compared against
+a stored result and the command exits non-zero when a stage is slower or uses
+more memory than the tolerance allows.
+
+Usage:
+    python3 benchmark_pipeline.py --rows 100k
+    python3 benchmark_pipeline.py --rows 1M --baseline bench_baseline.json
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+FETCHER_PATH = SCRIPTS_DIR / 'fetch-usda-food-categories.py'
+
+RESULTS_VERSION = 1
+STAGES = ['generate_csv', 'convert_sql', 'convert_copy', 'convert_copy_binary',
+          'split_sql', 'nutrient_matrix', 'search_index', 'usda_household_serving', 'usda_portion_info']
+
+# Stages that read the generated CSV, and the output format they convert to
+CONVERT_FORMATS = {'convert_sql': 'sql', 'convert_copy': 'copy',
+                   'convert_copy_binary': 'copy-binary'}
+
+FOODS = [
+    'apple', 'banana', 'orange', 'strawberry', 'blueberry', 'mango', 'pineapple',
+    'broccoli', 'carrot', 'spinach', 'kale', 'tomato', 'potato', 'sweet potato',
+    'onion', 'garlic', 'bell pepper', 'jalapeño pepper', 'mushroom', 'zucchini',
+    'chicken breast', 'chicken thigh', 'ground beef', 'beef sirloin', 'pork loin',
+    'salmon', 'tuna', 'cod', 'shrimp', 'egg', 'tofu', 'tempeh', 'black beans',
+    'chickpeas', 'lentils', 'brown rice', 'quinoa', 'rolled oats', 'whole wheat bread',
+    'pasta', 'cheddar cheese', 'greek yogurt', 'whole milk', 'butter', 'olive oil',
+    'almonds', 'walnuts', 'peanut butter', 'chia seeds', 'dark chocolate',
+    'crème fraîche', 'açaí', 'jicama', 'bok choy', 'edamame',
+]
+STYLES = ['', 'raw', 'cooked', 'boiled', 'roasted', 'grilled', 'steamed', 'frozen',
+          'canned, drained', 'dried', 'fresh', 'organic', 'low sodium', 'unsweetened']
+BRANDS = ['', '', '', "Trader Joe's", 'Kirkland', 'Great Value', 'Bob\'s Red Mill',
+          'The "Original"', 'Ben & Jerry\'s', 'Nature\'s Path']
+CATEGORIES = ['fruit', 'vegetable', 'protein', 'grain', 'dairy', 'fat', 'legume',
+              'nut_seed', 'beverage', 'snack', 'condiment']
+UNITS = ['g', 'g', 'g', 'ml', 'cup', 'tbsp', 'piece', 'slice', 'oz']
+HEALTH_LABELS = ['vegan', 'vegetarian', 'gluten-free', 'dairy-free', 'keto-friendly',
+                 'paleo', 'low-sodium', 'high-protein', 'sugar-conscious']
+DIET_LABELS = ['balanced', 'high-fiber', 'high-protein', 'low-carb', 'low-fat']
+ALLERGENS = ['milk', 'eggs', 'fish', 'shellfish', 'tree nuts', 'peanuts', 'wheat',
+             'soy', 'sesame']
+
+CSV_HEADER = [
+    'fdc_id', 'name', 'display_name', 'category', 'serving_quantity', 'serving_unit',
+    'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'sugar_g',
+    'saturated_fat_g', 'trans_fat_g', 'cholesterol_mg',
+    'vitamin_a_mcg', 'vitamin_d_mcg', 'vitamin_e_mg', 'vitamin_k_mcg',
+    'vitamin_c_mg', 'thiamin_mg', 'riboflavin_mg', 'niacin_mg',
+    'vitamin_b6_mg', 'vitamin_b12_mcg', 'folate_mcg', 'biotin_mcg',
+    'pantothenic_acid_mg', 'choline_mg',
+    'calcium_mg', 'phosphorus_mg', 'magnesium_mg', 'sodium_mg',
+    'potassium_mg', 'chloride_mg', 'iron_mg', 'zinc_mg', 'copper_mg',
+    'selenium_mcg', 'iodine_mcg', 'manganese_mg', 'molybdenum_mcg', 'chromium_mcg',
+    'health_labels', 'diet_labels', 'allergens', 'image_url', 'is_active',
+    'created_at', 'updated_at',
+]
+NUTRIENT_COLUMNS = CSV_HEADER[6:43]
+
+# Pre-built nutrient/label tails are reused across rows; this many keeps value
+# diversity above the encoders' memo cache size, as in real exports
+TAIL_POOL_SIZE = 8192
+
+HOUSEHOLD_SERVINGS = [
+    '1 cup', '2 tbsp', '1 tbsp', '1/2 cup', '3 oz', '1 ONZ', '1 medium', '1 large',
+    '1 slice', '2 slices', '1 piece', '1 container (170g)', '1 can', '1 bottle',
+    '8 fl oz', '1 fillet', '1 breast, bone removed', '1 scoop', '1 bowl',
+    '1 package (10 oz)', '4 pieces', '1 serving', '0.5 lb', '100 grams', '1 glass',
+]
+PORTION_MODIFIERS = ['cup', 'tbsp', 'tsp', 'slice', 'medium', 'large', 'small',
+                     'oz', 'fl oz', 'piece', 'NLEA serving', 'wing', 'drumstick']
+USDA_CATEGORIES = ['Dairy and Egg Products', 'Poultry Products', 'Vegetables and Vegetable Products',
+                   'Fruits and Fruit Juices', 'Beef Products', 'Baked Products',
+                   'Snacks', 'Beverages', 'Legumes and Legume Products',
+                   'Finfish and Shellfish Products', 'Cereal Grains and Pasta']
+
+
+def parse_count(value: str) -> int:
+    """Parse a row count such as 10000, 100k, 2.5M or 10M"""
+    units = {'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+    value = value.strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _number(rng: random.Random, high: float) -> str:
+    """A nutrient field: mostly 2-decimal numbers, sometimes blank or junk"""
+    roll = rng.random()
+    if roll < 0.12:
+        return ''
+    if roll < 0.125:
+        return rng.choice(['null', 'N/A', '-'])
+    if roll < 0.2:
+        return str(rng.randint(0, int(high)))
+    return f"{rng.uniform(0, high):.2f}"
+
+
+def _labels(rng: random.Random, choices: List[str]) -> str:
+    if rng.random() < 0.3:
+        return ''
+    return ','.join(rng.sample(choices, rng.randint(1, 3)))
+
+
+def _tail_pool(rng: random.Random) -> List[List[str]]:
+    """Pre-built nutrient, label, image and flag columns for generated rows"""
+    pool = []
+    for _ in range(TAIL_POOL_SIZE):
+        tail = [_number(rng, 900 if column == 'calories' else 120)
+                for column in NUTRIENT_COLUMNS]
+        tail.append(_labels(rng, HEALTH_LABELS))
+        tail.append(_labels(rng, DIET_LABELS))
+        tail.append(_labels(rng, ALLERGENS))
+        tail.append('' if rng.random() < 0.5
+                    else f"https://images.example.com/{rng.getrandbits(48):012x}.jpg")
+        tail.append(rng.choice(['true', 'true', 'true', '1', 'false', '0', '']))
+        tail.append('')
+        tail.append('')
+        pool.append(tail)
+    return pool
+
+
+def generate_csv(path: str, rows: int, seed: int = 42) -> int:
+    """
+    Write a synthetic simple_ingredients CSV
+
+    Args:
+        path: Output CSV path
+        rows: Number of data rows
+        seed: Random seed; the same rows and seed always give the same file
+
+    About 1% of rows repeat an earlier name with different case or padding, and
+    0.5% lack a category (skipped by the converter). Returns the file size.
+    """
+    rng = random.Random(seed)
+    tails = _tail_pool(rng)
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        recent = []
+        for i in range(rows):
+            roll = rng.random()
+            if recent and roll < 0.01:
+                name = rng.choice(recent)
+                name = f"  {name.upper()} " if roll < 0.005 else name.title()
+            else:
+                style = rng.choice(STYLES)
+                brand = rng.choice(BRANDS)
+                name = rng.choice(FOODS) + (f", {style}" if style else '')
+                name = (f"{brand} {name}" if brand else name) + f" #{i}"
+                if len(recent) < 1000:
+                    recent.append(name)
+                else:
+                    recent[i % 1000] = name
+
+            category = '' if roll > 0.995 else rng.choice(CATEGORIES)
+            display = name.title() if rng.random() < 0.7 else ''
+            writer.writerow([str(100000 + i), name, display, category,
+                             rng.choice(['1', '100', '0.5', '2', '']), rng.choice(UNITS)]
+                            + tails[rng.randrange(TAIL_POOL_SIZE)])
+
+    return os.path.getsize(path)
+
+
+def generate_usda_foods(count: int, seed: int = 42, first_id: int = 2_000_000) -> List[dict]:
+    """
+    Mock food entries shaped like a FoodData Central /foods/search response,
+    with the fields extract_portion_info() reads. fdcIds run from first_id.
+    """
+    rng = random.Random(seed)
+    foods = []
+    for i in range(count):
+        food = {
+            'fdcId': first_id + i,
+            'description': f"{rng.choice(FOODS).upper()}, {rng.choice(STYLES) or 'RAW'}",
+            'dataType': rng.choice(['Foundation', 'SR Legacy', 'Survey (FNDDS)', 'Branded']),
+            'foodCategory': rng.choice(USDA_CATEGORIES),
+            'servingSize': round(rng.uniform(5, 400), 1),
+            'servingSizeUnit': rng.choice(['g', 'g', 'ml', 'GRM', 'MLT']),
+        }
+        if rng.random() < 0.8:
+            food['householdServingFullText'] = rng.choice(HOUSEHOLD_SERVINGS)
+        if rng.random() < 0.4:
+            food['foodPortions'] = [
+                {
+                    'portionDescription': rng.choice(HOUSEHOLD_SERVINGS),
+                    'modifier': rng.choice(PORTION_MODIFIERS),
+                    'gramWeight': round(rng.uniform(1, 300), 1),
+                    'measureUnit': {'name': rng.choice(['cup', 'tablespoon', 'undetermined'])},
+                }
+                for _ in range(rng.randint(1, 4))
+            ]
+        foods.append(food)
+    return foods
+
+
+def usda_search_pages(foods: List[dict], page_size: int = 50) -> List[dict]:
+    """Group mock foods into /foods/search response pages"""
+    total_pages = max(1, -(-len(foods) // page_size))
+    return [
+        {
+            'totalHits': len(foods),
+            'currentPage': page + 1,
+            'totalPages': total_pages,
+            'foods': foods[page * page_size:(page + 1) * page_size],
+        }
+        for page in range(total_pages)
+    ]
+
+
+def load_fetcher_class():
+    """USDAFoodDataFetcher from fetch-usda-food-categories.py (needs requests)"""
+    spec = importlib.util.spec_from_file_location('fetch_usda_food_categories', FETCHER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.USDAFoodDataFetcher
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process and its finished children, in MB"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+@contextlib.contextmanager
+def silenced():
+    """Discard the progress output of the script being measured"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_stage(stage: str, context: dict) -> dict:
+    """
+    Run one benchmark stage in the current process
+
+    Setup work (loading modules, building payloads) is excluded from the
+    timing. Returns {"seconds", "rows", "bytes"} plus extra stage details.
+    """
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    work_dir = Path(context['work_dir'])
+    csv_path = context['csv_path']
+    if stage == 'generate_csv':
+        path = str(work_dir / 'generate_check.csv')
+        start = time.perf_counter()
+        size = generate_csv(path, context['rows'], context['seed'])
+        seconds = time.perf_counter() - start
+        os.remove(path)
+        return {'seconds': seconds, 'rows': context['rows'], 'bytes': size}
+
+    if stage in CONVERT_FORMATS:
+        from csv_to_ingredients_sql import convert_csv_to_sql
+
+        output_format = CONVERT_FORMATS[stage]
+        output = str(work_dir / f"{stage}.out")
+        start = time.perf_counter()
+        with silenced():
+            convert_csv_to_sql(csv_path, output, context['batch_size'], output_format,
+                               workers=context['workers'])
+        seconds = time.perf_counter() - start
+        return {'seconds': seconds, 'rows': context['rows'],
+                'bytes': os.path.getsize(csv_path), 'output_bytes': os.path.getsize(output)}
+
+    if stage == 'split_sql':
+        from csv_to_ingredients_sql import convert_csv_to_sql
+        from split_sql_file import split_sql_file
+
+        sql_path = work_dir / 'split_input.sql'
+        if not sql_path.exists():
+            with silenced():
+                convert_csv_to_sql(csv_path, str(sql_path), context['batch_size'], 'sql',
+                                   workers=context['workers'])
+        out_dir = work_dir / 'split_sql'
+        start = time.perf_counter()
+        with silenced():
+            split_sql_file(str(sql_path), str(out_dir), rows_per_file=500)
+        seconds = time.perf_counter() - start
+        shards = list(out_dir.glob('*.sql'))
+        for shard in shards:
+            shard.unlink()
+        return {'seconds': seconds, 'rows': context['rows'],
+                'bytes': sql_path.stat().st_size, 'files': len(shards)}
+
+    if stage == 'nutrient_matrix':
+        from label_masks import allowed
+        from nutrient_matrix import NutrientMatrix, write_nutrient_matrix
+
+        output = str(work_dir / 'simple_ingredients.nmx')
+        start = time.perf_counter()
+        write_nutrient_matrix(csv_path, output)
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        matrix = NutrientMatrix(output)
+        open_seconds = time.perf_counter() - start
+        # One client's allergies and diet, filtered over every row's label mask
+        restrictions = ['peanuts', 'tree nuts', 'dairy-free', 'vegetarian']
+        start = time.perf_counter()
+        for _ in range(100):
+            allowed(matrix.label_mask, restrictions)
+        filter_seconds = (time.perf_counter() - start) / 100
+        matrix.close()
+        return {'seconds': seconds, 'rows': context['rows'], 'bytes': os.path.getsize(csv_path),
+                'output_bytes': os.path.getsize(output), 'open_seconds': open_seconds,
+                'filter_us': filter_seconds * 1e6}
+
+    if stage == 'search_index':
+        from ingredient_search import SearchIndex, write_search_index
+
+        output = str(work_dir / 'ingredient_search.json')
+        start = time.perf_counter()
+        artifact = write_search_index(csv_path, output)
+        seconds = time.perf_counter() - start
+        index = SearchIndex(artifact)
+        # Every 2-8 character prefix of a sample of names, as typed
+        queries = [name.lower()[:length] for name in index.names[::max(1, len(index.names) // 200)]
+                   for length in range(2, 9)]
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query)
+        query_seconds = time.perf_counter() - start
+        return {'seconds': seconds, 'rows': context['rows'], 'bytes': os.path.getsize(csv_path),
+                'output_bytes': os.path.getsize(output),
+                'query_us': query_seconds / max(len(queries), 1) * 1e6}
+
+    if stage in ('usda_household_serving', 'usda_portion_info'):
+        try:
+            fetcher = load_fetcher_class()()
+        except ImportError as e:
+            return {'skipped': f"cannot load fetcher ({e})"}
+        foods = generate_usda_foods(context['usda_foods'], context['seed'])
+        payload_bytes = len(json.dumps(usda_search_pages(foods)).encode('utf-8'))
+
+        if stage == 'usda_household_serving':
+            texts = [food.get('householdServingFullText', '') for food in foods]
+            start = time.perf_counter()
+            for text in texts:
+                fetcher._parse_household_serving(text)
+        else:
+            start = time.perf_counter()
+            for food in foods:
+                fetcher.extract_portion_info(food)
+        seconds = time.perf_counter() - start
+        return {'seconds': seconds, 'rows': len(foods), 'bytes': payload_bytes}
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def _stage_worker(stage: str, context: dict) -> dict:
+    """Pool entry point: run a stage and attach this process's peak RSS"""
+    try:
+        result = run_stage(stage, context)
+    except SystemExit as e:
+        # The pipeline scripts exit on bad input instead of raising
+        raise RuntimeError(f"{stage} exited with status {e.code}") from None
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def measure_stage(stage: str, context: dict, repeat: int = 1) -> dict:
+    """
+    Run a stage `repeat` times, each in a fresh process so peak RSS is the
+    stage's own. Keeps the fastest run's time and the highest peak RSS.
+    """
+    spawn = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        with spawn.Pool(1) as pool:
+            runs.append(pool.apply(_stage_worker, (stage, context)))
+        if 'skipped' in runs[-1]:
+            return {'skipped': runs[-1]['skipped']}
+
+    best = min(runs, key=lambda run: run['seconds'])
+    result = dict(best)
+    peaks = [run['peak_rss_mb'] for run in runs if run.get('peak_rss_mb') is not None]
+    result['peak_rss_mb'] = max(peaks) if peaks else None
+    result['seconds'] = round(best['seconds'], 4)
+    result['rows_per_sec'] = round(best['rows'] / best['seconds'], 1) if best['seconds'] else None
+    result['mb_per_sec'] = (round(best['bytes'] / (1024 * 1024) / best['seconds'], 2)
+                            if best['seconds'] else None)
+    result['runs'] = repeat
+    return result
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Regressions of results against baseline: a stage is flagged when its
+    rows/sec drops, or its peak RSS grows, by more than `tolerance` (a
+    fraction). RSS growth under 5 MB is ignored as noise.
+    """
+    regressions = []
+    for stage, current in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or 'skipped' in current or 'skipped' in previous:
+            continue
+
+        if current.get('rows_per_sec') and previous.get('rows_per_sec'):
+            ratio = current['rows_per_sec'] / previous['rows_per_sec']
+            if ratio < 1 - tolerance:
+                regressions.append(f"{stage}: {current['rows_per_sec']:,.0f} rows/s vs "
+                                   f"{previous['rows_per_sec']:,.0f} baseline "
+                                   f"({(1 - ratio) * 100:.0f}% slower)")
+
+        if current.get('peak_rss_mb') and previous.get('peak_rss_mb'):
+            growth = current['peak_rss_mb'] - previous['peak_rss_mb']
+            if growth > 5 and growth > previous['peak_rss_mb'] * tolerance:
+                regressions.append(f"{stage}: peak RSS {current['peak_rss_mb']:.1f} MB vs "
+                                   f"{previous['peak_rss_mb']:.1f} MB baseline")
+    return regressions
+
+
+def run_benchmarks(rows: int = 100_000, seed: int = 42, stages: Optional[List[str]] = None,
+                   repeat: int = 1, workers: int = 1, batch_size: int = 1000,
+                   usda_foods: Optional[int] = None, work_dir: Optional[str] = None) -> dict:
+    """
+    Generate the synthetic inputs and run the benchmark stages
+
+    Args:
+        rows: Rows in the synthetic CSV (default: 100k)
+        seed: Random seed for the generated data
+        stages: Stage names to run (default: all, see STAGES)
+        repeat: Runs per stage; the fastest is kept
+        workers: --workers passed to the converter stages
+        batch_size: Rows per INSERT / batch in the converter stages
+        usda_foods: Mock USDA foods for the parser stages (default: min(rows, 100k))
+        work_dir: Directory for generated files; reused across runs so large
+            CSVs are only generated once (default: a temporary directory)
+    """
+    stages = stages or STAGES
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix='pipeline_bench_')
+        work_dir = temp_dir.name
+    Path(work_dir).mkdir(parents=True, exist_ok=True)
+
+    try:
+        csv_path = Path(work_dir) / f"ingredients_{rows}_{seed}.csv"
+        if not csv_path.exists() and any(stage != 'generate_csv' for stage in stages):
+            print(f"Generating {rows:,} row CSV: {csv_path}")
+            generate_csv(str(csv_path), rows, seed)
+        stale_sql = Path(work_dir) / 'split_input.sql'
+        if stale_sql.exists():
+            stale_sql.unlink()
+
+        context = {
+            'rows': rows, 'seed': seed, 'workers': workers, 'batch_size': batch_size,
+            'usda_foods': usda_foods or min(rows, 100_000),
+            'csv_path': str(csv_path), 'work_dir': str(work_dir),
+        }
+
+        results = {
+            'version': RESULTS_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'rows': rows,
+            'seed': seed,
+            'workers': workers,
+            'batch_size': batch_size,
+            'stages': {},
+        }
+
+        print("-" * 60)
+        for stage in stages:
+            result = measure_stage(stage, context, repeat)
+            results['stages'][stage] = result
+            if 'skipped' in result:
+                print(f"{stage:<24} skipped: {result['skipped']}")
+                continue
+            rss = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else "n/a"
+            print(f"{stage:<24} {result['seconds']:>8.2f}s {result['rows_per_sec']:>12,.0f} rows/s "
+                  f"{result['mb_per_sec']:>8.2f} MB/s  peak RSS {rss}")
+        return results
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ingredient CSV/SQL pipeline on synthetic data",
+        epilog="Example:\n  python benchmark_pipeline.py --rows 100k --output bench.json\n"
+               "  python benchmark_pipeline.py --rows 1M --baseline bench_baseline.json\n"
+               "  python benchmark_pipeline.py --rows 1M --baseline bench_baseline.json "
+               "--update-baseline",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--rows', type=parse_count, default=100_000,
+                        help="Rows in the synthetic CSV, e.g. 10k, 1M, 10M (default: 100k)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, metavar='STAGE',
+                        help=f"Stages to run (default: all of {', '.join(STAGES)})")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Runs per stage, fastest kept (default: 1)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Converter --workers (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Converter batch size (default: 1000)")
+    parser.add_argument('--usda-foods', type=parse_count,
+                        help="Mock USDA foods to parse (default: min(rows, 100k))")
+    parser.add_argument('--work-dir', metavar='DIR',
+                        help="Keep generated inputs here and reuse them across runs")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="Results JSON file (default: benchmark_results.json)")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help="Compare against this results file and exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed slowdown / RSS growth as a fraction (default: 0.15)")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Write these results to --baseline after comparing")
+    args = parser.parse_args()
+
+    if args.rows < 1:
+        parser.error("--rows must be at least 1")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline requires --baseline")
+
+    baseline = None
+    if args.baseline and Path(args.baseline).exists():
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            print(f"Error: Unsupported baseline version in {args.baseline}: "
+                  f"{baseline.get('version')}")
+            sys.exit(1)
+
+    print(f"Rows: {args.rows:,} (seed {args.seed})")
+    print(f"Stages: {', '.join(args.stages or STAGES)}")
+    if args.baseline:
+        print(f"Baseline: {args.baseline}" + ("" if baseline else " (not found, nothing to compare)"))
+
+    results = run_benchmarks(args.rows, args.seed, args.stages, args.repeat, args.workers,
+                             args.batch_size, args.usda_foods, args.work_dir)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    print("-" * 60)
+    print(f"Results: {args.output}")
+
+    regressions = []
+    if baseline:
+        if baseline.get('rows') != results['rows']:
+            print(f"Note: baseline was recorded with {baseline.get('rows'):,} rows; "
+                  f"comparing rates only")
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print(f"No regressions against baseline (tolerance {args.tolerance:.0%})")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
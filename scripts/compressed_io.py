@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Compressed File Streams for the Ingredient Pipeline
+Opens CSV input, SQL/COPY output and split chunks as plain, gzip or zstd
+streams, so large exports can be read and written without ever being
+decompressed to disk.
+
+Compression is chosen from the file name (.gz, .zst) when writing and from
+the file's magic bytes when reading, so renamed files still open correctly.
+gzip support is built in; zstd needs Python 3.14+ or the zstandard package
+(pip install zstandard).
+"""
+
+import gzip
+import io
+from pathlib import Path
+from typing import Optional
+
+try:
+    from compression import zstd as stdlib_zstd  # Python 3.14+
+except ImportError:
+    stdlib_zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIONS = ('gzip', 'zstd')
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+SUFFIX_COMPRESSION = {'.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+MAGIC = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+# Defaults trade a little ratio for speed; these files are rewritten often
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+# Shell commands that decompress to stdout, for psql \copy ... FROM PROGRAM
+DECOMPRESS_COMMANDS = {'gzip': 'gzip -dc', 'zstd': 'zstd -dc'}
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def compression_for_name(path) -> Optional[str]:
+    """Compression implied by a file name's suffix (None for plain files)"""
+    return SUFFIX_COMPRESSION.get(Path(path).suffix.lower())
+
+
+def detect_compression(path) -> Optional[str]:
+    """Compression of an existing file, from its magic bytes"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for magic, compression in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_compression_suffix(path) -> str:
+    """File name without a trailing .gz/.zst"""
+    path = str(path)
+    if compression_for_name(path):
+        return path[:path.rfind('.')]
+    return path
+
+
+def check_compression(compression: Optional[str]):
+    """Raise ValueError if a compression is unknown or its library is missing"""
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd' and stdlib_zstd is None and zstandard is None:
+        raise ValueError("zstd compression requires zstandard (pip install zstandard)")
+
+
+def _open_zstd(path, binary_mode: str, level: int):
+    if stdlib_zstd is not None:
+        if binary_mode == 'rb':
+            return stdlib_zstd.open(path, 'rb')
+        return stdlib_zstd.open(path, binary_mode, level=level)
+
+    raw = open(path, binary_mode)
+    try:
+        if binary_mode == 'rb':
+            # A file may hold several frames (e.g. concatenated zstd output)
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=True)
+            return io.BufferedReader(reader, BUFFER_SIZE)
+        return zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+    except Exception:
+        raw.close()
+        raise
+
+
+def open_stream(path, mode: str = 'r', compression: Optional[str] = 'auto',
+                level: Optional[int] = None, encoding: str = 'utf-8',
+                newline: Optional[str] = None):
+    """
+    Open a possibly compressed file like the built-in open()
+
+    Args:
+        path: File to open
+        mode: 'r', 'w', 'a', 'rb', 'wb' or 'ab'. Appending to a compressed
+            file adds a gzip member or zstd frame, which readers (this
+            module, gzip -dc, zstd -dc) decompress as one stream
+        compression: 'gzip', 'zstd', None for a plain file, or 'auto' to use the
+            magic bytes (reading) or the file name suffix (writing)
+        level: Compression level (default: 6 for gzip, 3 for zstd)
+        encoding: Text encoding in text modes
+        newline: Newline handling in text modes, as for open()
+    """
+    if mode not in ('r', 'w', 'a', 'rb', 'wb', 'ab'):
+        raise ValueError(f"Unsupported mode: {mode}")
+    binary_mode = mode[0] + 'b'
+
+    if compression == 'auto':
+        if binary_mode == 'rb':
+            compression = detect_compression(path)
+        else:
+            compression = compression_for_name(path)
+    check_compression(compression)
+
+    if compression is None:
+        if mode in ('rb', 'wb', 'ab'):
+            return open(path, mode)
+        return open(path, mode, encoding=encoding, newline=newline)
+
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == 'gzip':
+        stream = gzip.open(path, binary_mode, compresslevel=level)
+    else:
+        stream = _open_zstd(path, binary_mode, level)
+
+    if mode in ('rb', 'wb', 'ab'):
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, newline=newline,
+                            write_through=False)
@@ -5,11 +5,59 @@ Converts a CSV file with nutritional data into SQL INSERT statements
 for the simple_ingredients table.
 """
 
+import argparse
 import csv
+import hashlib
+import io
+import json
+import math
+import os
+import sqlite3
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from typing import Optional, List
 from pathlib import Path
 
+from compressed_io import (
+    DECOMPRESS_COMMANDS,
+    check_compression,
+    compression_for_name,
+    detect_compression,
+    open_stream,
+)
+from delta_manifest import DeltaManifest, pending_path, promote_manifest
+from ingredient_search import write_search_index
+from nutrient_matrix import write_nutrient_matrix
+from pipeline_metrics import Metrics, add_metrics_arguments, report
+from seed_schema import (
+    FORMAT_METHODS,
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    SEED_TABLES,
+    get_table_encoder,
+)
+
+
+# Compiled from the simple_ingredients DDL in migration 067 (see seed_schema.py)
+SIMPLE_INGREDIENTS = get_table_encoder('simple_ingredients')
+
+# Column order shared by every output format
+SIMPLE_INGREDIENT_COLUMNS = SIMPLE_INGREDIENTS.columns
+
+# Column kinds used by the COPY encoders
+TEXT_COLUMNS = {c for c, kind in SIMPLE_INGREDIENTS.kinds.items() if kind == 'text'}
+ARRAY_COLUMNS = {c for c, kind in SIMPLE_INGREDIENTS.kinds.items() if kind == 'text_array'}
+BOOLEAN_COLUMNS = {c for c, kind in SIMPLE_INGREDIENTS.kinds.items() if kind == 'boolean'}
+
+# Column list as written in batch INSERT statements
+INSERT_COLUMN_LIST = ', '.join(SIMPLE_INGREDIENT_COLUMNS)
+
+STAGING_TABLE = 'simple_ingredients_staging'
+ON_CONFLICT_NOTHING = "ON CONFLICT (name) DO NOTHING"
+OUTPUT_FORMATS = ('sql', 'copy', 'copy-binary')
+
 
 def escape_sql_string(value: Optional[str], max_length: Optional[int] = None) -> str:
     """Escape single quotes in SQL strings and optionally truncate"""
@@ -24,154 +72,582 @@ def escape_sql_string(value: Optional[str], max_length: Optional[int] = None) ->
     return f"'{escaped}'"
 
 
-def format_decimal(value: Optional[str], not_null: bool = False, default: str = '0') -> str:
-    """Format decimal values for SQL"""
-    if value is None or value == '' or value.lower() == 'null':
-        if not_null:
-            return default
-        return 'NULL'
-    try:
-        float(value)  # Validate it's a number
-        return str(value)
-    except ValueError:
-        if not_null:
-            return default
-        return 'NULL'
+def conflict_clause(upsert: bool = False, table: str = 'simple_ingredients') -> str:
+    """ON CONFLICT clause for merges: skip existing keys, or update them in place"""
+    encoder = get_table_encoder(table)
+    if not upsert:
+        return f"ON CONFLICT ({encoder.key}) DO NOTHING"
+    assignments = ',\n    '.join(f"{column} = EXCLUDED.{column}"
+                                  for column in encoder.columns if column != encoder.key)
+    return f"ON CONFLICT ({encoder.key}) DO UPDATE SET\n    {assignments}"
 
 
-def format_boolean(value: Optional[str]) -> str:
-    """Format boolean values for SQL"""
-    if value is None or value == '':
-        return 'TRUE'
-    if isinstance(value, bool):
-        return 'TRUE' if value else 'FALSE'
-    value_lower = str(value).lower()
-    if value_lower in ('true', '1', 'yes', 't'):
-        return 'TRUE'
-    elif value_lower in ('false', '0', 'no', 'f'):
-        return 'FALSE'
-    return 'TRUE'  # Default to true
+def staging_table(table: str = 'simple_ingredients') -> str:
+    return f"{table}_staging"
+
+
+def staging_sql(columns: str, conflict: str = ON_CONFLICT_NOTHING,
+                table: str = 'simple_ingredients') -> tuple:
+    """Return the (prepare, merge) SQL wrapped around a COPY into the staging table"""
+    prepare = (f"CREATE TEMP TABLE {staging_table(table)}\n"
+               f"  (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;\n")
+    merge = (f"INSERT INTO {table} ({columns})\n"
+             f"SELECT {columns}\nFROM {staging_table(table)}\n"
+             f"{conflict};\n")
+    return prepare, merge
+
+
+def deactivate_sql(names: List[str], chunk_size: int = 1000,
+                   table: str = 'simple_ingredients') -> str:
+    """UPDATE statements marking the rows with the given keys inactive"""
+    key = get_table_encoder(table).key
+    statements = []
+    for i in range(0, len(names), chunk_size):
+        quoted = ', '.join(escape_sql_string(name) for name in names[i:i + chunk_size])
+        statements.append(f"UPDATE {table} SET is_active = FALSE\n"
+                          f"WHERE is_active AND {key} IN ({quoted});\n")
+    return '\n'.join(statements)
+
+
+def row_hash(values: list) -> str:
+    """Stable content hash of a row's typed values (see BoundEncoder.values in seed_schema.py)"""
+    payload = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def normalize_name(name: str) -> str:
+    """
+    Match key for an ingredient name.
+
+    SimpleIngredientService trims and lower-cases search terms and matches
+    names with ILIKE, so names differing only in case or surrounding
+    whitespace are the same ingredient to the app.
+    """
+    return name.strip().lower()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_bits = max(64, num_bits)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class NameDeduper:
+    """
+    Drops rows whose normalised name was already seen earlier in the input
+    (the first occurrence wins, as ON CONFLICT (name) DO NOTHING would) and
+    writes each dropped row to a CSV conflict report.
+
+    Seen names are held in a dict until max_memory_names is reached. After
+    that they move to an on-disk SQLite index fronted by a Bloom filter, so
+    most new names are accepted without a disk lookup and memory stays flat
+    however large the input is. The Bloom filter only skips lookups; every
+    reported duplicate is confirmed against the exact index.
+    """
+
+    REPORT_COLUMNS = ['row', 'name', 'normalized_name', 'first_row']
+
+    def __init__(self, report_path: str, max_memory_names: int = 2_000_000,
+                 bloom_capacity: Optional[int] = None):
+        self.report_path = report_path
+        self.max_memory_names = max_memory_names
+        self.bloom_capacity = bloom_capacity or max_memory_names * 10
+
+        self.seen = {}  # normalised name -> first row number
+        self.bloom = None
+        self.spill = None
+        self.spill_path = None
+
+        self.report_file = open(report_path, 'w', encoding='utf-8', newline='')
+        self.report = csv.writer(self.report_file)
+        self.report.writerow(self.REPORT_COLUMNS)
+
+        self.unique_rows = 0
+        self.duplicate_rows = 0
+
+    def _spill(self):
+        """Move the in-memory names to a temporary SQLite index and a Bloom filter"""
+        report_dir = os.path.dirname(os.path.abspath(self.report_path))
+        fd, self.spill_path = tempfile.mkstemp(prefix='.dedupe_', suffix='.sqlite', dir=report_dir)
+        os.close(fd)
+        self.spill = sqlite3.connect(self.spill_path)
+        self.spill.execute("PRAGMA journal_mode = OFF")
+        self.spill.execute("PRAGMA synchronous = OFF")
+        self.spill.execute("CREATE TABLE names (name TEXT PRIMARY KEY, first_row INTEGER) WITHOUT ROWID")
+
+        self.bloom = BloomFilter(max(self.bloom_capacity, len(self.seen) * 2))
+        for name in self.seen:
+            self.bloom.add(name)
+        self.spill.executemany("INSERT INTO names VALUES (?, ?)", self.seen.items())
+        self.seen = {}
+
+    def _first_row(self, key: str) -> Optional[int]:
+        if self.spill is None:
+            return self.seen.get(key)
+        if key not in self.bloom:
+            return None
+        found = self.spill.execute("SELECT first_row FROM names WHERE name = ?", (key,)).fetchone()
+        return found[0] if found else None
+
+    def _remember(self, key: str, row_number: int):
+        if self.spill is None:
+            self.seen[key] = row_number
+            if len(self.seen) >= self.max_memory_names:
+                self._spill()
+        else:
+            self.bloom.add(key)
+            self.spill.execute("INSERT INTO names VALUES (?, ?)", (key, row_number))
+
+    def filter(self, encoded_rows: list, keys: List[tuple], row_numbers: List[int]) -> tuple:
+        """
+        Keep only rows whose normalised name is new.
+
+        Args:
+            encoded_rows: Encoded valid rows
+            keys: Their (name, content hash) pairs from encode_rows
+            row_numbers: Their 1-based data row numbers in the CSV
+
+        Returns:
+            (encoded, keys) for the rows that were kept
+        """
+        kept_rows = []
+        kept_keys = []
+        for encoded, key, row_number in zip(encoded_rows, keys, row_numbers):
+            name = key[0]
+            normalized = normalize_name(name)
+            first_row = self._first_row(normalized)
+            if first_row is not None:
+                self.duplicate_rows += 1
+                self.report.writerow([row_number, name, normalized, first_row])
+                continue
+            self._remember(normalized, row_number)
+            self.unique_rows += 1
+            kept_rows.append(encoded)
+            kept_keys.append(key)
+        return kept_rows, kept_keys
+
+    def close(self):
+        """Flush the conflict report and delete the spill index"""
+        self.report_file.close()
+        if self.spill is not None:
+            self.spill.close()
+            os.remove(self.spill_path)
+            self.spill = None
+
+    def summary(self) -> List[str]:
+        lines = [
+            f"Unique names: {self.unique_rows}",
+            f"Duplicate rows dropped: {self.duplicate_rows}",
+        ]
+        if self.bloom is not None:
+            lines.append("Dedupe index spilled to disk")
+        return lines
+
+
+def valid_row_numbers(first_row: int, rows_read: int, skipped: List[int]) -> List[int]:
+    """1-based CSV data row numbers of the valid rows in one encode_rows() chunk"""
+    skipped = set(skipped)
+    return [first_row + position - 1 for position in range(1, rows_read + 1)
+            if position not in skipped]
+
+
+class SqlBatchWriter:
+    """Writes batches as multi-row INSERT statements (the original output format)"""
+
+    binary = False
+    output_format = 'sql'
+
+    def __init__(self, outfile, csv_path: str, upsert: bool = False,
+                 table: str = 'simple_ingredients', compression: Optional[str] = None):
+        self.outfile = outfile
+        self.csv_path = csv_path
+        self.table = table
+        self.compression = compression
+        self.columns = ', '.join(get_table_encoder(table).columns)
+        self.conflict = conflict_clause(upsert, table)
+        # Extra statements written just before COMMIT (e.g. deactivations)
+        self.epilogue = ''
+
+    def begin(self):
+        self.outfile.write(f"-- Generated SQL for {self.table} table\n")
+        self.outfile.write("-- Source: {}\n".format(self.csv_path))
+        self.outfile.write("-- Date: {}\n\n".format(__import__('datetime').datetime.now()))
+        self.outfile.write("BEGIN;\n\n")
+
+    def write_batch(self, batch_rows: List[dict]):
+        if not batch_rows:
+            return
+        bound = get_table_encoder(self.table).bind(tuple(batch_rows[0]))
+        encode = getattr(bound, FORMAT_METHODS[self.output_format])
+        self.write_encoded([encode(list(row.values())) for row in batch_rows])
+
+    def write_encoded(self, encoded_rows: list):
+        write_values(self.outfile, encoded_rows, self.conflict, self.table, self.columns)
+
+    def finish(self):
+        if self.epilogue:
+            self.outfile.write(self.epilogue)
+        self.outfile.write("\nCOMMIT;\n")
+
+
+class CopyTextWriter(SqlBatchWriter):
+    """
+    Writes a psql script that streams rows with COPY ... FROM STDIN into a
+    temporary staging table, then merges them with a single INSERT ... SELECT.
+    """
+
+    output_format = 'copy'
+
+    def begin(self):
+        prepare, self.merge = staging_sql(self.columns, self.conflict, self.table)
+        self.outfile.write(f"-- Generated COPY load for {self.table} table\n")
+        self.outfile.write("-- Source: {}\n".format(self.csv_path))
+        self.outfile.write("-- Date: {}\n".format(__import__('datetime').datetime.now()))
+        if self.compression:
+            self.outfile.write(f"-- Run with: {DECOMPRESS_COMMANDS[self.compression]} <this file> | psql\n\n")
+        else:
+            self.outfile.write("-- Run with: psql -f <this file>\n\n")
+        self.outfile.write("BEGIN;\n\n")
+        self.outfile.write(prepare)
+        self.outfile.write(f"\nCOPY {staging_table(self.table)} ({self.columns}) FROM STDIN;\n")
+
+    def write_encoded(self, encoded_rows: list):
+        self.outfile.write(''.join(encoded_rows))
+
+    def finish(self):
+        self.outfile.write("\\.\n\n")
+        self.outfile.write(self.merge)
+        if self.epilogue:
+            self.outfile.write("\n" + self.epilogue)
+        self.outfile.write("\nCOMMIT;\n")
+
+
+class CopyBinaryWriter(SqlBatchWriter):
+    """
+    Writes a COPY binary data file plus a companion psql script
+    (<output>.sql) that loads it through the staging table.
+    """
+
+    binary = True
+    output_format = 'copy-binary'
+
+    def __init__(self, outfile, csv_path: str, data_path: Optional[str] = None,
+                 upsert: bool = False, table: str = 'simple_ingredients',
+                 compression: Optional[str] = None):
+        super().__init__(outfile, csv_path, upsert=upsert, table=table, compression=compression)
+        self.data_path = data_path
+
+    def begin(self):
+        self.outfile.write(PGCOPY_HEADER)
+
+    def write_encoded(self, encoded_rows: list):
+        self.outfile.write(b''.join(encoded_rows))
+
+    def finish(self):
+        self.outfile.write(PGCOPY_TRAILER)
+        if not self.data_path:
+            return
+
+        prepare, merge = staging_sql(self.columns, self.conflict, self.table)
+        data_file = Path(self.data_path).resolve()
+        if self.compression:
+            # psql decompresses on the client while streaming the COPY
+            command = f"{DECOMPRESS_COMMANDS[self.compression]} '{data_file}'".replace("'", "''")
+            source = f"PROGRAM '{command}'"
+        else:
+            source = f"'{data_file}'"
+        with open(f"{self.data_path}.sql", 'w', encoding='utf-8') as script:
+            script.write(f"-- Generated binary COPY load for {self.table} table\n")
+            script.write("-- Source: {}\n".format(self.csv_path))
+            script.write("-- Date: {}\n".format(__import__('datetime').datetime.now()))
+            script.write("-- Run with: psql -f <this file>\n\n")
+            script.write("BEGIN;\n\n")
+            script.write(prepare)
+            script.write(f"\n\\copy {staging_table(self.table)} ({self.columns}) "
+                         f"FROM {source} WITH (FORMAT binary)\n\n")
+            script.write(merge)
+            if self.epilogue:
+                script.write("\n" + self.epilogue)
+            script.write("\nCOMMIT;\n")
+
+
+# Upper bound on the bytes a single worker task parses (bounds memory per task)
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def is_valid_row(row: dict) -> bool:
+    """Rows without a name or category are skipped"""
+    return SIMPLE_INGREDIENTS.bind(tuple(row)).is_valid(list(row.values()))
+
+
+def encode_rows(records, fieldnames: List[str], output_format: str, with_keys: bool = False,
+                table: str = 'simple_ingredients') -> tuple:
+    """
+    Encode an iterable of csv.reader records laid out as fieldnames.
+
+    Blank lines are ignored (as csv.DictReader does). Records missing a
+    required field (for simple_ingredients: name or category) are skipped.
+
+    Returns:
+        (rows_read, skipped, encoded, keys) where skipped holds the 1-based
+        positions of skipped rows within the iterable, encoded the encoded
+        valid rows and keys their (key column value, content hash) pairs when
+        with_keys is set (otherwise an empty list)
+    """
+    bound = get_table_encoder(table).bind(fieldnames)
+    method = FORMAT_METHODS[output_format]
+    encode = getattr(bound, method)
+    values_of = bound.values
+    encode_values = getattr(bound.encoder, 'encode_values_' + method)
+    is_valid = bound.is_valid
+    key_index = bound.key_index
+    rows_read = 0
+    skipped = []
+    encoded = []
+    keys = []
+    for record in records:
+        if not record:
+            continue
+        rows_read += 1
+        if not is_valid(record):
+            skipped.append(rows_read)
+            continue
+        if with_keys:
+            values = values_of(record)
+            encoded.append(encode_values(values))
+            keys.append((values[key_index], row_hash(values)))
+        else:
+            encoded.append(encode(record))
+    return rows_read, skipped, encoded, keys
+
+
+def find_record_boundaries(csv_path: str, start: int, targets: List[int],
+                           block_size: int = 1024 * 1024) -> List[int]:
+    """
+    Find CSV record boundaries at or after each target byte offset.
+
+    A boundary is the offset just past a newline that is not inside a quoted
+    field. Quote parity is tracked from ``start`` (which must itself be a
+    record boundary) with bytes.count, so only the bytes near each target are
+    scanned line by line. Targets that fall before an earlier boundary are
+    dropped, so the result is strictly increasing.
+    """
+    boundaries = []
+    pending = iter(sorted(targets))
+    target = next(pending, None)
+
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        in_quotes = False
+        seeking = False
+
+        while target is not None:
+            block = f.read(block_size)
+            if not block:
+                break
+            i = 0
+            while target is not None:
+                if not seeking:
+                    if target >= pos + len(block):
+                        break
+                    j = max(target - pos, i)
+                    in_quotes ^= bool(block.count(b'"', i, j) & 1)
+                    i = j
+                    seeking = True
+
+                newline = block.find(b'\n', i)
+                if newline == -1:
+                    break
+                in_quotes ^= bool(block.count(b'"', i, newline) & 1)
+                i = newline + 1
+                if not in_quotes:
+                    boundary = pos + i
+                    boundaries.append(boundary)
+                    seeking = False
+                    while target is not None and target < boundary:
+                        target = next(pending, None)
+
+            in_quotes ^= bool(block.count(b'"', i) & 1)
+            pos += len(block)
+
+    return boundaries
+
+
+def plan_csv_chunks(csv_path: str, num_chunks: int) -> tuple:
+    """
+    Split a CSV file into byte ranges aligned to record boundaries.
+
+    Returns:
+        (fieldnames, ranges) where ranges is a list of (start, end) offsets
+        covering every data record after the header exactly once
+    """
+    file_size = os.path.getsize(csv_path)
+    header_end = (find_record_boundaries(csv_path, 0, [0]) or [file_size])[0]
+
+    with open(csv_path, 'rb') as f:
+        header = f.read(header_end).decode('utf-8')
+    fieldnames = next(csv.reader(io.StringIO(header, newline=None)), [])
 
+    data_size = file_size - header_end
+    num_chunks = max(1, num_chunks, -(-data_size // MAX_CHUNK_BYTES))
+    targets = [header_end + data_size * n // num_chunks for n in range(1, num_chunks)]
+    cuts = [header_end] + find_record_boundaries(csv_path, header_end, targets) + [file_size]
 
-def parse_array_field(value: Optional[str]) -> str:
-    """Parse array fields (comma-separated) into PostgreSQL array format"""
-    if value is None or value == '' or value.lower() == 'null':
-        return "ARRAY[]::TEXT[]"
+    ranges = [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+    return fieldnames, ranges
 
-    # Split by comma and clean up each item
-    items = [item.strip() for item in str(value).split(',') if item.strip()]
-    if not items:
-        return "ARRAY[]::TEXT[]"
 
-    # Escape single quotes and format as PostgreSQL array
-    escaped_items = [f"'{item.replace(chr(39), chr(39)*2)}'" for item in items]
-    return f"ARRAY[{', '.join(escaped_items)}]::TEXT[]"
+def _convert_chunk(task: tuple) -> tuple:
+    """Worker: parse and encode the records in one byte range of the CSV"""
+    csv_path, fieldnames, start, end, output_format, with_keys, table = task
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    # Match the universal-newline translation the serial reader applies
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    reader = csv.reader(io.StringIO(text, newline=''))
+    return encode_rows(reader, fieldnames, output_format, with_keys, table)
 
 
-def generate_insert_statement(row: dict, batch_mode: bool = True) -> str:
+def _encode_records(task: tuple) -> tuple:
+    """Worker: encode records the parent already parsed (compressed input)"""
+    records, fieldnames, output_format, with_keys, table = task
+    return encode_rows(records, fieldnames, output_format, with_keys, table)
+
+
+def iter_csv_records(csv_path: str, chunk_rows: int):
+    """
+    Yield (fieldnames, records) for consecutive groups of up to chunk_rows
+    non-blank CSV records. Compressed input is decompressed as it is read.
+    """
+    with open_stream(csv_path, 'r') as infile:
+        reader = csv.reader(infile)
+        fieldnames = next(reader, [])
+        reader = (record for record in reader if record)  # DictReader skips blank lines too
+        while True:
+            records = list(islice(reader, chunk_rows))
+            if not records:
+                return
+            yield fieldnames, records
+
+
+def iter_serial_chunks(csv_path: str, output_format: str, chunk_rows: int,
+                       with_keys: bool = False, table: str = 'simple_ingredients',
+                       metrics: Optional[Metrics] = None):
+    """
+    Yield encode_rows() results for consecutive groups of rows, in one process.
+    With metrics, reading (and decompressing) is timed as the parse stage and
+    encoding as the encode stage.
     """
-    Generate a single INSERT statement from a CSV row.
-    Note: fdc_id from CSV is ignored as DB uses UUID primary key
+    chunks = iter_csv_records(csv_path, chunk_rows)
+    if metrics is None:
+        for fieldnames, records in chunks:
+            yield encode_rows(records, fieldnames, output_format, with_keys, table)
+        return
+    for fieldnames, records in metrics.timed(chunks, 'parse'):
+        with metrics.stage('encode'):
+            result = encode_rows(records, fieldnames, output_format, with_keys, table)
+        yield result
+
+
+# Records per worker task when a compressed CSV is parsed in the parent
+RECORDS_PER_TASK = 20000
+
+
+def iter_parallel_chunks(csv_path: str, output_format: str, workers: int,
+                         with_keys: bool = False, table: str = 'simple_ingredients'):
     """
+    Yield encode_rows() results for record-aligned byte ranges of the CSV,
+    encoded on a process pool and yielded in file order.
 
-    # Map CSV columns to SQL values
-    # NOT NULL fields use not_null=True to default to 0 instead of NULL
-    values = {
-        'name': escape_sql_string(row.get('name'), max_length=255),
-        'display_name': escape_sql_string(row.get('display_name'), max_length=255) if row.get('display_name') else 'NULL',
-        'category': escape_sql_string(row.get('category'), max_length=100),
-        'serving_quantity': format_decimal(row.get('serving_quantity'), not_null=True, default='1'),
-        'serving_unit': escape_sql_string(row.get('serving_unit'), max_length=50) if row.get('serving_unit') else "'g'",
-        'calories': format_decimal(row.get('calories'), not_null=True, default='0'),
-        'protein_g': format_decimal(row.get('protein_g'), not_null=True, default='0'),
-        'carbs_g': format_decimal(row.get('carbs_g'), not_null=True, default='0'),
-        'fat_g': format_decimal(row.get('fat_g'), not_null=True, default='0'),
-        'fiber_g': format_decimal(row.get('fiber_g'), not_null=True, default='0'),
-        'sugar_g': format_decimal(row.get('sugar_g'), not_null=False, default='0'),
-        'saturated_fat_g': format_decimal(row.get('saturated_fat_g'), not_null=False, default='0'),
-        'trans_fat_g': format_decimal(row.get('trans_fat_g'), not_null=False, default='0'),
-        'cholesterol_mg': format_decimal(row.get('cholesterol_mg'), not_null=False, default='0'),
-        'vitamin_a_mcg': format_decimal(row.get('vitamin_a_mcg')),
-        'vitamin_d_mcg': format_decimal(row.get('vitamin_d_mcg')),
-        'vitamin_e_mg': format_decimal(row.get('vitamin_e_mg')),
-        'vitamin_k_mcg': format_decimal(row.get('vitamin_k_mcg')),
-        'vitamin_c_mg': format_decimal(row.get('vitamin_c_mg')),
-        'thiamin_mg': format_decimal(row.get('thiamin_mg')),
-        'riboflavin_mg': format_decimal(row.get('riboflavin_mg')),
-        'niacin_mg': format_decimal(row.get('niacin_mg')),
-        'vitamin_b6_mg': format_decimal(row.get('vitamin_b6_mg')),
-        'vitamin_b12_mcg': format_decimal(row.get('vitamin_b12_mcg')),
-        'folate_mcg': format_decimal(row.get('folate_mcg')),
-        'biotin_mcg': format_decimal(row.get('biotin_mcg')),
-        'pantothenic_acid_mg': format_decimal(row.get('pantothenic_acid_mg')),
-        'choline_mg': format_decimal(row.get('choline_mg')),
-        'calcium_mg': format_decimal(row.get('calcium_mg')),
-        'phosphorus_mg': format_decimal(row.get('phosphorus_mg')),
-        'magnesium_mg': format_decimal(row.get('magnesium_mg')),
-        'sodium_mg': format_decimal(row.get('sodium_mg')),
-        'potassium_mg': format_decimal(row.get('potassium_mg')),
-        'chloride_mg': format_decimal(row.get('chloride_mg')),
-        'iron_mg': format_decimal(row.get('iron_mg')),
-        'zinc_mg': format_decimal(row.get('zinc_mg')),
-        'copper_mg': format_decimal(row.get('copper_mg')),
-        'selenium_mcg': format_decimal(row.get('selenium_mcg')),
-        'iodine_mcg': format_decimal(row.get('iodine_mcg')),
-        'manganese_mg': format_decimal(row.get('manganese_mg')),
-        'molybdenum_mcg': format_decimal(row.get('molybdenum_mcg')),
-        'chromium_mcg': format_decimal(row.get('chromium_mcg')),
-        'health_labels': parse_array_field(row.get('health_labels')),
-        'diet_labels': parse_array_field(row.get('diet_labels')),
-        'allergens': parse_array_field(row.get('allergens')),
-        'image_url': escape_sql_string(row.get('image_url')) if row.get('image_url') else 'NULL',
-        'is_active': format_boolean(row.get('is_active', 'TRUE'))
-    }
-
-    if batch_mode:
-        # Return only the VALUES part for batch inserts
-        return f"""  ({values['name']}, {values['display_name']}, {values['category']},
-    {values['serving_quantity']}, {values['serving_unit']},
-    {values['calories']}, {values['protein_g']}, {values['carbs_g']},
-    {values['fat_g']}, {values['fiber_g']}, {values['sugar_g']},
-    {values['saturated_fat_g']}, {values['trans_fat_g']}, {values['cholesterol_mg']},
-    {values['vitamin_a_mcg']}, {values['vitamin_d_mcg']}, {values['vitamin_e_mg']},
-    {values['vitamin_k_mcg']}, {values['vitamin_c_mg']}, {values['thiamin_mg']},
-    {values['riboflavin_mg']}, {values['niacin_mg']}, {values['vitamin_b6_mg']},
-    {values['vitamin_b12_mcg']}, {values['folate_mcg']}, {values['biotin_mcg']},
-    {values['pantothenic_acid_mg']}, {values['choline_mg']},
-    {values['calcium_mg']}, {values['phosphorus_mg']}, {values['magnesium_mg']},
-    {values['sodium_mg']}, {values['potassium_mg']}, {values['chloride_mg']},
-    {values['iron_mg']}, {values['zinc_mg']}, {values['copper_mg']},
-    {values['selenium_mcg']}, {values['iodine_mcg']}, {values['manganese_mg']},
-    {values['molybdenum_mcg']}, {values['chromium_mcg']},
-    {values['health_labels']}, {values['diet_labels']}, {values['allergens']},
-    {values['image_url']}, {values['is_active']})"""
+    A compressed CSV cannot be cut into byte ranges, so it is decompressed
+    and parsed in this process and only the encoding runs on the pool.
+    At most ``2 * workers`` tasks are in flight, so memory stays bounded by
+    the chunk size rather than the file size.
+    """
+    if detect_compression(csv_path):
+        worker = _encode_records
+        tasks = ((records, fieldnames, output_format, with_keys, table)
+                 for fieldnames, records in iter_csv_records(csv_path, RECORDS_PER_TASK))
     else:
-        # Return full INSERT statement
-        columns = """name, display_name, category,
-    serving_quantity, serving_unit,
-    calories, protein_g, carbs_g, fat_g, fiber_g, sugar_g,
-    saturated_fat_g, trans_fat_g, cholesterol_mg,
-    vitamin_a_mcg, vitamin_d_mcg, vitamin_e_mg, vitamin_k_mcg,
-    vitamin_c_mg, thiamin_mg, riboflavin_mg, niacin_mg,
-    vitamin_b6_mg, vitamin_b12_mcg, folate_mcg, biotin_mcg,
-    pantothenic_acid_mg, choline_mg,
-    calcium_mg, phosphorus_mg, magnesium_mg, sodium_mg,
-    potassium_mg, chloride_mg, iron_mg, zinc_mg, copper_mg,
-    selenium_mcg, iodine_mcg, manganese_mg, molybdenum_mcg, chromium_mcg,
-    health_labels, diet_labels, allergens, image_url, is_active"""
-
-        return f"""INSERT INTO simple_ingredients ({columns})
-VALUES {generate_insert_statement(row, batch_mode=True)};"""
-
-
-def convert_csv_to_sql(csv_path: str, output_path: str, batch_size: int = 100):
+        worker = _convert_chunk
+        fieldnames, ranges = plan_csv_chunks(csv_path, workers * 4)
+        tasks = ((csv_path, fieldnames, start, end, output_format, with_keys, table)
+                 for start, end in ranges)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = []
+        for task in tasks:
+            in_flight.append(executor.submit(worker, task))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.pop(0).result()
+        while in_flight:
+            yield in_flight.pop(0).result()
+
+
+def convert_csv_to_sql(csv_path: str, output_path: str, batch_size: int = 100,
+                       output_format: str = 'sql', workers: int = 1,
+                       delta_manifest: Optional[str] = None, deactivate_removed: bool = False,
+                       conflict_report: Optional[str] = None,
+                       dedupe_memory_names: int = 2_000_000, table: str = 'simple_ingredients',
+                       compression_level: Optional[int] = None,
+                       matrix_path: Optional[str] = None,
+                       search_index_path: Optional[str] = None,
+                       metrics: Optional[Metrics] = None):
     """
-    Convert CSV file to SQL INSERT statements
+    Convert CSV file to SQL INSERT statements or a COPY load
 
     Args:
         csv_path: Path to the input CSV file
-        output_path: Path to the output SQL file
+        output_path: Path to the output SQL file (COPY data file for copy-binary)
         batch_size: Number of rows per batch INSERT (default: 100)
+        output_format: 'sql' (batched INSERTs), 'copy' (psql script with COPY text
+            data) or 'copy-binary' (binary COPY data plus <output>.sql loader)
+        workers: Number of processes encoding rows (default: 1, 0 = all cores).
+            Output is identical to the single-process path.
+        delta_manifest: Path to a name -> content hash manifest from the last run.
+            Only new or changed rows are emitted, as ON CONFLICT (name) DO UPDATE.
+            The manifest for this run is written to <manifest>.pending and only
+            replaces the real one once the output is applied (see delta_manifest.py).
+        deactivate_removed: With delta_manifest, also mark names that disappeared
+            from the CSV as is_active = FALSE
+        conflict_report: Drop rows whose normalised name repeats an earlier row and
+            write them to this CSV report instead of the output
+        dedupe_memory_names: Names kept in memory before the dedupe index
+            spills to a Bloom filter plus an on-disk index
+        table: Seed table the CSV is converted for (see seed_schema.SEED_TABLES).
+            Delta manifests and dedupe key on its unique column.
+        compression_level: gzip/zstd level when output_path ends in .gz or .zst
+        matrix_path: Also write the memory-mapped nutrient matrix
+            (nutrient_matrix.py) of the CSV's active rows here
+        search_index_path: Also write the autocomplete index
+            (ingredient_search.py) of the CSV's active rows here
+        metrics: Stage timings and counters of the run go here (see
+            pipeline_metrics.py). With workers > 1, parsing and encoding
+            happen in the pool and are timed together as parse_encode.
+
+    A gzip or zstd compressed CSV is read directly, and an output path ending
+    in .gz or .zst is written compressed; neither is ever decompressed to disk.
     """
 
     csv_file = Path(csv_path)
@@ -179,110 +655,282 @@ def convert_csv_to_sql(csv_path: str, output_path: str, batch_size: int = 100):
         print(f"Error: CSV file not found: {csv_path}")
         sys.exit(1)
 
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown output format: {output_format}")
+        sys.exit(1)
+
+    if table not in SEED_TABLES:
+        print(f"Error: Unknown table: {table}")
+        sys.exit(1)
+
+    if (matrix_path or search_index_path) and table != 'simple_ingredients':
+        print(f"Error: A nutrient matrix or search index can only be built for "
+              f"simple_ingredients, not {table}")
+        sys.exit(1)
+
+    if deactivate_removed and 'is_active' not in get_table_encoder(table).columns:
+        print(f"Error: {table} has no is_active column to deactivate rows with")
+        sys.exit(1)
+
     output_file = Path(output_path)
+    input_compression = detect_compression(csv_path)
+    output_compression = compression_for_name(output_path)
+    try:
+        check_compression(input_compression)
+        check_compression(output_compression)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
-    print(f"Reading CSV from: {csv_path}")
-    print(f"Writing SQL to: {output_path}")
-    print(f"Batch size: {batch_size} rows per INSERT")
+    print(f"Reading CSV from: {csv_path}" +
+          (f" ({input_compression})" if input_compression else ""))
+    print(f"Writing {output_format} output for {table} to: {output_path}" +
+          (f" ({output_compression})" if output_compression else ""))
+    if output_format == 'sql':
+        print(f"Batch size: {batch_size} rows per INSERT")
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        print(f"Workers: {workers}")
+
+    delta = None
+    if delta_manifest:
+        try:
+            delta = DeltaManifest(delta_manifest)
+        except (OSError, ValueError) as e:
+            print(f"Error reading delta manifest: {e}")
+            sys.exit(1)
+        print(f"Delta manifest: {delta_manifest} ({len(delta.previous)} rows from last run)")
+    if conflict_report:
+        print(f"Conflict report: {conflict_report}")
     print("-" * 60)
 
+    if metrics is None:
+        metrics = Metrics('csv_to_sql')
+    metrics.count('bytes_read', csv_file.stat().st_size)
+
     total_rows = 0
     skipped_rows = 0
     batch_count = 0
+    binary = output_format == 'copy-binary'
+    deduper = None
 
     try:
-        with open(csv_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
+        if conflict_report:
+            deduper = NameDeduper(conflict_report, max_memory_names=dedupe_memory_names)
+
+        with open_stream(output_file, 'wb' if binary else 'w', compression=output_compression,
+                         level=compression_level) as outfile:
+
+            upsert = delta is not None
+            with_keys = upsert or deduper is not None
+            if output_format == 'copy':
+                writer = CopyTextWriter(outfile, csv_path, upsert=upsert, table=table,
+                                        compression=output_compression)
+            elif binary:
+                writer = CopyBinaryWriter(outfile, csv_path, data_path=output_path,
+                                          upsert=upsert, table=table,
+                                          compression=output_compression)
+            else:
+                writer = SqlBatchWriter(outfile, csv_path, upsert=upsert, table=table,
+                                        compression=output_compression)
 
             # Write header
-            outfile.write("-- Generated SQL for simple_ingredients table\n")
-            outfile.write("-- Source: {}\n".format(csv_path))
-            outfile.write("-- Date: {}\n\n".format(__import__('datetime').datetime.now()))
-            outfile.write("BEGIN;\n\n")
-
-            # Read CSV
-            reader = csv.DictReader(infile)
+            writer.begin()
 
-            batch_rows = []
+            if workers > 1:
+                chunks = metrics.timed(iter_parallel_chunks(csv_path, output_format, workers,
+                                                            with_keys=with_keys, table=table),
+                                       'parse_encode')
+            else:
+                chunks = iter_serial_chunks(csv_path, output_format, batch_size,
+                                            with_keys=with_keys, table=table, metrics=metrics)
 
-            for row in reader:
-                total_rows += 1
+            pending = []
+            missing = ' or '.join(get_table_encoder(table).required)
 
+            for rows_read, skipped, encoded, keys in chunks:
                 # Skip rows without required fields
-                if not row.get('name') or not row.get('category'):
-                    skipped_rows += 1
-                    print(f"Warning: Skipping row {total_rows} - missing name or category")
-                    continue
-
-                batch_rows.append(row)
-
-                # Write batch when we reach batch_size
-                if len(batch_rows) >= batch_size:
-                    write_batch(outfile, batch_rows)
+                for position in skipped:
+                    print(f"Warning: Skipping row {total_rows + position} - missing {missing}")
+                if deduper is not None:
+                    row_numbers = valid_row_numbers(total_rows + 1, rows_read, skipped)
+                    with metrics.stage('dedupe'):
+                        encoded, keys = deduper.filter(encoded, keys, row_numbers)
+                total_rows += rows_read
+                skipped_rows += len(skipped)
+                if delta is not None:
+                    with metrics.stage('delta'):
+                        encoded = delta.filter(encoded, keys)
+                pending.extend(encoded)
+
+                # Write batches when we reach batch_size
+                while len(pending) >= batch_size:
+                    with metrics.stage('write', histogram='batch_write_seconds'):
+                        writer.write_encoded(pending[:batch_size])
+                    metrics.count('rows_written', batch_size)
                     batch_count += 1
-                    print(f"Processed batch {batch_count} ({len(batch_rows)} rows)")
-                    batch_rows = []
+                    print(f"Processed batch {batch_count} ({batch_size} rows)")
+                    del pending[:batch_size]
 
             # Write remaining rows
-            if batch_rows:
-                write_batch(outfile, batch_rows)
+            if pending:
+                with metrics.stage('write', histogram='batch_write_seconds'):
+                    writer.write_encoded(pending)
+                metrics.count('rows_written', len(pending))
                 batch_count += 1
-                print(f"Processed final batch {batch_count} ({len(batch_rows)} rows)")
+                print(f"Processed final batch {batch_count} ({len(pending)} rows)")
+
+            removed = delta.removed_names() if delta is not None else []
+            if removed and deactivate_removed:
+                writer.epilogue = deactivate_sql(removed, table=table)
 
             # Write footer
-            outfile.write("\nCOMMIT;\n")
+            with metrics.stage('write'):
+                writer.finish()
+
+        if delta is not None:
+            with metrics.stage('manifest'):
+                delta.save(csv_path, pending=True)
+
+        matrix = search_index = None
+        if matrix_path:
+            with metrics.stage('nutrient_matrix'):
+                matrix = write_nutrient_matrix(csv_path, matrix_path)
+        if search_index_path:
+            with metrics.stage('search_index'):
+                search_index = write_search_index(csv_path, search_index_path)
 
     except Exception as e:
         print(f"Error processing CSV: {e}")
         sys.exit(1)
+    finally:
+        if deduper is not None:
+            deduper.close()
+
+    metrics.count('rows_read', total_rows)
+    metrics.count('rows_skipped', skipped_rows)
+    metrics.count('batches', batch_count)
+    if deduper is not None:
+        metrics.count('rows_duplicate', deduper.duplicate_rows)
+    if delta is not None:
+        metrics.count('rows_new', delta.new_rows)
+        metrics.count('rows_changed', delta.changed_rows)
+        metrics.count('rows_unchanged', delta.unchanged_rows)
+    metrics.count('bytes_written', output_file.stat().st_size)
 
     print("-" * 60)
     print(f"Conversion complete!")
     print(f"Total rows read: {total_rows}")
-    print(f"Rows inserted: {total_rows - skipped_rows}")
+    if delta is None:
+        duplicates = deduper.duplicate_rows if deduper is not None else 0
+        print(f"Rows inserted: {total_rows - skipped_rows - duplicates}")
     print(f"Rows skipped: {skipped_rows}")
+    if deduper is not None:
+        for line in deduper.summary():
+            print(line)
+    if delta is not None:
+        for line in delta.summary():
+            print(line)
+        action = "deactivated" if deactivate_removed else "left untouched"
+        print(f"Removed rows: {len(removed)} ({action})")
     print(f"Batches created: {batch_count}")
     print(f"Output file: {output_path}")
-
-
-def write_batch(outfile, batch_rows: List[dict]):
-    """Write a batch of rows as a single INSERT statement"""
-    if not batch_rows:
+    if binary:
+        print(f"Loader script: {output_path}.sql")
+    if delta is not None:
+        print(f"Pending manifest: {pending_path(delta_manifest)}")
+        print(f"  Promote it once the output is applied: apply_sql_shards.py --delta-manifest "
+              f"{delta_manifest}, or csv_to_ingredients_sql.py --commit-manifest {delta_manifest}")
+    if deduper is not None:
+        print(f"Conflict report: {conflict_report}")
+    if matrix is not None:
+        print(f"Nutrient matrix: {matrix_path} ({matrix['rows']} rows, "
+              f"version {matrix['version']})")
+    if search_index is not None:
+        print(f"Search index: {search_index_path} ({search_index['rows']} names, "
+              f"version {search_index['version']})")
+
+
+def write_values(outfile, value_statements: List[str], conflict: str = ON_CONFLICT_NOTHING,
+                 table: str = 'simple_ingredients', columns: str = INSERT_COLUMN_LIST):
+    """Write pre-encoded VALUES tuples as a single INSERT statement"""
+    if not value_statements:
         return
 
-    columns = """name, display_name, category,
-    serving_quantity, serving_unit,
-    calories, protein_g, carbs_g, fat_g, fiber_g, sugar_g,
-    saturated_fat_g, trans_fat_g, cholesterol_mg,
-    vitamin_a_mcg, vitamin_d_mcg, vitamin_e_mg, vitamin_k_mcg,
-    vitamin_c_mg, thiamin_mg, riboflavin_mg, niacin_mg,
-    vitamin_b6_mg, vitamin_b12_mcg, folate_mcg, biotin_mcg,
-    pantothenic_acid_mg, choline_mg,
-    calcium_mg, phosphorus_mg, magnesium_mg, sodium_mg,
-    potassium_mg, chloride_mg, iron_mg, zinc_mg, copper_mg,
-    selenium_mcg, iodine_mcg, manganese_mg, molybdenum_mcg, chromium_mcg,
-    health_labels, diet_labels, allergens, image_url, is_active"""
-
-    outfile.write(f"INSERT INTO simple_ingredients ({columns})\nVALUES\n")
-
-    value_statements = [generate_insert_statement(row, batch_mode=True) for row in batch_rows]
+    outfile.write(f"INSERT INTO {table} ({columns})\nVALUES\n")
     outfile.write(",\n".join(value_statements))
-    outfile.write("\nON CONFLICT (name) DO NOTHING;\n\n")
+    outfile.write(f"\n{conflict};\n\n")
 
 
 def main():
     """Main entry point"""
-    if len(sys.argv) < 2:
-        print("Usage: python csv_to_ingredients_sql.py <csv_file> [output_file] [batch_size]")
-        print("\nExample:")
-        print("  python csv_to_ingredients_sql.py ingredients.csv output.sql 100")
-        sys.exit(1)
-
-    csv_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else 'ingredients_insert.sql'
-    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
-
-    convert_csv_to_sql(csv_path, output_path, batch_size)
+    parser = argparse.ArgumentParser(
+        description="Convert a nutrition CSV into SQL for the simple_ingredients table",
+        epilog="Example:\n  python csv_to_ingredients_sql.py ingredients.csv output.sql 100\n"
+               "  python csv_to_ingredients_sql.py ingredients.csv load.sql --format copy\n"
+               "  python csv_to_ingredients_sql.py ingredients.csv.gz output.sql.zst",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('csv_file', nargs='?', help="Input CSV file")
+    parser.add_argument('output_file', nargs='?', default='ingredients_insert.sql',
+                        help="Output file (default: ingredients_insert.sql)")
+    parser.add_argument('batch_size', nargs='?', type=int, default=100,
+                        help="Rows per batch INSERT (default: 100)")
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default='sql',
+                        help="Output format: batched INSERTs (default), COPY text "
+                             "script, or binary COPY data with a loader script")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Encode rows on N processes (default: 1, 0 = all cores)")
+    parser.add_argument('--delta-manifest', metavar='PATH',
+                        help="Only emit rows that are new or changed since the run that "
+                             "wrote this manifest, as upserts; the new manifest is written "
+                             "to <manifest>.pending")
+    parser.add_argument('--commit-manifest', metavar='PATH',
+                        help="Replace manifest PATH with PATH.pending once the output of "
+                             "the delta run that wrote it has been applied, then exit")
+    parser.add_argument('--deactivate-removed', action='store_true',
+                        help="With --delta-manifest, set is_active = FALSE for names no "
+                             "longer in the CSV")
+    parser.add_argument('--conflict-report', metavar='PATH',
+                        help="Drop rows whose name (trimmed, case-insensitive) repeats an "
+                             "earlier row and list them in this CSV report")
+    parser.add_argument('--dedupe-memory-names', type=int, default=2_000_000,
+                        help="Names held in memory before dedupe spills to disk "
+                             "(default: 2000000)")
+    parser.add_argument('--table', choices=sorted(SEED_TABLES), default='simple_ingredients',
+                        help="Seed table the CSV holds rows for (default: simple_ingredients)")
+    parser.add_argument('--compression-level', type=int,
+                        help="Level for .gz/.zst output (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument('--matrix', metavar='PATH',
+                        help="Also write the memory-mapped nutrient matrix of the active "
+                             "rows (see nutrient_matrix.py)")
+    parser.add_argument('--search-index', metavar='PATH',
+                        help="Also write the autocomplete search index of the active "
+                             "rows (see ingredient_search.py)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.commit_manifest:
+        if not promote_manifest(args.commit_manifest):
+            print(f"Error: No pending manifest: {pending_path(args.commit_manifest)}")
+            sys.exit(1)
+        print(f"Manifest updated: {args.commit_manifest}")
+        return
+    if not args.csv_file:
+        parser.error("the following arguments are required: csv_file")
+    if args.deactivate_removed and not args.delta_manifest:
+        parser.error("--deactivate-removed requires --delta-manifest")
+
+    metrics = Metrics.from_args('csv_to_sql', args)
+
+    convert_csv_to_sql(args.csv_file, args.output_file, args.batch_size, args.output_format,
+                       workers=args.workers, delta_manifest=args.delta_manifest,
+                       deactivate_removed=args.deactivate_removed,
+                       conflict_report=args.conflict_report,
+                       dedupe_memory_names=args.dedupe_memory_names, table=args.table,
+                       compression_level=args.compression_level, matrix_path=args.matrix,
+                       search_index_path=args.search_index, metrics=metrics)
+    report(metrics, args.metrics)
 
 
 if __name__ == '__main__':
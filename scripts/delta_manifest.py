@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Delta Manifests for Incremental Seed Loads
+A manifest maps each row's unique name to a hash of its formatted values from
+the last load, so a re-run only sends rows that are new or changed.
+
+A converter that only writes a file (csv_to_ingredients_sql.py) cannot know
+whether that file will ever be applied, so it writes the new manifest next to
+the old one as <manifest>.pending. The pending manifest replaces the real one
+only once the load is confirmed: by apply_sql_shards.py --delta-manifest after
+every shard has succeeded, or by csv_to_ingredients_sql.py --commit-manifest.
+A loader that applies the rows itself (load_ingredients.py) saves the manifest
+directly once every batch has committed.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+PENDING_SUFFIX = '.pending'
+
+
+def pending_path(path: str) -> Path:
+    """Where the manifest of a not yet applied load is written"""
+    path = Path(path)
+    return path.with_name(path.name + PENDING_SUFFIX)
+
+
+def promote_manifest(path: str) -> bool:
+    """
+    Replace a manifest with its pending version, once the load that wrote
+    the pending version has been applied
+
+    Args:
+        path: The manifest path (not the .pending one)
+
+    Returns:
+        True if a pending manifest was promoted, False if there was none
+    """
+    pending = pending_path(path)
+    if not pending.exists():
+        return False
+    os.replace(pending, path)
+    return True
+
+
+class DeltaManifest:
+    """
+    Tracks name -> content hash for the rows of the last load, so a
+    re-run only emits rows that are new or changed.
+
+    The manifest is a JSON file ({"version", "source", "generated", "rows"}).
+    A missing file means every row is new.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.previous = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                raise ValueError(f"Unsupported manifest version in {path}: {data.get('version')}")
+            self.previous = data.get('rows', {})
+
+        self.current = {}
+        self.new_rows = 0
+        self.changed_rows = 0
+        self.unchanged_rows = 0
+        self.duplicate_rows = 0
+
+    def filter(self, encoded_rows: list, keys: List[tuple]) -> list:
+        """Keep only encoded rows whose (name, hash) key is new or changed"""
+        kept = []
+        for encoded, (name, digest) in zip(encoded_rows, keys):
+            if name in self.current:
+                # ON CONFLICT DO UPDATE cannot touch the same name twice in one
+                # statement; the first occurrence wins, as with DO NOTHING
+                self.duplicate_rows += 1
+                continue
+            self.current[name] = digest
+            previous = self.previous.get(name)
+            if previous == digest:
+                self.unchanged_rows += 1
+                continue
+            if previous is None:
+                self.new_rows += 1
+            else:
+                self.changed_rows += 1
+            kept.append(encoded)
+        return kept
+
+    def removed_names(self) -> List[str]:
+        """Names present in the previous load but missing from this one"""
+        return sorted(name for name in self.previous if name not in self.current)
+
+    def save(self, source: str, pending: bool = False) -> Path:
+        """
+        Write the manifest for this load (atomically)
+
+        Args:
+            source: The CSV the load was built from
+            pending: Write <manifest>.pending instead of replacing the manifest,
+                for a load that has not been applied yet (see promote_manifest)
+
+        Returns:
+            The path written
+        """
+        data = {
+            'version': self.VERSION,
+            'source': source,
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'rows': self.current,
+        }
+        target = pending_path(self.path) if pending else self.path
+        tmp_path = target.with_name(target.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, target)
+        return target
+
+    def summary(self) -> List[str]:
+        return [
+            f"New rows: {self.new_rows}",
+            f"Changed rows: {self.changed_rows}",
+            f"Unchanged rows: {self.unchanged_rows}",
+            f"Duplicate names: {self.duplicate_rows}",
+        ]
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+FoodData Central Bulk Download Ingestion
+Reads the official FDC bulk downloads (https://fdc.nal.usda.gov/download-datasets)
+from local disk, so the category/portion map and gram weights can be built
+from the complete dataset without any API requests.
+
+Both download formats are supported, as an extracted directory, the .zip as
+downloaded, or single files compressed with gzip/zstd:
+
+- CSV: food.csv is joined with food_portion.csv, food_nutrient.csv,
+  branded_food.csv and the category tables. The child tables are loaded into
+  a temporary SQLite file clustered on fdc_id and read back as one sorted
+  merge, so memory does not grow with the dataset.
+- JSON (FoundationFoods, SRLegacyFoods, SurveyFoods, BrandedFoods): each file
+  is parsed incrementally, one food at a time.
+
+Every food is yielded in the shape of an API /food/{fdcId} response, so the
+fetcher's portion extraction applies unchanged. IngredientCsvWriter turns
+foods into simple_ingredients rows (nutrients per 100 g) that
+csv_to_ingredients_sql.py converts directly.
+"""
+
+import csv
+import io
+import itertools
+import json
+import re
+import sqlite3
+import tempfile
+import zipfile
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from compressed_io import open_stream, strip_compression_suffix
+from seed_schema import get_table_encoder
+
+# CSV data_type values and the dataType names the API uses for them
+DATA_TYPES = {
+    'foundation_food': 'Foundation',
+    'sr_legacy_food': 'SR Legacy',
+    'survey_fndds_food': 'Survey (FNDDS)',
+    'branded_food': 'Branded',
+}
+
+# Foods written to the simple_ingredients CSV unless told otherwise
+DEFAULT_INGREDIENT_TYPES = ('Foundation', 'SR Legacy')
+
+# simple_ingredients columns and the FDC nutrient ids that fill them, in order
+# of preference (Foundation foods report energy as Atwater 2047/2048, not 1008)
+NUTRIENT_IDS = {
+    'calories': (1008, 2048, 2047),
+    'protein_g': (1003,),
+    'carbs_g': (1005, 1050),
+    'fat_g': (1004, 1085),
+    'fiber_g': (1079,),
+    'sugar_g': (2000, 1063),
+    'saturated_fat_g': (1258,),
+    'trans_fat_g': (1257,),
+    'cholesterol_mg': (1253,),
+    'vitamin_a_mcg': (1106,),
+    'vitamin_d_mcg': (1114,),
+    'vitamin_e_mg': (1109,),
+    'vitamin_k_mcg': (1185,),
+    'vitamin_c_mg': (1162,),
+    'thiamin_mg': (1165,),
+    'riboflavin_mg': (1166,),
+    'niacin_mg': (1167,),
+    'vitamin_b6_mg': (1175,),
+    'vitamin_b12_mcg': (1178,),
+    'folate_mcg': (1177, 1190),
+    'biotin_mcg': (1176,),
+    'pantothenic_acid_mg': (1170,),
+    'choline_mg': (1180,),
+    'calcium_mg': (1087,),
+    'phosphorus_mg': (1091,),
+    'magnesium_mg': (1090,),
+    'sodium_mg': (1093,),
+    'potassium_mg': (1092,),
+    'chloride_mg': (1088,),
+    'iron_mg': (1089,),
+    'zinc_mg': (1095,),
+    'copper_mg': (1098,),
+    'selenium_mcg': (1103,),
+    'iodine_mcg': (1100,),
+    'manganese_mg': (1101,),
+    'molybdenum_mcg': (1102,),
+    'chromium_mcg': (1096,),
+}
+WANTED_NUTRIENTS = {nutrient_id for ids in NUTRIENT_IDS.values() for nutrient_id in ids}
+
+# FDC food categories and the simple_ingredients category they belong to;
+# others are kept as their lowercased FDC description
+SIMPLE_CATEGORIES = {
+    'Baked Products': 'grain',
+    'Beef Products': 'protein',
+    'Breakfast Cereals': 'grain',
+    'Cereal Grains and Pasta': 'grain',
+    'Dairy and Egg Products': 'dairy',
+    'Fats and Oils': 'fat',
+    'Finfish and Shellfish Products': 'protein',
+    'Fruits and Fruit Juices': 'fruit',
+    'Lamb, Veal, and Game Products': 'protein',
+    'Legumes and Legume Products': 'legume',
+    'Nut and Seed Products': 'nuts',
+    'Pork Products': 'protein',
+    'Poultry Products': 'protein',
+    'Sausages and Luncheon Meats': 'protein',
+    'Sweets': 'sweetener',
+    'Vegetables and Vegetable Products': 'vegetable',
+}
+
+INGREDIENT_COLUMNS = ['fdc_id'] + get_table_encoder('simple_ingredients').columns
+NAME_LENGTH = 255
+
+JSON_CHUNK_SIZE = 1024 * 1024
+INSERT_BATCH = 50_000
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class BulkSource:
+    """
+    Files of a bulk download, by name without compression suffix: an
+    extracted directory, the downloaded .zip, or a single (compressed) file.
+    Members of a .zip are read as stored.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.zip = None
+        if self.path.is_dir():
+            members = [p for p in sorted(self.path.rglob('*')) if p.is_file()]
+            self.members = {strip_compression_suffix(p.name): p for p in members}
+        elif zipfile.is_zipfile(self.path):
+            self.zip = zipfile.ZipFile(self.path)
+            self.members = {Path(name).name: name
+                            for name in self.zip.namelist() if not name.endswith('/')}
+        elif self.path.is_file():
+            self.members = {strip_compression_suffix(self.path.name): self.path}
+        else:
+            raise FileNotFoundError(f"Bulk download not found: {path}")
+
+    def has(self, name: str) -> bool:
+        return name in self.members
+
+    def json_files(self) -> List[str]:
+        return [name for name in self.members if name.lower().endswith('.json')]
+
+    def open(self, name: str):
+        """Text stream of a member (decompressed if needed)"""
+        member = self.members[name]
+        if self.zip is not None:
+            return io.TextIOWrapper(self.zip.open(member), encoding='utf-8-sig', newline='')
+        return open_stream(member, 'r', encoding='utf-8-sig', newline='')
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+def iter_json_array(stream, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator:
+    """
+    Yield the elements of the first JSON array in a text stream one by one,
+    e.g. the foods of {"SRLegacyFoods": [...]}, holding one chunk in memory
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        start = buffer.find('[')
+        if start >= 0:
+            pos = start + 1
+            break
+        buffer = ''
+
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise ValueError("need more data")
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if eof:
+                raise ValueError("Truncated JSON array") from None
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def _csv_rows(source: BulkSource, name: str, columns: List[str]) -> Iterator[list]:
+    """Rows of a CSV member, as tuples of the named columns ('' if absent)"""
+    with source.open(name) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        index = {column: i for i, column in enumerate(header)}
+        # Missing columns read the padding cell past the end of the header
+        picks = [index.get(column, len(header)) for column in columns]
+        width = max(picks) + 1
+        pick = itemgetter(*picks)
+        for row in reader:
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            yield pick(row)
+
+
+def _lookup(source: BulkSource, name: str, key: str, value: str) -> Dict[str, str]:
+    if not source.has(name):
+        return {}
+    return {row[0]: row[1] for row in _csv_rows(source, name, [key, value])}
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple]) -> int:
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, INSERT_BATCH))
+        if not batch:
+            return count
+        conn.executemany(sql, batch)
+        count += len(batch)
+
+
+def _groups(cursor) -> Iterator[tuple]:
+    """(fdc_id, rows) for a cursor ordered by fdc_id"""
+    for fdc_id, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+        yield fdc_id, list(rows)
+
+
+def _merge(foods, *children) -> Iterator[tuple]:
+    """Sorted merge join: each food row with its rows from every child"""
+    iterators = [iter(child) for child in children]
+    heads = [next(it, None) for it in iterators]
+    for food in foods:
+        fdc_id = food[0]
+        matched = []
+        for i, it in enumerate(iterators):
+            while heads[i] is not None and heads[i][0] < fdc_id:
+                heads[i] = next(it, None)
+            if heads[i] is not None and heads[i][0] == fdc_id:
+                matched.append(heads[i][1])
+                heads[i] = next(it, None)
+            else:
+                matched.append([])
+        yield food, matched
+
+
+def _build_csv_index(source: BulkSource, conn: sqlite3.Connection,
+                     nutrient_types: Optional[set], log=print) -> Dict[str, int]:
+    """Load the CSV tables into the SQLite index; returns rows per table"""
+    conn.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE food (fdc_id INTEGER PRIMARY KEY, data_type TEXT,
+                           description TEXT, category TEXT);
+        CREATE TABLE branded (fdc_id INTEGER PRIMARY KEY, category TEXT, serving_size REAL,
+                              serving_unit TEXT, household TEXT);
+        CREATE TABLE survey (fdc_id INTEGER PRIMARY KEY, category TEXT);
+        CREATE TABLE portion (fdc_id INTEGER, seq INTEGER, id INTEGER, amount REAL, unit TEXT,
+                              description TEXT, modifier TEXT, gram_weight REAL,
+                              PRIMARY KEY (fdc_id, seq, id)) WITHOUT ROWID;
+        CREATE TABLE nutrient (fdc_id INTEGER, nutrient_id INTEGER, amount REAL,
+                               PRIMARY KEY (fdc_id, nutrient_id)) WITHOUT ROWID;
+    """)
+    categories = _lookup(source, 'food_category.csv', 'id', 'description')
+    wweia = _lookup(source, 'wweia_food_category.csv', 'wweia_food_category',
+                    'wweia_food_category_description')
+    units = _lookup(source, 'measure_unit.csv', 'id', 'name')
+    counts = {}
+    nutrient_ids = set()
+
+    def foods():
+        for fdc_id, data_type, description, category_id in _csv_rows(
+                source, 'food.csv', ['fdc_id', 'data_type', 'description', 'food_category_id']):
+            data_type = DATA_TYPES.get(data_type)
+            if data_type is None or not fdc_id.isdigit():
+                continue
+            if data_type == 'Survey (FNDDS)':
+                category = wweia.get(category_id)
+            else:
+                category = categories.get(category_id)
+            if nutrient_types is not None and data_type in nutrient_types:
+                nutrient_ids.add(fdc_id)
+            yield int(fdc_id), data_type, description, category
+
+    log("  Indexing food.csv...")
+    counts['food'] = _insert(conn, "INSERT OR REPLACE INTO food VALUES (?, ?, ?, ?)", foods())
+
+    if source.has('branded_food.csv'):
+        log("  Indexing branded_food.csv...")
+        rows = ((int(fdc_id), category, _float(size), unit, household)
+                for fdc_id, category, size, unit, household in _csv_rows(
+                    source, 'branded_food.csv',
+                    ['fdc_id', 'branded_food_category', 'serving_size', 'serving_size_unit',
+                     'household_serving_fulltext'])
+                if fdc_id.isdigit())
+        counts['branded'] = _insert(conn, "INSERT OR REPLACE INTO branded VALUES (?, ?, ?, ?, ?)",
+                                    rows)
+
+    if source.has('survey_fndds_food.csv') and wweia:
+        rows = ((int(fdc_id), wweia.get(code))
+                for fdc_id, code in _csv_rows(source, 'survey_fndds_food.csv',
+                                              ['fdc_id', 'wweia_category_code'])
+                if fdc_id.isdigit())
+        counts['survey'] = _insert(conn, "INSERT OR REPLACE INTO survey VALUES (?, ?)", rows)
+
+    if source.has('food_portion.csv'):
+        log("  Indexing food_portion.csv...")
+        rows = ((int(fdc_id), int(_float(seq) or 0), number, _float(amount), units.get(unit_id),
+                 description, modifier, _float(grams))
+                for number, (fdc_id, seq, amount, unit_id, description, modifier, grams)
+                in enumerate(_csv_rows(
+                    source, 'food_portion.csv',
+                    ['fdc_id', 'seq_num', 'amount', 'measure_unit_id', 'portion_description',
+                     'modifier', 'gram_weight']))
+                if fdc_id.isdigit())
+        counts['portion'] = _insert(conn, "INSERT INTO portion VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    rows)
+
+    if nutrient_ids and source.has('food_nutrient.csv'):
+        log("  Indexing food_nutrient.csv...")
+        wanted = {str(nutrient_id) for nutrient_id in WANTED_NUTRIENTS}
+        rows = ((int(fdc_id), int(nutrient_id), _float(amount))
+                for fdc_id, nutrient_id, amount in _csv_rows(
+                    source, 'food_nutrient.csv', ['fdc_id', 'nutrient_id', 'amount'])
+                if nutrient_id in wanted and fdc_id in nutrient_ids)
+        counts['nutrient'] = _insert(conn, "INSERT OR REPLACE INTO nutrient VALUES (?, ?, ?)",
+                                     rows)
+
+    conn.commit()
+    return counts
+
+
+def iter_csv_foods(source: BulkSource, nutrient_types: Optional[set] = None,
+                   index_dir: Optional[str] = None, log=print) -> Iterator[dict]:
+    """
+    Foods of a CSV bulk download in fdc_id order, shaped like /food/{fdcId}
+    responses. Nutrients are only loaded for foods of nutrient_types.
+    """
+    with tempfile.TemporaryDirectory(prefix='fdc_index_', dir=index_dir) as temp_dir:
+        conn = sqlite3.connect(str(Path(temp_dir) / 'index.sqlite'))
+        try:
+            counts = _build_csv_index(source, conn, nutrient_types, log)
+            log("  Indexed " + ', '.join(f"{count} {table}" for table, count in counts.items()))
+
+            foods = conn.execute(
+                "SELECT f.fdc_id, f.data_type, f.description, "
+                "COALESCE(b.category, s.category, f.category), "
+                "b.serving_size, b.serving_unit, b.household FROM food f "
+                "LEFT JOIN branded b ON b.fdc_id = f.fdc_id "
+                "LEFT JOIN survey s ON s.fdc_id = f.fdc_id ORDER BY f.fdc_id")
+            portions = _groups(conn.cursor().execute(
+                "SELECT fdc_id, amount, unit, description, modifier, gram_weight "
+                "FROM portion ORDER BY fdc_id, seq, id"))
+            nutrients = _groups(conn.cursor().execute(
+                "SELECT fdc_id, nutrient_id, amount FROM nutrient ORDER BY fdc_id, nutrient_id"))
+
+            for row, (food_portions, food_nutrients) in _merge(foods, portions, nutrients):
+                fdc_id, data_type, description, category, size, unit, household = row
+                food = {
+                    'fdcId': fdc_id,
+                    'dataType': data_type,
+                    'description': description,
+                    'foodCategory': category or 'Uncategorized',
+                }
+                if size is not None:
+                    food['servingSize'] = size
+                if unit:
+                    food['servingSizeUnit'] = unit
+                if household:
+                    food['householdServingFullText'] = household
+                if food_portions:
+                    food['foodPortions'] = [
+                        {'amount': amount, 'measureUnit': {'name': unit_name or ''},
+                         'portionDescription': portion_description or '',
+                         'modifier': modifier or '', 'gramWeight': grams}
+                        for _, amount, unit_name, portion_description, modifier, grams
+                        in food_portions]
+                if food_nutrients:
+                    food['foodNutrients'] = [{'nutrient': {'id': nutrient_id}, 'amount': amount}
+                                             for _, nutrient_id, amount in food_nutrients]
+                yield food
+        finally:
+            conn.close()
+
+
+def normalize_json_food(food: dict) -> dict:
+    """Flatten the JSON downloads' category fields into foodCategory"""
+    category = food.get('foodCategory')
+    if isinstance(category, dict):
+        category = category.get('description')
+    if not category:
+        wweia = food.get('wweiaFoodCategory') or {}
+        category = (wweia.get('wweiaFoodCategoryDescription')
+                    or food.get('brandedFoodCategory'))
+    food['foodCategory'] = category or 'Uncategorized'
+    return food
+
+
+def iter_json_foods(source: BulkSource) -> Iterator[dict]:
+    """Foods of every JSON file in a bulk download, parsed one at a time"""
+    for name in source.json_files():
+        with source.open(name) as f:
+            for food in iter_json_array(f):
+                if isinstance(food, dict):
+                    yield normalize_json_food(food)
+
+
+def iter_bulk_foods(path: str, nutrient_types: Optional[set] = None,
+                    index_dir: Optional[str] = None, log=print) -> Iterator[dict]:
+    """
+    Foods of a bulk download (CSV or JSON), shaped like /food/{fdcId} responses
+
+    Args:
+        path: Extracted download directory, the downloaded .zip, or one JSON file
+        nutrient_types: dataTypes whose foodNutrients are needed (CSV only;
+            the JSON downloads always include them)
+        index_dir: Where the temporary CSV join index goes (default: system temp)
+        log: Progress callback
+    """
+    source = BulkSource(path)
+    try:
+        if source.has('food.csv'):
+            log(f"Reading FoodData Central CSV download: {path}")
+            yield from iter_csv_foods(source, nutrient_types, index_dir, log)
+        elif source.json_files():
+            log(f"Reading FoodData Central JSON download: {path}")
+            yield from iter_json_foods(source)
+        else:
+            raise ValueError(f"No food.csv or JSON files in {path}")
+    finally:
+        source.close()
+
+
+def nutrient_amounts(food: dict) -> Dict[str, float]:
+    """simple_ingredients nutrient columns of a food, per 100 g"""
+    by_id = {}
+    for entry in food.get('foodNutrients', []):
+        nutrient = entry.get('nutrient') or {}
+        nutrient_id = nutrient.get('id')
+        amount = entry.get('amount')
+        if nutrient_id in WANTED_NUTRIENTS and amount is not None:
+            by_id[nutrient_id] = amount
+    amounts = {}
+    for column, ids in NUTRIENT_IDS.items():
+        for nutrient_id in ids:
+            if nutrient_id in by_id:
+                amounts[column] = by_id[nutrient_id]
+                break
+    return amounts
+
+
+def ingredient_row(food: dict) -> Optional[list]:
+    """A simple_ingredients CSV row for a food, or None if it has no energy value"""
+    amounts = nutrient_amounts(food)
+    if 'calories' not in amounts:
+        return None
+    description = ' '.join((food.get('description') or '').split())[:NAME_LENGTH]
+    if not description:
+        return None
+    category = food.get('foodCategory') or 'Uncategorized'
+    values = {
+        'fdc_id': food.get('fdcId', ''),
+        'name': description.lower(),
+        'display_name': description,
+        'category': SIMPLE_CATEGORIES.get(category, category.lower())[:100],
+        'serving_quantity': 100,
+        'serving_unit': 'g',
+        'is_active': 'true',
+    }
+    for column, amount in amounts.items():
+        values[column] = f"{amount:.2f}".rstrip('0').rstrip('.')
+    return [values.get(column, '') for column in INGREDIENT_COLUMNS]
+
+
+class IngredientCsvWriter:
+    """Writes foods as simple_ingredients CSV rows (gzip/zstd by file suffix)"""
+
+    def __init__(self, path: str, data_types=DEFAULT_INGREDIENT_TYPES):
+        self.path = path
+        self.data_types = set(data_types)
+        self.file = open_stream(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(INGREDIENT_COLUMNS)
+        self.written = 0
+        self.skipped = 0
+
+    def write(self, food: dict):
+        if food.get('dataType') not in self.data_types:
+            return
+        row = ingredient_row(food)
+        if row is None:
+            self.skipped += 1
+        else:
+            self.writer.writerow(row)
+            self.written += 1
+
+    def close(self):
+        self.file.close()
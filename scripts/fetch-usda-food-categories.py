@@ -7,68 +7,271 @@ from the USDA FoodData Central API to create a USDA-compliant mapping.
 
 Usage:
     python3 fetch-usda-food-categories.py [API_KEY]
+    python3 fetch-usda-food-categories.py [API_KEY] --async --concurrency 8
+    python3 fetch-usda-food-categories.py --bulk FoodData_Central_csv_2024-10-31.zip
 
 If no API_KEY is provided, uses DEMO_KEY (limited to lower rate limits)
 
+With --async, requests run concurrently on aiohttp (pip install aiohttp),
+paced by a token bucket sized to the key's hourly limit. HTTP 429 responses
+pause the bucket until the server's reset time. --base-url points the fetcher
+at another server, e.g. usda_stub_server.py for local testing.
+
+Responses are cached in .usda_response_cache.sqlite (see usda_response_cache.py),
+so a re-run replays from disk; stale entries are revalidated with ETag /
+Last-Modified. --cache-only never touches the network.
+
+With --crawl FOODS.jsonl, every page of every query and data type is walked
+and each food is appended to the JSONL file; a checkpoint beside it lets a
+crash or exhausted quota resume mid-crawl. The portion map is then built by
+streaming the JSONL file (also available on its own with --from-jsonl).
+
+Details (foodPortions with gram weights) for every food found are fetched in
+batches of up to 20 fdcIds per request via the /foods endpoint, skipping ids
+already in the response cache; --no-details turns this off.
+
+With --bulk PATH, everything is built offline from a FoodData Central bulk
+download (CSV or JSON; directory, .zip or single file) instead of the API,
+and a simple_ingredients CSV for csv_to_ingredients_sql.py is written too
+(see fdc_bulk_download.py).
+
 Output: usda_food_categories_portions.json
 """
 
+import argparse
+import asyncio
+import os
+import random
 import sys
 import json
 import time
 import requests
 from collections import defaultdict
-from typing import Dict, List, Set
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from fdc_bulk_download import DEFAULT_INGREDIENT_TYPES, IngredientCsvWriter, iter_bulk_foods
+from household_serving import parse_household_serving
+from pipeline_metrics import Metrics, add_metrics_arguments, report
+from portion_grams import portion_weights
+from usda_response_cache import (
+    DEFAULT_CACHE_PATH,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_TTL,
+    ResponseCache,
+    cache_key,
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # USDA FoodData Central API base URL
 BASE_URL = "https://api.nal.usda.gov/fdc/v1"
 
 # Rate limiting
 REQUESTS_PER_HOUR = 1000  # USDA limit
+DEMO_KEY_REQUESTS_PER_HOUR = 30  # api.data.gov DEMO_KEY limit per IP
 DELAY_BETWEEN_REQUESTS = 3.6  # seconds (to stay under 1000/hour)
 
+# Largest page the search endpoint returns
+MAX_PAGE_SIZE = 200
+# Most fdcIds the /foods endpoint accepts per request
+MAX_DETAIL_BATCH = 20
+
+# Back-off used on 429 when the response carries no reset header
+DEFAULT_RATE_LIMIT_BACKOFF = 60.0
+MAX_RATE_LIMIT_BACKOFF = 3600.0
+
 class USDAFoodDataFetcher:
-    def __init__(self, api_key: str = "DEMO_KEY"):
+    def __init__(self, api_key: str = "DEMO_KEY", cache: Optional[ResponseCache] = None,
+                 cache_only: bool = False, base_url: str = BASE_URL,
+                 fetch_details: bool = True, metrics: Optional[Metrics] = None):
         self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
         self.session = requests.Session()
 
+        # fdcIds seen in search results, in order, for the batched detail fetch
+        self.fetch_details = fetch_details
+        self.detail_ids: List[int] = []
+        self._seen_ids: Set[int] = set()
+        self.details_fetched = 0
+        self.detail_requests = 0
+        # (category, portion) -> [samples, total grams, min, max] per one unit
+        self.gram_weights: Dict[Tuple[str, str], list] = {}
+
+        # Optional response cache; cache_only serves even stale entries and
+        # never makes a request
+        self.cache = cache
+        self.cache_only = cache_only
+        self.last_from_cache = False
+
+        # Request counts and latencies, time spent pacing, stage timings
+        self.metrics = metrics or Metrics('usda_fetch')
+
         # Track categories and their portion sizes
         self.category_portions: Dict[str, Set[str]] = defaultdict(set)
         self.all_portion_units: Set[str] = set()
 
-    def search_foods(self, query: str, data_types: List[str] = None, page_size: int = 50) -> dict:
+    def search_foods(self, query: str, data_types: List[str] = None, page_size: int = 50,
+                     page_number: int = 1) -> dict:
         """Search for foods using the USDA API"""
-        url = f"{BASE_URL}/foods/search"
         params = {
             "api_key": self.api_key,
             "query": query,
             "pageSize": page_size
         }
+        if page_number > 1:
+            params["pageNumber"] = page_number
 
         if data_types:
             params["dataType"] = data_types
 
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._cached_get("/foods/search", params)
         except requests.RequestException as e:
             print(f"Error searching for '{query}': {e}")
             return {}
 
     def get_food_details(self, fdc_id: int) -> dict:
         """Get detailed food information by FDC ID"""
-        url = f"{BASE_URL}/food/{fdc_id}"
         params = {"api_key": self.api_key}
 
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._cached_get(f"/food/{fdc_id}", params)
         except requests.RequestException as e:
             print(f"Error fetching food {fdc_id}: {e}")
             return {}
 
+    def collect_fdc_id(self, food: dict):
+        """Remember a search result's fdcId for the detail fetch"""
+        fdc_id = food.get("fdcId")
+        if self.fetch_details and fdc_id is not None and fdc_id not in self._seen_ids:
+            self._seen_ids.add(fdc_id)
+            self.detail_ids.append(fdc_id)
+
+    def _split_cached_details(self, fdc_ids: List[int], on_food) -> List[int]:
+        """Pass cached details to on_food; returns the ids that still need fetching"""
+        if self.cache is None:
+            return list(fdc_ids)
+        missing = []
+        for fdc_id in fdc_ids:
+            cached = self.cache.get(cache_key(f"/food/{fdc_id}"))
+            if cached is not None and (cached.fresh or self.cache_only):
+                on_food(cached.json())
+            else:
+                missing.append(fdc_id)
+        return missing
+
+    def _store_details(self, url: str, foods: list, on_food):
+        """Cache each food of a /foods response under its own /food/{fdcId} key"""
+        for food in foods:
+            fdc_id = food.get("fdcId")
+            if self.cache is not None and fdc_id is not None:
+                self.cache.put(cache_key(f"/food/{fdc_id}"), f"{url}#{fdc_id}",
+                               json.dumps(food, separators=(',', ':')).encode('utf-8'))
+            on_food(food)
+
+    def fetch_food_details_batch(self, fdc_ids: List[int], on_food):
+        """
+        Fetch details for many foods, up to MAX_DETAIL_BATCH fdcIds per request.
+        Foods already cached are not requested. on_food(food) is called for each.
+        """
+        missing = self._split_cached_details(fdc_ids, on_food)
+        if self.cache_only:
+            return
+        url = f"{self.base_url}/foods"
+        for start in range(0, len(missing), MAX_DETAIL_BATCH):
+            batch = missing[start:start + MAX_DETAIL_BATCH]
+            params = {"api_key": self.api_key, "fdcIds": batch}
+            try:
+                self.detail_requests += 1
+                response = self._get(url, params)
+                response.raise_for_status()
+                self._store_details(url, response.json(), on_food)
+            except requests.RequestException as e:
+                print(f"Error fetching details for {len(batch)} foods: {e}")
+            self._pace(DELAY_BETWEEN_REQUESTS)
+
+    def apply_food_details(self, food: dict):
+        """Add a detailed food's portions and gram weights to the mapping"""
+        self.details_fetched += 1
+        category = food.get("foodCategory", "Uncategorized")
+        if isinstance(category, dict):  # full details nest the category
+            category = category.get("description", "Uncategorized")
+        _, portions = self.extract_portion_info(food)
+        if portions:
+            self.category_portions[category].update(portions)
+            self.all_portion_units.update(portions)
+        for portion, grams in self.extract_gram_weights(food):
+            stats = self.gram_weights.get((category, portion))
+            if stats is None:
+                self.gram_weights[(category, portion)] = [1, grams, grams, grams]
+            else:
+                stats[0] += 1
+                stats[1] += grams
+                stats[2] = min(stats[2], grams)
+                stats[3] = max(stats[3], grams)
+
+    def fetch_collected_details(self):
+        """Fetch details for every fdcId collected from search results"""
+        if not self.fetch_details or not self.detail_ids:
+            return
+        print(f"\nFetching details for {len(self.detail_ids)} foods "
+              f"(up to {MAX_DETAIL_BATCH} per request)...")
+        with self.metrics.stage('details'):
+            self.fetch_food_details_batch(self.detail_ids, self.apply_food_details)
+        print(f"✓ Details for {self.details_fetched} foods in {self.detail_requests} requests")
+
+    def _get(self, url: str, params, headers: Optional[dict] = None) -> requests.Response:
+        """session.get, counted and timed in self.metrics"""
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, headers=headers)
+        except requests.RequestException:
+            self.metrics.count('http_errors')
+            raise
+        finally:
+            self.metrics.count('http_requests')
+            self.metrics.observe('http_request_seconds', time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.metrics.count('http_errors')
+        return response
+
+    def _pace(self, seconds: float):
+        """Sleep to stay under the rate limit, counted as time rate-limited"""
+        self.metrics.count('rate_limited_seconds', seconds)
+        time.sleep(seconds)
+
+    def _cached_get(self, path: str, params: dict) -> dict:
+        """GET base_url + path through the response cache"""
+        url = f"{self.base_url}{path}"
+        self.last_from_cache = False
+        if self.cache is None:
+            response = self._get(url, params)
+            response.raise_for_status()
+            return response.json()
+
+        key = cache_key(path, params)
+        cached = self.cache.get(key)
+        if cached is not None and (cached.fresh or self.cache_only):
+            self.last_from_cache = True
+            return cached.json()
+        if self.cache_only:
+            return {}
+
+        headers = cached.revalidation_headers() if cached is not None else {}
+        response = self._get(url, params, headers)
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(key)
+            return cached.json()
+        response.raise_for_status()
+        self.cache.put(key, url, response.content, response.headers.get('ETag'),
+                       response.headers.get('Last-Modified'))
+        return response.json()
+
     def extract_portion_info(self, food_data: dict) -> tuple:
         """Extract portion size information from food data"""
         portions = set()
@@ -105,29 +308,16 @@ class USDAFoodDataFetcher:
 
         return category, portions
 
+    def extract_gram_weights(self, food_data: dict) -> List[Tuple[str, float]]:
+        """
+        (portion, grams per one portion) pairs from a detailed food's
+        foodPortions, e.g. ("cup", 128.0)
+        """
+        return portion_weights(food_data)
+
     def _parse_household_serving(self, serving_text: str) -> Set[str]:
         """Parse household serving text to extract measurement units"""
-        units = set()
-        serving_lower = serving_text.lower()
-
-        # Common units to look for
-        common_units = [
-            'cup', 'cups', 'tbsp', 'tablespoon', 'tablespoons',
-            'tsp', 'teaspoon', 'teaspoons', 'oz', 'ounce', 'ounces',
-            'lb', 'pound', 'pounds', 'g', 'gram', 'grams',
-            'ml', 'milliliter', 'milliliters', 'liter', 'liters',
-            'fl oz', 'fluid ounce', 'piece', 'pieces', 'slice', 'slices',
-            'serving', 'container', 'package', 'can', 'bottle',
-            'whole', 'half', 'quarter', 'large', 'medium', 'small',
-            'fillet', 'breast', 'thigh', 'drumstick', 'wing',
-            'bowl', 'glass', 'scoop'
-        ]
-
-        for unit in common_units:
-            if unit in serving_lower:
-                units.add(unit)
-
-        return units
+        return set(parse_household_serving(serving_text).units)
 
     def fetch_category_data(self, sample_queries: List[str], data_types: List[str] = None):
         """Fetch food data for sample queries to build category-portion mapping"""
@@ -144,7 +334,7 @@ class USDAFoodDataFetcher:
 
             # Process each food to extract portion info
             for food in foods[:10]:  # Limit to first 10 to avoid rate limits
-                fdc_id = food.get("fdcId")
+                self.collect_fdc_id(food)
                 category = food.get("foodCategory", "Uncategorized")
 
                 # Extract basic portion info from search results
@@ -155,14 +345,109 @@ class USDAFoodDataFetcher:
                     self.all_portion_units.update(portions)
 
                 # Small delay to respect rate limits
-                time.sleep(0.1)
+                if not self.last_from_cache:
+                    self._pace(0.1)
 
-            # Delay between category searches
-            time.sleep(1)
+            # Delay between category searches (replays from the cache need none)
+            if not self.last_from_cache:
+                self._pace(1)
+
+        self.fetch_collected_details()
 
         print(f"\n✓ Completed! Found {len(self.category_portions)} categories")
         print(f"✓ Found {len(self.all_portion_units)} unique portion units")
 
+    def crawl(self, queries: List[str], data_types: Optional[List[str]], jsonl_path: str,
+              page_size: int = MAX_PAGE_SIZE, max_pages: Optional[int] = None,
+              restart: bool = False) -> bool:
+        """
+        Walk every search page for each query and data type, appending foods
+        to jsonl_path and checkpointing after each page
+
+        Args:
+            queries: Search queries
+            data_types: Data types crawled one at a time (None = unfiltered)
+            jsonl_path: Append-only output, one {"query", "dataType", "food"} per line
+            page_size: Foods per page (at most 200)
+            max_pages: Stop each query/data type after this many pages
+            restart: Discard an existing checkpoint and JSONL file
+
+        Returns:
+            True when the crawl is complete, False if it stopped on an error
+            (re-running the same crawl resumes after the last saved page)
+        """
+        plan = crawl_plan(queries, data_types)
+        checkpoint, log = open_crawl(jsonl_path, plan, page_size, max_pages, restart)
+        try:
+            for index, (query, data_type) in enumerate(plan, 1):
+                key = crawl_key(query, data_type)
+                if key in checkpoint.done:
+                    continue
+                page, total = checkpoint.position(key)
+                while total is None or page <= total:
+                    results = self.search_foods(query, data_types=[data_type] if data_type else None,
+                                                page_size=page_size, page_number=page)
+                    if "totalHits" not in results:
+                        return False
+                    total = crawl_total_pages(results, page_size, max_pages)
+                    commit_crawl_page(checkpoint, log, key, query, data_type, page, total,
+                                      results.get("foods", []), f"[{index}/{len(plan)}]")
+                    page += 1
+                    # Stay under REQUESTS_PER_HOUR (use --async to pace exactly)
+                    if not self.last_from_cache:
+                        self._pace(DELAY_BETWEEN_REQUESTS)
+            return True
+        finally:
+            log.close()
+
+    def load_jsonl(self, jsonl_path: str) -> int:
+        """
+        Build the category-portion map by streaming a crawl's JSONL file.
+        Only the portion sets are kept in memory. Returns the foods read.
+        """
+        foods = 0
+        for record in iter_crawl_records(jsonl_path):
+            food = record.get("food", {})
+            self.collect_fdc_id(food)
+            category = food.get("foodCategory", "Uncategorized")
+            _, portions = self.extract_portion_info(food)
+            if portions:
+                self.category_portions[category].update(portions)
+                self.all_portion_units.update(portions)
+            foods += 1
+        return foods
+
+    def load_bulk_download(self, path: str, ingredients_csv: Optional[str] = None,
+                           ingredient_types=DEFAULT_INGREDIENT_TYPES) -> int:
+        """
+        Build the category-portion map and gram weights from a bulk download,
+        without any requests. Returns the foods read.
+
+        Args:
+            path: Bulk download directory, .zip or JSON file
+            ingredients_csv: Also write foods of ingredient_types to this
+                simple_ingredients CSV
+            ingredient_types: dataTypes written to ingredients_csv
+        """
+        writer = IngredientCsvWriter(ingredients_csv, ingredient_types) if ingredients_csv else None
+        nutrient_types = set(ingredient_types) if writer else None
+        foods = 0
+        try:
+            for food in iter_bulk_foods(path, nutrient_types):
+                self.apply_food_details(food)
+                if writer:
+                    writer.write(food)
+                foods += 1
+                if foods % 100_000 == 0:
+                    print(f"  {foods} foods, {len(self.category_portions)} categories")
+        finally:
+            if writer:
+                writer.close()
+        if writer:
+            print(f"✓ Wrote {writer.written} ingredients to {ingredients_csv} "
+                  f"({writer.skipped} without an energy value skipped)")
+        return foods
+
     def generate_output(self) -> dict:
         """Generate the final category-portion mapping"""
         output = {
@@ -181,6 +466,18 @@ class USDAFoodDataFetcher:
         for category, portions in sorted(self.category_portions.items()):
             output["categories"][category] = sorted(list(portions))
 
+        # Grams per portion from food details, for portion_sizes
+        if self.gram_weights:
+            output["metadata"]["foods_with_details"] = self.details_fetched
+            weights = output["portion_gram_weights"] = {}
+            for (category, portion), (samples, total, low, high) in sorted(self.gram_weights.items()):
+                weights.setdefault(category, {})[portion] = {
+                    "grams": round(total / samples, 2),
+                    "min": round(low, 2),
+                    "max": round(high, 2),
+                    "samples": samples,
+                }
+
         return output
 
     def save_to_file(self, filename: str = "usda_food_categories_portions.json"):
@@ -194,16 +491,661 @@ class USDAFoodDataFetcher:
         return filename
 
 
+CRAWL_VERSION = 1
+
+
+def crawl_key(query: str, data_type: Optional[str]) -> str:
+    return f"{query}\t{data_type or ''}"
+
+
+def crawl_plan(queries: List[str], data_types: Optional[List[str]]) -> List[Tuple[str, Optional[str]]]:
+    """Every (query, data type) pair to crawl, in order"""
+    return [(query, data_type) for query in queries for data_type in (data_types or [None])]
+
+
+def crawl_total_pages(results: dict, page_size: int, max_pages: Optional[int]) -> int:
+    """Pages to walk for a search, from its totalHits and the --max-pages cap"""
+    total = -(-int(results.get("totalHits", 0)) // page_size)
+    return min(total, max_pages) if max_pages else total
+
+
+class CrawlCheckpoint:
+    """
+    Position of a crawl, saved atomically after every page.
+
+    ``committed_bytes`` is the length of the JSONL file when the checkpoint
+    was written; anything after it belongs to a page that was not
+    checkpointed and is truncated on resume, so no food is written twice.
+    """
+
+    def __init__(self, path: str, plan_signature: dict):
+        self.path = Path(path)
+        self.plan = plan_signature
+        self.done: Set[str] = set()
+        self.current: Optional[str] = None
+        self.next_page = 1
+        self.total_pages: Optional[int] = None
+        self.committed_bytes = 0
+        self.pages = 0
+        self.foods = 0
+
+    @classmethod
+    def load(cls, path: str, plan_signature: dict) -> "CrawlCheckpoint":
+        checkpoint = cls(path, plan_signature)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != CRAWL_VERSION:
+            raise ValueError(f"Unsupported checkpoint version in {path}: {data.get('version')}")
+        if data.get("plan") != plan_signature:
+            raise ValueError(f"{path} belongs to a crawl with different queries, data types "
+                             f"or page size (use --restart to discard it)")
+        checkpoint.done = set(data.get("done", []))
+        checkpoint.current = data.get("current")
+        checkpoint.next_page = data.get("next_page", 1)
+        checkpoint.total_pages = data.get("total_pages")
+        checkpoint.committed_bytes = data.get("committed_bytes", 0)
+        checkpoint.pages = data.get("pages", 0)
+        checkpoint.foods = data.get("foods", 0)
+        return checkpoint
+
+    def position(self, key: str) -> Tuple[int, Optional[int]]:
+        """(next page, total pages or None) for a query/data type"""
+        if key == self.current:
+            return self.next_page, self.total_pages
+        return 1, None
+
+    def save(self):
+        data = {
+            "version": CRAWL_VERSION,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "plan": self.plan,
+            "done": sorted(self.done),
+            "current": self.current,
+            "next_page": self.next_page,
+            "total_pages": self.total_pages,
+            "committed_bytes": self.committed_bytes,
+            "pages": self.pages,
+            "foods": self.foods,
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def open_crawl(jsonl_path: str, plan: List[Tuple[str, Optional[str]]], page_size: int,
+               max_pages: Optional[int], restart: bool = False):
+    """
+    Load or start the checkpoint for a crawl and open its JSONL file for
+    appending, cut back to the last checkpointed length
+    """
+    checkpoint_path = f"{jsonl_path}.checkpoint.json"
+    signature = {"plan": [list(pair) for pair in plan], "page_size": page_size,
+                 "max_pages": max_pages}
+
+    if not restart and not os.path.exists(checkpoint_path):
+        # Without a checkpoint there is no telling which searches the foods came from
+        if os.path.exists(jsonl_path) and os.path.getsize(jsonl_path) > 0:
+            raise ValueError(f"{jsonl_path} already holds foods but has no checkpoint "
+                             f"(use --restart to overwrite it)")
+
+    if restart or not os.path.exists(checkpoint_path):
+        checkpoint = CrawlCheckpoint(checkpoint_path, signature)
+        log = open(jsonl_path, 'wb')
+        checkpoint.save()
+        return checkpoint, log
+
+    checkpoint = CrawlCheckpoint.load(checkpoint_path, signature)
+    size = os.path.getsize(jsonl_path) if os.path.exists(jsonl_path) else 0
+    if size < checkpoint.committed_bytes:
+        raise ValueError(f"{jsonl_path} is shorter than its checkpoint records "
+                         f"(use --restart to start over)")
+    log = open(jsonl_path, 'ab')
+    log.truncate(checkpoint.committed_bytes)
+    log.seek(checkpoint.committed_bytes)
+    print(f"Resuming crawl: {len(checkpoint.done)}/{len(plan)} searches done, "
+          f"{checkpoint.foods} foods in {jsonl_path}")
+    return checkpoint, log
+
+
+def commit_crawl_page(checkpoint: CrawlCheckpoint, log, key: str, query: str,
+                      data_type: Optional[str], page: int, total: int, foods: List[dict],
+                      label: str = ""):
+    """Append one page of foods to the JSONL file, fsync it, then checkpoint"""
+    lines = [json.dumps({"query": query, "dataType": data_type, "food": food},
+                        ensure_ascii=False, separators=(',', ':')) + "\n"
+             for food in foods]
+    log.write(''.join(lines).encode('utf-8'))
+    log.flush()
+    os.fsync(log.fileno())
+
+    checkpoint.committed_bytes = log.tell()
+    checkpoint.pages += 1
+    checkpoint.foods += len(foods)
+    if page >= total:
+        checkpoint.done.add(key)
+        checkpoint.current = None
+        checkpoint.next_page = 1
+        checkpoint.total_pages = None
+    else:
+        checkpoint.current = key
+        checkpoint.next_page = page + 1
+        checkpoint.total_pages = total
+    checkpoint.save()
+
+    print(f"{label} {query} ({data_type or 'all types'}): "
+          f"page {page}/{max(total, 1)}, {len(foods)} foods")
+
+
+def iter_crawl_records(jsonl_path: str) -> Iterator[dict]:
+    """Stream the records of a crawl's JSONL file, skipping a torn last line"""
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # partially written by an interrupted crawl
+            yield json.loads(line)
+
+
+class TokenBucket:
+    """
+    asyncio token bucket shared by all concurrent requests.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, so with
+    capacity 1 requests go out exactly every 1/rate seconds and a larger
+    capacity allows a burst first. Waiters are served in arrival order. A
+    rate-limited response pauses the bucket until the server's reset time.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now <= self.updated:  # still paused
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent, then take its token"""
+        async with self._lock:
+            while True:
+                now = self.clock()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Send nothing for `seconds`, then restart with an empty bucket"""
+        now = self.clock()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def sync(self, remaining: int):
+        """Never hold more tokens than the server says are left"""
+        self._refill(self.clock())
+        self.tokens = min(self.tokens, remaining)
+
+
+def rate_limit_delay(headers, attempt: int, now: Optional[float] = None) -> float:
+    """
+    Seconds to wait after an HTTP 429, from Retry-After or X-RateLimit-Reset
+    (epoch seconds or seconds from now), else exponential back-off
+    """
+    now = time.time() if now is None else now
+
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+
+    reset = headers.get('X-RateLimit-Reset')
+    if reset:
+        try:
+            reset = float(reset)
+            # Values this large are timestamps rather than a number of seconds
+            return max(0.0, reset - now if reset > 1e9 else reset)
+        except ValueError:
+            pass
+
+    return min(DEFAULT_RATE_LIMIT_BACKOFF * (2 ** attempt), MAX_RATE_LIMIT_BACKOFF)
+
+
+class AsyncUSDAFoodDataFetcher(USDAFoodDataFetcher):
+    """
+    Fetches search results concurrently on aiohttp.
+
+    At most `concurrency` requests are in flight, and all of them draw from
+    one TokenBucket, so the key's hourly limit is used fully without being
+    exceeded. Portion extraction and output are shared with the serial fetcher.
+    """
+
+    def __init__(self, api_key: str = "DEMO_KEY", base_url: str = BASE_URL,
+                 requests_per_hour: Optional[int] = None, burst: int = 1,
+                 concurrency: int = 4, max_retries: int = 5,
+                 cache: Optional[ResponseCache] = None, cache_only: bool = False,
+                 fetch_details: bool = True, metrics: Optional[Metrics] = None):
+        if aiohttp is None:
+            print("Error: aiohttp is required for --async (pip install aiohttp)")
+            sys.exit(1)
+
+        super().__init__(api_key, cache=cache, cache_only=cache_only, base_url=base_url,
+                         fetch_details=fetch_details, metrics=metrics)
+        if requests_per_hour is None:
+            requests_per_hour = (DEMO_KEY_REQUESTS_PER_HOUR if api_key == "DEMO_KEY"
+                                 else REQUESTS_PER_HOUR)
+        self.requests_per_hour = requests_per_hour
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+        self.requests_sent = 0
+        self.rate_limited = 0
+        self.bucket = None
+        self._http = None
+
+    async def _get_json(self, path: str, params: list, label: str, store: bool = True):
+        """
+        GET base_url + path, honouring the bucket and retrying 429s and 5xx.
+        Fresh cache entries are returned without a request or a token;
+        store=False bypasses the cache (the caller caches the parts itself).
+        """
+        url = f"{self.base_url}{path}"
+        key = cache_key(path, params)
+        cached = self.cache.get(key) if self.cache is not None and store else None
+        if cached is not None and (cached.fresh or self.cache_only):
+            return cached.json()
+        if self.cache_only:
+            return {}
+        headers = cached.revalidation_headers() if cached is not None else {}
+
+        params = [("api_key", self.api_key)] + params
+        attempt = 0
+
+        while True:
+            start = time.perf_counter()
+            await self.bucket.acquire()
+            self.metrics.count('rate_limited_seconds', time.perf_counter() - start)
+            self.requests_sent += 1
+            start = time.perf_counter()
+            responded = False
+            try:
+                async with self._http.get(url, params=params, headers=headers) as response:
+                    # Latency to the response headers; 5xx back-off sleeps come after
+                    responded = True
+                    self.metrics.count('http_requests')
+                    self.metrics.observe('http_request_seconds', time.perf_counter() - start)
+                    remaining = response.headers.get('X-RateLimit-Remaining')
+                    if remaining is not None and remaining.isdigit():
+                        self.bucket.sync(int(remaining))
+
+                    if response.status >= 400:
+                        self.metrics.count('http_errors')
+                    if response.status == 429:
+                        self.rate_limited += 1
+                        self.metrics.count('http_rate_limited')
+                        delay = rate_limit_delay(response.headers, attempt)
+                        self.bucket.pause(delay)
+                        if attempt >= self.max_retries:
+                            print(f"Error: Rate limited on '{label}', giving up")
+                            return {}
+                        print(f"  Rate limited on '{label}', pausing {delay:.0f}s")
+                        attempt += 1
+                        continue
+
+                    if response.status >= 500 and attempt < self.max_retries:
+                        attempt += 1
+                        await asyncio.sleep(min(2 ** attempt, 60) * (1 + random.random()) / 2)
+                        continue
+
+                    if response.status == 304 and cached is not None:
+                        self.cache.refresh(key)
+                        return cached.json()
+
+                    response.raise_for_status()
+                    body = await response.read()
+                    if self.cache is not None and store:
+                        self.cache.put(key, url, body, response.headers.get('ETag'),
+                                       response.headers.get('Last-Modified'))
+                    return json.loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not responded:
+                    self.metrics.count('http_requests')
+                    self.metrics.observe('http_request_seconds', time.perf_counter() - start)
+                if not isinstance(e, aiohttp.ClientResponseError):  # statuses are counted above
+                    self.metrics.count('http_errors')
+                if isinstance(e, aiohttp.ClientResponseError) or attempt >= self.max_retries:
+                    print(f"Error fetching '{label}': {e}")
+                    return {}
+                attempt += 1
+                await asyncio.sleep(min(2 ** attempt, 60) * (1 + random.random()) / 2)
+
+    async def search_foods_async(self, query: str, data_types: List[str] = None,
+                                 page_size: int = 50, page_number: int = 1) -> dict:
+        """Search for foods using the USDA API (async)"""
+        params = [("query", query), ("pageSize", str(page_size))]
+        if page_number > 1:
+            params.append(("pageNumber", str(page_number)))
+        for data_type in data_types or []:
+            params.append(("dataType", data_type))
+        return await self._get_json("/foods/search", params, query)
+
+    async def fetch_food_details_batch_async(self, fdc_ids: List[int], on_food):
+        """fetch_food_details_batch() with the batches sent concurrently"""
+        missing = self._split_cached_details(fdc_ids, on_food)
+        if self.cache_only:
+            return
+        url = f"{self.base_url}/foods"
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(batch: List[int]):
+            async with limit:
+                self.detail_requests += 1
+                return await self._get_json("/foods", [("fdcIds", str(i)) for i in batch],
+                                            f"details for {len(batch)} foods", store=False)
+
+        tasks = [asyncio.ensure_future(fetch(missing[start:start + MAX_DETAIL_BATCH]))
+                 for start in range(0, len(missing), MAX_DETAIL_BATCH)]
+        for task in asyncio.as_completed(tasks):
+            foods = await task
+            if isinstance(foods, list):
+                self._store_details(url, foods, on_food)
+
+    async def _fetch_collected_details_async(self):
+        if not self.fetch_details or not self.detail_ids:
+            return
+        print(f"\nFetching details for {len(self.detail_ids)} foods "
+              f"(up to {MAX_DETAIL_BATCH} per request)...")
+        with self.metrics.stage('details'):
+            await self.fetch_food_details_batch_async(self.detail_ids, self.apply_food_details)
+        print(f"✓ Details for {self.details_fetched} foods in {self.detail_requests} requests")
+
+    def fetch_food_details_batch(self, fdc_ids: List[int], on_food):
+        async def run():
+            self.bucket = TokenBucket(self.requests_per_hour / 3600.0, capacity=self.burst)
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as self._http:
+                await self.fetch_food_details_batch_async(fdc_ids, on_food)
+        asyncio.run(run())
+
+    def _collect(self, results: dict):
+        for food in results.get("foods", [])[:10]:  # Same sample as the serial fetch
+            self.collect_fdc_id(food)
+            category = food.get("foodCategory", "Uncategorized")
+            _, portions = self.extract_portion_info(food)
+            if portions:
+                self.category_portions[category].update(portions)
+                self.all_portion_units.update(portions)
+
+    async def fetch_category_data_async(self, sample_queries: List[str],
+                                        data_types: List[str] = None):
+        """Fetch food data for sample queries concurrently, at the key's rate limit"""
+        print(f"Fetching USDA food data for {len(sample_queries)} categories "
+              f"({self.concurrency} concurrent, {self.requests_per_hour} requests/hour)...")
+
+        self.bucket = TokenBucket(self.requests_per_hour / 3600.0, capacity=self.burst)
+        limit = asyncio.Semaphore(self.concurrency)
+        start = time.monotonic()
+
+        async def search(query: str):
+            async with limit:
+                return query, await self.search_foods_async(query, data_types=data_types,
+                                                            page_size=25)
+
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as self._http:
+            tasks = [asyncio.ensure_future(search(query)) for query in sample_queries]
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                query, results = await task
+                print(f"[{done}/{len(sample_queries)}] {query}: "
+                      f"{len(results.get('foods', []))} foods")
+                self._collect(results)
+            await self._fetch_collected_details_async()
+
+        elapsed = time.monotonic() - start
+        print(f"\n✓ Completed! Found {len(self.category_portions)} categories")
+        print(f"✓ Found {len(self.all_portion_units)} unique portion units")
+        print(f"✓ {self.requests_sent} requests in {elapsed:.1f}s "
+              f"({self.rate_limited} rate limited)")
+
+    def fetch_category_data(self, sample_queries: List[str], data_types: List[str] = None):
+        asyncio.run(self.fetch_category_data_async(sample_queries, data_types))
+
+    async def crawl_async(self, queries: List[str], data_types: Optional[List[str]],
+                          jsonl_path: str, page_size: int = MAX_PAGE_SIZE,
+                          max_pages: Optional[int] = None, restart: bool = False) -> bool:
+        """
+        Concurrent crawl(): once a search's first page gives its page count,
+        the remaining pages are fetched `concurrency` at a time but written
+        and checkpointed strictly in page order
+        """
+        plan = crawl_plan(queries, data_types)
+        checkpoint, log = open_crawl(jsonl_path, plan, page_size, max_pages, restart)
+        self.bucket = TokenBucket(self.requests_per_hour / 3600.0, capacity=self.burst)
+        timeout = aiohttp.ClientTimeout(total=60)
+
+        async def fetch(query, data_type, page):
+            return await self.search_foods_async(
+                query, data_types=[data_type] if data_type else None,
+                page_size=page_size, page_number=page)
+
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as self._http:
+                for index, (query, data_type) in enumerate(plan, 1):
+                    key = crawl_key(query, data_type)
+                    if key in checkpoint.done:
+                        continue
+                    label = f"[{index}/{len(plan)}]"
+                    page, total = checkpoint.position(key)
+
+                    if total is None:
+                        results = await fetch(query, data_type, page)
+                        if "totalHits" not in results:
+                            return False
+                        total = crawl_total_pages(results, page_size, max_pages)
+                        commit_crawl_page(checkpoint, log, key, query, data_type, page, total,
+                                          results.get("foods", []), label)
+                        page += 1
+
+                    in_flight = []
+                    try:
+                        while page <= total or in_flight:
+                            while page <= total and len(in_flight) < self.concurrency * 2:
+                                in_flight.append(
+                                    (page, asyncio.ensure_future(fetch(query, data_type, page))))
+                                page += 1
+                            done_page, task = in_flight.pop(0)
+                            results = await task
+                            if "totalHits" not in results:
+                                return False
+                            commit_crawl_page(checkpoint, log, key, query, data_type, done_page,
+                                              total, results.get("foods", []), label)
+                    finally:
+                        for _, task in in_flight:
+                            task.cancel()
+            return True
+        finally:
+            log.close()
+            print(f"✓ {self.requests_sent} requests ({self.rate_limited} rate limited)")
+
+    def crawl(self, queries: List[str], data_types: Optional[List[str]], jsonl_path: str,
+              page_size: int = MAX_PAGE_SIZE, max_pages: Optional[int] = None,
+              restart: bool = False) -> bool:
+        return asyncio.run(self.crawl_async(queries, data_types, jsonl_path, page_size,
+                                            max_pages, restart))
+
+
+def print_summary(fetcher: USDAFoodDataFetcher):
+    """Print the summary of a finished run"""
+    print("\n" + "="*60)
+    print("SUMMARY")
+    print("="*60)
+
+    output = fetcher.generate_output()
+    print(f"Total Categories: {output['metadata']['total_categories']}")
+    print(f"Total Portion Units: {output['metadata']['total_portion_units']}")
+
+    print("\nSample Categories:")
+    for category in list(output['categories'].keys())[:10]:
+        portions = output['categories'][category]
+        print(f"  • {category}: {len(portions)} portion types")
+
+    print(f"\nAll Portion Units Found:")
+    print(f"  {', '.join(output['all_portion_units'][:20])}...")
+
+    if output.get('portion_gram_weights'):
+        print(f"\nGram weights from {output['metadata']['foods_with_details']} detailed foods:")
+        for category, weights in list(output['portion_gram_weights'].items())[:5]:
+            sample = ', '.join(f"{portion} = {w['grams']:g} g"
+                               for portion, w in list(weights.items())[:3])
+            print(f"  • {category}: {sample}")
+
+
+def report_run(fetcher: USDAFoodDataFetcher, cache: Optional[ResponseCache],
+               metrics_path: Optional[str]):
+    """Add the run's totals and cache statistics to its metrics and report them"""
+    metrics = fetcher.metrics
+    metrics.count('categories', len(fetcher.category_portions))
+    metrics.count('foods_with_details', fetcher.details_fetched)
+    metrics.count('detail_requests', fetcher.detail_requests)
+    if cache is not None:
+        metrics.count('cache_hits', cache.hits)
+        metrics.count('cache_misses', cache.misses)
+        metrics.count('cache_stale', cache.stale)
+        metrics.count('cache_revalidated', cache.revalidated)
+    report(metrics, metrics_path)
+
+
 def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch USDA food categories and their portion sizes",
+        epilog="Example:\n  python3 fetch-usda-food-categories.py YOUR_API_KEY --async --concurrency 8\n"
+               "  python3 fetch-usda-food-categories.py --async --base-url http://127.0.0.1:8089/fdc/v1",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
     # Get API key from command line or use DEMO_KEY
-    api_key = sys.argv[1] if len(sys.argv) > 1 else "DEMO_KEY"
+    parser.add_argument('api_key', nargs='?', default="DEMO_KEY",
+                        help="FoodData Central API key (default: DEMO_KEY)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Fetch concurrently with a shared rate limiter (needs aiohttp)")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="Requests in flight with --async (default: 4)")
+    parser.add_argument('--requests-per-hour', type=int,
+                        help=f"Rate limit with --async (default: {REQUESTS_PER_HOUR}, "
+                             f"{DEMO_KEY_REQUESTS_PER_HOUR} for DEMO_KEY)")
+    parser.add_argument('--burst', type=int, default=1,
+                        help="Requests that may be sent back to back before pacing "
+                             "starts (default: 1)")
+    parser.add_argument('--base-url', default=BASE_URL,
+                        help=f"API base URL (default: {BASE_URL})")
+    parser.add_argument('--output', default="usda_food_categories_portions.json",
+                        help="Output JSON file (default: usda_food_categories_portions.json)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, metavar='PATH',
+                        help=f"Response cache file (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--no-cache', action='store_true', help="Do not cache responses")
+    parser.add_argument('--cache-ttl-hours', type=float, default=DEFAULT_TTL / 3600,
+                        help=f"Hours a cached response is used without revalidation "
+                             f"(default: {DEFAULT_TTL // 3600})")
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024),
+                        help=f"Cache size before least recently used entries are evicted "
+                             f"(default: {DEFAULT_MAX_BYTES // (1024 * 1024)})")
+    parser.add_argument('--cache-only', action='store_true',
+                        help="Replay cached responses (even expired ones) and make no requests")
+    parser.add_argument('--crawl', metavar='FOODS_JSONL',
+                        help="Walk every page of every query and data type, streaming foods "
+                             "to this JSONL file (resumable)")
+    parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE,
+                        help=f"Foods per page with --crawl (default: {MAX_PAGE_SIZE})")
+    parser.add_argument('--max-pages', type=int,
+                        help="With --crawl, pages per query and data type (default: all)")
+    parser.add_argument('--restart', action='store_true',
+                        help="With --crawl, discard the checkpoint and start over")
+    parser.add_argument('--from-jsonl', metavar='FOODS_JSONL',
+                        help="Build the portion map from a crawl's JSONL file, without fetching "
+                             "(food details come from the cache only)")
+    parser.add_argument('--no-details', action='store_true',
+                        help="Skip the batched food detail fetch (no gram weights)")
+    parser.add_argument('--bulk', metavar='PATH',
+                        help="Build everything offline from a FoodData Central bulk download "
+                             "(CSV or JSON directory, .zip or file)")
+    parser.add_argument('--ingredients-csv', default="usda_simple_ingredients.csv",
+                        help="simple_ingredients CSV written with --bulk "
+                             "(default: usda_simple_ingredients.csv)")
+    parser.add_argument('--ingredient-types', nargs='+', default=list(DEFAULT_INGREDIENT_TYPES),
+                        metavar='DATA_TYPE',
+                        help="Data types written to --ingredients-csv "
+                             f"(default: {' '.join(repr(t) for t in DEFAULT_INGREDIENT_TYPES)})")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    api_key = args.api_key
+    if args.concurrency < 1 or args.burst < 1:
+        parser.error("--concurrency and --burst must be at least 1")
+    if args.requests_per_hour is not None and args.requests_per_hour < 1:
+        parser.error("--requests-per-hour must be at least 1")
+    if args.cache_only and args.no_cache:
+        parser.error("--cache-only and --no-cache are mutually exclusive")
+    if sum(bool(mode) for mode in (args.crawl, args.from_jsonl, args.bulk)) > 1:
+        parser.error("--crawl, --from-jsonl and --bulk are mutually exclusive")
+    if not 1 <= args.page_size <= MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {MAX_PAGE_SIZE}")
+
+    metrics = Metrics.from_args('usda_fetch', args)
+
+    if args.bulk:
+        fetcher = USDAFoodDataFetcher(api_key, metrics=metrics)
+        start = time.monotonic()
+        try:
+            with metrics.stage('bulk'):
+                foods = fetcher.load_bulk_download(args.bulk, args.ingredients_csv,
+                                                   args.ingredient_types)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        metrics.count('foods', foods)
+        print(f"✓ Built portion map from {foods} foods in {args.bulk} "
+              f"({time.monotonic() - start:.1f}s)")
+        with metrics.stage('save'):
+            fetcher.save_to_file(args.output)
+        print_summary(fetcher)
+        report_run(fetcher, None, args.metrics)
+        return
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache, ttl=args.cache_ttl_hours * 3600,
+                              max_bytes=int(args.cache_max_mb * 1024 * 1024))
 
     if api_key == "DEMO_KEY":
         print("⚠️  Using DEMO_KEY - rate limits are lower!")
         print("   Sign up for a free API key at: https://fdc.nal.usda.gov/api-key-signup/\n")
 
     # Initialize fetcher
-    fetcher = USDAFoodDataFetcher(api_key)
+    if args.use_async:
+        fetcher = AsyncUSDAFoodDataFetcher(api_key, base_url=args.base_url,
+                                           requests_per_hour=args.requests_per_hour,
+                                           burst=args.burst, concurrency=args.concurrency,
+                                           cache=cache, cache_only=args.cache_only,
+                                           fetch_details=not args.no_details, metrics=metrics)
+    else:
+        fetcher = USDAFoodDataFetcher(api_key, cache=cache, cache_only=args.cache_only,
+                                      base_url=args.base_url, fetch_details=not args.no_details,
+                                      metrics=metrics)
 
     # Sample queries covering major food categories
     # These are designed to broadly sample the USDA food database
@@ -245,30 +1187,49 @@ def main():
     ]
 
     # Fetch data from USDA (use Foundation and SR Legacy for most comprehensive data)
-    fetcher.fetch_category_data(
-        sample_queries,
-        data_types=["Foundation", "SR Legacy", "Survey (FNDDS)", "Branded"]
-    )
-
-    # Save results
-    output_file = fetcher.save_to_file()
-
-    # Print summary
-    print("\n" + "="*60)
-    print("SUMMARY")
-    print("="*60)
-
-    output = fetcher.generate_output()
-    print(f"Total Categories: {output['metadata']['total_categories']}")
-    print(f"Total Portion Units: {output['metadata']['total_portion_units']}")
+    data_types = ["Foundation", "SR Legacy", "Survey (FNDDS)", "Branded"]
+    if args.from_jsonl:
+        with metrics.stage('load_jsonl'):
+            foods = fetcher.load_jsonl(args.from_jsonl)
+        print(f"✓ Built portion map from {foods} foods in {args.from_jsonl}")
+        fetcher.cache_only = True
+        fetcher.fetch_collected_details()
+    elif args.crawl:
+        try:
+            with metrics.stage('crawl'):
+                complete = fetcher.crawl(sample_queries, data_types, args.crawl,
+                                         page_size=args.page_size, max_pages=args.max_pages,
+                                         restart=args.restart)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if not complete:
+            if cache is not None:
+                print(cache.summary())
+            report_run(fetcher, cache, args.metrics)
+            if cache is not None:
+                cache.close()
+            print(f"\nCrawl stopped early; re-run the same command to resume from "
+                  f"{args.crawl}.checkpoint.json")
+            sys.exit(1)
+        with metrics.stage('load_jsonl'):
+            foods = fetcher.load_jsonl(args.crawl)
+        print(f"✓ Built portion map from {foods} foods in {args.crawl}")
+        fetcher.fetch_collected_details()
+    else:
+        with metrics.stage('search'):
+            fetcher.fetch_category_data(sample_queries, data_types=data_types)
 
-    print("\nSample Categories:")
-    for category in list(output['categories'].keys())[:10]:
-        portions = output['categories'][category]
-        print(f"  • {category}: {len(portions)} portion types")
+    if cache is not None:
+        print(cache.summary())
 
-    print(f"\nAll Portion Units Found:")
-    print(f"  {', '.join(output['all_portion_units'][:20])}...")
+    # Save results
+    with metrics.stage('save'):
+        fetcher.save_to_file(args.output)
+    print_summary(fetcher)
+    report_run(fetcher, cache, args.metrics)
+    if cache is not None:
+        cache.close()
 
 
 if __name__ == "__main__":
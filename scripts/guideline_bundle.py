@@ -0,0 +1,1676 @@
+#!/usr/bin/env python3
+"""
+Compiled Nutrition Guideline Bundle
+Builds one versioned JSON file holding the EER formulas, PAL values, macro
+guidelines and micronutrient guidelines, so guideline resolution can be
+served from a file instead of several database queries per request.
+
+The guideline tables are filled only by seed migrations (005-037). The
+bundle is built either by replaying those migrations here with a small SQL
+evaluator (no database needed), or by reading the tables from a Postgres
+that has them applied (--dsn). The replay understands the subset of SQL the
+migrations use: INSERT ... VALUES [ON CONFLICT], UPDATE ... SET ... WHERE,
+DELETE, TRUNCATE, CREATE/DROP TABLE and ALTER TABLE ADD COLUMN/UNIQUE, with
+expressions such as LOWER(), jsonb_set() and ::jsonb casts. Statements on
+other tables, comments, indexes, functions and triggers are skipped; any
+statement that writes a guideline table in a way it cannot evaluate stops
+the build instead of silently producing different rows.
+
+Every lookup the app makes is keyed by an exact match (country, gender and,
+for micronutrients, the pregnancy/lactation/activity condition) plus an age
+inside [age_min, age_max]. For each key the build cuts the age axis at every
+age_min/age_max into bands and stores which row wins in each band, using
+the same rule as the query it replaces. A lookup is then a dict access and
+one binary search over the band bounds.
+
+Requires psycopg2 only with --dsn (pip install psycopg2-binary).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from bisect import bisect_left
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from split_sql_file import iter_sql_statements
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+BUNDLE_FORMAT = 'nutrition-guidelines'
+FORMAT_VERSION = 1
+DEFAULT_MIGRATIONS = Path(__file__).resolve().parent.parent / 'database' / 'migrations'
+DEFAULT_SCHEMA = DEFAULT_MIGRATIONS.parent / 'schema-complete.sql'
+
+GUIDELINE_TABLES = ('eer_formulas', 'pal_values', 'macro_guidelines',
+                    'micronutrient_guidelines_flexible', 'country_micronutrient_mappings')
+# Bookkeeping columns that differ on every replay and no lookup reads
+SKIPPED_COLUMNS = ('created_at', 'updated_at')
+KEY_SEPARATOR = '|'
+
+# Micronutrient conditions, in the order FlexibleMicronutrientService tries them
+PREGNANCY = 'pregnancy'
+LACTATION = 'lactation'
+GENERAL = 'general'          # notes IS NULL
+NOTED = 'noted'              # notes set, but not pregnancy/lactation
+ACTIVITY_NOTES = {           # activity level -> notes ILIKE pattern
+    'moderately_active': 'moderate',
+    'very_active': 'heavy',
+    'sedentary': 'sedentary',
+}
+MACRO_FALLBACK_COUNTRY = 'usa'
+
+
+class ReplayError(ValueError):
+    """A migration statement the replay cannot evaluate the way Postgres would"""
+
+
+# ---------------------------------------------------------------------------
+# SQL tokens
+# ---------------------------------------------------------------------------
+
+TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<estring>[Ee]'(?:[^'\\]|\\.|'')*')
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$)
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||->>|->|\#>>|\#>|[(),;=<>+\-*/.\[\]%])
+  | (?P<other>\S)
+""", re.S | re.X)
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+
+def tokenize(sql: str) -> List[Tuple[str, object]]:
+    """
+    (kind, value) tokens of one statement, without whitespace and comments.
+
+    Unquoted identifiers are folded to lower case, as Postgres does; strings
+    and quoted identifiers keep theirs. Kinds: ident, name (quoted
+    identifier), string, number, op. Characters the evaluator has no use
+    for (~, @, ...) come through as single-character ops, so only statements
+    on guideline tables that use them fail.
+    """
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        match = TOKEN.match(sql, pos)
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group(0)
+        if kind in ('space', 'comment'):
+            continue
+        if kind == 'string':
+            tokens.append(('string', text[1:-1].replace("''", "'")))
+        elif kind == 'estring':
+            body = text[2:-1].replace("''", "'")
+            tokens.append(('string', re.sub(r'\\(.)', lambda m: ESCAPES.get(m.group(1), m.group(1)),
+                                            body)))
+        elif kind == 'dollar':
+            tag_length = text.index('$', 1) + 1
+            tokens.append(('string', text[tag_length:-tag_length]))
+        elif kind == 'qident':
+            tokens.append(('name', text[1:-1].replace('""', '"')))
+        elif kind == 'number':
+            is_float = any(c in text for c in '.eE')
+            tokens.append(('number', float(text) if is_float else int(text)))
+        elif kind == 'ident':
+            tokens.append(('ident', text.lower()))
+        else:
+            tokens.append(('op', text))
+    return tokens
+
+
+# ---------------------------------------------------------------------------
+# Values
+# ---------------------------------------------------------------------------
+
+def _number(value):
+    """A SQL value as a Python number (or None), casting strings as Postgres would"""
+    if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    raise ReplayError(f"invalid input syntax for a number: {value!r}")
+
+
+def _json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            raise ReplayError(f"invalid input syntax for type json: {e}")
+    return value
+
+
+def _text_array(value):
+    """'{a,b}' array literal (or a list) as a list of strings"""
+    if value is None or isinstance(value, list):
+        return value
+    text = str(value).strip()
+    if not (text.startswith('{') and text.endswith('}')):
+        raise ReplayError(f"malformed array literal: {value!r}")
+    body = text[1:-1].strip()
+    if not body:
+        return []
+    items = re.findall(r'"((?:[^"\\]|\\.)*)"|([^,]+)', body)
+    return [quoted.replace('\\"', '"') if quoted else bare.strip() for quoted, bare in items]
+
+
+def _round_half_up(value: float, scale: int) -> float:
+    return float(Decimal(repr(value)).quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP))
+
+
+class ColumnType:
+    """
+    How a column stores assigned values.
+
+    Args:
+        name: The SQL type as written (e.g. 'numeric(5,2)', 'jsonb', 'text[]')
+    """
+
+    INTEGER = ('smallint', 'integer', 'int', 'int2', 'int4', 'int8', 'bigint',
+               'serial', 'bigserial', 'smallserial')
+    NUMERIC = ('numeric', 'decimal')
+    FLOAT = ('real', 'float4', 'float8', 'float', 'double')
+    JSON = ('json', 'jsonb')
+    BOOLEAN = ('boolean', 'bool')
+
+    def __init__(self, name: str):
+        self.name = name
+        base = re.match(r'[a-z0-9_]+', name)
+        self.base = base.group(0) if base else name
+        self.array = name.endswith('[]')
+        scale = re.match(r'(?:numeric|decimal)\s*\(\s*\d+\s*,\s*(\d+)\s*\)', name)
+        self.scale = int(scale.group(1)) if scale else None
+
+    def coerce(self, value):
+        """value as stored in a column of this type"""
+        if value is None:
+            return None
+        if self.array:
+            return _text_array(value)
+        if self.base in self.JSON:
+            return _json(value)
+        if self.base in self.INTEGER:
+            number = _number(value)
+            return int(Decimal(repr(number)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        if self.base in self.NUMERIC:
+            number = _number(value)
+            if self.scale is not None:
+                return _round_half_up(number, self.scale)
+            return number
+        if self.base in self.FLOAT:
+            return float(_number(value))
+        if self.base in self.BOOLEAN:
+            if isinstance(value, str):
+                return value.strip().lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+            return bool(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value) if not isinstance(value, str) else value
+
+
+def _cast(value, type_name: str):
+    return ColumnType(type_name).coerce(value)
+
+
+def _compare(a, b) -> Optional[int]:
+    if a is None or b is None:
+        return None
+    if isinstance(a, str) != isinstance(b, str):
+        a, b = _number(a), _number(b)
+    return (a > b) - (a < b)
+
+
+def _like(value, pattern, case_insensitive: bool) -> Optional[bool]:
+    if value is None or pattern is None:
+        return None
+    regex = ''
+    chars = iter(str(pattern))
+    for char in chars:
+        if char == '\\':
+            regex += re.escape(next(chars, '\\'))
+        elif char == '%':
+            regex += '.*'
+        elif char == '_':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+    flags = re.S | (re.I if case_insensitive else 0)
+    return re.fullmatch(regex, str(value), flags) is not None
+
+
+def _and(a, b):
+    if a is False or b is False:
+        return False
+    if a is None or b is None:
+        return None
+    return True
+
+
+def _or(a, b):
+    if a is True or b is True:
+        return True
+    if a is None or b is None:
+        return None
+    return False
+
+
+def _jsonb_set(target, path, value, create_missing=True):
+    if target is None or path is None:
+        return None
+    result = json.loads(json.dumps(_json(target)))
+    keys = _text_array(path)
+    node = result
+    for key in keys[:-1]:
+        if isinstance(node, list):
+            node = node[int(key)]
+        elif key in node:
+            node = node[key]
+        else:
+            return result
+    if isinstance(node, dict) and (create_missing or keys[-1] in node):
+        node[keys[-1]] = _json(value)
+    elif isinstance(node, list):
+        node[int(keys[-1])] = _json(value)
+    return result
+
+
+def _concat_json(a, b):
+    a, b = _json(a), _json(b)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return {**a, **b}
+    return (a if isinstance(a, list) else [a]) + (b if isinstance(b, list) else [b])
+
+
+def _strict(function):
+    """A function that returns NULL when any argument is NULL"""
+    return lambda *args: None if any(arg is None for arg in args) else function(*args)
+
+
+FUNCTIONS = {
+    'lower': _strict(lambda s: str(s).lower()),
+    'upper': _strict(lambda s: str(s).upper()),
+    'trim': _strict(lambda s: str(s).strip()),
+    'initcap': _strict(lambda s: str(s).title()),
+    'coalesce': lambda *args: next((arg for arg in args if arg is not None), None),
+    'nullif': lambda a, b: None if _compare(a, b) == 0 else a,
+    'greatest': lambda *args: max((arg for arg in args if arg is not None), default=None),
+    'least': lambda *args: min((arg for arg in args if arg is not None), default=None),
+    'round': _strict(lambda x, scale=0: _round_half_up(_number(x), int(scale))),
+    'concat': lambda *args: ''.join('' if arg is None else str(arg) for arg in args),
+    'jsonb_set': _jsonb_set,
+    'jsonb_build_object': lambda *args: {str(args[i]): _json(args[i + 1]) if isinstance(args[i + 1], (dict, list)) else args[i + 1]
+                                         for i in range(0, len(args), 2)},
+    # Timestamps are not part of the bundle
+    'now': lambda: None,
+    'current_timestamp': lambda: None,
+    'timezone': lambda *args: None,
+}
+
+NO_PAREN_FUNCTIONS = ('current_timestamp', 'current_date', 'localtimestamp')
+
+# An evaluated expression: row -> value (excluded is the proposed row of ON CONFLICT)
+Expression = Callable[[Optional[dict], Optional[dict]], object]
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+class _Parser:
+    """Recursive-descent parser over one statement's tokens"""
+
+    TYPE_STOP = ('not', 'null', 'default', 'primary', 'unique', 'check', 'references',
+                 'constraint', 'generated', 'collate')
+
+    def __init__(self, tokens: List[Tuple[str, object]]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Tuple[str, object]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else ('end', None)
+
+    def next(self) -> Tuple[str, object]:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def at(self, *values, offset: int = 0) -> bool:
+        kind, value = self.peek(offset)
+        return kind in ('ident', 'op') and value in values
+
+    def accept(self, *values) -> bool:
+        if self.at(*values):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, *values):
+        if not self.accept(*values):
+            raise ReplayError(f"expected {' or '.join(map(str, values))}, got {self.peek()[1]!r}")
+
+    def done(self) -> bool:
+        while self.accept(';'):
+            pass
+        return self.pos >= len(self.tokens)
+
+    def identifier(self) -> str:
+        kind, value = self.next()
+        if kind not in ('ident', 'name'):
+            raise ReplayError(f"expected a name, got {value!r}")
+        return value
+
+    def table_name(self) -> str:
+        name = self.identifier()
+        while self.accept('.'):
+            name = self.identifier()  # schema-qualified: keep the table name
+        return name
+
+    def name_list(self) -> List[str]:
+        self.expect('(')
+        names = [self.identifier()]
+        while self.accept(','):
+            names.append(self.identifier())
+        self.expect(')')
+        return names
+
+    def skip_group(self):
+        """Skip a parenthesised group, nested groups included"""
+        self.expect('(')
+        depth = 1
+        while depth:
+            kind, value = self.next()
+            if kind == 'end':
+                raise ReplayError("unbalanced parentheses")
+            if kind == 'op' and value == '(':
+                depth += 1
+            elif kind == 'op' and value == ')':
+                depth -= 1
+
+    def type_name(self) -> str:
+        """A type as written: words, an optional (precision, scale) and [] suffixes"""
+        words = [self.identifier()]
+        while self.peek()[0] == 'ident' and self.peek()[1] not in self.TYPE_STOP \
+                and words[-1] in ('double', 'character', 'timestamp', 'time', 'with', 'without',
+                                  'varying', 'zone', 'precision', 'time'):
+            words.append(self.identifier())
+        name = ' '.join(words)
+        if self.at('('):
+            start = self.pos
+            self.skip_group()
+            name += '(' + ','.join(str(v) for k, v in self.tokens[start + 1:self.pos - 1]
+                                   if v != ',') + ')'
+        # timestamp(3) with time zone
+        while self.peek()[0] == 'ident' and self.peek()[1] in ('with', 'without', 'time', 'zone'):
+            name += ' ' + self.identifier()
+        while self.accept('['):
+            self.accept(')')
+            self.expect(']')
+            name += '[]'
+        return name
+
+    # Expressions, loosest binding first
+
+    def expression(self) -> Expression:
+        left = self.conjunction()
+        while self.accept('or'):
+            left = (lambda a, b: lambda row, ex: _or(a(row, ex), b(row, ex)))(left, self.conjunction())
+        return left
+
+    def conjunction(self) -> Expression:
+        left = self.negation()
+        while self.accept('and'):
+            left = (lambda a, b: lambda row, ex: _and(a(row, ex), b(row, ex)))(left, self.negation())
+        return left
+
+    def negation(self) -> Expression:
+        if self.accept('not'):
+            inner = self.negation()
+            return lambda row, ex: None if (v := inner(row, ex)) is None else not v
+        return self.comparison()
+
+    def comparison(self) -> Expression:
+        left = self.concatenation()
+        while True:
+            kind, value = self.peek()
+            if kind == 'op' and value in ('=', '<>', '!=', '<', '<=', '>', '>='):
+                self.next()
+                right = self.concatenation()
+                left = self._comparator(left, right, value)
+            elif self.accept('is'):
+                negate = self.accept('not')
+                if self.accept('null'):
+                    test = lambda v: v is None
+                elif self.accept('true'):
+                    test = lambda v: v is True
+                elif self.accept('false'):
+                    test = lambda v: v is False
+                else:
+                    raise ReplayError(f"unsupported IS {self.peek()[1]!r}")
+                left = (lambda a, t, n: lambda row, ex: t(a(row, ex)) != n)(left, test, negate)
+            elif self.at('in', 'like', 'ilike', 'between') or (
+                    self.at('not') and self.at('in', 'like', 'ilike', 'between', offset=1)):
+                negate = self.accept('not')
+                operator = self.next()[1]
+                if operator == 'in':
+                    if self.at('(') and self.at('select', offset=1):
+                        raise ReplayError("IN (SELECT ...) is not supported")
+                    self.expect('(')
+                    items = [self.expression()]
+                    while self.accept(','):
+                        items.append(self.expression())
+                    self.expect(')')
+                    test = (lambda a, items: lambda row, ex: self._in(a(row, ex), [i(row, ex) for i in items]))(left, items)
+                elif operator == 'between':
+                    low = self.concatenation()
+                    self.expect('and')
+                    high = self.concatenation()
+                    test = (lambda a, lo, hi: lambda row, ex: _and(
+                        None if (c := _compare(a(row, ex), lo(row, ex))) is None else c >= 0,
+                        None if (c := _compare(a(row, ex), hi(row, ex))) is None else c <= 0))(left, low, high)
+                else:
+                    pattern = self.concatenation()
+                    test = (lambda a, p, ci: lambda row, ex: _like(a(row, ex), p(row, ex), ci))(
+                        left, pattern, operator == 'ilike')
+                left = test if not negate else (
+                    lambda t: lambda row, ex: None if (v := t(row, ex)) is None else not v)(test)
+            else:
+                return left
+
+    @staticmethod
+    def _in(value, items) -> Optional[bool]:
+        if value is None:
+            return None
+        results = [_compare(value, item) for item in items]
+        if 0 in results:
+            return True
+        return None if None in results else False
+
+    @staticmethod
+    def _comparator(left: Expression, right: Expression, operator: str) -> Expression:
+        tests = {'=': lambda c: c == 0, '<>': lambda c: c != 0, '!=': lambda c: c != 0,
+                 '<': lambda c: c < 0, '<=': lambda c: c <= 0, '>': lambda c: c > 0,
+                 '>=': lambda c: c >= 0}
+        test = tests[operator]
+
+        def compare(row, ex):
+            result = _compare(left(row, ex), right(row, ex))
+            return None if result is None else test(result)
+        return compare
+
+    def concatenation(self) -> Expression:
+        left = self.additive()
+        while self.accept('||'):
+            right = self.additive()
+
+            def concat(row, ex, a=left, b=right):
+                x, y = a(row, ex), b(row, ex)
+                if x is None or y is None:
+                    return None
+                if isinstance(x, (dict, list)) or isinstance(y, (dict, list)):
+                    return _concat_json(x, y)
+                return str(x) + str(y)
+            left = concat
+        return left
+
+    def additive(self) -> Expression:
+        left = self.multiplicative()
+        while self.at('+', '-'):
+            operator = self.next()[1]
+            right = self.multiplicative()
+            left = self._arithmetic(left, right, operator)
+        return left
+
+    def multiplicative(self) -> Expression:
+        left = self.unary()
+        while self.at('*', '/', '%'):
+            operator = self.next()[1]
+            right = self.unary()
+            left = self._arithmetic(left, right, operator)
+        return left
+
+    @staticmethod
+    def _arithmetic(left: Expression, right: Expression, operator: str) -> Expression:
+        def apply(row, ex):
+            a, b = left(row, ex), right(row, ex)
+            if a is None or b is None:
+                return None
+            a, b = _number(a), _number(b)
+            if operator == '+':
+                return a + b
+            if operator == '-':
+                return a - b
+            if operator == '*':
+                return a * b
+            if b == 0:
+                raise ReplayError("division by zero")
+            if operator == '%':
+                return math.fmod(a, b)
+            return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+        return apply
+
+    def unary(self) -> Expression:
+        if self.accept('-'):
+            inner = self.unary()
+            return lambda row, ex: None if (v := inner(row, ex)) is None else -_number(v)
+        if self.accept('+'):
+            return self.unary()
+        return self.postfix()
+
+    def postfix(self) -> Expression:
+        value = self.primary()
+        while True:
+            if self.accept('::'):
+                type_name = self.type_name()
+                value = (lambda v, t: lambda row, ex: _cast(v(row, ex), t))(value, type_name)
+            elif self.at('->', '->>', '#>', '#>>'):
+                operator = self.next()[1]
+                key = self.additive()
+                value = self._json_access(value, key, operator)
+            else:
+                return value
+
+    @staticmethod
+    def _json_access(value: Expression, key: Expression, operator: str) -> Expression:
+        def access(row, ex):
+            document, k = _json(value(row, ex)), key(row, ex)
+            if document is None or k is None:
+                return None
+            path = _text_array(k) if operator.startswith('#') else [k]
+            for step in path:
+                if isinstance(document, dict):
+                    document = document.get(str(step))
+                elif isinstance(document, list):
+                    try:
+                        document = document[int(step)]
+                    except (ValueError, IndexError):
+                        return None
+                else:
+                    return None
+                if document is None:
+                    return None
+            if operator in ('->>', '#>>') and isinstance(document, (dict, list)):
+                return json.dumps(document)
+            if operator in ('->>', '#>>') and document is not None and not isinstance(document, str):
+                return json.dumps(document)
+            return document
+        return access
+
+    def primary(self) -> Expression:
+        kind, value = self.next()
+        if kind in ('string', 'number'):
+            return lambda row, ex: value
+        if kind == 'op' and value == '(':
+            if self.at('select'):
+                raise ReplayError("subqueries are not supported")
+            inner = self.expression()
+            self.expect(')')
+            return inner
+        if kind == 'ident':
+            if value == 'null':
+                return lambda row, ex: None
+            if value in ('true', 'false'):
+                return lambda row, ex: value == 'true'
+            if value == 'case':
+                return self._case()
+            if value == 'array' and self.accept('['):
+                items = []
+                if not self.at(']'):
+                    items.append(self.expression())
+                    while self.accept(','):
+                        items.append(self.expression())
+                self.expect(']')
+                return lambda row, ex: [item(row, ex) for item in items]
+            if value in ('date', 'timestamp', 'interval') and self.peek()[0] == 'string':
+                self.next()
+                return lambda row, ex: None
+            if value in NO_PAREN_FUNCTIONS and not self.at('('):
+                return lambda row, ex: None
+        if kind in ('ident', 'name'):
+            if self.at('(') and kind == 'ident':
+                return self._call(value)
+            if self.accept('.'):
+                column = self.identifier()
+                if value == 'excluded':
+                    return lambda row, ex: self._column(ex, column)
+                return lambda row, ex: self._column(row, column)
+            return lambda row, ex: self._column(row, value)
+        raise ReplayError(f"unexpected {value!r} in expression")
+
+    @staticmethod
+    def _column(row: Optional[dict], column: str):
+        if row is None or column not in row:
+            raise ReplayError(f"column \"{column}\" does not exist here")
+        return row[column]
+
+    def _call(self, name: str) -> Expression:
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise ReplayError(f"function {name}() is not supported")
+        self.expect('(')
+        args = []
+        if not self.at(')'):
+            args.append(self.expression())
+            while self.accept(','):
+                args.append(self.expression())
+        self.expect(')')
+        return lambda row, ex: function(*(arg(row, ex) for arg in args))
+
+    def _case(self) -> Expression:
+        subject = None if self.at('when') else self.expression()
+        branches = []
+        while self.accept('when'):
+            condition = self.expression()
+            self.expect('then')
+            branches.append((condition, self.expression()))
+        otherwise = self.expression() if self.accept('else') else (lambda row, ex: None)
+        self.expect('end')
+
+        def case(row, ex):
+            for condition, result in branches:
+                if subject is None:
+                    matched = condition(row, ex) is True
+                else:
+                    matched = _compare(subject(row, ex), condition(row, ex)) == 0
+                if matched:
+                    return result(row, ex)
+            return otherwise(row, ex)
+        return case
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+class Column:
+    def __init__(self, name: str, type_name: str, default: Optional[Expression] = None,
+                 serial: bool = False):
+        self.name = name
+        self.type = ColumnType(type_name)
+        self.default = default
+        self.serial = serial
+
+
+class Table:
+    """Rows and definition of one replayed table"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.columns: Dict[str, Column] = {}
+        self.unique: Dict[str, Tuple[str, ...]] = {}
+        self.rows: List[dict] = []
+        self.next_serial: Dict[str, int] = {}
+
+    def add_column(self, column: Column):
+        self.columns[column.name] = column
+        if column.serial:
+            self.next_serial.setdefault(column.name, 1)
+        for row in self.rows:
+            row[column.name] = self.default(column)
+
+    def default(self, column: Column):
+        if column.serial:
+            value = self.next_serial[column.name]
+            self.next_serial[column.name] = value + 1
+            return value
+        if column.default is None:
+            return None
+        return column.type.coerce(column.default(None, None))
+
+    def new_row(self, values: Dict[str, object]) -> dict:
+        row = {}
+        for name, column in self.columns.items():
+            if name in values:
+                row[name] = column.type.coerce(values[name])
+            else:
+                row[name] = self.default(column)
+        return row
+
+    def conflicts(self, row: dict, constraints: Iterable[Tuple[str, ...]]) -> Optional[dict]:
+        """The existing row that row would duplicate under any of constraints"""
+        for columns in constraints:
+            key = tuple(row[c] for c in columns)
+            if None in key:
+                continue  # NULLs never conflict
+            for other in self.rows:
+                if other is not row and tuple(other[c] for c in columns) == key:
+                    return other
+        return None
+
+
+def _split_top_level(parser: _Parser) -> List[List[Tuple[str, object]]]:
+    """The tokens of a parenthesised, comma-separated list, one list per item"""
+    parser.expect('(')
+    items, current, depth = [], [], 0
+    while True:
+        token = parser.next()
+        kind, value = token
+        if kind == 'end':
+            raise ReplayError("unbalanced parentheses")
+        if kind == 'op' and value == '(':
+            depth += 1
+        elif kind == 'op' and value == ')':
+            if depth == 0:
+                items.append(current)
+                return items
+            depth -= 1
+        elif kind == 'op' and value == ',' and depth == 0:
+            items.append(current)
+            current = []
+            continue
+        current.append(token)
+
+
+class GuidelineReplay:
+    """
+    Replays migration files against in-memory copies of the guideline tables.
+
+    Args:
+        tables: Tables to keep (default: GUIDELINE_TABLES); statements on any
+            other table are skipped
+        schema_path: Schema file whose CREATE TABLE statements define tables
+            the migrations write without ever creating
+            (micronutrient_guidelines_flexible)
+    """
+
+    def __init__(self, tables: Tuple[str, ...] = GUIDELINE_TABLES,
+                 schema_path: Optional[str] = None):
+        self.tracked = set(tables)
+        self.tables: Dict[str, Table] = {}
+        self.schema: Dict[str, List[Tuple[str, object]]] = {}
+        self.skipped = 0
+        self.applied = 0
+        if schema_path:
+            with open(schema_path, 'r', encoding='utf-8') as f:
+                for statement in iter_sql_statements(f):
+                    tokens = tokenize(statement)
+                    parser = _Parser(tokens)
+                    if parser.accept('create') and parser.accept('table'):
+                        if parser.accept('if'):
+                            parser.expect('not')
+                            parser.expect('exists')
+                        name = parser.table_name()
+                        if name in self.tracked:
+                            self.schema[name] = tokens
+
+    def replay_file(self, path: str):
+        """Apply every statement of one migration file, in order"""
+        with open(path, 'r', encoding='utf-8') as f:
+            for number, statement in enumerate(iter_sql_statements(f), 1):
+                try:
+                    self.execute(statement)
+                except ReplayError as e:
+                    raise ReplayError(f"{Path(path).name}, statement {number}: {e}\n"
+                                      f"  {' '.join(statement.split())[:200]}") from None
+
+    def execute(self, statement: str):
+        tokens = tokenize(statement)
+        if not tokens or tokens == [('op', ';')]:
+            return
+        parser = _Parser(tokens)
+        keyword = parser.peek()[1]
+        handler = {
+            'insert': self._insert, 'update': self._update, 'delete': self._delete,
+            'truncate': self._truncate, 'drop': self._drop, 'create': self._create,
+            'alter': self._alter, 'do': self._do,
+        }.get(keyword)
+        if handler is None or not handler(parser):
+            self.skipped += 1
+        else:
+            self.applied += 1
+
+    def table(self, name: str) -> Table:
+        """A tracked table, defined from the schema file if no migration created it"""
+        table = self.tables.get(name)
+        if table is None:
+            if name not in self.schema:
+                raise ReplayError(f"relation \"{name}\" does not exist")
+            self._create(_Parser(self.schema[name]))
+            table = self.tables[name]
+        return table
+
+    # Statements. Each returns False when the statement was skipped.
+
+    def _insert(self, parser: _Parser) -> bool:
+        parser.expect('insert')
+        parser.expect('into')
+        name = parser.table_name()
+        if name not in self.tracked:
+            return False
+        table = self.table(name)
+        if parser.accept('as'):
+            parser.identifier()
+        columns = parser.name_list() if parser.at('(') else list(table.columns)
+        for column in columns:
+            if column not in table.columns:
+                raise ReplayError(f"column \"{column}\" of relation \"{name}\" does not exist")
+        if parser.accept('default'):
+            parser.expect('values')
+            tuples = [[]]
+        else:
+            parser.expect('values')
+            tuples = []
+            while True:
+                tuples.append(_split_top_level(parser))
+                if not parser.accept(','):
+                    break
+
+        arbiter, action, assignments, condition = self._on_conflict(parser, table)
+        if parser.accept('returning'):
+            parser.pos = len(parser.tokens)
+        if not parser.done():
+            raise ReplayError(f"unexpected {parser.peek()[1]!r} after VALUES")
+
+        for item_tokens in tuples:
+            values = {}
+            if columns:
+                items = self._tuple_items(item_tokens)
+                if len(items) != len(columns):
+                    raise ReplayError(f"{len(items)} values for {len(columns)} columns")
+                for column, item in zip(columns, items):
+                    if item is not None:
+                        values[column] = item(None, None)
+            row = table.new_row(values)
+            existing = table.conflicts(row, arbiter if arbiter is not None else table.unique.values())
+            if existing is not None:
+                if action is None:
+                    raise ReplayError(f"duplicate key value violates unique constraint on {name}")
+                if action == 'update' and (condition is None or condition(existing, row) is True):
+                    self._assign(table, existing, assignments, row)
+                continue
+            if arbiter is not None and table.conflicts(row, table.unique.values()) is not None:
+                raise ReplayError(f"duplicate key value violates unique constraint on {name}")
+            table.rows.append(row)
+        return True
+
+    @staticmethod
+    def _tuple_items(tokens: List[List[Tuple[str, object]]]) -> List[Optional[Expression]]:
+        """Expressions of one VALUES tuple; None where it says DEFAULT"""
+        items = []
+        for item in tokens:
+            if item == [('ident', 'default')]:
+                items.append(None)
+                continue
+            parser = _Parser(item)
+            items.append(parser.expression())
+            if not parser.done():
+                raise ReplayError(f"unexpected {parser.peek()[1]!r} in VALUES")
+        return items
+
+    def _on_conflict(self, parser: _Parser, table: Table):
+        """(arbiter constraints, None | 'nothing' | 'update', assignments, WHERE) of ON CONFLICT"""
+        if not parser.accept('on'):
+            return None, None, [], None
+        parser.expect('conflict')
+        arbiter = None
+        if parser.at('('):
+            columns = tuple(parser.name_list())
+            matching = [c for c in table.unique.values() if sorted(c) == sorted(columns)]
+            if not matching:
+                raise ReplayError("there is no unique or exclusion constraint matching the "
+                                  "ON CONFLICT specification")
+            arbiter = matching
+        elif parser.accept('on'):
+            parser.expect('constraint')
+            constraint = parser.identifier()
+            if constraint not in table.unique:
+                raise ReplayError(f"constraint \"{constraint}\" for table \"{table.name}\" does not exist")
+            arbiter = [table.unique[constraint]]
+        parser.expect('do')
+        if parser.accept('nothing'):
+            return arbiter, 'nothing', [], None
+        parser.expect('update')
+        parser.expect('set')
+        assignments = self._assignments(parser)
+        condition = parser.expression() if parser.accept('where') else None
+        return arbiter, 'update', assignments, condition
+
+    @staticmethod
+    def _assignments(parser: _Parser) -> List[Tuple[str, Expression]]:
+        assignments = []
+        while True:
+            if parser.at('('):
+                raise ReplayError("SET (a, b) = (...) is not supported")
+            column = parser.identifier()
+            if parser.accept('.'):
+                column = parser.identifier()
+            parser.expect('=')
+            assignments.append((column, parser.expression()))
+            if not parser.accept(','):
+                return assignments
+
+    @staticmethod
+    def _assign(table: Table, row: dict, assignments, excluded: Optional[dict] = None):
+        # Every right-hand side sees the row as it was before the UPDATE
+        before = dict(row)
+        for column, expression in assignments:
+            if column not in table.columns:
+                raise ReplayError(f"column \"{column}\" of relation \"{table.name}\" does not exist")
+            row[column] = table.columns[column].type.coerce(expression(before, excluded))
+
+    def _update(self, parser: _Parser) -> bool:
+        parser.expect('update')
+        parser.accept('only')
+        name = parser.table_name()
+        if name not in self.tracked:
+            return False
+        table = self.table(name)
+        if parser.accept('as') or (parser.peek()[0] == 'ident' and not parser.at('set')):
+            parser.identifier()
+        parser.expect('set')
+        assignments = self._assignments(parser)
+        if parser.at('from'):
+            raise ReplayError("UPDATE ... FROM is not supported")
+        condition = parser.expression() if parser.accept('where') else None
+        if parser.accept('returning'):
+            parser.pos = len(parser.tokens)
+        if not parser.done():
+            raise ReplayError(f"unexpected {parser.peek()[1]!r} in UPDATE")
+        for row in list(table.rows):
+            if condition is None or condition(row, None) is True:
+                self._assign(table, row, assignments)
+                if table.conflicts(row, table.unique.values()) is not None:
+                    raise ReplayError(f"duplicate key value violates unique constraint on {name}")
+        return True
+
+    def _delete(self, parser: _Parser) -> bool:
+        parser.expect('delete')
+        parser.expect('from')
+        parser.accept('only')
+        name = parser.table_name()
+        if name not in self.tracked:
+            return False
+        table = self.table(name)
+        if parser.accept('as') or (parser.peek()[0] == 'ident' and not parser.at('where', 'using')):
+            parser.identifier()
+        if parser.at('using'):
+            raise ReplayError("DELETE ... USING is not supported")
+        condition = parser.expression() if parser.accept('where') else None
+        if parser.accept('returning'):
+            parser.pos = len(parser.tokens)
+        if not parser.done():
+            raise ReplayError(f"unexpected {parser.peek()[1]!r} in DELETE")
+        table.rows = [row for row in table.rows
+                      if not (condition is None or condition(row, None) is True)]
+        return True
+
+    def _truncate(self, parser: _Parser) -> bool:
+        parser.expect('truncate')
+        parser.accept('table')
+        names = [parser.table_name()]
+        while parser.accept(','):
+            names.append(parser.table_name())
+        restart = parser.accept('restart') and parser.accept('identity')
+        tracked = [name for name in names if name in self.tracked]
+        for name in tracked:
+            table = self.table(name)
+            table.rows = []
+            if restart:
+                table.next_serial = {column: 1 for column in table.next_serial}
+        return bool(tracked)
+
+    def _drop(self, parser: _Parser) -> bool:
+        parser.expect('drop')
+        if not parser.accept('table'):
+            return False
+        if parser.accept('if'):
+            parser.expect('exists')
+        names = [parser.table_name()]
+        while parser.accept(','):
+            names.append(parser.table_name())
+        tracked = [name for name in names if name in self.tracked]
+        for name in tracked:
+            self.tables.pop(name, None)
+        return bool(tracked)
+
+    def _create(self, parser: _Parser) -> bool:
+        parser.expect('create')
+        if parser.accept('unique'):
+            return self._create_index(parser, unique=True)
+        if parser.at('index'):
+            return self._create_index(parser, unique=False)
+        if not parser.accept('table'):
+            return False
+        if_not_exists = False
+        if parser.accept('if'):
+            parser.expect('not')
+            parser.expect('exists')
+            if_not_exists = True
+        name = parser.table_name()
+        if name not in self.tracked:
+            return False
+        if name in self.tables:
+            if if_not_exists:
+                return False
+            raise ReplayError(f"relation \"{name}\" already exists")
+        if parser.at('as'):
+            raise ReplayError("CREATE TABLE ... AS is not supported")
+
+        table = Table(name)
+        for item in _split_top_level(parser):
+            element = _Parser(item)
+            if element.accept('constraint'):
+                constraint = element.identifier()
+            else:
+                constraint = None
+            if element.accept('unique'):
+                columns = tuple(element.name_list())
+                table.unique[constraint or f"{name}_{'_'.join(columns)}_key"] = columns
+            elif element.accept('primary'):
+                element.expect('key')
+                columns = tuple(element.name_list())
+                table.unique[constraint or f"{name}_pkey"] = columns
+            elif element.at('check', 'foreign', 'exclude'):
+                continue
+            else:
+                self._column_definition(table, element)
+        self.tables[name] = table
+        return True
+
+    def _column_definition(self, table: Table, parser: _Parser, if_not_exists: bool = False):
+        column_name = parser.identifier()
+        type_name = parser.type_name()
+        serial = type_name in ('serial', 'bigserial', 'smallserial')
+        default = None
+        unique = False
+        while not parser.done() and not parser.at(','):
+            if parser.accept('default'):
+                default = parser.concatenation()
+            elif parser.accept('unique'):
+                unique = True
+            elif parser.accept('primary'):
+                parser.expect('key')
+                unique = True
+            elif parser.accept('check'):
+                parser.skip_group()
+            elif parser.accept('references'):
+                parser.table_name()
+                if parser.at('('):
+                    parser.skip_group()
+                while parser.accept('on'):
+                    parser.next()
+                    parser.next()
+                    if parser.at('null', 'default'):
+                        parser.next()
+            elif parser.accept('generated'):
+                raise ReplayError("generated columns are not supported")
+            else:
+                parser.next()  # NOT NULL, NULL, CONSTRAINT name, COLLATE ...
+        if column_name in table.columns:
+            if if_not_exists:
+                return
+            raise ReplayError(f"column \"{column_name}\" of relation \"{table.name}\" already exists")
+        table.add_column(Column(column_name, type_name, default, serial))
+        if unique and not serial:
+            table.unique[f"{table.name}_{column_name}_key"] = (column_name,)
+
+    def _create_index(self, parser: _Parser, unique: bool) -> bool:
+        parser.expect('index')
+        parser.accept('concurrently')
+        if parser.accept('if'):
+            parser.expect('not')
+            parser.expect('exists')
+        index_name = parser.identifier() if not parser.at('on') else None
+        parser.expect('on')
+        parser.accept('only')
+        name = parser.table_name()
+        if name not in self.tracked or not unique:
+            return False
+        if parser.accept('using'):
+            parser.identifier()
+        items = _split_top_level(parser)
+        if parser.accept('where') or any(len(item) != 1 or item[0][0] not in ('ident', 'name')
+                                         for item in items):
+            return False  # partial or expression index: never an ON CONFLICT arbiter here
+        self.table(name).unique[index_name or f"{name}_idx"] = tuple(item[0][1] for item in items)
+        return True
+
+    def _alter(self, parser: _Parser) -> bool:
+        parser.expect('alter')
+        if not parser.accept('table'):
+            return False
+        if parser.accept('if'):
+            parser.expect('exists')
+        parser.accept('only')
+        name = parser.table_name()
+        if name not in self.tracked:
+            return False
+        table = self.table(name)
+
+        actions, current, depth = [], [], 0
+        while not parser.done():
+            token = parser.next()
+            if token == ('op', '('):
+                depth += 1
+            elif token == ('op', ')'):
+                depth -= 1
+            elif token == ('op', ',') and depth == 0:
+                actions.append(current)
+                current = []
+                continue
+            current.append(token)
+        actions.append(current)
+
+        changed = False
+        for action_tokens in actions:
+            action = _Parser(action_tokens)
+            if action.accept('add'):
+                if action.accept('constraint'):
+                    constraint = action.identifier()
+                    if action.accept('unique'):
+                        columns = tuple(action.name_list())
+                        self._check_unique(table, columns)
+                        table.unique[constraint] = columns
+                        changed = True
+                    continue
+                if action.at('unique', 'primary', 'check', 'foreign'):
+                    if action.accept('unique'):
+                        columns = tuple(action.name_list())
+                        self._check_unique(table, columns)
+                        table.unique[f"{name}_{'_'.join(columns)}_key"] = columns
+                        changed = True
+                    continue
+                action.accept('column')
+                if_not_exists = False
+                if action.accept('if'):
+                    action.expect('not')
+                    action.expect('exists')
+                    if_not_exists = True
+                self._column_definition(table, action, if_not_exists)
+                changed = True
+            elif action.accept('drop'):
+                if action.accept('constraint'):
+                    action.accept('if') and action.accept('exists')
+                    table.unique.pop(action.identifier(), None)
+                    continue
+                action.accept('column')
+                missing_ok = action.accept('if') and action.accept('exists')
+                column = action.identifier()
+                if column not in table.columns:
+                    if missing_ok:
+                        continue
+                    raise ReplayError(f"column \"{column}\" of relation \"{name}\" does not exist")
+                del table.columns[column]
+                for row in table.rows:
+                    row.pop(column, None)
+                table.unique = {k: v for k, v in table.unique.items() if column not in v}
+                changed = True
+            elif action.accept('rename'):
+                action.accept('column')
+                if action.accept('to'):
+                    raise ReplayError("renaming a guideline table is not supported")
+                old = action.identifier()
+                action.expect('to')
+                new = action.identifier()
+                column = table.columns.pop(old)
+                column.name = new
+                table.columns[new] = column
+                for row in table.rows:
+                    row[new] = row.pop(old)
+                table.unique = {k: tuple(new if c == old else c for c in v)
+                                for k, v in table.unique.items()}
+                changed = True
+            elif action.accept('alter'):
+                action.accept('column')
+                column = table.columns.get(action.identifier())
+                if column is None:
+                    raise ReplayError(f"column does not exist in \"{name}\"")
+                if action.accept('set') and action.accept('default'):
+                    column.default = action.concatenation()
+                elif action.accept('drop') and action.accept('default'):
+                    column.default = None
+                elif action.accept('type') or (action.accept('set') and action.accept('data')
+                                               and action.accept('type')):
+                    column.type = ColumnType(action.type_name())
+                    for row in table.rows:
+                        row[column.name] = column.type.coerce(row[column.name])
+                changed = True
+        return changed
+
+    @staticmethod
+    def _check_unique(table: Table, columns: Tuple[str, ...]):
+        seen = set()
+        for row in table.rows:
+            key = tuple(row[c] for c in columns)
+            if None in key:
+                continue
+            if key in seen:
+                raise ReplayError(f"could not create unique index on {table.name}: "
+                                  f"key {key} is duplicated")
+            seen.add(key)
+
+    def _do(self, parser: _Parser) -> bool:
+        parser.expect('do')
+        body = next((value for kind, value in parser.tokens if kind == 'string'), '')
+        writes = re.compile(r'\b(?:insert\s+into|update|delete\s+from|truncate)\s+(?:only\s+)?'
+                            r'(?:\w+\.)?(\w+)', re.I)
+        touched = {m.group(1).lower() for m in writes.finditer(body)} & self.tracked
+        if touched:
+            raise ReplayError(f"DO block writes {', '.join(sorted(touched))}; build with --dsn instead")
+        return False
+
+    def rows(self, name: str) -> Tuple[List[str], List[list]]:
+        """(columns, rows) of a replayed table in id order, without timestamps"""
+        table = self.tables.get(name)
+        if table is None:
+            return [], []
+        columns = [c for c in table.columns if c not in SKIPPED_COLUMNS]
+        ordered = sorted(table.rows, key=lambda row: row.get('id') or 0)
+        return columns, [[row[c] for c in columns] for row in ordered]
+
+
+def replay_migrations(migrations_dir: str, schema_path: Optional[str] = None,
+                      until: Optional[str] = None) -> Tuple[Dict[str, dict], List[dict]]:
+    """
+    Replay every migration in file name order and return the guideline tables
+
+    Args:
+        migrations_dir: Directory of NNN_*.sql migrations
+        schema_path: Schema file for tables no migration creates
+        until: Stop after the migration whose name starts with this prefix
+
+    Returns:
+        ({table: {"columns", "rows"}}, [{"name", "sha256"}] of the files replayed)
+    """
+    replay = GuidelineReplay(schema_path=schema_path)
+    sources = []
+    for path in sorted(Path(migrations_dir).glob('*.sql')):
+        replay.replay_file(str(path))
+        sources.append({'name': path.name,
+                        'sha256': hashlib.sha256(path.read_bytes()).hexdigest()[:12]})
+        if until and path.name.startswith(until):
+            break
+    tables = {}
+    for name in GUIDELINE_TABLES:
+        columns, rows = replay.rows(name)
+        tables[name] = {'columns': columns, 'rows': rows}
+    return tables, sources
+
+
+def read_database(dsn: str) -> Dict[str, dict]:
+    """The guideline tables as they are in a live or restored database"""
+    if psycopg2 is None:
+        print("Error: psycopg2 is required for --dsn (pip install psycopg2-binary)")
+        sys.exit(1)
+
+    def plain(value):
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() and value.as_tuple().exponent >= 0 \
+                else float(value)
+        return value
+
+    tables = {}
+    with psycopg2.connect(dsn) as conn:
+        with conn.cursor() as cur:
+            for name in GUIDELINE_TABLES:
+                cur.execute(f"SELECT * FROM {name} ORDER BY id")
+                columns = [d.name for d in cur.description]
+                keep = [i for i, c in enumerate(columns) if c not in SKIPPED_COLUMNS]
+                tables[name] = {
+                    'columns': [columns[i] for i in keep],
+                    'rows': [[plain(row[i]) for i in keep] for row in cur.fetchall()],
+                }
+    conn.close()
+    return tables
+
+
+# ---------------------------------------------------------------------------
+# Bundle
+# ---------------------------------------------------------------------------
+
+def _key(*parts) -> str:
+    return KEY_SEPARATOR.join('' if part is None else str(part) for part in parts)
+
+
+def age_bands(rows: List[dict], candidates: List[int],
+              pick: Callable[[List[int]], int]) -> dict:
+    """
+    Cut the age axis of a group of rows into bands with a fixed winner
+
+    The set of rows whose [age_min, age_max] holds an age only changes at an
+    age_min or age_max, so between two consecutive bounds - and at each bound
+    itself - the winner is fixed. Band 2i is the bound itself and band 2i+1
+    the open interval after it.
+
+    Args:
+        rows: All rows of the table as dicts
+        candidates: Indexes of the rows in this group
+        pick: Chooses the winning row index among those covering an age
+
+    Returns:
+        {"bounds": [...], "rows": [row index or -1 per band]}
+    """
+    bounds = sorted({rows[i]['age_min'] for i in candidates} | {rows[i]['age_max'] for i in candidates})
+    winners = []
+    for band in range(2 * len(bounds) - 1):
+        if band % 2 == 0:
+            age = bounds[band // 2]
+        else:
+            age = (bounds[band // 2] + bounds[band // 2 + 1]) / 2
+        covering = [i for i in candidates if rows[i]['age_min'] <= age <= rows[i]['age_max']]
+        winners.append(pick(covering) if covering else -1)
+    return {'bounds': bounds, 'rows': winners}
+
+
+def _most_specific(rows: List[dict]) -> Callable[[List[int]], int]:
+    """ORDER BY age_min DESC LIMIT 1; ties go to the lowest id"""
+    return lambda covering: min(covering, key=lambda i: (-rows[i]['age_min'], i))
+
+
+def _first(covering: List[int]) -> int:
+    """LIMIT 1 without ORDER BY: the lowest id"""
+    return min(covering)
+
+
+def _micronutrient_conditions(notes: Optional[str]) -> List[str]:
+    """The condition slots a micronutrient row can answer, by its notes"""
+    if notes is None:
+        return [GENERAL]
+    lowered = notes.lower()
+    slots = [condition for condition in (PREGNANCY, LACTATION) if condition in lowered]
+    if not slots:
+        slots.append(NOTED)
+        slots.extend(f"{NOTED}:{pattern}" for pattern in ACTIVITY_NOTES.values()
+                     if pattern in lowered)
+    return slots
+
+
+def compile_bundle(tables: Dict[str, dict], source: str, sources: Optional[List[dict]] = None) -> dict:
+    """
+    Build the lookup bundle from the guideline tables
+
+    Args:
+        tables: {table: {"columns", "rows"}} from replay_migrations() or read_database()
+        source: 'migrations' or 'database'
+        sources: The migration files replayed, recorded in the bundle
+    """
+    def dicts(name):
+        table = tables.get(name) or {'columns': [], 'rows': []}
+        return [dict(zip(table['columns'], row)) for row in table['rows']]
+
+    def groups(rows, *fields, slots=None):
+        grouped: Dict[str, List[int]] = {}
+        for i, row in enumerate(rows):
+            for slot in (slots(row) if slots else [None]):
+                parts = [row.get(field) for field in fields] + ([slot] if slots else [])
+                grouped.setdefault(_key(*parts), []).append(i)
+        return grouped
+
+    index = {}
+    eer = dicts('eer_formulas')
+    index['eer_formulas'] = {key: age_bands(eer, members, _most_specific(eer))
+                             for key, members in groups(eer, 'country', 'gender').items()}
+    index['eer_formula_ids'] = {str(row['id']): i for i, row in enumerate(eer)}
+
+    macros = dicts('macro_guidelines')
+    index['macro_guidelines'] = {key: age_bands(macros, members, _most_specific(macros))
+                                 for key, members in groups(macros, 'country', 'gender').items()}
+
+    pal = dicts('pal_values')
+    index['pal_values'] = {key: _first(members)
+                           for key, members in groups(pal, 'country', 'activity_level').items()}
+
+    micros = dicts('micronutrient_guidelines_flexible')
+    index['micronutrient_guidelines_flexible'] = {
+        key: age_bands(micros, members, _first)
+        for key, members in groups(micros, 'country', 'gender',
+                                   slots=lambda row: _micronutrient_conditions(row.get('notes'))).items()
+    }
+
+    mappings = dicts('country_micronutrient_mappings')
+    index['country_micronutrient_mappings'] = {
+        key: _first(members) for key, members in groups(mappings, 'country_name').items()
+    }
+
+    canonical = json.dumps(tables, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'format_version': FORMAT_VERSION,
+        'version': hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12],
+        'source': source,
+        'tables': tables,
+        'index': index,
+    }
+    if sources is not None:
+        bundle['migrations'] = sources
+    return bundle
+
+
+def js_round(value: float) -> int:
+    """Math.round: halves round up"""
+    return math.floor(value + 0.5)
+
+
+class GuidelineBundle:
+    """
+    Guideline lookups answered from a compiled bundle, with the same
+    precedence as the database queries in lib/calculations.ts and
+    lib/micronutrients-flexible.ts. Countries are matched exactly, so pass
+    them normalised (lower case) as those queries do.
+
+    Args:
+        bundle: A bundle dict from compile_bundle() or GuidelineBundle.load()
+    """
+
+    def __init__(self, bundle: dict):
+        if bundle.get('format') != BUNDLE_FORMAT or bundle.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Not a version {FORMAT_VERSION} {BUNDLE_FORMAT} bundle")
+        self.version = bundle['version']
+        self.index = bundle['index']
+        self.rows = {name: [dict(zip(table['columns'], row)) for row in table['rows']]
+                     for name, table in bundle['tables'].items()}
+
+    @classmethod
+    def load(cls, path: str) -> 'GuidelineBundle':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _band(self, table: str, key: str, age: float) -> Optional[dict]:
+        entry = self.index[table].get(key)
+        if entry is None:
+            return None
+        bounds = entry['bounds']
+        i = bisect_left(bounds, age)
+        if i < len(bounds) and bounds[i] == age:
+            band = 2 * i
+        elif 0 < i < len(bounds):
+            band = 2 * i - 1
+        else:
+            return None
+        winner = entry['rows'][band]
+        return self.rows[table][winner] if winner >= 0 else None
+
+    def eer_formula(self, country: str, gender: str, age: float) -> Optional[dict]:
+        """The EER formula covering the rounded age, most specific age range first"""
+        return self._band('eer_formulas', _key(country, gender), js_round(age))
+
+    def eer_formula_by_id(self, formula_id: int) -> Optional[dict]:
+        index = self.index['eer_formula_ids'].get(str(formula_id))
+        return self.rows['eer_formulas'][index] if index is not None else None
+
+    def pal_value(self, country: str, activity_level: str) -> Optional[float]:
+        index = self.index['pal_values'].get(_key(country, activity_level))
+        return self.rows['pal_values'][index]['pal_value'] if index is not None else None
+
+    def macro_guidelines(self, country: str, gender: str, age: float) -> Optional[dict]:
+        """Macro guidelines for the rounded age, falling back to the USA's"""
+        rounded = js_round(age)
+        found = self._band('macro_guidelines', _key(country, gender), rounded)
+        if found is None:
+            found = self._band('macro_guidelines', _key(MACRO_FALLBACK_COUNTRY, gender), rounded)
+        return found
+
+    def micronutrient_guidelines(self, country: str, gender: str, age: float,
+                                 pregnancy: bool = False, lactation: bool = False,
+                                 activity_level: Optional[str] = None) -> Optional[dict]:
+        """
+        Micronutrient guidelines, tried in FlexibleMicronutrientService's order:
+        pregnancy/lactation, the gender's general row, the common general row,
+        the gender's noted rows (matching the activity level first), then the
+        common noted rows
+        """
+        age = round(age * 1_000_000) / 1_000_000
+
+        def lookup(gender_key: str, condition: str) -> Optional[dict]:
+            return self._band('micronutrient_guidelines_flexible',
+                              _key(country, gender_key, condition), age)
+
+        if gender == 'female' and (pregnancy or lactation):
+            found = lookup(gender, PREGNANCY if pregnancy else LACTATION)
+            if found:
+                return found
+        found = lookup(gender, GENERAL) or lookup('common', GENERAL)
+        if found:
+            return found
+        pattern = ACTIVITY_NOTES.get(activity_level) if activity_level else None
+        if pattern:
+            found = lookup(gender, f"{NOTED}:{pattern}")
+            if found:
+                return found
+        return lookup(gender, NOTED) or lookup('common', NOTED)
+
+    def country_mapping(self, country_name: str) -> Optional[dict]:
+        index = self.index['country_micronutrient_mappings'].get(country_name)
+        return self.rows['country_micronutrient_mappings'][index] if index is not None else None
+
+
+def write_bundle(bundle: dict, output_path: str):
+    """Write a bundle atomically"""
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+
+
+def build(output_path: str, migrations_dir: Optional[str] = None, schema_path: Optional[str] = None,
+          dsn: Optional[str] = None, until: Optional[str] = None) -> dict:
+    """
+    Compile the guideline bundle and write it to output_path
+
+    Args:
+        output_path: Where the bundle goes
+        migrations_dir: Migrations to replay (default: database/migrations)
+        schema_path: Schema for tables no migration creates
+            (default: database/schema-complete.sql)
+        dsn: Read the tables from this database instead of replaying
+        until: Stop the replay after this migration (name prefix)
+    """
+    start = time.perf_counter()
+    if dsn:
+        print("Reading guideline tables from the database")
+        tables, sources, source = read_database(dsn), None, 'database'
+    else:
+        migrations_dir = migrations_dir or str(DEFAULT_MIGRATIONS)
+        schema_path = schema_path or (str(DEFAULT_SCHEMA) if DEFAULT_SCHEMA.exists() else None)
+        print(f"Replaying migrations from: {migrations_dir}")
+        if schema_path:
+            print(f"Table definitions from: {schema_path}")
+        try:
+            tables, sources = replay_migrations(migrations_dir, schema_path, until=until)
+        except ReplayError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        source = 'migrations'
+        print(f"Migrations replayed: {len(sources)}")
+    print("-" * 60)
+
+    bundle = compile_bundle(tables, source, sources)
+    write_bundle(bundle, output_path)
+    elapsed = time.perf_counter() - start
+
+    for name in GUIDELINE_TABLES:
+        print(f"✓ {name}: {len(tables[name]['rows'])} rows")
+    keys = sum(len(bundle['index'][name]) for name in
+               ('eer_formulas', 'macro_guidelines', 'micronutrient_guidelines_flexible'))
+    print("-" * 60)
+    print(f"Bundle: {output_path} (version {bundle['version']}, "
+          f"{os.path.getsize(output_path) / 1024:.1f} KB, {keys} age-banded keys)")
+    print(f"Elapsed: {elapsed:.2f}s")
+    return bundle
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Compile EER, PAL, macro and micronutrient guidelines into a lookup bundle",
+        epilog="Example:\n  python3 guideline_bundle.py --output nutrition_guidelines.json\n"
+               "  python3 guideline_bundle.py --bundle nutrition_guidelines.json "
+               "--country uk --gender female --age 31 --pregnancy",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--output', help="Build the bundle and write it here")
+    parser.add_argument('--migrations', metavar='DIR',
+                        help="Migrations to replay (default: database/migrations)")
+    parser.add_argument('--schema', metavar='PATH',
+                        help="Schema for tables no migration creates "
+                             "(default: database/schema-complete.sql)")
+    parser.add_argument('--until', metavar='PREFIX',
+                        help="Stop the replay after the migration starting with PREFIX")
+    parser.add_argument('--dsn', help="Read the tables from this database instead of replaying")
+    parser.add_argument('--bundle', help="Look up guidelines in this bundle")
+    parser.add_argument('--country', help="Country (lower case, as stored)")
+    parser.add_argument('--gender', choices=('male', 'female'), default='female')
+    parser.add_argument('--age', type=float, default=30.0)
+    parser.add_argument('--pregnancy', action='store_true')
+    parser.add_argument('--lactation', action='store_true')
+    parser.add_argument('--activity-level')
+    args = parser.parse_args()
+
+    if not args.output and not args.bundle:
+        parser.error("pass --output to build a bundle or --bundle to query one")
+
+    if args.output:
+        build(args.output, migrations_dir=args.migrations, schema_path=args.schema,
+              dsn=args.dsn, until=args.until)
+
+    if args.bundle:
+        if not args.country:
+            parser.error("--bundle needs --country")
+        try:
+            bundle = GuidelineBundle.load(args.bundle)
+        except (OSError, ValueError) as e:
+            print(f"Error reading bundle: {e}")
+            sys.exit(1)
+        start = time.perf_counter()
+        results = {
+            'eer_formula': bundle.eer_formula(args.country, args.gender, args.age),
+            'macro_guidelines': bundle.macro_guidelines(args.country, args.gender, args.age),
+            'micronutrient_guidelines': bundle.micronutrient_guidelines(
+                args.country, args.gender, args.age, pregnancy=args.pregnancy,
+                lactation=args.lactation, activity_level=args.activity_level),
+        }
+        formula = results['eer_formula']
+        if formula and args.activity_level:
+            results['pal_value'] = bundle.pal_value(formula['country'], args.activity_level)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"Bundle version {bundle.version}, lookups took {elapsed_us:.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
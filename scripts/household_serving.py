@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Household Serving Parser
+Extracts the quantity and normalised unit from FoodData Central
+householdServingFullText values such as "1 cup", "2 TBSP", "1 container (170g)"
+or "1 1/2 ONZ".
+
+Each text is split into quantities and words by one compiled regular
+expression and every word is looked up in a table of unit spellings, so a
+text is scanned once and units only match as whole words ("pecan" is not a
+can and "egg" is not a gram). parse_household_servings() parses large batches from a
+crawl or bulk download, memoising the repeated texts that dominate branded
+foods.
+
+Usage:
+    python3 household_serving.py usda_foods.jsonl      # crawl output
+    python3 household_serving.py branded_food.csv      # FDC bulk download
+"""
+
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from compressed_io import open_stream, strip_compression_suffix
+
+# Normalised unit -> spellings found in FDC serving text
+UNIT_SPELLINGS = {
+    'cup': ('cup', 'cups', 'c'),
+    'tbsp': ('tbsp', 'tbsps', 'tbs', 'tbl', 'tablespoon', 'tablespoons'),
+    'tsp': ('tsp', 'tsps', 'teaspoon', 'teaspoons'),
+    'fl oz': ('fl oz', 'fl. oz', 'fl.oz', 'floz', 'fluid ounce', 'fluid ounces', 'fl ounce'),
+    'oz': ('oz', 'ozs', 'onz', 'ounce', 'ounces'),
+    'lb': ('lb', 'lbs', 'pound', 'pounds'),
+    'g': ('g', 'gr', 'grm', 'gram', 'grams', 'gramm'),
+    'mg': ('mg', 'milligram', 'milligrams'),
+    'kg': ('kg', 'kilogram', 'kilograms'),
+    'ml': ('ml', 'mlt', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+    'l': ('l', 'liter', 'liters', 'litre', 'litres'),
+    'pint': ('pint', 'pints', 'pt'),
+    'quart': ('quart', 'quarts', 'qt'),
+    'gallon': ('gallon', 'gallons', 'gal'),
+    'piece': ('piece', 'pieces', 'pc', 'pcs'),
+    'slice': ('slice', 'slices'),
+    'serving': ('serving', 'servings'),
+    'container': ('container', 'containers'),
+    'package': ('package', 'packages', 'pkg', 'pack'),
+    'packet': ('packet', 'packets'),
+    'can': ('can', 'cans'),
+    'bottle': ('bottle', 'bottles'),
+    'bar': ('bar', 'bars'),
+    'stick': ('stick', 'sticks'),
+    'pouch': ('pouch', 'pouches'),
+    'whole': ('whole',),
+    'half': ('half', 'halves'),
+    'quarter': ('quarter', 'quarters'),
+    'large': ('large', 'lg'),
+    'medium': ('medium', 'med'),
+    'small': ('small', 'sm'),
+    'fillet': ('fillet', 'fillets', 'filet', 'filets'),
+    'breast': ('breast', 'breasts'),
+    'thigh': ('thigh', 'thighs'),
+    'drumstick': ('drumstick', 'drumsticks'),
+    'wing': ('wing', 'wings'),
+    'bowl': ('bowl', 'bowls'),
+    'glass': ('glass', 'glasses'),
+    'scoop': ('scoop', 'scoops'),
+    'clove': ('clove', 'cloves'),
+    'pinch': ('pinch', 'pinches'),
+    'dash': ('dash', 'dashes'),
+}
+UNIT_ALIASES = {spelling: unit for unit, spellings in UNIT_SPELLINGS.items()
+                for spelling in spellings}
+# Lookup keys have spaces and dots removed: "fl. oz", "fl oz" and "floz" are one
+_ALIAS_KEYS = {spelling.replace('.', '').replace(' ', ''): unit
+               for spelling, unit in UNIT_ALIASES.items()}
+# First words of multi-word spellings ("fl" of "fl oz")
+_PHRASE_STARTS = {spelling.replace('.', ' ').split()[0] for spelling in UNIT_ALIASES
+                  if len(spelling.replace('.', ' ').split()) > 1}
+# One-letter spellings ("c", "g", "l") are units only right after a quantity
+# ("1 c", "170g"); elsewhere they are words ("vitamin c")
+_QUANTITY_ONLY = {key for key in _ALIAS_KEYS if len(key) == 1}
+
+UNICODE_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75,
+                     '⅛': 0.125, '⅜': 0.375, '⅝': 0.625, '⅞': 0.875}
+
+_FRACTIONS = ''.join(UNICODE_FRACTIONS)
+# One pass splits a text into numbers ("1 1/2", "1/2", ".5", "1½", "1 ½", ...)
+# and words. Units are then dictionary lookups, so a word is a unit only as a
+# whole ("pecan" is not "can"). Only a whole number followed by a fraction
+# forms a mixed number, so "2 3 oz" is the numbers 2 and 3, not 5.
+_PARENTHESES = re.compile(r'\([^)]*\)')
+TOKEN_PATTERN = re.compile(rf"(\d+\s+\d+/\d+|\d+\s*[{_FRACTIONS}]|\d+/\d+|\d*\.\d+|\d+|[{_FRACTIONS}])"
+                           rf"|([a-z]+)")
+
+CACHE_LIMIT = 1 << 16
+_parsed: Dict[str, 'HouseholdServing'] = {}
+_quantities: Dict[str, Optional[float]] = {}
+
+
+class HouseholdServing(NamedTuple):
+    """
+    A parsed serving text: the first unit given with a quantity (or the first
+    unit, with quantity None), every unit mentioned, and every (quantity,
+    unit) pair, in order
+    """
+    quantity: Optional[float]
+    unit: Optional[str]
+    units: Tuple[str, ...]
+    amounts: Tuple[Tuple[float, str], ...] = ()
+
+
+NO_SERVING = HouseholdServing(None, None, ())
+
+
+class IngredientLine(NamedTuple):
+    """A recipe ingredient line split into its leading quantity, unit and name"""
+    quantity: Optional[float]
+    unit: Optional[str]
+    name: str
+
+
+def parse_quantity(text: str) -> Optional[float]:
+    """Number in "1 1/2", "1/2", "1.5", "1½" or "½" form (None if malformed)"""
+    if text in _quantities:
+        return _quantities[text]
+    value = _parse_quantity(text)
+    if len(_quantities) < CACHE_LIMIT:
+        _quantities[text] = value
+    return value
+
+
+def _parse_quantity(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    whole = 0.0
+    if text[-1] in UNICODE_FRACTIONS:
+        whole = UNICODE_FRACTIONS[text[-1]]
+        text = text[:-1].rstrip()
+        if not text:
+            return whole
+    try:
+        if ' ' in text:
+            head, text = text.split(' ', 1)
+            whole += float(head)
+        if '/' in text:
+            numerator, denominator = text.split('/')
+            return whole + float(numerator) / float(denominator)
+        return whole + float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_household_serving(text: str) -> HouseholdServing:
+    """
+    Parse one householdServingFullText value
+
+    Args:
+        text: e.g. "1 container (170g)"; matching is case-insensitive
+
+    Returns HouseholdServing(1.0, 'container', ('container', 'g'),
+    ((1.0, 'container'), (170.0, 'g'))) for the example above, or NO_SERVING
+    when no unit is found.
+    """
+    if not text:
+        return NO_SERVING
+    parsed = _parsed.get(text)
+    if parsed is not None:
+        return parsed
+
+    # The first unit with a quantity ("serving size 2 slices"), else the first unit
+    units = []
+    amounts = []
+    amount = prefix = ''  # number before the current word; pending "fl" of "fl oz"
+    after_number = False
+    for number, word in TOKEN_PATTERN.findall(text.lower()):
+        if number:
+            amount = number
+            prefix = ''
+            after_number = True
+            continue
+        normalised = _ALIAS_KEYS.get(prefix + word) if prefix else None
+        if normalised is None and (after_number or word not in _QUANTITY_ONLY):
+            normalised = _ALIAS_KEYS.get(word)
+        after_number = False
+        prefix = word if word in _PHRASE_STARTS else ''
+        if normalised is None:
+            if not prefix:
+                amount = ''
+            continue
+        if amount:
+            quantity = parse_quantity(amount)
+            if quantity is not None:
+                amounts.append((quantity, normalised))
+        amount = ''
+        if normalised not in units:
+            units.append(normalised)
+
+    if amounts:
+        parsed = HouseholdServing(*amounts[0], tuple(units), tuple(amounts))
+    elif units:
+        parsed = HouseholdServing(None, units[0], tuple(units))
+    else:
+        parsed = NO_SERVING
+    if len(_parsed) < CACHE_LIMIT:
+        _parsed[text] = parsed
+    return parsed
+
+
+def parse_ingredient_line(text: str) -> IngredientLine:
+    """
+    Split a recipe line such as "2 cups cooked rice" into
+    IngredientLine(2.0, 'cup', 'cooked rice')
+
+    Only a quantity and unit before the name count ("1 can (15 oz) black
+    beans" is one can); parenthesised notes are dropped and unit words inside
+    the name stay part of it ("2 chicken breasts" has no unit).
+    """
+    quantity = unit = None
+    name = []
+    prefix = ''
+    after_number = False
+    for number, word in TOKEN_PATTERN.findall(_PARENTHESES.sub(' ', text.lower())):
+        if name:
+            if word:
+                name.append(word)
+            continue
+        if number:
+            if quantity is None:
+                quantity = parse_quantity(number)
+            after_number = True
+            continue
+        quantity_word, after_number = after_number, False
+        if unit is None:
+            normalised = _ALIAS_KEYS.get(prefix + word) if prefix else None
+            if normalised is None and not prefix and (quantity_word or word not in _QUANTITY_ONLY):
+                normalised = _ALIAS_KEYS.get(word)
+            if normalised is not None:
+                unit = normalised
+                prefix = ''
+                continue
+            if word in _PHRASE_STARTS and not prefix:
+                prefix = word
+                continue
+        if word == 'of' and unit is not None:
+            continue
+        if prefix:
+            name.append(prefix)
+            prefix = ''
+        name.append(word)
+    if prefix:
+        name.append(prefix)
+    return IngredientLine(quantity, unit, ' '.join(name))
+
+
+def stem(word: str) -> str:
+    """Crude singular form: berries -> berry, tomatoes -> tomato, eggs -> egg"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def parse_household_servings(texts: Iterable[str]) -> Iterator[HouseholdServing]:
+    """Parse many serving texts; repeated texts are parsed once"""
+    return map(parse_household_serving, texts)
+
+
+def iter_serving_texts(path: str) -> Iterator[str]:
+    """
+    householdServingFullText values from a crawl JSONL file, a bulk download
+    CSV (household_serving_fulltext column) or a plain text file, one per line
+    """
+    name = strip_compression_suffix(path).lower()
+    with open_stream(path, 'r', newline='') as f:
+        if name.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    text = json.loads(line).get('food', {}).get('householdServingFullText')
+                    if text:
+                        yield text
+        elif name.endswith('.csv'):
+            reader = csv.reader(f)
+            header = next(reader, [])
+            if 'household_serving_fulltext' not in header:
+                raise ValueError(f"{path} has no household_serving_fulltext column")
+            column = header.index('household_serving_fulltext')
+            for row in reader:
+                if len(row) > column and row[column]:
+                    yield row[column]
+        else:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Parse householdServingFullText values and report the units found",
+        epilog="Example:\n  python3 household_serving.py branded_food.csv --top 30",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('input_file',
+                        help="Crawl JSONL, FDC CSV with household_serving_fulltext, "
+                             "or one text per line")
+    parser.add_argument('--top', type=int, default=20,
+                        help="Units to list (default: 20)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    units = Counter()
+    texts = unparsed = 0
+    try:
+        for serving in parse_household_servings(iter_serving_texts(args.input_file)):
+            texts += 1
+            if serving.unit is None:
+                unparsed += 1
+            else:
+                units[serving.unit] += 1
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    print(f"Parsed {texts} serving texts in {elapsed:.2f}s "
+          f"({len(_parsed)} distinct, {unparsed} without a unit)")
+    print("-" * 60)
+    for unit, count in units.most_common(args.top):
+        print(f"  {unit:<12} {count}")
+
+
+if __name__ == '__main__':
+    main()
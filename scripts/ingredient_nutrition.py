@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Offline Ingredient-Line Nutrition Resolver
+Resolves free-text recipe lines such as "2 cups cooked rice" to nutrition
+without an Edamam call: the line is split into quantity, unit and name, the
+name is fuzzy-matched against a simple_ingredients CSV (as written by the
+CSV pipeline or fetch-usda-food-categories.py --bulk), and the matched
+ingredient's per-serving nutrients are scaled to the line's amount.
+
+Each result carries StandardizedNutrition-shaped "nutrition" (see
+lib/nutritionMappingService.ts) and a "confidence" between 0 and 1, the
+product of the name match score and how reliable the unit conversion was.
+Callers keep results at or above their threshold and send the rest to
+Edamam.
+
+Names are matched on an inverted index of stemmed words weighted by inverse
+document frequency, so "cooked rice" prefers "rice, white, cooked" to
+"rice crackers" and common words such as "raw" barely count. Units the
+ingredient's serving is not given in are converted through grams, using the
+portion_grams.py table when one is given (--portions).
+
+Usage:
+    python3 ingredient_nutrition.py usda_simple_ingredients.csv lines.txt
+    python3 ingredient_nutrition.py usda_simple_ingredients.csv lines.txt \\
+        --portions portion_grams.json --output resolved.jsonl
+"""
+
+import argparse
+import csv
+import json
+import math
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from compressed_io import open_stream
+from household_serving import TOKEN_PATTERN, parse_household_serving, parse_ingredient_line, stem
+from portion_grams import MASS_UNITS, VOLUME_UNITS, PortionGrams
+
+CACHE_LIMIT = 1 << 16
+DEFAULT_MIN_CONFIDENCE = 0.6
+# Names missing some words of the query scored per word, lightest first
+MAX_CANDIDATES = 32
+
+# simple_ingredients column -> (StandardizedNutrition section, key, unit).
+# Macros are always reported (0 when blank), as the API's simple-ingredient
+# paths do; micros only when the column has a value.
+NUTRITION_FIELDS = [
+    ('calories', None, 'calories', 'kcal'),
+    ('protein_g', 'macros', 'protein', 'g'),
+    ('carbs_g', 'macros', 'carbs', 'g'),
+    ('fat_g', 'macros', 'fat', 'g'),
+    ('fiber_g', 'macros', 'fiber', 'g'),
+    ('sugar_g', 'macros', 'sugar', 'g'),
+    ('sodium_mg', 'macros', 'sodium', 'mg'),
+    ('cholesterol_mg', 'macros', 'cholesterol', 'mg'),
+    ('saturated_fat_g', 'macros', 'saturatedFat', 'g'),
+    ('trans_fat_g', 'macros', 'transFat', 'g'),
+    ('vitamin_a_mcg', 'vitamins', 'vitaminA', 'µg'),
+    ('vitamin_c_mg', 'vitamins', 'vitaminC', 'mg'),
+    ('vitamin_d_mcg', 'vitamins', 'vitaminD', 'µg'),
+    ('vitamin_e_mg', 'vitamins', 'vitaminE', 'mg'),
+    ('vitamin_k_mcg', 'vitamins', 'vitaminK', 'µg'),
+    ('thiamin_mg', 'vitamins', 'thiamin', 'mg'),
+    ('riboflavin_mg', 'vitamins', 'riboflavin', 'mg'),
+    ('niacin_mg', 'vitamins', 'niacin', 'mg'),
+    ('vitamin_b6_mg', 'vitamins', 'vitaminB6', 'mg'),
+    ('folate_mcg', 'vitamins', 'folate', 'µg'),
+    ('vitamin_b12_mcg', 'vitamins', 'vitaminB12', 'µg'),
+    ('biotin_mcg', 'vitamins', 'biotin', 'µg'),
+    ('pantothenic_acid_mg', 'vitamins', 'pantothenicAcid', 'mg'),
+    ('calcium_mg', 'minerals', 'calcium', 'mg'),
+    ('iron_mg', 'minerals', 'iron', 'mg'),
+    ('magnesium_mg', 'minerals', 'magnesium', 'mg'),
+    ('phosphorus_mg', 'minerals', 'phosphorus', 'mg'),
+    ('potassium_mg', 'minerals', 'potassium', 'mg'),
+    ('zinc_mg', 'minerals', 'zinc', 'mg'),
+    ('copper_mg', 'minerals', 'copper', 'mg'),
+    ('manganese_mg', 'minerals', 'manganese', 'mg'),
+    ('selenium_mcg', 'minerals', 'selenium', 'µg'),
+    ('iodine_mcg', 'minerals', 'iodine', 'µg'),
+    ('chromium_mcg', 'minerals', 'chromium', 'µg'),
+    ('molybdenum_mcg', 'minerals', 'molybdenum', 'µg'),
+]
+
+# Words that describe preparation or amount rather than the ingredient
+STOPWORDS = {
+    'a', 'an', 'and', 'about', 'for', 'fresh', 'freshly', 'in', 'into', 'of', 'or',
+    'optional', 'plus', 'the', 'to', 'taste', 'with', 'chopped', 'diced', 'minced',
+    'sliced', 'grated', 'shredded', 'finely', 'roughly', 'thinly', 'coarsely',
+    'peeled', 'divided', 'cut', 'packed', 'softened', 'melted', 'room', 'temperature',
+}
+
+# How much a conversion path is trusted (multiplied into the match score)
+UNIT_CONFIDENCE = {
+    'same': 1.0,      # line and serving in the same unit, or exact mass/volume ratio
+    'table': 0.9,     # grams from the portion table (ingredient, category or density)
+    'count': 0.8,     # "3 bananas" against a gram serving, via a per-item weight
+    'assumed': 0.5,   # no quantity ("salt to taste"): one serving assumed
+}
+# Per-item units tried for lines without a unit
+COUNT_UNITS = ('medium', 'piece', 'whole', 'large', 'small', 'serving')
+
+
+def name_tokens(text: str) -> Tuple[str, ...]:
+    """Stemmed, de-duplicated words of a name, stopwords removed"""
+    tokens = []
+    for _, word in TOKEN_PATTERN.findall(text.lower()):
+        if word and word not in STOPWORDS:
+            word = stem(word)
+            if word not in tokens:
+                tokens.append(word)
+    return tuple(tokens)
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+class Ingredient:
+    """One simple_ingredients row: serving and per-serving nutrient values"""
+
+    __slots__ = ('name', 'category', 'serving_quantity', 'serving_unit', 'values', 'tokens')
+
+    def __init__(self, row: dict):
+        self.name = row['name'].strip().lower()
+        self.category = row.get('category') or ''
+        self.serving_quantity = _float(row.get('serving_quantity')) or 1.0
+        unit = (row.get('serving_unit') or 'g').strip().lower()
+        self.serving_unit = parse_household_serving(unit).unit or unit
+        self.values = [_float(row.get(column)) for column, _, _, _ in NUTRITION_FIELDS]
+        self.tokens = name_tokens(self.name)
+
+    def nutrition(self, factor: float) -> dict:
+        """StandardizedNutrition for factor servings"""
+        calories = self.values[0] or 0.0
+        result = {
+            'calories': {'quantity': round(calories * factor, 2), 'unit': 'kcal'},
+            'macros': {},
+            'micros': {'vitamins': {}, 'minerals': {}},
+        }
+        for value, (_, section, key, unit) in zip(self.values[1:], NUTRITION_FIELDS[1:]):
+            if section == 'macros':
+                result['macros'][key] = {'quantity': round((value or 0.0) * factor, 2), 'unit': unit}
+            elif value is not None:
+                result['micros'][section][key] = {'quantity': round(value * factor, 2), 'unit': unit}
+        return result
+
+
+def load_ingredients(path: str) -> List[Ingredient]:
+    """Active rows of a simple_ingredients CSV (gzip/zstd by suffix)"""
+    with open_stream(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise ValueError(f"{path} has no name column")
+        return [Ingredient(row) for row in reader
+                if row.get('name') and (row.get('is_active') or 'true').lower() != 'false']
+
+
+class NutritionResolver:
+    """
+    Matches ingredient lines to simple_ingredients rows and scales their
+    nutrients. resolve() is memoised per line, so repeated lines are free.
+    """
+
+    def __init__(self, ingredients: List[Ingredient], portions: Optional[PortionGrams] = None):
+        self.ingredients = ingredients
+        self.portions = portions
+        self.exact: Dict[Tuple[str, ...], int] = {}
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for index, ingredient in enumerate(ingredients):
+            self.exact.setdefault(tuple(sorted(ingredient.tokens)), index)
+            for token in ingredient.tokens:
+                self.postings[token].append(index)
+        total = len(ingredients) + 1
+        self.idf = {token: math.log(total / (len(ids) + 1)) + 1.0
+                    for token, ids in self.postings.items()}
+        self.unknown_idf = math.log(total) + 1.0
+        self.token_sets = [frozenset(ingredient.tokens) for ingredient in ingredients]
+        self.weights = [sum(self.idf[token] for token in ingredient.tokens)
+                        for ingredient in ingredients]
+        # Lightest names first: when a word is common, the closest matches
+        # are the entries with the fewest other words
+        for ids in self.postings.values():
+            ids.sort(key=self.weights.__getitem__)
+        self.posting_sets = {token: frozenset(ids) for token, ids in self.postings.items()}
+        self._resolved: Dict[str, dict] = {}
+
+    def match(self, name: str) -> Tuple[Optional[Ingredient], float]:
+        """Best ingredient for a name and its IDF-weighted Dice score (0-1)"""
+        tokens = name_tokens(name)
+        if not tokens:
+            return None, 0.0
+        index = self.exact.get(tuple(sorted(tokens)))
+        if index is not None:
+            return self.ingredients[index], 1.0
+
+        known = sorted((token for token in tokens if token in self.postings),
+                       key=lambda token: len(self.postings[token]))
+        if not known:
+            return None, 0.0
+        idf = self.idf
+        query = frozenset(tokens)
+        query_weight = sum(idf.get(token, self.unknown_idf) for token in tokens)
+
+        # Of the names holding every known word, the lightest scores best
+        best, best_score = None, 0.0
+        full = self.posting_sets[known[0]].intersection(
+            *(self.posting_sets[token] for token in known[1:]))
+        if full:
+            best = min(full, key=self.weights.__getitem__)
+            best_score = 2 * sum(idf[token] for token in known) / (
+                query_weight + self.weights[best])
+        # A name missing some words can only win if it is lighter still
+        limit = self.weights[best] if best is not None else math.inf
+        for token in known:
+            for index in self.postings[token][:MAX_CANDIDATES]:
+                if self.weights[index] >= limit:
+                    break
+                shared = sum(idf[word] for word in query.intersection(self.token_sets[index]))
+                score = 2 * shared / (query_weight + self.weights[index])
+                if score > best_score:
+                    best, best_score = index, score
+        if best is None:
+            return None, 0.0
+        return self.ingredients[best], best_score
+
+    def _unit_grams(self, unit: str, ingredient: Ingredient) -> Tuple[Optional[float], float]:
+        """Grams in one unit for an ingredient, and the conversion confidence"""
+        if unit in MASS_UNITS:
+            return MASS_UNITS[unit], UNIT_CONFIDENCE['same']
+        if self.portions is not None:
+            grams = self.portions.unit_grams(ingredient.name, unit)
+            if grams is not None:
+                return grams, UNIT_CONFIDENCE['table']
+        return None, 0.0
+
+    def servings(self, quantity: Optional[float], unit: Optional[str],
+                 ingredient: Ingredient) -> Tuple[Optional[float], Optional[float], float]:
+        """
+        (servings, grams, confidence) for an amount of an ingredient; servings
+        is None when the unit cannot be converted
+        """
+        serving_unit = ingredient.serving_unit
+        serving_quantity = ingredient.serving_quantity
+        confidence = UNIT_CONFIDENCE['same']
+        if quantity is None:
+            quantity = 1.0
+            if unit is None:
+                return 1.0, None, UNIT_CONFIDENCE['assumed']
+
+        if unit == serving_unit or (unit is None and serving_unit not in MASS_UNITS
+                                    and serving_unit not in VOLUME_UNITS):
+            factor = quantity / serving_quantity
+            grams = MASS_UNITS.get(serving_unit)
+            return factor, grams and quantity * grams, confidence
+        if unit in VOLUME_UNITS and serving_unit in VOLUME_UNITS:
+            factor = quantity * VOLUME_UNITS[unit] / (serving_quantity * VOLUME_UNITS[serving_unit])
+            serving_grams, _ = self._unit_grams(serving_unit, ingredient)
+            return factor, serving_grams and factor * serving_quantity * serving_grams, confidence
+
+        if unit is None:
+            line_grams = None
+            for count_unit in COUNT_UNITS:
+                line_grams, _ = self._unit_grams(count_unit, ingredient)
+                if line_grams is not None:
+                    confidence = UNIT_CONFIDENCE['count']
+                    break
+        else:
+            line_grams, confidence = self._unit_grams(unit, ingredient)
+        serving_grams, serving_confidence = self._unit_grams(serving_unit, ingredient)
+        if line_grams is None or not serving_grams:
+            return None, None, 0.0
+        grams = quantity * line_grams
+        return grams / (serving_quantity * serving_grams), grams, min(confidence, serving_confidence)
+
+    def resolve(self, line: str) -> dict:
+        """
+        Nutrition for one ingredient line
+
+        Returns a dict with the parsed quantity, unit and name, the matched
+        ingredient ("match", None if nothing matched), the grams when known,
+        "confidence" and StandardizedNutrition "nutrition" (None when the
+        line could not be scaled).
+        """
+        resolved = self._resolved.get(line)
+        if resolved is not None:
+            return resolved
+
+        parsed = parse_ingredient_line(line)
+        ingredient, score = self.match(parsed.name)
+        resolved = {
+            'line': line,
+            'quantity': parsed.quantity,
+            'unit': parsed.unit,
+            'name': parsed.name,
+            'match': None,
+            'grams': None,
+            'confidence': 0.0,
+            'nutrition': None,
+        }
+        if ingredient is not None:
+            resolved['match'] = ingredient.name
+            factor, grams, unit_confidence = self.servings(parsed.quantity, parsed.unit, ingredient)
+            if factor is not None:
+                resolved['grams'] = round(grams, 2) if grams else None
+                resolved['confidence'] = round(score * unit_confidence, 3)
+                resolved['nutrition'] = ingredient.nutrition(factor)
+
+        if len(self._resolved) < CACHE_LIMIT:
+            self._resolved[line] = resolved
+        return resolved
+
+    def resolve_lines(self, lines: Iterable[str]) -> Iterator[dict]:
+        """Resolve many lines; repeated lines are resolved once"""
+        return map(self.resolve, lines)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Resolve recipe ingredient lines to nutrition from simple_ingredients data",
+        epilog="Example:\n  python3 ingredient_nutrition.py usda_simple_ingredients.csv lines.txt "
+               "--portions portion_grams.json --output resolved.jsonl",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('ingredients_csv', help="simple_ingredients CSV (gzip/zstd by suffix)")
+    parser.add_argument('lines_file', help="Ingredient lines, one per line ('-' for stdin)")
+    parser.add_argument('--portions', metavar='PATH',
+                        help="portion_grams.py table for unit-to-gram conversions")
+    parser.add_argument('--output', help="Write results as JSON lines (default: stdout)")
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f"Confidence counted as resolved (default: {DEFAULT_MIN_CONFIDENCE})")
+    args = parser.parse_args()
+
+    try:
+        ingredients = load_ingredients(args.ingredients_csv)
+        portions = PortionGrams.load(args.portions) if args.portions else None
+        if args.lines_file == '-':
+            lines = [line.strip() for line in sys.stdin if line.strip()]
+        else:
+            with open_stream(args.lines_file, 'r') as f:
+                lines = [line.strip() for line in f if line.strip()]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    resolver = NutritionResolver(ingredients, portions)
+    indexed = time.perf_counter()
+    results = list(resolver.resolve_lines(lines))
+    elapsed = time.perf_counter() - indexed
+
+    out = open_stream(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if args.output:
+            out.close()
+
+    confident = sum(1 for result in results if result['confidence'] >= args.min_confidence)
+    report = sys.stdout if args.output else sys.stderr
+    print("-" * 60, file=report)
+    print(f"Indexed {len(ingredients)} ingredients in {indexed - start:.2f}s", file=report)
+    print(f"Resolved {len(results)} lines in {elapsed:.2f}s "
+          f"({len(results) / elapsed if elapsed else 0:,.0f} lines/s)", file=report)
+    print(f"Confidence >= {args.min_confidence:g}: {confident} "
+          f"({len(results) - confident} to send to Edamam)", file=report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Ingredient Search Index
+Builds a prebuilt autocomplete index of simple_ingredients names, so lookups
+stop running name.ilike.%term% / category.ilike.%term% (a leading-wildcard
+scan idx_simple_ingredients_name cannot serve) on every keystroke, and ships
+the query side as SearchIndex.
+
+Names and queries are folded the same way: accents stripped, lowercased,
+split into words, plurals singularised (household_serving.stem) and
+cooking words normalised ("sautéed", "saute" -> sauteed; "stir fry",
+"stir-fried" -> stirfry). Queries that are a category word ("veggies",
+"beans") return that category, as categoryMap in
+lib/simpleIngredientService.ts does.
+
+The artifact is one JSON object holding:
+
+- names, categories and folded names, numbered shortest first so lower
+  row numbers rank higher among equal matches
+- a prefix table: rows sorted by folded name, with the best rows of every
+  2-3 character prefix precomputed
+- a sorted word table with each word's rows, for word-prefix matches
+- trigram postings, for typos and mid-word fragments
+
+Matches rank exact name, then name prefix, then every query word found
+(the last one as a prefix), then trigram similarity.
+
+Usage:
+    python3 ingredient_search.py usda_simple_ingredients.csv --output ingredient_search.json
+    python3 ingredient_search.py --index ingredient_search.json --query "sauteed mush"
+"""
+
+import argparse
+import bisect
+import csv
+import hashlib
+import heapq
+import json
+import math
+import re
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from compressed_io import compression_for_name, open_stream
+from household_serving import stem
+
+FORMAT = 'ingredient-search'
+FORMAT_VERSION = 1  # bump when folding changes: queries must fold like the index
+DEFAULT_INDEX_PATH = 'ingredient_search.json'
+CACHE_LIMIT = 1 << 16
+DEFAULT_LIMIT = 10
+MIN_QUERY_LENGTH = 2
+# Name prefixes up to this length keep their best rows precomputed
+SHORT_PREFIX = 3
+SHORT_PREFIX_ROWS = 64
+MIN_SIMILARITY = 0.6
+# Fuzzy matching scores at most this many candidate rows, best ranked first
+MAX_FUZZY_CANDIDATES = 1024
+
+# Match tiers (a fuzzy match scores the share of query trigrams found, at most 1)
+EXACT, PREFIX, WORDS = 3.0, 2.0, 1.0
+
+# Mirrors categoryMap in lib/simpleIngredientService.ts
+CATEGORY_SYNONYMS = {
+    'vegetable': 'vegetable',
+    'vegetables': 'vegetable',
+    'veggie': 'vegetable',
+    'veggies': 'vegetable',
+    'fruit': 'fruit',
+    'fruits': 'fruit',
+    'protein': 'protein',
+    'proteins': 'protein',
+    'meat': 'protein',
+    'meats': 'protein',
+    'grain': 'grain',
+    'grains': 'grain',
+    'dairy': 'dairy',
+    'nut': 'nuts',
+    'nuts': 'nuts',
+    'legume': 'legume',
+    'legumes': 'legume',
+    'bean': 'legume',
+    'beans': 'legume',
+}
+
+# Spellings of the cooked-variant prefixes (migrations 072-074) and USDA
+# preparation words, after stemming
+COOKING_SYNONYMS = {
+    'saute': 'sauteed',
+    'sautee': 'sauteed',
+    'sauted': 'sauteed',
+    'grill': 'grilled',
+    'roast': 'roasted',
+    'steam': 'steamed',
+    'boil': 'boiled',
+    'bake': 'baked',
+    'fry': 'fried',
+    'stirfried': 'stirfry',
+    'cook': 'cooked',
+}
+
+_STIR_FRY = re.compile(r'\bstir[\s-]*fr(?:y|ied|ies)\b')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+@lru_cache(maxsize=CACHE_LIMIT)
+def fold_word(word: str) -> str:
+    """Stemmed, normalised form of one lowercase word"""
+    word = stem(word)
+    return COOKING_SYNONYMS.get(word, word)
+
+
+def _fold_words(text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = _STIR_FRY.sub('stirfry', text)
+    raw = tuple(word for word in _NON_WORD.split(text) if word)
+    return tuple(fold_word(word) for word in raw), raw
+
+
+# (folded words, raw words) of a name or query: folded words are stemmed and
+# normalised, raw words only lowercased without accents
+fold_words = lru_cache(maxsize=CACHE_LIMIT)(_fold_words)
+
+
+def fold(text: str) -> str:
+    """Folded form of a name or query, words joined by spaces"""
+    return ' '.join(fold_words(text)[0])
+
+
+def trigrams(folded: str) -> set:
+    """pg_trgm-style trigrams: each word padded with two spaces before, one after"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[k:k + 3] for k in range(len(padded) - 2))
+    return grams
+
+
+def build_index(rows: Iterable[dict], source: str = '') -> dict:
+    """
+    Index artifact for simple_ingredients CSV rows. Rows missing a name,
+    inactive rows and repeated names (first one wins) are left out.
+    """
+    entries = []
+    seen = set()
+    for row in rows:
+        name = (row.get('name') or '').strip()
+        if not name or name in seen:
+            continue
+        if (row.get('is_active') or 'true').strip().lower() in ('false', 'f', '0', 'no'):
+            continue
+        seen.add(name)
+        folded_words, raw_words = _fold_words(name)
+        entries.append((len(folded_words), ' '.join(folded_words), name,
+                        (row.get('category') or '').strip(), raw_words))
+    entries.sort()
+
+    names = [entry[2] for entry in entries]
+    folded = [entry[1] for entry in entries]
+    categories = sorted({entry[3] for entry in entries})
+    category_index = {category: k for k, category in enumerate(categories)}
+
+    word_rows = defaultdict(list)
+    trigram_rows = defaultdict(list)
+    row_words = []
+    for row, (_, key, _, _, raw_words) in enumerate(entries):
+        # Raw words too, so a half-typed "berri" still finds "berries"
+        words = list(dict.fromkeys(key.split() + list(raw_words)))
+        row_words.append(' '.join(words))
+        for word in words:
+            word_rows[word].append(row)
+        for gram in trigrams(key):
+            trigram_rows[gram].append(row)
+
+    prefix_order = sorted(range(len(names)), key=folded.__getitem__)
+    prefix_top = defaultdict(list)
+    for row in range(len(names)):
+        for length in range(MIN_QUERY_LENGTH, SHORT_PREFIX + 1):
+            if len(folded[row]) >= length:
+                best = prefix_top[folded[row][:length]]
+                if len(best) < SHORT_PREFIX_ROWS:
+                    best.append(row)
+
+    words = sorted(word_rows)
+    body = {
+        'names': names,
+        'folded': folded,
+        'row_words': row_words,
+        'categories': categories,
+        'category_ids': [category_index[entry[3]] for entry in entries],
+        'prefix_order': prefix_order,
+        'prefix_top': dict(sorted(prefix_top.items())),
+        'words': words,
+        'word_rows': [word_rows[word] for word in words],
+        'trigrams': dict(sorted(trigram_rows.items())),
+    }
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+    return {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'version': digest[:12],
+        'generated_date': time.strftime('%Y-%m-%d'),
+        'source': source,
+        'rows': len(names),
+        **body,
+    }
+
+
+def write_search_index(csv_path: str, output_path: str = DEFAULT_INDEX_PATH) -> dict:
+    """Build the index from a simple_ingredients CSV and write it (.gz/.zst by suffix)"""
+    with open_stream(csv_path, 'r', newline='') as f:
+        artifact = build_index(csv.DictReader(f), source=Path(csv_path).name)
+    output = Path(output_path)
+    temp = output.with_name(output.name + '.tmp')
+    with open_stream(str(temp), 'w', compression=compression_for_name(output_path)) as f:
+        json.dump(artifact, f, separators=(',', ':'))
+    temp.replace(output)
+    return artifact
+
+
+class SearchIndex:
+    """
+    Loaded search index. search() returns the top matches for a query,
+    typically in well under a millisecond.
+    """
+
+    def __init__(self, artifact: dict):
+        if artifact.get('format') != FORMAT or artifact.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Not a {FORMAT} v{FORMAT_VERSION} index "
+                             f"(format {artifact.get('format')!r} "
+                             f"v{artifact.get('format_version')})")
+        self.version = artifact['version']
+        self.names: List[str] = artifact['names']
+        self.folded: List[str] = artifact['folded']
+        # " word word ...": a word starts with p when " p" occurs
+        self.row_words = [' ' + words for words in artifact['row_words']]
+        self.categories: List[str] = artifact['categories']
+        self.category_ids: List[int] = artifact['category_ids']
+        self.prefix_order: List[int] = artifact['prefix_order']
+        self.prefix_keys = [self.folded[row] for row in self.prefix_order]
+        self.prefix_top: Dict[str, List[int]] = artifact['prefix_top']
+        self.words: List[str] = artifact['words']
+        self.word_rows: List[List[int]] = artifact['word_rows']
+        self.word_index = {word: k for k, word in enumerate(self.words)}
+        self._word_sets: Dict[int, frozenset] = {}
+        self.trigram_rows: Dict[str, List[int]] = artifact['trigrams']
+        self.category_rows: Dict[str, List[int]] = defaultdict(list)
+        for row, category_id in enumerate(self.category_ids):
+            self.category_rows[self.categories[category_id]].append(row)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> 'SearchIndex':
+        """Load an index written by this script (.gz/.zst by suffix)"""
+        with open_stream(path, 'r') as f:
+            return cls(json.load(f))
+
+    def category(self, row: int) -> str:
+        return self.categories[self.category_ids[row]]
+
+    def _word_range(self, prefix: str) -> Tuple[int, int]:
+        """Range of the word table starting with prefix"""
+        start = bisect.bisect_left(self.words, prefix)
+        return start, bisect.bisect_left(self.words, prefix + '\uffff', start)
+
+    def _word_prefix_rows(self, start: int, end: int) -> Iterable[int]:
+        """Rows of a word table range, in row order, each once"""
+        last = -1
+        for row in heapq.merge(*self.word_rows[start:end]):
+            if row != last:
+                yield row
+                last = row
+
+    def _word_set(self, k: int) -> frozenset:
+        rows = self._word_sets.get(k)
+        if rows is None:
+            rows = frozenset(self.word_rows[k])
+            if len(self._word_sets) < CACHE_LIMIT:
+                self._word_sets[k] = rows
+        return rows
+
+    def _has_word_prefix(self, row: int, prefix: str) -> bool:
+        return ' ' + prefix in self.row_words[row]
+
+    def _name_prefix_rows(self, query: str, limit: int, allowed) -> List[int]:
+        """Best rows whose folded name starts with query"""
+        if len(query) <= SHORT_PREFIX and allowed is None and limit <= SHORT_PREFIX_ROWS:
+            return self.prefix_top.get(query, [])[:limit]
+        start = bisect.bisect_left(self.prefix_keys, query)
+        end = bisect.bisect_left(self.prefix_keys, query + '\uffff', start)
+        rows = self.prefix_order[start:end]
+        if allowed is not None:
+            rows = [row for row in rows if row in allowed]
+        return heapq.nsmallest(limit, rows)
+
+    def _word_rows(self, words: Tuple[str, ...], limit: int, allowed) -> List[int]:
+        """Best rows holding every word, the last one as a prefix"""
+        *complete, last = words
+        ids = []
+        for word in complete:
+            k = self.word_index.get(word)
+            if k is None:
+                return []
+            ids.append(k)
+        start, end = self._word_range(last)
+        prefix_size = sum(len(rows) for rows in self.word_rows[start:end])
+        ids.sort(key=lambda k: len(self.word_rows[k]))
+        required = [self._word_set(k) for k in ids]
+        if allowed is not None:
+            required.append(allowed)
+
+        # Walk the shortest candidate list in row order, checking the rest
+        matches = []
+        if not ids or prefix_size <= len(self.word_rows[ids[0]]):
+            candidates, check_prefix = self._word_prefix_rows(start, end), False
+        else:
+            candidates, check_prefix = self.word_rows[ids[0]], True
+            required = required[1:]
+        for row in candidates:
+            if (all(row in rows for rows in required)
+                    and (not check_prefix or self._has_word_prefix(row, last))):
+                matches.append(row)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def _fuzzy_rows(self, folded: str, limit: int, allowed) -> List[Tuple[float, int]]:
+        """
+        (similarity, row) of the names holding most of the query's trigrams.
+        Only trigrams inside the query's words count, so a fragment such as
+        "berri" or a typo such as "mushrom" still matches mid-name, as
+        ILIKE '%term%' did.
+        """
+        grams = set()
+        for word in folded.split():
+            grams.update(word[k:k + 3] for k in range(len(word) - 2))
+        if not grams:
+            return []
+        # A name with MIN_SIMILARITY of the trigrams holds one of the rarest
+        # len - needed + 1, so only their rows are candidates
+        needed = math.ceil(MIN_SIMILARITY * len(grams))
+        rare = sorted(grams, key=lambda gram: len(self.trigram_rows.get(gram, ())))
+        postings = [self.trigram_rows.get(gram, []) for gram in rare[:len(grams) - needed + 1]]
+        scored = []
+        last = -1
+        for row in islice(heapq.merge(*postings), MAX_FUZZY_CANDIDATES):
+            if row == last or (allowed is not None and row not in allowed):
+                continue
+            last = row
+            name = self.folded[row]
+            count = sum(1 for gram in grams if gram in name)
+            if count >= needed:
+                scored.append((count / len(grams), row))
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT,
+               category: Optional[str] = None) -> List[dict]:
+        """
+        Ranked matches for a query: [{"name", "category", "score"}, ...]
+
+        Args:
+            query: Search text, at least MIN_QUERY_LENGTH characters
+            limit: Most matches returned
+            category: Only match rows of this category
+        """
+        query = (query or '').strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        allowed = set(self.category_rows.get(category, ())) if category else None
+
+        category_match = CATEGORY_SYNONYMS.get(query.lower())
+        if category_match and not category:
+            return [{'name': self.names[row], 'category': category_match, 'score': EXACT}
+                    for row in self.category_rows.get(category_match, [])[:limit]]
+
+        words, _ = fold_words(query)
+        if not words:
+            return []
+        folded = ' '.join(words)
+        scores: Dict[int, float] = {}
+        for row in self._name_prefix_rows(folded, limit, allowed):
+            scores[row] = EXACT if self.folded[row] == folded else PREFIX
+        for row in self._word_rows(words, limit, allowed):
+            scores.setdefault(row, WORDS)
+        if len(scores) < limit:
+            for similarity, row in self._fuzzy_rows(folded, limit, allowed):
+                scores.setdefault(row, round(similarity, 3))
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{'name': self.names[row], 'category': self.category(row), 'score': score}
+                for row, score in ranked]
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Build or query the simple_ingredients autocomplete index",
+        epilog="Example:\n  python3 ingredient_search.py usda_simple_ingredients.csv "
+               "--output ingredient_search.json\n"
+               "  python3 ingredient_search.py --index ingredient_search.json --query banana",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('input_file', nargs='?', help="simple_ingredients CSV to index")
+    parser.add_argument('--output', default=DEFAULT_INDEX_PATH,
+                        help=f"Index path; .gz/.zst compresses (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH,
+                        help="Index to query with --query")
+    parser.add_argument('--query', action='append', default=[],
+                        help="Search the index; repeatable")
+    parser.add_argument('--category', help="Only match this category")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT,
+                        help=f"Matches per query (default: {DEFAULT_LIMIT})")
+    args = parser.parse_args()
+
+    if args.query:
+        try:
+            index = SearchIndex.load(args.index)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        for query in args.query:
+            start = time.perf_counter()
+            matches = index.search(query, args.limit, args.category)
+            elapsed = time.perf_counter() - start
+            print(f"{query!r}: {len(matches)} matches in {elapsed * 1e6:.0f} µs")
+            for match in matches:
+                print(f"  {match['score']:<6g} {match['name']} ({match['category']})")
+        return
+
+    if not args.input_file:
+        parser.error("give a CSV to build an index, or --query to search one")
+    if not Path(args.input_file).exists():
+        print(f"Error: File not found: {args.input_file}")
+        sys.exit(1)
+
+    start = time.monotonic()
+    try:
+        artifact = write_search_index(args.input_file, args.output)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("-" * 60)
+    print(f"Index version: {artifact['version']}")
+    print(f"Names: {artifact['rows']} ({len(artifact['words'])} words, "
+          f"{len(artifact['trigrams'])} trigrams)")
+    print(f"✓ Wrote {args.output} ({time.monotonic() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Allergen and Health-Label Bit Masks
+Gives every allergen in VALID_ALLERGENS_AND_PREFERENCES.md and every health
+and diet label in ALL_HEALTH_LABELS_TAGS.md a fixed bit, so an ingredient's
+allergens / health_labels / diet_labels arrays become one uint64 and a
+client's restrictions become a (forbidden, required) pair. A row is allowed
+when
+
+    mask & (forbidden | required) == required
+
+which NumPy evaluates over the whole catalogue in one pass. The nutrient
+matrix (nutrient_matrix.py) stores the masks as its label_mask section, in
+row order.
+
+Bits:
+- 0-15: contains an allergen (the allergens column; names are aliased as
+  in lib/allergenPreferenceValidation.ts, and an empty column falls back
+  to the name keywords of getAllergens in lib/simpleIngredientService.ts)
+- 16-31: the matching "-free" health label, same order (bit + 16)
+- 32 and up: diet, lifestyle and nutrition-focus labels
+
+The table is append-only: masks stay comparable across builds as long as
+no bit is moved or reused. Labels that are not in it are ignored.
+
+Usage:
+    python3 label_masks.py --bits
+    python3 label_masks.py simple_ingredients.nmx --restrict dairy-free --restrict vegan
+"""
+
+import argparse
+import re
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Allergens (bits 0-15) and their "-free" labels (bits 16-31), in the same order
+ALLERGENS = (
+    'peanuts', 'tree nuts', 'dairy', 'eggs', 'soy', 'wheat', 'gluten', 'fish',
+    'shellfish', 'sesame', 'sulfites', 'crustacean', 'mollusk', 'celery',
+    'mustard', 'lupine',
+)
+FREE_LABELS = (
+    'peanut-free', 'tree-nut-free', 'dairy-free', 'egg-free', 'soy-free',
+    'wheat-free', 'gluten-free', 'fish-free', 'shellfish-free', 'sesame-free',
+    'sulfite-free', 'crustacean-free', 'mollusk-free', 'celery-free',
+    'mustard-free', 'lupine-free',
+)
+FREE_LABEL_BIT = 16
+# Bits 32 and up; append only
+DIET_LABELS = (
+    'vegetarian', 'vegan', 'pescatarian', 'paleo', 'ketogenic', 'low-carb',
+    'low-fodmap', 'low-fat', 'low-sodium', 'high-protein', 'high-fiber',
+    'kosher', 'alcohol-free', 'balanced', 'whole30', 'pork-free',
+    'red-meat-free', 'primal', 'lacto-vegetarian', 'ovo-vegetarian',
+    'sugar-conscious', 'low-sugar', 'low-calorie', 'high-vitamin',
+    'high-calcium', 'high-iron', 'high-potassium', 'antioxidant-rich',
+    'heart-healthy',
+)
+DIET_LABEL_BIT = 32
+CACHE_LIMIT = 1 << 16
+
+# Label of every bit, by position
+LABEL_BITS: List[str] = list(ALLERGENS) + list(FREE_LABELS) + list(DIET_LABELS)
+assert len(ALLERGENS) == len(FREE_LABELS) == FREE_LABEL_BIT
+assert len(LABEL_BITS) - len(DIET_LABELS) == DIET_LABEL_BIT and len(LABEL_BITS) <= 64
+
+
+def label_key(value: str) -> str:
+    """Lowercased, with runs of spaces, hyphens and underscores as one hyphen"""
+    return re.sub(r'[\s_-]+', '-', value.strip().lower()).strip('-')
+
+
+# Mirrors ALLERGEN_ALIASES in lib/allergenPreferenceValidation.ts (keys as label_key)
+ALLERGEN_ALIASES = {
+    'peanut': 'peanuts', 'peanut-free': 'peanuts', 'peanutfree': 'peanuts',
+    'nuts': 'tree nuts', 'tree-nut': 'tree nuts', 'treenut': 'tree nuts',
+    'tree-nut-free': 'tree nuts', 'treenutfree': 'tree nuts',
+    'almond': 'tree nuts', 'almonds': 'tree nuts', 'cashew': 'tree nuts',
+    'cashews': 'tree nuts', 'walnut': 'tree nuts', 'walnuts': 'tree nuts',
+    'pecan': 'tree nuts', 'pecans': 'tree nuts',
+    'milk': 'dairy', 'lactose': 'dairy', 'cheese': 'dairy', 'butter': 'dairy',
+    'cream': 'dairy', 'yogurt': 'dairy', 'dairy-free': 'dairy', 'dairyfree': 'dairy',
+    'egg': 'eggs', 'egg-free': 'eggs', 'eggfree': 'eggs',
+    'soya': 'soy', 'soybeans': 'soy', 'soy-free': 'soy', 'soyfree': 'soy',
+    'wheat-free': 'wheat', 'wheatfree': 'wheat',
+    'gluten-free': 'gluten', 'glutenfree': 'gluten',
+    'fish-free': 'fish', 'fishfree': 'fish',
+    'shrimp': 'shellfish', 'crab': 'shellfish', 'lobster': 'shellfish',
+    'oyster': 'shellfish', 'oysters': 'shellfish', 'clam': 'shellfish',
+    'clams': 'shellfish', 'mussel': 'shellfish', 'mussels': 'shellfish',
+    'shellfish-free': 'shellfish', 'shellfishfree': 'shellfish',
+    'sesame-free': 'sesame', 'sesamefree': 'sesame', 'sesame-seeds': 'sesame',
+    'sulfite': 'sulfites', 'sulfite-free': 'sulfites', 'sulfitefree': 'sulfites',
+    'crustaceans': 'crustacean', 'mollusks': 'mollusk', 'molluscs': 'mollusk',
+    'lupin': 'lupine',
+}
+
+# Provider spellings of the labels (Edamam Title-Case and Spoonacular spaced
+# forms fold to the canonical ones through label_key already)
+LABEL_ALIASES = {
+    'keto': 'ketogenic', 'keto-friendly': 'ketogenic',
+    'pescetarian': 'pescatarian',
+    'sulfites-free': 'sulfite-free', 'tree-nuts-free': 'tree-nut-free',
+    'peanuts-free': 'peanut-free', 'eggs-free': 'egg-free',
+    'mollusc-free': 'mollusk-free', 'lupin-free': 'lupine-free',
+    'high-in-protein': 'high-protein', 'high-in-fiber': 'high-fiber',
+    'low-in-sodium': 'low-sodium', 'low-in-sugar': 'low-sugar',
+    'low-in-fat': 'low-fat', 'high-in-calcium': 'high-calcium',
+    'high-in-iron': 'high-iron', 'high-in-vitamin-a': 'high-vitamin',
+    'high-in-vitamin-c': 'high-vitamin',
+}
+
+ALLERGEN_BITS: Dict[str, int] = {label_key(name): bit for bit, name in enumerate(ALLERGENS)}
+ALLERGEN_BITS.update({alias: ALLERGEN_BITS[label_key(name)]
+                      for alias, name in ALLERGEN_ALIASES.items()})
+HEALTH_LABEL_BITS: Dict[str, int] = {name: bit for bit, name in enumerate(LABEL_BITS)
+                                     if bit >= FREE_LABEL_BIT}
+HEALTH_LABEL_BITS.update({alias: HEALTH_LABEL_BITS[name] for alias, name in LABEL_ALIASES.items()})
+
+# Mirrors SimpleIngredientService.getAllergens (substring matches on the name)
+NAME_ALLERGENS = (
+    ('tree nuts', ('almond', 'walnut', 'cashew', 'pistachio')),
+    ('peanuts', ('peanut',)),
+    ('dairy', ('milk', 'cheese', 'yogurt', 'butter', 'ghee', 'paneer', 'curd',
+               'cottage cheese', 'cheddar')),
+    ('eggs', ('egg',)),
+    ('fish', ('fish', 'salmon', 'tuna', 'cod')),
+    ('shellfish', ('shrimp', 'prawns', 'crab', 'lobster')),
+    ('gluten', ('bread', 'pasta', 'naan', 'wheat')),
+    ('soy', ('soy', 'tofu')),
+)
+NON_DAIRY_MILKS = ('almond milk', 'soy milk', 'coconut milk')
+_NAME_KEYWORD_BITS = [(keyword, 1 << ALLERGEN_BITS[label_key(allergen)])
+                      for allergen, keywords in NAME_ALLERGENS for keyword in keywords]
+
+# Restrictions hasAllergenConflict treats as "must carry this label"
+LABEL_RESTRICTIONS = ('vegetarian', 'vegan')
+# ... and as "no such allergen and must carry the label" (hyphens dropped, as it compares)
+FREE_RESTRICTIONS = ('dairyfree', 'glutenfree')
+
+
+def split_labels(raw: Optional[str]) -> List[str]:
+    """A CSV array field ("a,b" or a Postgres {a,"b c"} literal) as items"""
+    raw = (raw or '').strip()
+    if raw.startswith('{') and raw.endswith('}'):
+        raw = raw[1:-1]
+    return [item.strip().strip('"').strip() for item in raw.split(',') if item.strip().strip('"')]
+
+
+def name_allergens(name: str) -> List[str]:
+    """Allergens getAllergens infers from an ingredient name"""
+    return [label for label in labels(_name_mask(name.lower())) if label in ALLERGENS]
+
+
+def ingredient_mask(allergens: Iterable[str] = (), health_labels: Iterable[str] = (),
+                    diet_labels: Iterable[str] = (), name: str = '') -> int:
+    """
+    The mask of one ingredient.
+
+    Args:
+        allergens: Allergen names or aliases; when empty, inferred from name
+        health_labels: Health labels, any provider spelling
+        diet_labels: Diet labels, any provider spelling
+        name: Ingredient name, used only when allergens is empty
+    """
+    mask = 0
+    allergens = list(allergens) or name_allergens(name)
+    for allergen in allergens:
+        k = ALLERGEN_BITS.get(label_key(allergen))
+        if k is not None:
+            mask |= 1 << k
+    for label in list(health_labels) + list(diet_labels):
+        k = HEALTH_LABEL_BITS.get(label_key(label))
+        if k is not None:
+            mask |= 1 << k
+    return mask
+
+
+def _name_mask(name: str) -> int:
+    mask = 0
+    for keyword, keyword_bit in _NAME_KEYWORD_BITS:
+        if keyword in name:
+            mask |= keyword_bit
+    if name in NON_DAIRY_MILKS:
+        mask &= ~(1 << ALLERGEN_BITS['dairy'])
+    return mask
+
+
+@lru_cache(maxsize=CACHE_LIMIT)
+def _field_masks(allergens: str, health_labels: str, diet_labels: str) -> Tuple[int, bool]:
+    """(mask, whether allergens is empty) of a row's raw array fields"""
+    items = split_labels(allergens)
+    mask = ingredient_mask(items, split_labels(health_labels), split_labels(diet_labels),
+                           name='')
+    return mask, not items
+
+
+def row_mask(row: dict) -> int:
+    """The mask of a simple_ingredients CSV row"""
+    mask, infer = _field_masks(row.get('allergens') or '', row.get('health_labels') or '',
+                               row.get('diet_labels') or '')
+    if infer:
+        mask |= _name_mask((row.get('name') or '').strip().lower())
+    return mask
+
+
+def restriction_masks(restrictions: Iterable[str]) -> Tuple[int, int]:
+    """
+    (forbidden, required) for a client's allergies and dietary restrictions,
+    with the rules of hasAllergenConflict in lib/simpleIngredientService.ts:
+    "dairy-free" and "gluten-free" forbid the allergen and require the label,
+    "vegetarian" and "vegan" require the label, and anything else forbids the
+    allergen it names. Unknown restrictions are ignored.
+    """
+    forbidden = required = 0
+    for restriction in restrictions:
+        key = label_key(restriction)
+        key = LABEL_ALIASES.get(key, key)
+        if key in LABEL_RESTRICTIONS:
+            required |= 1 << HEALTH_LABEL_BITS[key]
+            continue
+        k = ALLERGEN_BITS.get(key)
+        if k is None:
+            continue
+        forbidden |= 1 << k
+        if key.replace('-', '') in FREE_RESTRICTIONS:
+            required |= 1 << (k + FREE_LABEL_BIT)
+    return forbidden, required
+
+
+def labels(mask: int) -> List[str]:
+    """Canonical labels of a mask, in bit order"""
+    return [label for k, label in enumerate(LABEL_BITS) if mask >> k & 1]
+
+
+def allowed(masks, restrictions: Iterable[str]):
+    """
+    Which rows pass a client's restrictions: a NumPy bool array for a NumPy
+    uint64 array of masks, otherwise a list of bools.
+
+    Args:
+        masks: Row masks (e.g. NutrientMatrix.label_mask)
+        restrictions: Client allergies and dietary restrictions
+    """
+    forbidden, required = restriction_masks(restrictions)
+    test = forbidden | required
+    if np is not None and isinstance(masks, np.ndarray):
+        return (masks & np.uint64(test)) == np.uint64(required)
+    return [mask & test == required for mask in masks]
+
+
+def allowed_rows(masks, restrictions: Iterable[str]) -> List[int]:
+    """Row numbers that pass a client's restrictions"""
+    keep = allowed(masks, restrictions)
+    if np is not None and isinstance(keep, np.ndarray):
+        return np.flatnonzero(keep).tolist()
+    return [row for row, ok in enumerate(keep) if ok]
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Print the label bit table, or filter a nutrient matrix by client restrictions",
+        epilog="Example:\n  python3 label_masks.py --bits\n"
+               "  python3 label_masks.py simple_ingredients.nmx --restrict peanuts "
+               "--restrict dairy-free",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('matrix_file', nargs='?', help="Nutrient matrix (nutrient_matrix.py) to filter")
+    parser.add_argument('--bits', action='store_true', help="Print every label's bit")
+    parser.add_argument('--restrict', action='append', default=[], metavar='LABEL',
+                        help="Client allergy or restriction; repeatable")
+    parser.add_argument('--show', type=int, default=10,
+                        help="Allowed ingredients to list (default: 10)")
+    args = parser.parse_args()
+
+    if args.bits:
+        for k, label in enumerate(LABEL_BITS):
+            print(f"  {k:>2}  {label}")
+        return
+
+    if not args.matrix_file:
+        parser.error("give a nutrient matrix to filter, or --bits")
+    if not Path(args.matrix_file).exists():
+        print(f"Error: File not found: {args.matrix_file}")
+        sys.exit(1)
+
+    from nutrient_matrix import NutrientMatrix
+    try:
+        matrix = NutrientMatrix(args.matrix_file)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    with matrix:
+        forbidden, required = restriction_masks(args.restrict)
+        print(f"Forbidden: {', '.join(labels(forbidden)) or '-'}")
+        print(f"Required: {', '.join(labels(required)) or '-'}")
+        start = time.perf_counter()
+        allowed(matrix.label_mask, args.restrict)
+        elapsed = time.perf_counter() - start
+        rows = allowed_rows(matrix.label_mask, args.restrict)
+        print("-" * 60)
+        print(f"{len(rows)} of {matrix.rows} ingredients allowed "
+              f"({elapsed * 1e6:.0f} µs, {'NumPy' if np else 'pure Python'})")
+        for row in rows[:args.show]:
+            print(f"  {matrix.name(row)}  [{', '.join(labels(int(matrix.label_mask[row])))}]")
+
+
+if __name__ == '__main__':
+    main()
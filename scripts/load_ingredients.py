@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Direct-to-Database Loader for Simple Ingredients
+Streams a nutrition CSV straight into the simple_ingredients table using
+binary COPY batches over a pooled set of connections, instead of generating
+a .sql file and pasting chunks into the Supabase SQL editor.
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional
+
+from csv_to_ingredients_sql import (
+    SIMPLE_INGREDIENT_COLUMNS,
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    STAGING_TABLE,
+    NameDeduper,
+    conflict_clause,
+    iter_parallel_chunks,
+    iter_serial_chunks,
+    valid_row_numbers,
+)
+from delta_manifest import DeltaManifest
+from pg_retry import is_retryable
+
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+except ImportError:
+    psycopg2 = None
+    pg_pool = None
+
+
+class IngredientLoader:
+    """
+    Loads encoded COPY batches into simple_ingredients.
+
+    Each batch runs in its own transaction on a pooled connection:
+    COPY into a per-connection temp staging table, then one
+    INSERT ... SELECT ... ON CONFLICT (name) merge (DO NOTHING, or DO UPDATE
+    when upsert is set). Failed batches are retried with exponential backoff.
+    """
+
+    def __init__(self, dsn: str, concurrency: int = 4, retries: int = 3,
+                 retry_delay: float = 0.5, upsert: bool = False):
+        if psycopg2 is None:
+            print("Error: psycopg2 is required (pip install psycopg2-binary)")
+            sys.exit(1)
+
+        self.pool = pg_pool.ThreadedConnectionPool(1, concurrency, dsn)
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        columns = ', '.join(SIMPLE_INGREDIENT_COLUMNS)
+        self.prepare_sql = (f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                            f"(LIKE simple_ingredients INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        self.copy_sql = f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT binary)"
+        self.merge_sql = (f"INSERT INTO simple_ingredients ({columns}) "
+                          f"SELECT {columns} FROM {STAGING_TABLE} "
+                          f"{conflict_clause(upsert)}")
+
+        self._lock = threading.Lock()
+        self.rows_sent = 0
+        self.rows_inserted = 0
+        self.batches_loaded = 0
+        self.batches_retried = 0
+
+    def load_batch(self, encoded_rows: List[bytes]) -> int:
+        """Load one batch of binary COPY tuples, retrying on transient errors"""
+        payload = PGCOPY_HEADER + b''.join(encoded_rows) + PGCOPY_TRAILER
+
+        def run(cur):
+            cur.execute(self.prepare_sql)
+            cur.copy_expert(self.copy_sql, io.BytesIO(payload))
+            cur.execute(self.merge_sql)
+            return cur.rowcount
+
+        inserted = self.run_transaction(run)
+        with self._lock:
+            self.rows_sent += len(encoded_rows)
+            self.rows_inserted += inserted
+            self.batches_loaded += 1
+        return inserted
+
+    def execute(self, sql: str, params: Optional[tuple] = None) -> int:
+        """Run a single statement in its own transaction, with retries"""
+        def run(cur):
+            cur.execute(sql, params)
+            return cur.rowcount
+        return self.run_transaction(run)
+
+    def run_transaction(self, work) -> int:
+        """Run work(cursor) in one transaction on a pooled connection, retrying on transient errors"""
+        attempt = 0
+
+        while True:
+            conn = self.pool.getconn()
+            broken = False
+            try:
+                with conn.cursor() as cur:
+                    result = work(cur)
+                conn.commit()
+            except Exception as e:
+                broken = conn.closed != 0
+                if not broken:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                attempt += 1
+                if attempt > self.retries or not is_retryable(e):
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1)) * (1 + random.random())
+                print(f"Warning: Transaction failed ({e.__class__.__name__}: {str(e).strip()}), "
+                      f"retry {attempt}/{self.retries} in {delay:.1f}s")
+                with self._lock:
+                    self.batches_retried += 1
+                time.sleep(delay)
+                continue
+            finally:
+                self.pool.putconn(conn, close=broken)
+
+            return result
+
+    def close(self):
+        self.pool.closeall()
+
+
+def load_csv(csv_path: str, dsn: str, batch_size: int = 5000, concurrency: int = 4,
+             retries: int = 3, workers: int = 1, delta_manifest: Optional[str] = None,
+             deactivate_removed: bool = False, conflict_report: Optional[str] = None,
+             dedupe_memory_names: int = 2_000_000):
+    """
+    Load a nutrition CSV directly into simple_ingredients
+
+    Args:
+        csv_path: Path to the input CSV file
+        dsn: PostgreSQL connection string
+        batch_size: Rows per COPY batch / transaction (default: 5000)
+        concurrency: Batches loaded concurrently, one pooled connection each (default: 4)
+        retries: Attempts per failed batch before giving up (default: 3)
+        workers: Processes encoding rows (default: 1, 0 = all cores)
+        delta_manifest: Path to a name -> content hash manifest from the last load.
+            Only new or changed rows are sent, as upserts. The manifest is
+            rewritten only if every batch committed.
+        deactivate_removed: With delta_manifest, mark names that disappeared from
+            the CSV as is_active = FALSE
+        conflict_report: Drop rows whose normalised name repeats an earlier row and
+            write them to this CSV report instead of sending them
+        dedupe_memory_names: Names kept in memory before the dedupe index
+            spills to a Bloom filter plus an on-disk index
+    """
+    if not os.path.exists(csv_path):
+        print(f"Error: CSV file not found: {csv_path}")
+        sys.exit(1)
+
+    workers = workers or os.cpu_count() or 1
+
+    print(f"Reading CSV from: {csv_path}")
+    print(f"Batch size: {batch_size} rows per transaction")
+    print(f"Concurrency: {concurrency} connections")
+
+    delta = None
+    if delta_manifest:
+        try:
+            delta = DeltaManifest(delta_manifest)
+        except (OSError, ValueError) as e:
+            print(f"Error reading delta manifest: {e}")
+            sys.exit(1)
+        print(f"Delta manifest: {delta_manifest} ({len(delta.previous)} rows from last load)")
+    if conflict_report:
+        print(f"Conflict report: {conflict_report}")
+    print("-" * 60)
+
+    upsert = delta is not None
+    deduper = None
+    if conflict_report:
+        deduper = NameDeduper(conflict_report, max_memory_names=dedupe_memory_names)
+    with_keys = upsert or deduper is not None
+    loader = IngredientLoader(dsn, concurrency=concurrency, retries=retries, upsert=upsert)
+    start = time.perf_counter()
+    total_rows = 0
+    skipped_rows = 0
+    failed_batches = 0
+    deactivated = 0
+
+    if workers > 1:
+        chunks = iter_parallel_chunks(csv_path, 'copy-binary', workers, with_keys=with_keys)
+    else:
+        chunks = iter_serial_chunks(csv_path, 'copy-binary', batch_size, with_keys=with_keys)
+
+    def report(future):
+        nonlocal failed_batches
+        error = future.exception()
+        if error is not None:
+            failed_batches += 1
+            print(f"Error: Batch failed permanently: {error}")
+            return
+        elapsed = time.perf_counter() - start
+        print(f"Loaded batch {loader.batches_loaded} "
+              f"({loader.rows_sent} rows, {loader.rows_sent / elapsed:,.0f} rows/sec)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = set()
+            pending: List[bytes] = []
+
+            def submit(batch: List[bytes]):
+                nonlocal in_flight
+                while len(in_flight) >= concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report(future)
+                in_flight.add(executor.submit(loader.load_batch, batch))
+
+            for rows_read, skipped, encoded, keys in chunks:
+                for position in skipped:
+                    print(f"Warning: Skipping row {total_rows + position} - missing name or category")
+                if deduper is not None:
+                    row_numbers = valid_row_numbers(total_rows + 1, rows_read, skipped)
+                    encoded, keys = deduper.filter(encoded, keys, row_numbers)
+                total_rows += rows_read
+                skipped_rows += len(skipped)
+                if delta is not None:
+                    encoded = delta.filter(encoded, keys)
+                pending.extend(encoded)
+
+                while len(pending) >= batch_size:
+                    submit(pending[:batch_size])
+                    del pending[:batch_size]
+
+            if pending:
+                submit(pending)
+
+            for future in wait(in_flight).done:
+                report(future)
+
+        if delta is not None and not failed_batches:
+            removed = delta.removed_names()
+            if removed and deactivate_removed:
+                deactivated = loader.execute(
+                    "UPDATE simple_ingredients SET is_active = FALSE "
+                    "WHERE is_active AND name = ANY(%s)", (removed,))
+            delta.save(csv_path)
+    finally:
+        loader.close()
+        if deduper is not None:
+            deduper.close()
+
+    elapsed = time.perf_counter() - start
+
+    print("-" * 60)
+    print(f"Load {'complete' if not failed_batches else 'finished with errors'}!")
+    print(f"Total rows read: {total_rows}")
+    print(f"Rows sent: {loader.rows_sent}")
+    if upsert:
+        # ON CONFLICT DO UPDATE counts updated rows as well as inserted ones
+        print(f"Rows inserted or updated: {loader.rows_inserted}")
+    else:
+        print(f"Rows inserted: {loader.rows_inserted} "
+              f"({loader.rows_sent - loader.rows_inserted} already present)")
+    print(f"Rows skipped: {skipped_rows}")
+    if deduper is not None:
+        for line in deduper.summary():
+            print(line)
+    if delta is not None:
+        for line in delta.summary():
+            print(line)
+        if deactivate_removed:
+            print(f"Rows deactivated: {deactivated}")
+    print(f"Batches loaded: {loader.batches_loaded} ({loader.batches_retried} retries)")
+    print(f"Elapsed: {elapsed:.2f}s ({loader.rows_sent / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+    if failed_batches:
+        print(f"Failed batches: {failed_batches}")
+        if delta is not None:
+            print(f"Manifest not updated: {delta_manifest}")
+        sys.exit(1)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Load a nutrition CSV directly into the simple_ingredients table",
+        epilog="Example:\n  python load_ingredients.py ingredients.csv "
+               "--dsn postgresql://localhost/caloriescience",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('csv_file', help="Input CSV file")
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'),
+                        help="PostgreSQL connection string (default: $DATABASE_URL)")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="Rows per COPY batch / transaction (default: 5000)")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="Batches loaded concurrently (default: 4)")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="Retries per failed batch (default: 3)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Encode rows on N processes (default: 1, 0 = all cores)")
+    parser.add_argument('--delta-manifest', metavar='PATH',
+                        help="Only load rows that are new or changed since the load that "
+                             "wrote this manifest, as upserts")
+    parser.add_argument('--deactivate-removed', action='store_true',
+                        help="With --delta-manifest, set is_active = FALSE for names no "
+                             "longer in the CSV")
+    parser.add_argument('--conflict-report', metavar='PATH',
+                        help="Drop rows whose name (trimmed, case-insensitive) repeats an "
+                             "earlier row and list them in this CSV report")
+    parser.add_argument('--dedupe-memory-names', type=int, default=2_000_000,
+                        help="Names held in memory before dedupe spills to disk "
+                             "(default: 2000000)")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("no connection string: pass --dsn or set DATABASE_URL")
+    if args.deactivate_removed and not args.delta_manifest:
+        parser.error("--deactivate-removed requires --delta-manifest")
+
+    load_csv(args.csv_file, args.dsn, batch_size=args.batch_size,
+             concurrency=args.concurrency, retries=args.retries, workers=args.workers,
+             delta_manifest=args.delta_manifest, deactivate_removed=args.deactivate_removed,
+             conflict_report=args.conflict_report,
+             dedupe_memory_names=args.dedupe_memory_names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Batch Meal-Plan Nutrition Totals
+Totals and scores many meal plans at once against client_goals, instead of
+adding up nutrition objects one recipe at a time as
+NutritionMappingService.addNutrition / multiplyNutrition do per request.
+
+Each plan is a list of days, each day a sparse list of (ingredient or
+recipe, amount) items. Items become three arrays (day, source row, factor)
+over one source matrix: the simple_ingredients nutrient matrix
+(nutrient_matrix.py) followed by per-serving vectors of cached recipes. Day
+totals for every nutrient column are then a single weighted scatter-add,
+plan totals a second one, and the goal ranges are compared for all days at
+once. Plans are processed in batches of BATCH_PLANS.
+
+Plans (JSON lines or a JSON array):
+    {"id": "draft-1", "client_id": "...", "days": [
+        [{"ingredient": "bananas, raw", "servings": 1},
+         {"ingredient": "rice, white, cooked", "grams": 150},
+         {"recipe": "<cached_recipes id>", "servings": 2}],
+        ...]}
+A plan may carry its own "client_goals" object (snake_case or camelCase,
+as stored in async_meal_plans) instead of a client_id.
+
+Goals come from a client_goals export (CSV or JSON lines): calories within
+CALORIE_TOLERANCE of eer_goal_calories, protein/carbs/fat within their
+min-max range (0/0 means no goal, see migration 053) and fiber at least
+fiber_goal_grams.
+
+Requires NumPy (pip install numpy).
+
+Usage:
+    python3 meal_plan_totals.py plans.jsonl --matrix simple_ingredients.nmx \\
+        --goals client_goals.csv --output plan_scores.jsonl
+    python3 meal_plan_totals.py plans.jsonl --matrix simple_ingredients.nmx \\
+        --recipes cached_recipes.csv --goals client_goals.csv --calorie-tolerance 0.05
+"""
+
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from compressed_io import open_stream
+from nutrient_matrix import DEFAULT_MATRIX_PATH, NutrientMatrix
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH_PLANS = 4096
+CACHE_LIMIT = 1 << 16
+CALORIE_TOLERANCE = 0.10
+
+# Scored goal -> (matrix column, client_goals minimum, client_goals maximum).
+# Calories get a tolerance band around the EER; fiber is a minimum only.
+GOALS = [
+    ('calories', 'calories', 'eer_goal_calories', None),
+    ('protein', 'protein_g', 'protein_goal_min', 'protein_goal_max'),
+    ('carbs', 'carbs_g', 'carbs_goal_min', 'carbs_goal_max'),
+    ('fat', 'fat_g', 'fat_goal_min', 'fat_goal_max'),
+    ('fiber', 'fiber_g', 'fiber_goal_grams', None),
+]
+
+# simple_ingredients column -> cached_recipes per-serving column, then the
+# whole-recipe column divided by servings
+RECIPE_COLUMNS = {
+    'calories': ('calories_per_serving', 'total_calories'),
+    'protein_g': ('protein_per_serving_g', 'total_protein_g'),
+    'carbs_g': ('carbs_per_serving_g', 'total_carbs_g'),
+    'fat_g': ('fat_per_serving_g', 'total_fat_g'),
+    'fiber_g': ('fiber_per_serving_g', 'total_fiber_g'),
+    'sugar_g': (None, 'total_sugar_g'),
+    'sodium_mg': (None, 'total_sodium_mg'),
+}
+
+GRAM_UNITS = ('g', 'gram', 'grams')
+
+_CAMEL = re.compile(r'(?<=[a-z0-9])([A-Z])')
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _group_sums(values: 'np.ndarray', groups: 'np.ndarray', count: int) -> 'np.ndarray':
+    """Sums of values rows per group, for non-decreasing group numbers"""
+    sums = np.zeros((count,) + values.shape[1:])
+    if len(values):
+        starts = np.searchsorted(groups, np.arange(count))
+        ends = np.append(starts[1:], len(groups))
+        present = starts < ends
+        sums[present] = np.add.reduceat(values, starts[present], axis=0)
+    return sums
+
+
+def snake_case(record: dict) -> dict:
+    """eerGoalCalories -> eer_goal_calories; snake_case keys are kept"""
+    return {_CAMEL.sub(r'_\1', key).lower(): value for key, value in record.items()}
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """Rows of a CSV, JSON lines or JSON array file (gzip/zstd by suffix)"""
+    suffixes = [suffix for suffix in Path(path).suffixes if suffix not in ('.gz', '.zst')]
+    with open_stream(path, 'r', newline='') as f:
+        if suffixes and suffixes[-1] == '.csv':
+            yield from csv.DictReader(f)
+            return
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == '[':
+            yield from json.loads(first + f.read())
+            return
+        for line in (first + f.readline(), *f):
+            if line.strip():
+                yield json.loads(line)
+
+
+def goal_bounds(goals: Optional[dict], calorie_tolerance: float = CALORIE_TOLERANCE) -> tuple:
+    """
+    (low, high) per scored goal for one client_goals row; NaN marks a goal
+    that is not set
+    """
+    low = [math.nan] * len(GOALS)
+    high = [math.nan] * len(GOALS)
+    if not goals:
+        return low, high
+    goals = snake_case(goals)
+    for k, (name, _, minimum, maximum) in enumerate(GOALS):
+        value = _float(goals.get(minimum))
+        if not value:
+            continue
+        if name == 'calories':
+            low[k], high[k] = value * (1 - calorie_tolerance), value * (1 + calorie_tolerance)
+        elif maximum is None:
+            low[k], high[k] = value, math.inf
+        else:
+            top = _float(goals.get(maximum))
+            if top:
+                low[k], high[k] = value, top
+    return low, high
+
+
+def load_goals(path: str) -> Dict[str, dict]:
+    """Active client_goals rows by client_id"""
+    goals = {}
+    for row in read_records(path):
+        row = snake_case(row)
+        client_id = row.get('client_id')
+        if client_id and str(row.get('is_active', 'true')).lower() not in ('false', 'f', '0'):
+            goals[str(client_id)] = row
+    return goals
+
+
+def load_recipes(path: str, columns: List[str]) -> Tuple[Dict[str, int], 'np.ndarray']:
+    """
+    Per-serving nutrient vectors of cached_recipes rows, in the matrix's
+    column order (0 for what the recipe columns do not cover)
+    """
+    index = {}
+    vectors = []
+    for row in read_records(path):
+        recipe_id = row.get('id')
+        if not recipe_id or str(recipe_id) in index:
+            continue
+        # Whole-recipe totals cannot be divided by a missing or zero servings
+        servings = _float(row.get('servings')) or 1.0
+        vector = [0.0] * len(columns)
+        for k, column in enumerate(columns):
+            per_serving, total = RECIPE_COLUMNS.get(column, (None, None))
+            value = _float(row.get(per_serving)) if per_serving else None
+            if value is None and total:
+                value = _float(row.get(total))
+                value = value / servings if value is not None else None
+            vector[k] = value or 0.0
+        index[str(recipe_id)] = len(vectors)
+        vectors.append(vector)
+    return index, np.array(vectors, dtype=np.float64).reshape(len(vectors), len(columns))
+
+
+class MealPlanTotals:
+    """
+    Totals and scores batches of plans over one nutrient matrix (plus
+    optional recipe vectors). Sources are resolved by name or id once and
+    remembered.
+    """
+
+    def __init__(self, matrix: NutrientMatrix, recipes: Optional[tuple] = None,
+                 goals: Optional[Dict[str, dict]] = None,
+                 calorie_tolerance: float = CALORIE_TOLERANCE):
+        if np is None:
+            raise ImportError("numpy is required (pip install numpy)")
+        self.matrix = matrix
+        self.columns = matrix.columns
+        recipe_index, recipe_vectors = recipes if recipes else ({}, None)
+        # Missing nutrients add nothing to a total
+        sources = np.nan_to_num(np.asarray(matrix.matrix, dtype=np.float64).reshape(
+            matrix.rows, len(self.columns)))
+        if recipe_vectors is not None and len(recipe_vectors):
+            sources = np.vstack([sources, recipe_vectors])
+        # Nutrient-major, so each nutrient's values for a batch's items are
+        # one gather from a contiguous row
+        self.sources = np.ascontiguousarray(sources.T)
+        # Servings per gram of rows served in grams (0 for other units)
+        self.per_gram = np.zeros(self.sources.shape[1])
+        for row in range(matrix.rows):
+            quantity = float(matrix.serving_quantity[row])
+            if quantity > 0 and matrix.serving_unit(row).strip().lower() in GRAM_UNITS:
+                self.per_gram[row] = 1.0 / quantity
+        self.recipe_index = {recipe_id: matrix.rows + k for recipe_id, k in recipe_index.items()}
+        self.goals = goals or {}
+        self.calorie_tolerance = calorie_tolerance
+        self.goal_columns = [self.columns.index(column) for _, column, _, _ in GOALS]
+        self._lowercase: Optional[Dict[str, int]] = None
+        self._rows: Dict[str, int] = {}
+        self._bounds: Dict[str, tuple] = {}
+
+    def source_row(self, item: dict) -> int:
+        """Source row of a plan item (-1 when unknown), remembered per name or id"""
+        if 'recipe' in item:
+            return self.recipe_index.get(str(item['recipe']), -1)
+        name = item.get('ingredient') or ''
+        row = self._rows.get(name)
+        if row is None:
+            row = self.matrix.index(name)
+            if row is None:
+                if self._lowercase is None:
+                    self._lowercase = {}
+                    for k in range(self.matrix.rows):
+                        self._lowercase.setdefault(self.matrix.name(k).lower(), k)
+                row = self._lowercase.get(name.strip().lower(), -1)
+            if len(self._rows) < CACHE_LIMIT:
+                self._rows[name] = row
+        return row
+
+    def bounds(self, plan: dict) -> tuple:
+        """Goal (low, high) for a plan's embedded goals or its client's"""
+        if plan.get('client_goals'):
+            return goal_bounds(plan['client_goals'], self.calorie_tolerance)
+        client_id = str(plan.get('client_id'))
+        if client_id not in self._bounds:
+            self._bounds[client_id] = goal_bounds(self.goals.get(client_id),
+                                                  self.calorie_tolerance)
+        return self._bounds[client_id]
+
+    def score_batch(self, plans: List[dict]) -> List[dict]:
+        """Totals and goal scores for a batch of plans, in order"""
+        day_plan = []      # plan of each day
+        item_day = []      # day of each item
+        item_source = []   # source row of each item, -1 when unknown
+        item_amount = []   # servings, or grams when item_grams is set
+        item_grams = []
+        lows, highs = [], []
+        source_row = self.source_row
+        for p, plan in enumerate(plans):
+            for day in plan.get('days') or []:
+                d = len(day_plan)
+                day_plan.append(p)
+                for item in day.get('items', []) if isinstance(day, dict) else day:
+                    grams = _float(item.get('grams')) if 'grams' in item else None
+                    servings = _float(item.get('servings'))
+                    item_day.append(d)
+                    item_source.append(source_row(item))
+                    item_grams.append(grams is not None)
+                    # A missing servings means one serving; 0 means none
+                    item_amount.append(grams if grams is not None
+                                       else 1.0 if servings is None else servings)
+            low, high = self.bounds(plan)
+            lows.append(low)
+            highs.append(high)
+
+        plans_count = len(plans)
+        day_plan = np.array(day_plan, dtype=np.intp)
+        item_day = np.array(item_day, dtype=np.intp)
+        source = np.array(item_source, dtype=np.intp)
+        amount = np.array(item_amount, dtype=np.float64)
+        grams = np.array(item_grams, dtype=bool)
+
+        # Gram amounts become servings of rows served in grams; anything
+        # else with grams, and unknown sources, is left out
+        known = source >= 0
+        per_gram = np.zeros(len(source))
+        per_gram[known] = self.per_gram[source[known]]
+        factor = np.where(grams, amount * per_gram, amount)
+        resolved = known & (~grams | (per_gram > 0))
+        unresolved = np.bincount(day_plan[item_day[~resolved]], minlength=plans_count)
+
+        # One weighted bincount per nutrient over every item of the batch
+        rows, weights, days = source[resolved], factor[resolved], item_day[resolved]
+        day_totals = np.empty((len(self.columns), len(day_plan)))
+        for k, values in enumerate(self.sources):
+            day_totals[k] = np.bincount(days, weights=values.take(rows) * weights,
+                                        minlength=len(day_plan))
+        day_totals = day_totals.T
+        plan_totals = _group_sums(day_totals, day_plan, plans_count)
+        day_counts = np.bincount(day_plan, minlength=plans_count)
+
+        # Relative distance outside each goal range, per day and goal
+        low = np.array(lows, dtype=np.float64).reshape(plans_count, len(GOALS))[day_plan]
+        high = np.array(highs, dtype=np.float64).reshape(plans_count, len(GOALS))[day_plan]
+        values = day_totals[:, self.goal_columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            below = np.where(values < low, (low - values) / low, 0.0)
+            above = np.where(values > high, (values - high) / high, 0.0)
+        is_set = ~np.isnan(low)
+        deviation = np.where(is_set, below + above, 0.0)
+        in_range = is_set & (deviation == 0)
+        day_scores = np.where(is_set, np.clip(1.0 - deviation, 0.0, 1.0), 0.0)
+
+        goal_days = _group_sums(is_set.astype(np.float64), day_plan, plans_count)
+        days_in_range = _group_sums(in_range.astype(np.float64), day_plan, plans_count)
+        score_sums = _group_sums(day_scores, day_plan, plans_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = np.round(100 * score_sums.sum(axis=1) / goal_days.sum(axis=1), 1)
+            goal_averages = plan_totals[:, self.goal_columns] / np.maximum(day_counts, 1)[:, None]
+        averages = np.round(plan_totals / np.maximum(day_counts, 1)[:, None], 2).tolist()
+        totals = np.round(plan_totals, 2).tolist()
+        goal_averages = np.round(goal_averages, 2).tolist()
+
+        results = []
+        columns = self.columns
+        for p, plan in enumerate(plans):
+            goal_results = {}
+            for k, (name, _, _, _) in enumerate(GOALS):
+                if goal_days[p, k]:
+                    goal_results[name] = {
+                        'low': round(lows[p][k], 2),
+                        'high': None if math.isinf(highs[p][k]) else round(highs[p][k], 2),
+                        'daily_average': goal_averages[p][k],
+                        'days_in_range': int(days_in_range[p, k]),
+                    }
+            results.append({
+                'id': plan.get('id'),
+                'client_id': plan.get('client_id'),
+                'days': int(day_counts[p]),
+                'unresolved_items': int(unresolved[p]),
+                'score': float(scores[p]) if goal_results else None,
+                'goals': goal_results,
+                'totals': dict(zip(columns, totals[p])),
+                'daily_average': dict(zip(columns, averages[p])),
+            })
+        return results
+
+    def score_plans(self, plans: Iterable[dict], batch_size: int = BATCH_PLANS) -> Iterator[dict]:
+        """score_batch over a stream of plans, batch_size plans at a time"""
+        batch = []
+        for plan in plans:
+            batch.append(plan)
+            if len(batch) >= batch_size:
+                yield from self.score_batch(batch)
+                batch = []
+        if batch:
+            yield from self.score_batch(batch)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Total and score many meal plans against client_goals in one pass",
+        epilog="Example:\n  python3 meal_plan_totals.py plans.jsonl --matrix simple_ingredients.nmx "
+               "--goals client_goals.csv --output plan_scores.jsonl",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('plans_file', help="Plans as JSON lines or a JSON array (gzip/zstd by suffix)")
+    parser.add_argument('--matrix', default=DEFAULT_MATRIX_PATH,
+                        help=f"nutrient_matrix.py file (default: {DEFAULT_MATRIX_PATH})")
+    parser.add_argument('--recipes', metavar='PATH',
+                        help="cached_recipes export (CSV or JSON lines) for recipe items")
+    parser.add_argument('--goals', metavar='PATH',
+                        help="client_goals export (CSV or JSON lines) to score plans against")
+    parser.add_argument('--calorie-tolerance', type=float, default=CALORIE_TOLERANCE,
+                        help=f"Allowed fraction either side of the EER (default: {CALORIE_TOLERANCE})")
+    parser.add_argument('--batch-size', type=int, default=BATCH_PLANS,
+                        help=f"Plans totalled per pass (default: {BATCH_PLANS})")
+    parser.add_argument('--output', help="Write results as JSON lines (default: stdout)")
+    args = parser.parse_args()
+
+    if np is None:
+        print("Error: numpy is required (pip install numpy)", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        matrix = NutrientMatrix(args.matrix)
+        recipes = load_recipes(args.recipes, matrix.columns) if args.recipes else None
+        goals = load_goals(args.goals) if args.goals else {}
+        plans = list(read_records(args.plans_file))
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    totals = MealPlanTotals(matrix, recipes, goals, args.calorie_tolerance)
+    results = list(totals.score_plans(plans, args.batch_size))
+    elapsed = time.perf_counter() - start
+
+    out = open_stream(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if args.output:
+            out.close()
+
+    report = sys.stdout if args.output else sys.stderr
+    days = sum(result['days'] for result in results)
+    unresolved = sum(result['unresolved_items'] for result in results)
+    scored = [result['score'] for result in results if result['score'] is not None]
+    print("-" * 60, file=report)
+    print(f"Plans: {len(results)} ({days} days, {unresolved} unresolved items)", file=report)
+    if scored:
+        print(f"Scored against goals: {len(scored)} (mean score {sum(scored) / len(scored):.1f})",
+              file=report)
+    print(f"Totalled in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):,.0f} plans/s)",
+          file=report)
+    if args.output:
+        print(f"Output file: {args.output}", file=report)
+    matrix.close()
+
+
+if __name__ == '__main__':
+    main()
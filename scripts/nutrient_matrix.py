@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Nutrient Matrix for simple_ingredients
+Writes the simple_ingredients catalogue as one binary file that services and
+batch jobs can mmap instead of selecting the whole table:
+
+- a float32 ingredient x nutrient matrix, columns in migration 067 order,
+  NaN where the CSV cell is empty
+- float32 serving quantities
+- uint64 allergen / health-label masks (label_masks.py), with the bit
+  table in the header
+- one string table (names, categories, serving units) as uint32 offsets
+  into a UTF-8 blob, with uint32 category and serving-unit ids per row
+- a JSON header with the format version, a content hash, the column names
+  and every section's offset, dtype and shape
+
+All numbers are little-endian and every section starts on a 64-byte
+boundary, so with NumPy each section is a zero-copy np.frombuffer view of
+the mapping; without it, memoryview casts are used. Opening the file reads
+only the header.
+
+Layout: MAGIC, uint32 header length, JSON header, padding, sections (offsets
+in the header are relative to the first section).
+
+Usage:
+    python3 nutrient_matrix.py usda_simple_ingredients.csv --output simple_ingredients.nmx
+    python3 nutrient_matrix.py simple_ingredients.nmx --inspect --lookup "banana"
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from compressed_io import open_stream
+from label_masks import LABEL_BITS, labels, row_mask
+from seed_schema import get_table_encoder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'NUTRMTX\x00'
+FORMAT = 'nutrient-matrix'
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+DEFAULT_MATRIX_PATH = 'simple_ingredients.nmx'
+
+SIMPLE_INGREDIENTS = get_table_encoder('simple_ingredients')
+# Every numeric column after the serving size, in DDL (migration 067) order
+NUTRIENT_COLUMNS = [column for column in SIMPLE_INGREDIENTS.columns
+                    if SIMPLE_INGREDIENTS.kinds[column] == 'numeric'
+                    and column != 'serving_quantity']
+
+# array typecode and NumPy dtype of each section
+SECTION_TYPES = {
+    'matrix': ('f', '<f4'),
+    'serving_quantity': ('f', '<f4'),
+    'label_mask': ('Q', '<u8'),
+    'category_id': ('I', '<u4'),
+    'serving_unit_id': ('I', '<u4'),
+    'string_offsets': ('I', '<u4'),
+    'strings': ('B', '|u1'),
+}
+
+
+def _float(value: Optional[str]) -> float:
+    try:
+        return float(value) if value not in (None, '') else math.nan
+    except ValueError:
+        return math.nan
+
+
+def _padding(length: int) -> int:
+    return -length % ALIGNMENT
+
+
+def build_sections(rows: Iterable[dict]) -> tuple:
+    """
+    (sections, row count) for simple_ingredients CSV rows. Rows missing a
+    name or category, inactive rows and repeated names (first one wins, as
+    ON CONFLICT (name) DO NOTHING) are left out.
+    """
+    matrix = array('f')
+    serving_quantity = array('f')
+    label_mask = array('Q')
+    category_id = array('I')
+    serving_unit_id = array('I')
+    names = []
+    extra = {}  # category / serving unit -> string id, after the names
+    extra_strings = []
+    seen = set()
+
+    def string_id(value: str) -> int:
+        if value not in extra:
+            extra[value] = len(extra_strings)
+            extra_strings.append(value)
+        return extra[value]
+
+    for row in rows:
+        name = (row.get('name') or '').strip()
+        category = (row.get('category') or '').strip()
+        if not name or not category or name in seen:
+            continue
+        if (row.get('is_active') or 'true').strip().lower() in ('false', 'f', '0', 'no'):
+            continue
+        seen.add(name)
+        names.append(name)
+        matrix.extend(_float(row.get(column)) for column in NUTRIENT_COLUMNS)
+        serving_quantity.append(_float(row.get('serving_quantity') or '1'))
+        label_mask.append(row_mask(row))
+        category_id.append(string_id(category))
+        serving_unit_id.append(string_id((row.get('serving_unit') or 'g').strip()))
+
+    # Names are strings 0..rows-1; categories and units follow them
+    offset = len(names)
+    category_id = array('I', (value + offset for value in category_id))
+    serving_unit_id = array('I', (value + offset for value in serving_unit_id))
+    blob = bytearray()
+    string_offsets = array('I', [0])
+    for value in names + extra_strings:
+        blob += value.encode('utf-8')
+        string_offsets.append(len(blob))
+
+    sections = {
+        'matrix': (matrix, [len(names), len(NUTRIENT_COLUMNS)]),
+        'serving_quantity': (serving_quantity, [len(names)]),
+        'label_mask': (label_mask, [len(names)]),
+        'category_id': (category_id, [len(names)]),
+        'serving_unit_id': (serving_unit_id, [len(names)]),
+        'string_offsets': (string_offsets, [len(string_offsets)]),
+        'strings': (array('B', blob), [len(blob)]),
+    }
+    return sections, len(names)
+
+
+def write_matrix(sections: dict, rows: int, output_path: str, source: str = '') -> dict:
+    """Write sections as a matrix file (atomically, so open mappings stay valid); returns the header"""
+    payloads = {}
+    for name, (values, _) in sections.items():
+        if sys.byteorder != 'little' and values.itemsize > 1:
+            values = array(values.typecode, values)
+            values.byteswap()
+        payloads[name] = values.tobytes()
+
+    layout = {}
+    offset = 0
+    digest = hashlib.sha256()
+    for name, (_, shape) in sections.items():
+        layout[name] = {'offset': offset, 'dtype': SECTION_TYPES[name][1], 'shape': shape}
+        offset += len(payloads[name])
+        offset += _padding(offset)
+        digest.update(payloads[name])
+
+    header = {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'version': digest.hexdigest()[:12],
+        'generated_date': time.strftime('%Y-%m-%d'),
+        'source': source,
+        'table': 'simple_ingredients',
+        'rows': rows,
+        'columns': NUTRIENT_COLUMNS,
+        'label_bits': LABEL_BITS,
+        'sections': layout,
+    }
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes
+
+    output = Path(output_path)
+    temp = output.with_name(output.name + '.tmp')
+    with open(temp, 'wb') as f:
+        f.write(prefix + bytes(_padding(len(prefix))))
+        for name, payload in payloads.items():
+            f.write(payload)
+            f.write(bytes(_padding(len(payload))))
+    os.replace(temp, output)
+    return header
+
+
+def write_nutrient_matrix(csv_path: str, output_path: str = DEFAULT_MATRIX_PATH) -> dict:
+    """Build the matrix file from a simple_ingredients CSV (gzip/zstd by suffix)"""
+    with open_stream(csv_path, 'r', newline='') as f:
+        sections, rows = build_sections(csv.DictReader(f))
+    return write_matrix(sections, rows, output_path, source=Path(csv_path).name)
+
+
+class NutrientMatrix:
+    """
+    A mapped matrix file. With NumPy, .matrix is a (rows, columns) float32
+    array and column() a strided view, both zero-copy; without it they are
+    flat memoryviews and lists.
+    """
+
+    def __init__(self, path: str = DEFAULT_MATRIX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            self.buffer.close()
+            raise ValueError(f"{path} is not a nutrient matrix file")
+        header_length, = struct.unpack_from('<I', self.buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.buffer[start:start + header_length])
+        if self.header.get('format_version') != FORMAT_VERSION:
+            self.buffer.close()
+            raise ValueError(f"{path} has format version {self.header.get('format_version')}, "
+                             f"expected {FORMAT_VERSION}")
+        # The bit table is append-only, so either one may have bits the other lacks
+        bits = self.header['label_bits']
+        shared = min(len(bits), len(LABEL_BITS))
+        if bits[:shared] != LABEL_BITS[:shared]:
+            self.buffer.close()
+            raise ValueError(f"{path} was built with a different label bit table")
+        self.data_start = start + header_length + _padding(start + header_length)
+        self.version = self.header['version']
+        self.rows = self.header['rows']
+        self.columns: List[str] = self.header['columns']
+        self.column_index = {name: k for k, name in enumerate(self.columns)}
+
+        self.matrix = self.section('matrix')
+        self.serving_quantity = self.section('serving_quantity')
+        self.label_mask = self.section('label_mask')
+        self.category_id = self.section('category_id')
+        self.serving_unit_id = self.section('serving_unit_id')
+        self.string_offsets = self.section('string_offsets')
+        strings = self.header['sections']['strings']
+        self.strings_start = self.data_start + strings['offset']
+        self._index: Optional[Dict[str, int]] = None
+
+    def section(self, name: str):
+        """A section as a NumPy array (or flat memoryview) over the mapping"""
+        spec = self.header['sections'][name]
+        typecode, dtype = SECTION_TYPES[name]
+        count = math.prod(spec['shape'])
+        start = self.data_start + spec['offset']
+        if np is not None:
+            return np.frombuffer(self.buffer, dtype=dtype, count=count,
+                                 offset=start).reshape(spec['shape'])
+        size = count * array(typecode).itemsize
+        view = memoryview(self.buffer)[start:start + size]
+        if sys.byteorder != 'little' and typecode != 'B':
+            values = array(typecode, view.tobytes())
+            values.byteswap()
+            return memoryview(values)
+        return view.cast(typecode)
+
+    def string(self, string_id: int) -> str:
+        start = int(self.string_offsets[string_id])
+        end = int(self.string_offsets[string_id + 1])
+        return self.buffer[self.strings_start + start:self.strings_start + end].decode('utf-8')
+
+    def name(self, row: int) -> str:
+        return self.string(row)
+
+    def category(self, row: int) -> str:
+        return self.string(int(self.category_id[row]))
+
+    def serving_unit(self, row: int) -> str:
+        return self.string(int(self.serving_unit_id[row]))
+
+    def index(self, name: str) -> Optional[int]:
+        """Row of an ingredient name (the name map is built on first use)"""
+        if self._index is None:
+            self._index = {self.name(row): row for row in range(self.rows)}
+        return self._index.get(name)
+
+    def value(self, row: int, column: str) -> Optional[float]:
+        """One nutrient value, None where the CSV had none"""
+        k = self.column_index[column]
+        if np is not None:
+            value = float(self.matrix[row, k])
+        else:
+            value = self.matrix[row * len(self.columns) + k]
+        return None if math.isnan(value) else value
+
+    def column(self, column: str):
+        """Every row's value of one nutrient (NaN where missing)"""
+        k = self.column_index[column]
+        if np is not None:
+            return self.matrix[:, k]
+        return list(self.matrix[k::len(self.columns)])
+
+    def row(self, row: int) -> dict:
+        """One ingredient as a simple_ingredients-style dict"""
+        record = {
+            'name': self.name(row),
+            'category': self.category(row),
+            'serving_quantity': float(self.serving_quantity[row]),
+            'serving_unit': self.serving_unit(row),
+            'labels': labels(int(self.label_mask[row])),
+        }
+        for column in self.columns:
+            record[column] = self.value(row, column)
+        return record
+
+    def close(self):
+        for name in ('matrix', 'serving_quantity', 'label_mask', 'category_id', 'serving_unit_id',
+                     'string_offsets'):
+            setattr(self, name, None)
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass  # Views handed out are still alive; the mapping goes with the last one
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Build or inspect the memory-mapped simple_ingredients nutrient matrix",
+        epilog="Example:\n  python3 nutrient_matrix.py usda_simple_ingredients.csv "
+               "--output simple_ingredients.nmx\n"
+               "  python3 nutrient_matrix.py simple_ingredients.nmx --inspect --lookup banana",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('input_file', help="simple_ingredients CSV, or a matrix with --inspect")
+    parser.add_argument('--output', default=DEFAULT_MATRIX_PATH,
+                        help=f"Matrix file to write (default: {DEFAULT_MATRIX_PATH})")
+    parser.add_argument('--inspect', action='store_true',
+                        help="Print the header of an existing matrix file")
+    parser.add_argument('--lookup', metavar='NAME',
+                        help="Print one ingredient of an existing matrix file (implies --inspect)")
+    args = parser.parse_args()
+
+    if not Path(args.input_file).exists():
+        print(f"Error: File not found: {args.input_file}")
+        sys.exit(1)
+
+    if args.inspect or args.lookup:
+        start = time.perf_counter()
+        try:
+            matrix = NutrientMatrix(args.input_file)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        elapsed = time.perf_counter() - start
+        with matrix:
+            print(f"Version: {matrix.version} (format {FORMAT_VERSION})")
+            print(f"Rows: {matrix.rows} x {len(matrix.columns)} nutrients")
+            print(f"Opened in {elapsed * 1e6:.0f} µs ({'NumPy' if np else 'memoryview'} views)")
+            if args.lookup:
+                row = matrix.index(args.lookup)
+                print("-" * 60)
+                if row is None:
+                    print(f"No ingredient named {args.lookup!r}")
+                    sys.exit(1)
+                for column, value in matrix.row(row).items():
+                    if isinstance(value, float):
+                        print(f"  {column:<20} {value:.7g}")
+                    elif isinstance(value, list):
+                        print(f"  {column:<20} {', '.join(value) or '-'}")
+                    elif value is not None:
+                        print(f"  {column:<20} {value}")
+        return
+
+    start = time.monotonic()
+    try:
+        header = write_nutrient_matrix(args.input_file, args.output)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    size = Path(args.output).stat().st_size
+    print(f"✓ Wrote {header['rows']} ingredients x {len(header['columns'])} nutrients "
+          f"to {args.output} ({size / 1024:.1f} KB, version {header['version']}, "
+          f"{time.monotonic() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Retryable Postgres Errors
+Decides whether a failed transaction is worth running again, for the loaders
+that apply batches or shards over pooled connections (load_ingredients.py,
+apply_sql_shards.py). Kept separate so those scripts share the rule without
+importing each other.
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+# SQLSTATE classes worth retrying: connection exceptions (08),
+# transaction rollbacks such as deadlocks/serialization failures (40),
+# insufficient resources (53) and operator intervention (57)
+RETRYABLE_SQLSTATE_CLASSES = ('08', '40', '53', '57')
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed batch should be retried"""
+    if psycopg2 is not None and isinstance(error, (psycopg2.OperationalError,
+                                                   psycopg2.InterfaceError)):
+        return True
+    pgcode = getattr(error, 'pgcode', None)
+    return bool(pgcode) and pgcode[:2] in RETRYABLE_SQLSTATE_CLASSES
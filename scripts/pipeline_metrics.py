@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+Stage timers, counters and latency histograms shared by the pipeline scripts
+(csv_to_ingredients_sql.py, split_sql_file.py, fetch-usda-food-categories.py),
+so a run can say where its time and memory went:
+
+- metrics.stage('encode') times a block; stages may nest and each keeps its
+  own total wall time and call count
+- metrics.count('rows_read', n) adds to a counter (rows, bytes, skipped,
+  HTTP requests, cache hits, seconds spent rate-limited, ...)
+- metrics.observe('http_request_seconds', seconds) adds a sample to a latency
+  histogram with fixed buckets (LATENCY_BUCKETS)
+
+metrics.write(path) emits JSON lines (appended, so one file collects every
+run: one record per stage, counter and histogram, tagged with the run id),
+or a Prometheus text file when the path ends in .prom (replaced atomically,
+for node_exporter's textfile collector).
+
+Profiling is opt-in. With profile='cpu' every stage runs under cProfile and
+close() dumps <profile_dir>/<script>.<stage>.prof (read with pstats or
+snakeviz). With profile='memory' allocations are traced with tracemalloc:
+each stage records its peak as peak_bytes, and close() writes the largest
+allocation sites still live to <script>.memory.txt. 'all' does both.
+
+The scripts take --metrics PATH (default: $PIPELINE_METRICS), --profile
+and --profile-dir; see add_metrics_arguments().
+"""
+
+import argparse
+import bisect
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+METRICS_ENV = 'PIPELINE_METRICS'
+PROFILE_MODES = ('cpu', 'memory', 'all')
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_TOP_SITES = 25
+
+
+def _number(value: float) -> str:
+    """Counters are ints unless something added a float (e.g. seconds)"""
+    return str(value) if isinstance(value, int) else f"{value:.3f}"
+
+
+class Histogram:
+    """Bucketed samples, as a Prometheus histogram"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th sample (inf past the last)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+
+class Metrics:
+    """
+    Metrics of one run of one script. Collecting is cheap enough to leave on;
+    nothing is written unless write() is called.
+
+    Args:
+        script: Name the metrics are tagged with (e.g. csv_to_sql)
+        profile: None, 'cpu', 'memory' or 'all'
+        profile_dir: Where profile files go (default: current directory)
+    """
+
+    def __init__(self, script: str, profile: Optional[str] = None, profile_dir: str = '.'):
+        if profile not in (None,) + PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {profile}")
+        self.script = script
+        self.run_id = f"{script}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.stage_peak: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+        self.profile_dir = Path(profile_dir)
+        self.cpu = profile in ('cpu', 'all')
+        self.memory = profile in ('memory', 'all')
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._profiling = False
+        self._active: List[list] = []  # [stage, peak bytes] of the open stages
+        self._traced = self.memory and not tracemalloc.is_tracing()
+        if self._traced:
+            tracemalloc.start()
+
+    @classmethod
+    def from_args(cls, script: str, args: argparse.Namespace) -> 'Metrics':
+        """Metrics for a script whose parser has add_metrics_arguments()"""
+        return cls(script, profile=args.profile, profile_dir=args.profile_dir)
+
+    @contextmanager
+    def stage(self, name: str, histogram: Optional[str] = None):
+        """
+        Add the wall time (and, when profiling, the CPU profile and peak
+        memory) of a block to a stage.
+
+        Args:
+            name: Stage name
+            histogram: Also observe the block's time in this histogram
+        """
+        profiler = None
+        # cProfile cannot nest: the outermost profiled stage covers inner ones
+        if self.cpu and not self._profiling:
+            profiler = self._profiles.setdefault(name, cProfile.Profile())
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            for frame in self._active:
+                frame[1] = max(frame[1], peak)
+            tracemalloc.reset_peak()
+        frame = [name, 0]
+        self._active.append(frame)
+        if profiler is not None:
+            self._profiling = True
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            self._active.pop()
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+            if histogram is not None:
+                self.observe(histogram, elapsed)
+            if self.memory:
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                self.stage_peak[name] = max(self.stage_peak.get(name, 0), peak)
+                for parent in self._active:
+                    parent[1] = max(parent[1], peak)
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        """Yield from iterable, timing each step (a lazy reader or pool) as a stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def records(self) -> List[dict]:
+        """Every stage, counter and histogram as a JSON-ready dict"""
+        tags = {'run': self.run_id, 'script': self.script,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))}
+        records = [dict(tags, type='run', seconds=round(self.elapsed, 6))]
+        for name, seconds in self.stage_seconds.items():
+            record = dict(tags, type='stage', name=name, seconds=round(seconds, 6),
+                          calls=self.stage_calls[name])
+            if name in self.stage_peak:
+                record['peak_bytes'] = self.stage_peak[name]
+            records.append(record)
+        for name, value in self.counters.items():
+            records.append(dict(tags, type='counter', name=name, value=value))
+        for name, histogram in self.histograms.items():
+            records.append(dict(tags, type='histogram', name=name,
+                                buckets=list(histogram.buckets), counts=histogram.counts,
+                                sum=round(histogram.sum, 6), count=histogram.count))
+        return records
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        script = f'script="{self.script}"'
+        lines = [
+            '# TYPE pipeline_run_seconds gauge',
+            f'pipeline_run_seconds{{{script}}} {self.elapsed:.6f}',
+            '# TYPE pipeline_run_timestamp_seconds gauge',
+            f'pipeline_run_timestamp_seconds{{{script}}} {self.started:.0f}',
+            '# TYPE pipeline_stage_seconds gauge',
+        ]
+        for name, seconds in self.stage_seconds.items():
+            lines.append(f'pipeline_stage_seconds{{{script},stage="{name}"}} {seconds:.6f}')
+        lines.append('# TYPE pipeline_stage_calls gauge')
+        for name, calls in self.stage_calls.items():
+            lines.append(f'pipeline_stage_calls{{{script},stage="{name}"}} {calls}')
+        if self.stage_peak:
+            lines.append('# TYPE pipeline_stage_peak_bytes gauge')
+            for name, peak in self.stage_peak.items():
+                lines.append(f'pipeline_stage_peak_bytes{{{script},stage="{name}"}} {peak}')
+        for name, value in self.counters.items():
+            lines.append(f'# TYPE pipeline_{name} gauge')
+            lines.append(f'pipeline_{name}{{{script}}} {_number(value)}')
+        for name, histogram in self.histograms.items():
+            lines.append(f'# TYPE pipeline_{name} histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'pipeline_{name}_bucket{{{script},le="{le}"}} {cumulative}')
+            lines.append(f'pipeline_{name}_sum{{{script}}} {histogram.sum:.6f}')
+            lines.append(f'pipeline_{name}_count{{{script}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """Append JSON lines to path, or replace it with Prometheus text (.prom)"""
+        output = Path(path)
+        if output.suffix == '.prom':
+            temp = output.with_name(output.name + '.tmp')
+            temp.write_text(self.prometheus(), encoding='utf-8')
+            os.replace(temp, output)
+            return
+        with open(output, 'a', encoding='utf-8') as f:
+            for record in self.records():
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def close(self) -> List[Path]:
+        """Stop profiling and write the profile files; returns their paths"""
+        written = []
+        if self._profiles:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+        for name, profiler in self._profiles.items():
+            path = self.profile_dir / f"{self.script}.{name}.prof"
+            profiler.dump_stats(str(path))
+            written.append(path)
+        self._profiles = {}
+        if self._traced:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            path = self.profile_dir / f"{self.script}.memory.txt"
+            sites = tracemalloc.take_snapshot().statistics('lineno')[:MEMORY_TOP_SITES]
+            with open(path, 'w', encoding='utf-8') as f:
+                for site in sites:
+                    f.write(f"{site}\n")
+            tracemalloc.stop()
+            self._traced = False
+            written.append(path)
+        return written
+
+    def summary(self) -> List[str]:
+        """Printable lines: stages by time, counters and histogram quantiles"""
+        lines = [f"Metrics ({self.run_id}, {self.elapsed:.2f}s):"]
+        for name, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1]):
+            line = f"  {name:<24} {seconds:>9.3f}s  {self.stage_calls[name]:>8} calls"
+            if name in self.stage_peak:
+                line += f"  peak {self.stage_peak[name] / (1024 * 1024):.1f} MB"
+            lines.append(line)
+        for name, value in self.counters.items():
+            lines.append(f"  {name:<24} {_number(value):>10}")
+        for name, histogram in self.histograms.items():
+            lines.append(f"  {name:<24} {histogram.count:>10} samples, "
+                         f"p50 <= {histogram.quantile(0.5):g}s, "
+                         f"p99 <= {histogram.quantile(0.99):g}s")
+        return lines
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """Add --metrics, --profile and --profile-dir to a script's parser"""
+    parser.add_argument('--metrics', metavar='PATH', default=os.environ.get(METRICS_ENV),
+                        help="Append stage timings and counters to this JSON lines file, or "
+                             f"write a Prometheus text file if it ends in .prom "
+                             f"(default: ${METRICS_ENV})")
+    parser.add_argument('--profile', choices=PROFILE_MODES,
+                        help="Profile each stage with cProfile (cpu), tracemalloc (memory) "
+                             "or both (all)")
+    parser.add_argument('--profile-dir', default='.', metavar='DIR',
+                        help="Directory for profile files (default: current directory)")
+
+
+def report(metrics: Metrics, path: Optional[str]):
+    """Finish a run: write profiles and metrics, and print where the time went"""
+    profiles = metrics.close()
+    if not path and not profiles:
+        return
+    print("-" * 60)
+    for line in metrics.summary():
+        print(line)
+    for profile in profiles:
+        print(f"Profile: {profile}")
+    if path:
+        try:
+            metrics.write(path)
+        except OSError as e:
+            print(f"Warning: could not write metrics to {path}: {e}")
+            return
+        print(f"Metrics: {path}")
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Unit-to-Gram Conversion Tables
+Compiles a versioned lookup artifact of (ingredient or category, unit) ->
+grams, so portion scaling can convert "2 cups" or "1 container (170g)" to
+grams locally instead of asking Edamam or the database.
+
+The table is built from:
+
+- USDA foodPortions gram weights, per ingredient (Foundation and SR Legacy
+  descriptions, lowercased as in simple_ingredients.name) and per FDC
+  category, read from a bulk download (--bulk) and/or the
+  portion_gram_weights of fetch-usda-food-categories.py output (--portions)
+- Branded foods' household serving text paired with their gram serving size
+  ("1 cup" = 240 g)
+- Densities (g/mL) from types/foodCategory.ts DENSITY_REFERENCES, plus ones
+  derived from volume portions, for volume units with no measured weight
+
+The artifact is one JSON object whose "grams" member is a flat hash keyed
+"<key>|<unit>", so a lookup is a single dictionary access in Python or
+TypeScript. "version" is a hash of the table contents.
+
+Lookup order for a key and unit: the key's own weight, its category's
+weight, a fixed mass conversion (oz, lb, ...), then volume times density.
+
+Usage:
+    python3 portion_grams.py --bulk FoodData_Central_csv_2024-10-31.zip
+    python3 portion_grams.py --table portion_grams.json --convert "2 cups" --key "rice_cooked"
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from compressed_io import open_stream
+from fdc_bulk_download import DEFAULT_INGREDIENT_TYPES, iter_bulk_foods
+from household_serving import parse_household_serving
+
+FORMAT = 'portion-grams'
+FORMAT_VERSION = 1
+DEFAULT_TABLE_PATH = 'portion_grams.json'
+KEY_SEPARATOR = '|'
+CACHE_LIMIT = 1 << 16
+
+# Exact conversions, grams per unit
+MASS_UNITS = {
+    'g': 1.0,
+    'mg': 0.001,
+    'kg': 1000.0,
+    'oz': 28.349523125,
+    'lb': 453.59237,
+}
+
+# US customary volumes, mL per unit
+VOLUME_UNITS = {
+    'ml': 1.0,
+    'l': 1000.0,
+    'tsp': 4.92892159375,
+    'tbsp': 14.78676478125,
+    'fl oz': 29.5735295625,
+    'cup': 236.5882365,
+    'pint': 473.176473,
+    'quart': 946.352946,
+    'gallon': 3785.411784,
+}
+
+# g/mL by app food category, from DENSITY_REFERENCES in types/foodCategory.ts
+# (midpoint where a range is given, as convertVolumeToWeight() uses)
+REFERENCE_DENSITIES = {
+    'beverage_water': 1.00,
+    'beverage_juice': 1.04,
+    'beverage_milk': 1.03,
+    'beverage_smoothie': 1.10,
+    'beverage_coffee_tea': 1.00,
+    'beverage_soft_drink': 1.04,
+    'soup_thin': 1.02,
+    'soup_thick': 1.15,
+    'stew': 1.20,
+    'broth': 1.00,
+    'cereal_dry': 0.35,
+    'cereal_cooked': 1.05,
+    'rice_cooked': 0.70,
+    'pasta_cooked': 0.75,
+    'quinoa_cooked': 0.70,
+    'yogurt': 1.04,
+    'cheese_soft': 0.95,
+    'ice_cream': 0.60,
+    'fruit_berries': 0.60,
+    'fruit_chopped': 0.65,
+    'vegetable_raw_leafy': 0.20,
+    'vegetable_cooked': 0.70,
+    'oil_liquid': 0.92,
+    'butter_spread': 0.96,
+    'sauce_pasta': 1.075,
+    'pudding': 1.10,
+    'mousse': 0.90,
+}
+
+
+def portion_weights(food: dict) -> List[Tuple[str, float]]:
+    """
+    (portion, grams per one portion) pairs from a detailed food's
+    foodPortions, e.g. ("cup", 128.0)
+    """
+    weights = []
+    for portion in food.get('foodPortions', []):
+        grams = portion.get('gramWeight')
+        if not grams:
+            continue
+        amount = portion.get('amount') or 1
+        unit = (portion.get('measureUnit') or {}).get('name') or ''
+        if unit and unit != 'undetermined':
+            label = unit
+        else:
+            label = portion.get('modifier') or portion.get('portionDescription') or ''
+        label = label.strip().lower()
+        if label:
+            weights.append((label, grams / amount))
+    return weights
+
+
+def normalize_unit(label: str) -> str:
+    """Normalised unit of a portion label ("cup, chopped" -> "cup"), else the label"""
+    return parse_household_serving(label).unit or ' '.join(label.lower().split())
+
+
+def household_weight(food: dict) -> Optional[Tuple[str, float]]:
+    """
+    (unit, grams per unit) from a branded food's household serving text and
+    gram serving size, e.g. "1 cup" with servingSize 240 g -> ("cup", 240.0)
+    """
+    size = food.get('servingSize')
+    if not size or (food.get('servingSizeUnit') or '').lower() not in ('g', 'grm'):
+        return None
+    serving = parse_household_serving(food.get('householdServingFullText') or '')
+    if not serving.quantity or serving.unit in MASS_UNITS:
+        return None
+    return serving.unit, size / serving.quantity
+
+
+class PortionGramsBuilder:
+    """Accumulates gram weights per (key, unit) and compiles the artifact"""
+
+    def __init__(self, ingredient_types=DEFAULT_INGREDIENT_TYPES):
+        self.ingredient_types = set(ingredient_types)
+        # (key, unit) -> [samples, total grams]
+        self.weights: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+        self.categories: Dict[str, str] = {}
+        self.sources: List[str] = []
+        self.foods = 0
+
+    def add(self, key: str, unit: str, grams: float, samples: int = 1):
+        if grams <= 0 or not unit:
+            return
+        entry = self.weights[key, unit]
+        entry[0] += samples
+        entry[1] += grams * samples
+
+    def add_food(self, food: dict):
+        """Add one /food/{fdcId}-shaped food's portions"""
+        self.foods += 1
+        category = (food.get('foodCategory') or 'Uncategorized').lower()
+        ingredient = None
+        if food.get('dataType') in self.ingredient_types:
+            ingredient = ' '.join((food.get('description') or '').split()).lower() or None
+        weights = [(normalize_unit(label), grams) for label, grams in portion_weights(food)]
+        household = household_weight(food)
+        if household:
+            weights.append(household)
+        for unit, grams in weights:
+            self.add(category, unit, grams)
+            if ingredient:
+                self.add(ingredient, unit, grams)
+        if ingredient and weights:
+            self.categories.setdefault(ingredient, category)
+
+    def add_bulk_download(self, path: str) -> int:
+        """Add every food of a bulk download; returns the foods read"""
+        foods = 0
+        for food in iter_bulk_foods(path):
+            self.add_food(food)
+            foods += 1
+            if foods % 100_000 == 0:
+                print(f"  {foods} foods, {len(self.weights)} weights")
+        self.sources.append(f"FoodData Central bulk download: {path}")
+        return foods
+
+    def add_portion_map(self, path: str) -> int:
+        """Add the portion_gram_weights of a fetcher output file; returns weights added"""
+        with open_stream(path, 'r') as f:
+            data = json.load(f)
+        added = 0
+        for category, portions in (data.get('portion_gram_weights') or {}).items():
+            for label, stats in portions.items():
+                self.add(category.lower(), normalize_unit(label), stats['grams'],
+                         stats.get('samples') or 1)
+                added += 1
+        self.sources.append(f"Portion map: {path}")
+        return added
+
+    def densities(self) -> Dict[str, float]:
+        """Reference densities plus g/mL derived from each key's volume portions"""
+        derived = defaultdict(list)
+        for (key, unit), (samples, total) in self.weights.items():
+            if unit in VOLUME_UNITS:
+                derived[key].append(total / samples / VOLUME_UNITS[unit])
+        densities = {key: round(sum(values) / len(values), 4)
+                     for key, values in derived.items()}
+        densities.update(REFERENCE_DENSITIES)
+        return densities
+
+    def build(self) -> dict:
+        """The artifact as a JSON-serialisable dict"""
+        grams = {f"{key}{KEY_SEPARATOR}{unit}": round(total / samples, 2)
+                 for (key, unit), (samples, total) in sorted(self.weights.items())}
+        body = {
+            'mass_units': MASS_UNITS,
+            'volume_units': VOLUME_UNITS,
+            'densities': dict(sorted(self.densities().items())),
+            'categories': dict(sorted(self.categories.items())),
+            'grams': grams,
+        }
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+        return {
+            'format': FORMAT,
+            'format_version': FORMAT_VERSION,
+            'version': digest[:12],
+            'generated_date': time.strftime('%Y-%m-%d'),
+            'sources': self.sources + ['types/foodCategory.ts DENSITY_REFERENCES'],
+            **body,
+        }
+
+
+class PortionGrams:
+    """
+    Loaded conversion table. unit_grams() is a few dictionary lookups;
+    parse_grams() parses serving or ingredient text and is LRU-memoised.
+    """
+
+    def __init__(self, table: dict, cache_size: int = CACHE_LIMIT):
+        if table.get('format') != FORMAT or table.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Not a {FORMAT} v{FORMAT_VERSION} table "
+                             f"(format {table.get('format')!r} v{table.get('format_version')})")
+        self.version = table['version']
+        self.grams: Dict[str, float] = table['grams']
+        self.categories: Dict[str, str] = table['categories']
+        self.densities: Dict[str, float] = table['densities']
+        self.mass_units: Dict[str, float] = table['mass_units']
+        self.volume_units: Dict[str, float] = table['volume_units']
+        self.parse_grams = lru_cache(maxsize=cache_size)(self._parse_grams)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TABLE_PATH, cache_size: int = CACHE_LIMIT) -> 'PortionGrams':
+        """Load an artifact written by this script (.gz/.zst by suffix)"""
+        with open_stream(path, 'r') as f:
+            return cls(json.load(f), cache_size)
+
+    def unit_grams(self, key: str, unit: str) -> Optional[float]:
+        """
+        Grams in one unit of an ingredient or category, or None
+
+        Args:
+            key: simple_ingredients name, FDC category, or app food category
+                (e.g. "rice_cooked"); may be empty for mass units
+            unit: Normalised unit, as household_serving returns it
+        """
+        key = key.lower()
+        grams = self.grams.get(f"{key}{KEY_SEPARATOR}{unit}")
+        if grams is not None:
+            return grams
+        category = self.categories.get(key)
+        if category is not None:
+            grams = self.grams.get(f"{category}{KEY_SEPARATOR}{unit}")
+            if grams is not None:
+                return grams
+        if unit in self.mass_units:
+            return self.mass_units[unit]
+        if unit in self.volume_units:
+            density = self.densities.get(key) or self.densities.get(category)
+            if density:
+                return self.volume_units[unit] * density
+        return None
+
+    def grams_for(self, quantity: float, unit: str, key: str = '') -> Optional[float]:
+        """Grams in quantity units of key, or None"""
+        grams = self.unit_grams(key, unit)
+        return None if grams is None else quantity * grams
+
+    def _parse_grams(self, text: str, key: str = '') -> Optional[float]:
+        """
+        Grams described by a serving text such as "1 container (170g)" or
+        "2 cups", for an ingredient or category key; None if no unit converts.
+        The first (quantity, unit) pair that converts wins; a unit without a
+        quantity counts as one.
+        """
+        serving = parse_household_serving(text)
+        for quantity, unit in serving.amounts:
+            grams = self.grams_for(quantity, unit, key)
+            if grams is not None:
+                return round(grams, 2)
+        if not serving.amounts:
+            for unit in serving.units:
+                grams = self.unit_grams(key, unit)
+                if grams is not None:
+                    return round(grams, 2)
+        return None
+
+
+def parse_grams_batch(table: PortionGrams, items: Iterable[Tuple[str, str]]) -> List[Optional[float]]:
+    """Grams for many (text, key) pairs; repeated pairs come from the LRU cache"""
+    parse = table.parse_grams
+    return [parse(text, key) for text, key in items]
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Compile or query the (ingredient/category, unit) -> grams table",
+        epilog="Example:\n"
+               "  python3 portion_grams.py --bulk FoodData_Central_csv_2024-10-31.zip\n"
+               "  python3 portion_grams.py --portions usda_food_categories_portions.json\n"
+               "  python3 portion_grams.py --convert \"1 1/2 cups\" --key \"rice_cooked\"",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--bulk', metavar='PATH', action='append', default=[],
+                        help="FDC bulk download (directory, .zip or JSON file); repeatable")
+    parser.add_argument('--portions', metavar='PATH', action='append', default=[],
+                        help="fetch-usda-food-categories.py output with "
+                             "portion_gram_weights; repeatable")
+    parser.add_argument('--ingredient-types', nargs='+', default=list(DEFAULT_INGREDIENT_TYPES),
+                        metavar='TYPE',
+                        help="dataTypes given per-ingredient weights "
+                             "(default: Foundation, SR Legacy)")
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH,
+                        help=f"Artifact path; .gz/.zst compresses (default: {DEFAULT_TABLE_PATH})")
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH,
+                        help="Artifact to query with --convert")
+    parser.add_argument('--convert', metavar='TEXT',
+                        help="Convert a serving text to grams using --table")
+    parser.add_argument('--key', default='',
+                        help="Ingredient or category for --convert")
+    args = parser.parse_args()
+
+    if args.convert is not None:
+        try:
+            table = PortionGrams.load(args.table)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        grams = table.parse_grams(args.convert, args.key)
+        if grams is None:
+            print(f"No conversion for {args.convert!r} ({args.key or 'no key'})")
+            sys.exit(1)
+        print(f"{args.convert} = {grams:g} g (table {table.version})")
+        return
+
+    if not args.bulk and not args.portions:
+        parser.error("give --bulk and/or --portions to build, or --convert to query")
+
+    start = time.monotonic()
+    builder = PortionGramsBuilder(args.ingredient_types)
+    try:
+        for path in args.bulk:
+            print(f"✓ Read {builder.add_bulk_download(path)} foods from {path}")
+        for path in args.portions:
+            print(f"✓ Read {builder.add_portion_map(path)} weights from {path}")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    artifact = builder.build()
+    with open_stream(args.output, 'w') as f:
+        json.dump(artifact, f, separators=(',', ':'))
+    print("-" * 60)
+    print(f"Table version: {artifact['version']}")
+    print(f"Weights: {len(artifact['grams'])} "
+          f"({len(artifact['categories'])} ingredients with a category)")
+    print(f"Densities: {len(artifact['densities'])}")
+    print(f"✓ Wrote {args.output} ({time.monotonic() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+"""
+Schema-Driven Row Encoders for Seed Tables
+Reads the column definitions of the reference tables we seed straight from
+their migrations and compiles, per table, a tuple of per-column converters
+that turn a raw CSV record into an INSERT VALUES tuple, a COPY text line or
+a COPY binary tuple.
+
+Encoders work on csv.reader records (lists) bound to the CSV header once, so
+no per-row dict is built. Run this file to print the compiled schemas.
+"""
+
+import re
+import struct
+import sys
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from split_sql_file import iter_sql_statements
+
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'database' / 'migrations'
+
+
+class SeedTable(NamedTuple):
+    """A table the CSV pipeline can seed"""
+    migrations: Tuple[str, ...]  # Migration files holding its DDL, applied in order
+    key: str  # Unique column rows are merged on (ON CONFLICT)
+    # Values used for blank CSV fields where the DDL has no usable default
+    csv_defaults: Dict[str, str] = {}
+
+
+SEED_TABLES = {
+    'simple_ingredients': SeedTable(
+        migrations=('067_create_simple_ingredients_table.sql',),
+        key='name',
+        csv_defaults={'serving_quantity': '1', 'serving_unit': 'g', 'calories': '0'},
+    ),
+    'portion_sizes': SeedTable(
+        migrations=('077_create_portion_sizes_table.sql', '080_add_food_categories.sql',
+                    '082_normalize_food_categories.sql'),
+        key='name',
+    ),
+    'food_categories': SeedTable(
+        migrations=('082_normalize_food_categories.sql',),
+        key='code',
+    ),
+}
+
+
+class Column(NamedTuple):
+    """One column as declared in the DDL"""
+    name: str
+    sql_type: str  # Upper-cased base type, e.g. VARCHAR, DECIMAL, TEXT[]
+    kind: Optional[str]  # text, numeric, integer, boolean, text_array or None (not seeded)
+    max_length: Optional[int]
+    not_null: bool
+    default: Optional[str]  # DDL DEFAULT expression, verbatim
+
+
+# Base type -> encoder kind; anything else (UUID, timestamps, JSONB) is left to the database
+TYPE_KINDS = {
+    'VARCHAR': 'text', 'CHARACTER VARYING': 'text', 'CHAR': 'text', 'CHARACTER': 'text',
+    'TEXT': 'text',
+    'DECIMAL': 'numeric', 'NUMERIC': 'numeric',
+    'SMALLINT': 'integer', 'INTEGER': 'integer', 'INT': 'integer', 'INT4': 'integer',
+    'BIGINT': 'integer', 'INT8': 'integer',
+    'BOOLEAN': 'boolean', 'BOOL': 'boolean',
+    'TEXT[]': 'text_array', 'VARCHAR[]': 'text_array',
+}
+INTEGER_FORMATS = {'SMALLINT': '!h', 'BIGINT': '!q', 'INT8': '!q'}  # default '!i'
+
+CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\(', re.IGNORECASE)
+ALTER_TABLE = re.compile(r'^\s*ALTER\s+TABLE\s+(?:ONLY\s+)?(?:IF\s+EXISTS\s+)?(\w+)\s+(.*)$',
+                         re.IGNORECASE | re.DOTALL)
+ADD_COLUMN = re.compile(r'^ADD\s+(?:COLUMN\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(.*)$',
+                        re.IGNORECASE | re.DOTALL)
+COLUMN_TYPE = re.compile(
+    r'(\w+)\s+(CHARACTER\s+VARYING|DOUBLE\s+PRECISION|TIMESTAMP(?:TZ)?'
+    r'(?:\s+WITH(?:OUT)?\s+TIME\s+ZONE)?|\w+)\s*(?:\(\s*([^)]*)\))?\s*(\[\])?',
+    re.IGNORECASE)
+NOT_NULL = re.compile(r'\bNOT\s+NULL\b|\bPRIMARY\s+KEY\b', re.IGNORECASE)
+DEFAULT = re.compile(r'\bDEFAULT\s+(.+?)\s*(?=\bNOT\s+NULL\b|\bNULL\b|\bCHECK\b|\bREFERENCES\b'
+                     r'|\bUNIQUE\b|\bPRIMARY\b|\bCONSTRAINT\b|$)', re.IGNORECASE | re.DOTALL)
+TABLE_CONSTRAINT = re.compile(r'^(?:CONSTRAINT|PRIMARY|UNIQUE|CHECK|FOREIGN|EXCLUDE)\b', re.IGNORECASE)
+LINE_COMMENT = re.compile(r'--[^\n]*')
+
+
+def split_top_level(text: str, separator: str = ',') -> List[str]:
+    """Split on separator outside parentheses, brackets and quotes"""
+    parts = []
+    depth = 0
+    quoted = False
+    start = 0
+    for i, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_column(definition: str) -> Optional[Column]:
+    """Parse one column definition, or None for a table constraint"""
+    definition = ' '.join(definition.split())
+    if TABLE_CONSTRAINT.match(definition):
+        return None
+    match = COLUMN_TYPE.match(definition)
+    if match is None:
+        return None
+
+    name, base_type, type_args, is_array = match.groups()
+    sql_type = ' '.join(base_type.upper().split()) + ('[]' if is_array else '')
+    max_length = None
+    if type_args and TYPE_KINDS.get(sql_type) == 'text':
+        max_length = int(type_args.split(',')[0])
+
+    constraints = definition[match.end():]
+    default = DEFAULT.search(constraints)
+    return Column(
+        name=name.lower(),
+        sql_type=sql_type,
+        kind=TYPE_KINDS.get(sql_type),
+        max_length=max_length,
+        not_null=bool(NOT_NULL.search(constraints)),
+        default=default.group(1).strip() if default else None,
+    )
+
+
+def parse_table_columns(table: str, migration_paths: Sequence[Path]) -> List[Column]:
+    """
+    Columns of a table after applying CREATE TABLE and ALTER TABLE ... ADD
+    COLUMN statements from the given migrations, in declaration order
+    """
+    columns: Dict[str, Column] = {}
+
+    for path in migration_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for statement in iter_sql_statements(f):
+                statement = LINE_COMMENT.sub('', statement).strip().rstrip(';')
+
+                create = CREATE_TABLE.match(statement)
+                if create and create.group(1).lower() == table:
+                    body = statement[create.end():statement.rindex(')')]
+                    columns = {}
+                    for definition in split_top_level(body):
+                        column = parse_column(definition)
+                        if column:
+                            columns[column.name] = column
+                    continue
+
+                alter = ALTER_TABLE.match(statement)
+                if alter and alter.group(1).lower() == table:
+                    for action in split_top_level(alter.group(2)):
+                        add = ADD_COLUMN.match(action)
+                        if add and not TABLE_CONSTRAINT.match(add.group(1)):
+                            column = parse_column(add.group(1))
+                            if column and column.name not in columns:
+                                columns[column.name] = column
+
+    if not columns:
+        raise ValueError(f"No CREATE TABLE for {table} in {', '.join(p.name for p in migration_paths)}")
+    return list(columns.values())
+
+
+# Value helpers shared with the COPY writers
+
+def copy_text_escape(value: str) -> str:
+    """Escape a value for the COPY text format"""
+    return (value.replace('\\', '\\\\')
+                 .replace('\t', '\\t')
+                 .replace('\n', '\\n')
+                 .replace('\r', '\\r'))
+
+
+def array_literal(items: List[str]) -> str:
+    """Format a list of strings as a PostgreSQL array literal ({"a","b"})"""
+    quoted = ['"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in items]
+    return '{' + ','.join(quoted) + '}'
+
+
+# Binary COPY constants (see PostgreSQL "COPY ... WITH (FORMAT binary)")
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('!h', -1)
+TEXT_OID = 25
+NUMERIC_POS = 0x0000
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+NUMERIC_PINF = 0xD000
+NUMERIC_NINF = 0xF000
+BINARY_NULL = struct.pack('!i', -1)
+
+
+def encode_numeric_binary(value: str) -> bytes:
+    """Encode a numeric string in PostgreSQL's binary NUMERIC representation"""
+    number = Decimal(value)
+    if number.is_nan():
+        return struct.pack('!hhHH', 0, 0, NUMERIC_NAN, 0)
+    if number.is_infinite():
+        return struct.pack('!hhHH', 0, 0, NUMERIC_NINF if number < 0 else NUMERIC_PINF, 0)
+
+    sign, digit_tuple, exponent = number.as_tuple()
+    digits = ''.join(str(d) for d in digit_tuple)
+    if exponent > 0:
+        digits += '0' * exponent
+        exponent = 0
+    dscale = -exponent
+
+    # Align fractional digits to base-10000 groups on the right,
+    # integer digits on the left
+    frac_len = dscale
+    if frac_len % 4:
+        digits += '0' * (4 - frac_len % 4)
+        frac_len += 4 - frac_len % 4
+    int_len = len(digits) - frac_len
+    if int_len % 4:
+        digits = '0' * (4 - int_len % 4) + digits
+        int_len += 4 - int_len % 4
+
+    groups = [int(digits[i:i + 4]) for i in range(0, len(digits), 4)]
+    weight = int_len // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    header = struct.pack('!hhHH', len(groups), weight,
+                         NUMERIC_NEG if sign and groups else NUMERIC_POS, dscale)
+    return header + struct.pack(f'!{len(groups)}H', *groups)
+
+
+def encode_text_array_binary(items: List[str]) -> bytes:
+    """Encode a list of strings as a binary one-dimensional TEXT[]"""
+    if not items:
+        return struct.pack('!iii', 0, 0, TEXT_OID)
+    parts = [struct.pack('!iiiii', 1, 0, TEXT_OID, len(items), 1)]
+    for item in items:
+        encoded = item.encode('utf-8')
+        parts.append(struct.pack('!i', len(encoded)))
+        parts.append(encoded)
+    return b''.join(parts)
+
+
+TRUE_VALUES = frozenset(('true', '1', 'yes', 't'))
+FALSE_VALUES = frozenset(('false', '0', 'no', 'f'))
+BOOLEAN_WORDS = {**{word: True for word in TRUE_VALUES}, **{word: False for word in FALSE_VALUES}}
+EMPTY_ARRAY_DEFAULT = re.compile(r"^(?:ARRAY\[\]|'\{\}')(?:::\w+\[\])?$", re.IGNORECASE)
+
+
+def _literal_default(column: Column, csv_defaults: Dict[str, str]):
+    """
+    Typed value for a blank CSV field, or None for NULL.
+
+    CSV overrides win. Otherwise NOT NULL columns and array/boolean columns
+    take their DDL default; nullable text and numeric columns stay NULL, so a
+    missing nutrient is stored as unknown rather than as 0.
+    """
+    if column.name in csv_defaults:
+        value = csv_defaults[column.name]
+        if column.kind == 'text_array':
+            return [item.strip() for item in value.split(',') if item.strip()]
+        if column.kind == 'boolean':
+            return value.lower() in TRUE_VALUES
+        return value
+
+    default = column.default
+    if default is None:
+        return None
+    if not column.not_null and column.kind not in ('text_array', 'boolean'):
+        return None
+
+    if column.kind == 'text_array':
+        return [] if EMPTY_ARRAY_DEFAULT.match(default) else None
+    if column.kind == 'boolean':
+        return default.upper() in ('TRUE', "'T'", "'TRUE'")
+    if default.startswith("'") and default.endswith("'"):
+        return default[1:-1].replace("''", "'")
+    if column.kind in ('numeric', 'integer'):
+        try:
+            Decimal(default)
+            return default
+        except ArithmeticError:
+            return None
+    return None
+
+
+# Numeric fields repeat heavily (0, NULL, common portion values), so
+# validation and binary encoding are memoised per process, up to a bound
+CACHE_LIMIT = 1 << 16
+_numbers: Dict[str, bool] = {}  # raw field -> valid as NUMERIC
+_integers: Dict[str, bool] = {}  # raw field -> valid as INTEGER
+_numeric_fields: Dict[str, bytes] = {}
+COPY_TEXT_SPECIAL = re.compile(r'[\\\t\n\r]')
+
+
+def _is_number(raw: str) -> bool:
+    """Whether raw is a valid numeric field ('null' and garbage are not)"""
+    try:
+        float(raw)
+        valid = True
+    except ValueError:
+        valid = False
+    # Only fields that need no COPY text escaping are cached, so a cached
+    # valid field can be written to COPY text as is
+    if len(_numbers) < CACHE_LIMIT and not COPY_TEXT_SPECIAL.search(raw):
+        _numbers[raw] = valid
+    return valid
+
+
+def _is_integer(raw: str) -> bool:
+    try:
+        int(raw)
+        valid = True
+    except ValueError:
+        valid = False
+    if len(_integers) < CACHE_LIMIT and not COPY_TEXT_SPECIAL.search(raw):
+        _integers[raw] = valid
+    return valid
+
+
+def _split_array(raw: str) -> List[str]:
+    return [item.strip() for item in raw.split(',') if item.strip()]
+
+
+def _sql_text(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _sql_array(value: List[str]) -> str:
+    if not value:
+        return 'ARRAY[]::TEXT[]'
+    return 'ARRAY[' + ', '.join([_sql_text(item) for item in value]) + ']::TEXT[]'
+
+
+def _binary_field(data: bytes) -> bytes:
+    return struct.pack('!i', len(data)) + data
+
+
+def _binary_text(value: str) -> bytes:
+    return _binary_field(value.encode('utf-8'))
+
+
+def _binary_numeric(value: str) -> bytes:
+    field = _numeric_fields.get(value)
+    if field is None:
+        field = _binary_field(encode_numeric_binary(value))
+        if len(_numeric_fields) < CACHE_LIMIT:
+            _numeric_fields[value] = field
+    return field
+
+
+def _binary_array(value: List[str]) -> bytes:
+    return _binary_field(encode_text_array_binary(value))
+
+
+BINARY_TRUE = _binary_field(b'\x01')
+BINARY_FALSE = _binary_field(b'\x00')
+
+# Names visible to the generated encoder functions
+_CODEGEN_GLOBALS = {
+    'NUM': _numbers, 'INT': _integers,
+    'is_number': _is_number, 'is_integer': _is_integer, 'split_array': _split_array,
+    'BOOL': BOOLEAN_WORDS,
+    'sql_text': _sql_text, 'sql_array': _sql_array,
+    'esc': copy_text_escape, 'array_literal': array_literal,
+    'NULL': BINARY_NULL, 'T': BINARY_TRUE, 'F': BINARY_FALSE,
+    'bin_text': _binary_text, 'bin_numeric': _binary_numeric, 'bin_array': _binary_array,
+}
+
+
+def _typed_expression(column: Column, k: int, raw: str) -> str:
+    """Source for raw CSV field -> typed value (str, list of str, bool or None)"""
+    blank = f'B{k}'
+    if column.kind == 'text':
+        if column.max_length:
+            return f"{raw}[:{column.max_length}] if {raw} else {blank}"
+        return f"{raw} if {raw} else {blank}"
+    if column.kind == 'numeric':
+        return (f"{raw} if {raw} and (NUM.get({raw}) or ({raw} not in NUM and is_number({raw}))) "
+                f"else {blank}")
+    if column.kind == 'integer':
+        return (f"{raw} if {raw} and (INT.get({raw}) or ({raw} not in INT and is_integer({raw}))) "
+                f"else {blank}")
+    if column.kind == 'boolean':
+        return f"BOOL.get({raw}.lower(), {blank}) if {raw} else {blank}"
+    if column.kind == 'text_array':
+        return f"split_array({raw}) if {raw} and {raw}.lower() != 'null' else {blank}"
+    raise ValueError(f"Column {column.name} ({column.sql_type}) cannot be seeded from CSV")
+
+
+def _output_expression(column: Column, k: int, output: str) -> str:
+    """Source for typed value v<k> -> SQL literal, COPY text field or COPY binary field"""
+    kind = column.kind
+    value = f'v{k}'
+    if output == 'sql':
+        if kind == 'text':
+            return f"'NULL' if {value} is None else sql_text({value})"
+        if kind in ('numeric', 'integer'):
+            return f"'NULL' if {value} is None else {value}"
+        if kind == 'boolean':
+            return f"'NULL' if {value} is None else ('TRUE' if {value} else 'FALSE')"
+        return f"'NULL' if {value} is None else sql_array({value})"
+
+    if output == 'copy_text':
+        if kind == 'numeric':
+            return f"'\\\\N' if {value} is None else ({value} if {value} in NUM else esc({value}))"
+        if kind == 'integer':
+            return f"'\\\\N' if {value} is None else ({value} if {value} in INT else esc({value}))"
+        if kind == 'boolean':
+            return f"'\\\\N' if {value} is None else ('t' if {value} else 'f')"
+        if kind == 'text_array':
+            return f"'\\\\N' if {value} is None else esc(array_literal({value}))"
+        return f"'\\\\N' if {value} is None else esc({value})"
+
+    if kind == 'text':
+        return f"NULL if {value} is None else bin_text({value})"
+    if kind == 'numeric':
+        return f"NULL if {value} is None else bin_numeric({value})"
+    if kind == 'integer':
+        return f"NULL if {value} is None else INTEGER{k}({value})"
+    if kind == 'boolean':
+        return f"NULL if {value} is None else (T if {value} else F)"
+    return f"NULL if {value} is None else bin_array({value})"
+
+
+def _join_expression(output: str, parts: List[str]) -> str:
+    if output == 'sql':
+        return "'  (' + ', '.join((" + ', '.join(parts) + ",)) + ')'"
+    if output == 'copy_text':
+        return "'\\t'.join((" + ', '.join(parts) + ",)) + '\\n'"
+    return "b''.join((HEADER, " + ', '.join(parts) + ",))"
+
+
+class TableEncoder:
+    """
+    Compiled encoders for one seed table.
+
+    Built once per table from its DDL. Each column's conversion is emitted
+    as an inline expression, and the expressions for a table are compiled
+    into one Python function per output format, so encoding a record costs
+    one call instead of one call (and one dict entry) per column. bind() it
+    to a CSV header to get a BoundEncoder that works on csv.reader records.
+    """
+
+    def __init__(self, table: str, columns: List[Column], key: str,
+                 csv_defaults: Optional[Dict[str, str]] = None):
+        csv_defaults = csv_defaults or {}
+        self.table = table
+        self.all_columns = columns
+        self.insert_columns = [c for c in columns if c.kind is not None]
+        self.columns = [c.name for c in self.insert_columns]
+        self.kinds = {c.name: c.kind for c in self.insert_columns}
+        self.key = key
+        self.key_index = self.columns.index(key)
+
+        for column in columns:
+            if column.kind is None and column.not_null and column.default is None:
+                raise ValueError(f"{table}.{column.name} ({column.sql_type}) is NOT NULL "
+                                 f"with no default and cannot be seeded from CSV")
+
+        # Rows missing any of these are skipped: NOT NULL with nothing to fall back on
+        self.required = [c.name for c in self.insert_columns
+                         if c.not_null and c.default is None and c.name not in csv_defaults]
+
+        self.namespace = dict(_CODEGEN_GLOBALS)
+        self.namespace['HEADER'] = struct.pack('!h', len(self.columns))
+        for k, column in enumerate(self.insert_columns):
+            self.namespace[f'B{k}'] = _literal_default(column, csv_defaults)
+            if column.kind == 'integer':
+                integer = struct.Struct(INTEGER_FORMATS.get(column.sql_type, '!i'))
+                self.namespace[f'INTEGER{k}'] = (
+                    lambda value, pack=integer.pack, size=integer.size:
+                    struct.pack('!i', size) + pack(int(value)))
+
+        self.encode_values_sql = self._compile_values_encoder('sql')
+        self.encode_values_copy_text = self._compile_values_encoder('copy_text')
+        self.encode_values_copy_binary = self._compile_values_encoder('copy_binary')
+
+        self._bound: Dict[Tuple[str, ...], 'BoundEncoder'] = {}
+
+    def _compile(self, name: str, source: str):
+        exec(compile(source, f'<{self.table}.{name}>', 'exec'), self.namespace)
+        return self.namespace.pop(name)
+
+    def _compile_values_encoder(self, output: str):
+        """typed values (a list in column order) -> output, for one format"""
+        value_names = [f'v{k}' for k in range(len(self.columns))]
+        parts = [f'({_output_expression(column, k, output)})'
+                 for k, column in enumerate(self.insert_columns)]
+        source = (f"def encode_values_{output}(values):\n"
+                  f"    {', '.join(value_names)}, = values\n"
+                  f"    return {_join_expression(output, parts)}\n")
+        return self._compile(f'encode_values_{output}', source)
+
+    def compile_record_encoder(self, positions: List[Optional[int]], output: Optional[str]):
+        """
+        Raw record -> output (or -> typed values when output is None), for
+        records whose field for column k sits at positions[k] (None if the
+        CSV has no such column). Short records are padded with blanks.
+        """
+        width = max([p for p in positions if p is not None], default=-1) + 1
+        lines = [f"def encode_record(r):",
+                 f"    if len(r) < {width}:",
+                 f"        r = r + PAD[len(r):]"]
+        for k, (column, position) in enumerate(zip(self.insert_columns, positions)):
+            if position is None:
+                lines.append(f"    v{k} = B{k}")
+            else:
+                lines.append(f"    x = r[{position}]")
+                lines.append(f"    v{k} = {_typed_expression(column, k, 'x')}")
+
+        if output is None:
+            lines.append(f"    return [{', '.join(f'v{k}' for k in range(len(positions)))}]")
+        else:
+            parts = [f'({_output_expression(column, k, output)})'
+                     for k, column in enumerate(self.insert_columns)]
+            lines.append(f"    return {_join_expression(output, parts)}")
+
+        self.namespace['PAD'] = [''] * width
+        return self._compile('encode_record', '\n'.join(lines) + '\n')
+
+    def bind(self, fieldnames: Sequence[str]) -> 'BoundEncoder':
+        """Encoder for records laid out as fieldnames (cached per header)"""
+        fieldnames = tuple(fieldnames)
+        bound = self._bound.get(fieldnames)
+        if bound is None:
+            bound = self._bound[fieldnames] = BoundEncoder(self, fieldnames)
+        return bound
+
+
+class BoundEncoder:
+    """A TableEncoder bound to one CSV header, with record encoders compiled for it"""
+
+    def __init__(self, encoder: TableEncoder, fieldnames: Tuple[str, ...]):
+        positions = {}
+        for position, field in enumerate(fieldnames):
+            if field is not None:
+                positions.setdefault(field, position)
+
+        columns = [positions.get(name) for name in encoder.columns]
+        self.encoder = encoder
+        self.fieldnames = fieldnames
+        self.key_index = encoder.key_index
+        # A required column missing from the header makes every row invalid
+        self.required = tuple(positions.get(name, sys.maxsize) for name in encoder.required)
+
+        self.values = encoder.compile_record_encoder(columns, None)
+        self.sql = encoder.compile_record_encoder(columns, 'sql')
+        self.copy_text = encoder.compile_record_encoder(columns, 'copy_text')
+        self.copy_binary = encoder.compile_record_encoder(columns, 'copy_binary')
+
+    def is_valid(self, record: list) -> bool:
+        """Whether every required field is present and non-empty"""
+        size = len(record)
+        for i in self.required:
+            if i >= size or not record[i]:
+                return False
+        return True
+
+
+# Output format name -> BoundEncoder method
+FORMAT_METHODS = {
+    'sql': 'sql',
+    'copy': 'copy_text',
+    'copy-binary': 'copy_binary',
+}
+
+
+@lru_cache(maxsize=None)
+def get_table_encoder(table: str, migrations_dir: str = str(MIGRATIONS_DIR)) -> TableEncoder:
+    """Compile (once per process) the encoder for a table in SEED_TABLES"""
+    if table not in SEED_TABLES:
+        raise ValueError(f"Unknown seed table: {table} (known: {', '.join(SEED_TABLES)})")
+    spec = SEED_TABLES[table]
+    paths = [Path(migrations_dir) / name for name in spec.migrations]
+    columns = parse_table_columns(table, paths)
+    return TableEncoder(table, columns, spec.key, spec.csv_defaults)
+
+
+def main():
+    """Print the compiled schema of every seed table"""
+    for table in SEED_TABLES:
+        encoder = get_table_encoder(table)
+        print(f"{table} (key: {encoder.key}, required: {', '.join(encoder.required)})")
+        for column in encoder.all_columns:
+            kind = column.kind or 'database default'
+            flags = []
+            if column.max_length:
+                flags.append(f"max {column.max_length}")
+            if column.not_null:
+                flags.append('not null')
+            if column.default is not None:
+                flags.append(f"default {column.default}")
+            print(f"  {column.name:<22} {column.sql_type:<12} {kind:<17} {', '.join(flags)}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,85 +1,770 @@
 #!/usr/bin/env python3
 """
 Split a large SQL file into smaller chunks for Supabase SQL editor
+
+The input is streamed statement by statement, so memory use is bounded by the
+largest single statement rather than the file size. Multi-row INSERT ... VALUES
+statements are re-cut at row boundaries, so chunks hold a true row count.
+A gzip or zstd compressed input is decompressed as it is read, and chunks can
+be written compressed with --compress.
 """
 
+import argparse
+import re
 import sys
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from compressed_io import SUFFIXES, check_compression, detect_compression, open_stream
+from pipeline_metrics import Metrics, add_metrics_arguments, report
+
+
+# Tokens that change the lexical state, plus statement terminators
+TOKEN = re.compile(r"""'|"|--|/\*|\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$|;""")
+# Tokens that matter when locating VALUES tuples inside one statement
+ROW_TOKEN = re.compile(r"""'|"|--|/\*|\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$|[()\[\]]|\bVALUES\b""",
+                       re.IGNORECASE)
+
+# Fast paths: these consume whole runs of complete, unambiguous text in one
+# regex call. Every alternative is self-delimiting, so wherever a match stops
+# the scanner is in a known state and falls back to the token loop.
+_STRING = r"'[^']*+(?:''[^']*+)*+'"
+_IDENTIFIER = r'"[^"]*+(?:""[^"]*+)*+"'
+_LINE_COMMENT = r'--[^\n]*+\n'
+_FLAT_BLOCK_COMMENT = r'/\*(?:[^*/]++|\*(?!/)|/(?!\*))*+\*/'
+PLAIN_TEXT = re.compile(rf"""(?:[^'"$;/\-]++|{_STRING}|{_IDENTIFIER}|{_LINE_COMMENT})*+""")
+FLAT_ROW = re.compile(
+    rf"""\((?:[^'"$()\[\]/\-]++|{_STRING}|{_IDENTIFIER}"""
+    rf"""|\[(?:[^'\[\]]++|{_STRING})*+\]|-(?!-)|/(?!\*))*+\)""")
+ROW_GAP = re.compile(rf'(?:\s++|--[^\n]*+(?:\n|$)|{_FLAT_BLOCK_COMMENT})*+')
+LEADING_KEYWORD = re.compile(r'[A-Za-z]+')
+COPY_FROM_STDIN = re.compile(r'\bFROM\s+STDIN\b', re.IGNORECASE)
+COPY_DATA_END = re.compile(r'^\\\.[ \t]*(?:\r?\n|$)', re.MULTILINE)
+_NAME = r'(?:"[^"]+"|[A-Za-z_][\w$]*)'
+COPY_TARGET = re.compile(rf'\bCOPY\s+(?:ONLY\s+)?(?:{_NAME}\s*\.\s*)?({_NAME})', re.IGNORECASE)
+CREATE_TEMP_TABLE = re.compile(
+    rf'^\s*CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?TEMP(?:ORARY)?\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?({_NAME})',
+    re.IGNORECASE)
+
+# Transaction control statements are dropped; every chunk gets its own BEGIN/COMMIT
+TRANSACTION_KEYWORDS = {'BEGIN', 'COMMIT', 'END', 'START', 'ROLLBACK'}
+
+# Item kinds yielded by iter_sql_items()
+STATEMENT = 'statement'
+COPY_DATA = 'copy_data'
+COPY_END = 'copy_end'
+
+# Ends a chunk's part of a COPY that continues in the next chunk
+COPY_END_LINE = '\\.\n'
+
+# Longest token we may need to see whole before deciding (dollar-quote tags)
+LOOKAHEAD = 64
+
+
+class IncompleteToken(Exception):
+    """Raised when a quoted span or comment runs past the end of the buffer"""
+
+
+def skip_token(text: str, start: int, token: str, eof: bool = True) -> int:
+    """
+    Return the index just past the quoted string, identifier, comment or
+    dollar-quoted body that begins with ``token`` at ``start``.
+
+    Raises IncompleteToken if the span is not terminated within ``text`` and
+    more input may follow (eof is False). At EOF the span runs to the end.
+    """
+    pos = start + len(token)
+
+    if token in ("'", '"'):
+        while True:
+            end = text.find(token, pos)
+            if end == -1:
+                break
+            if end + 1 < len(text) and text[end + 1] == token:
+                pos = end + 2  # doubled quote escapes itself
+                continue
+            if end + 1 == len(text) and not eof:
+                break  # may be the first half of a doubled quote
+            return end + 1
+    elif token == '--':
+        end = text.find('\n', pos)
+        if end != -1:
+            return end + 1
+    elif token == '/*':
+        depth = 1  # PostgreSQL block comments nest
+        while True:
+            opening = text.find('/*', pos)
+            closing = text.find('*/', pos)
+            if closing == -1:
+                break
+            if opening != -1 and opening < closing:
+                depth += 1
+                pos = opening + 2
+                continue
+            depth -= 1
+            pos = closing + 2
+            if depth == 0:
+                return pos
+    else:  # $tag$ ... $tag$
+        end = text.find(token, pos)
+        if end != -1:
+            return end + len(token)
+
+    if not eof:
+        raise IncompleteToken()
+    return len(text)
+
+
+def leading_keyword(statement: str) -> str:
+    """First keyword of a statement, skipping whitespace and comments (upper-cased)"""
+    pos = 0
+    while pos < len(statement):
+        if statement[pos].isspace():
+            pos += 1
+        elif statement.startswith('--', pos) or statement.startswith('/*', pos):
+            pos = skip_token(statement, pos, statement[pos:pos + 2])
+        else:
+            match = LEADING_KEYWORD.match(statement, pos)
+            return match.group(0).upper() if match else ''
+    return ''
+
+
+def leading_comments(statement: str) -> str:
+    """The whitespace and comments before a statement's first keyword"""
+    pos = 0
+    while pos < len(statement):
+        if statement[pos].isspace():
+            pos += 1
+        elif statement.startswith('--', pos) or statement.startswith('/*', pos):
+            pos = skip_token(statement, pos, statement[pos:pos + 2])
+        else:
+            break
+    return statement[:pos]
+
+
+def is_copy_from_stdin(statement: str) -> bool:
+    """Whether a statement is COPY ... FROM STDIN, followed by inline data"""
+    return leading_keyword(statement) == 'COPY' and COPY_FROM_STDIN.search(statement) is not None
+
+
+def table_key(name: str) -> str:
+    """Compare table names the way PostgreSQL does (unquoted names fold to lower case)"""
+    return name if name.startswith('"') else name.lower()
+
+
+def iter_sql_items(infile, block_size: int = 64 * 1024) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (kind, text) items from a SQL text stream, passing COPY data on as
+    it is read.
+
+    STATEMENT items are complete statements, as iter_sql_statements() yields
+    them. A COPY ... FROM STDIN statement (up to the end of its line) is
+    followed by COPY_DATA items, each a run of whole data lines, and one
+    COPY_END item holding the terminating '\\.' line ('' if the input ends
+    first). Memory stays bounded by the block size and the longest line or
+    statement, however large the COPY block.
+    """
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buf, eof
+        chunk = infile.read(block_size)
+        if not chunk:
+            eof = True
+            return False
+        buf += chunk
+        return True
+
+    while True:
+        pos = PLAIN_TEXT.match(buf, pos).end()
+        if pos == len(buf):
+            if not eof:
+                fill()
+                continue
+            if buf.strip() and leading_keyword(buf):
+                yield STATEMENT, buf
+            return
+
+        match = TOKEN.match(buf, pos)
+        if match is None:
+            # A lone '-', '/' or '$'; make sure it is not the start of a token
+            # cut off at the end of the buffer
+            if not eof and len(buf) - pos < LOOKAHEAD:
+                fill()
+            else:
+                pos += 1
+            continue
+
+        token = match.group(0)
+        if token != ';':
+            try:
+                pos = skip_token(buf, pos, token, eof)
+            except IncompleteToken:
+                fill()
+            continue
+
+        end = match.end()
+        statement = buf[:end]
+        if not is_copy_from_stdin(statement):
+            yield STATEMENT, statement
+            buf = buf[end:]
+            pos = 0
+            continue
+
+        # Inline COPY data runs from the next line to a line holding only '\.'
+        while buf.find('\n', end) == -1 and not eof:
+            fill()
+        newline = buf.find('\n', end)
+        end = newline + 1 if newline != -1 else len(buf)
+        yield STATEMENT, buf[:end]
+        buf = buf[end:]
+        while True:
+            marker = COPY_DATA_END.search(buf)
+            if marker and (marker.group(0).endswith('\n') or eof):
+                if marker.start():
+                    yield COPY_DATA, buf[:marker.start()]
+                yield COPY_END, marker.group(0)
+                buf = buf[marker.end():]
+                break
+            # Pass on whole lines; a partial line (or a '\.' that may not end
+            # its line) waits for the next block
+            cut = marker.start() if marker else buf.rfind('\n') + 1
+            if cut:
+                yield COPY_DATA, buf[:cut]
+                buf = buf[cut:]
+            if eof:
+                if buf:
+                    yield COPY_DATA, buf
+                yield COPY_END, ''
+                buf = ''
+                break
+            fill()
+        pos = 0
+
+
+def iter_sql_statements(infile, block_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Yield complete SQL statements from a text stream.
+
+    Each yielded string runs from the end of the previous statement up to and
+    including its terminating ';' (so leading comments stay attached). Quotes,
+    quoted identifiers, line and nested block comments and dollar-quoted bodies
+    are skipped, so a ';' or 'INSERT INTO' inside them never splits a
+    statement. Inline data after COPY ... FROM STDIN is attached to the COPY
+    statement up to its terminating '\\.' line. Trailing text without a ';'
+    is yielded last if it contains anything but whitespace and comments.
+    Use iter_sql_items() to stream COPY data instead of holding it.
+    """
+    copy: Optional[List[str]] = None
+    for kind, text in iter_sql_items(infile, block_size):
+        if copy is not None:
+            copy.append(text)
+            if kind == COPY_END:
+                yield ''.join(copy)
+                copy = None
+        elif is_copy_from_stdin(text):
+            copy = [text]
+        else:
+            yield text
+    if copy is not None:
+        yield ''.join(copy)
+
+
+def split_insert_rows(statement: str) -> Optional[Tuple[str, List[str], str, str]]:
+    """
+    Split an INSERT ... VALUES statement into its rows.
+
+    Returns:
+        (prefix, rows, separator, suffix) such that any run of rows can be
+        re-emitted as prefix + separator.join(rows[i:j]) + suffix, or None if
+        the statement is not a plain INSERT ... VALUES list (keep it whole)
+    """
+    if leading_keyword(statement) != 'INSERT':
+        return None
+
+    values_end = _find_values(statement)
+    if values_end is None:
+        return None
+
+    rows: List[Tuple[int, int]] = []
+    pos = values_end
+    while True:
+        start = ROW_GAP.match(statement, pos).end()
+        has_comma = statement.startswith(',', start)
+        if has_comma:
+            start = ROW_GAP.match(statement, start + 1).end()
+        if not statement.startswith('(', start):
+            if has_comma or not rows:
+                return None  # not a plain VALUES list; keep the statement whole
+            break
+        if rows and not has_comma:
+            return None
+
+        match = FLAT_ROW.match(statement, start)
+        end = match.end() if match else _match_parens(statement, start)
+        if end is None:
+            return None
+        rows.append((start, end))
+        pos = end
+
+    if len(rows) > 1:
+        separator = statement[rows[0][1]:rows[1][0]]
+    else:
+        separator = ',\n'
+    prefix = statement[:rows[0][0]]
+    suffix = statement[rows[-1][1]:]
+    row_texts = [statement[start:end] for start, end in rows]
+    return prefix, row_texts, separator, suffix
+
+
+def _find_values(statement: str) -> Optional[int]:
+    """Index just past the top-level VALUES keyword of an INSERT, if any"""
+    depth = 0
+    pos = 0
+    while True:
+        match = ROW_TOKEN.search(statement, pos)
+        if match is None:
+            return None
+        token = match.group(0)
+        if token in ('(', '['):
+            depth += 1
+            pos = match.end()
+        elif token in (')', ']'):
+            depth -= 1
+            pos = match.end()
+        elif token.upper() == 'VALUES':
+            if depth == 0:
+                return match.end()
+            pos = match.end()
+        else:
+            pos = skip_token(statement, match.start(), token)
+
+
+def _match_parens(statement: str, start: int) -> Optional[int]:
+    """Index just past the ')' matching the '(' at start, skipping literals and comments"""
+    depth = 0
+    pos = start
+    while True:
+        match = ROW_TOKEN.search(statement, pos)
+        if match is None:
+            return None
+        token = match.group(0)
+        if token in ('(', '['):
+            depth += 1
+            pos = match.end()
+        elif token in (')', ']'):
+            depth -= 1
+            pos = match.end()
+            if depth == 0:
+                return pos
+        elif token.upper() == 'VALUES':
+            pos = match.end()
+        else:
+            pos = skip_token(statement, match.start(), token)
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size such as 500000, 900K or 2M"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
 
 
-def split_sql_file(input_file: str, output_dir: str, rows_per_file: int = 500):
+class ChunkWriter:
+    """
+    Writes statements into numbered chunk files, starting a new file when
+    the row or byte limit is reached. Each chunk is wrapped in BEGIN/COMMIT
+    and repeats the input's header comments.
+
+    Byte limits and sizes count the uncompressed SQL, which is what the SQL
+    editor sees, even when chunks are written compressed.
+
+    COPY ... FROM STDIN data is cut between lines: the chunk gets a '\\.'
+    line and the next one repeats the COPY header. When the COPY fills a
+    temporary table (CREATE TEMP TABLE ... ON COMMIT DROP, as in the
+    copy-format staging load), each chunk also repeats the CREATE before the
+    COPY, and the statements after the data that use the table (the merge
+    INSERT ... SELECT) are appended to every chunk the COPY was cut from, so
+    each chunk loads and merges its own rows in one transaction.
+    """
+
+    def __init__(self, output_dir: Path, prefix: str, header: str,
+                 rows_per_file: Optional[int], max_bytes: Optional[int],
+                 compression: Optional[str] = None, compression_level: Optional[int] = None):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.header = header
+        self.rows_per_file = rows_per_file
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.compression_level = compression_level
+        self.suffix = '.sql' + (SUFFIXES[compression] if compression else '')
+        self.footer = "\nCOMMIT;\n"
+
+        self.files: List[Tuple[Path, int, int]] = []  # (temp path, rows, bytes)
+        self.outfile = None
+        self.rows = 0
+        self.bytes = 0
+        self.has_content = False
+
+        self.temp_tables: Dict[str, str] = {}  # table key -> CREATE TEMP TABLE statement
+        self.chunk_temp_tables = set()         # temp tables created in the current chunk
+        self.copy_header: Optional[str] = None
+        self.copy_table: Optional[str] = None  # temp table the current COPY fills
+        self.copy_rows = 0                     # COPY rows in the current chunk
+        self.awaiting: List[int] = []          # chunks cut from copy_table, left open for its merge
+        self.trailer_table: Optional[str] = None
+        self.trailer: List[str] = []           # statements using trailer_table after its COPY
+
+    def _open(self):
+        path = self.output_dir / f".{self.prefix}_part_{len(self.files) + 1:04d}{self.suffix}.tmp"
+        self.outfile = open_stream(path, 'w', compression=self.compression,
+                                   level=self.compression_level)
+        self.files.append((path, 0, 0))
+        self.rows = 0
+        self.bytes = 0
+        self.has_content = False
+        self.chunk_temp_tables = set()
+        self._write(self.header + "BEGIN;\n\n")
+
+    def _close(self, footer: bool = True):
+        if self.outfile is None:
+            return
+        if footer:
+            self._write(self.footer)
+        self.outfile.close()
+        path, _, _ = self.files[-1]
+        self.files[-1] = (path, self.rows, self.bytes)
+        self.outfile = None
+
+    def _write(self, text: str):
+        self.outfile.write(text)
+        self.bytes += len(text.encode('utf-8'))
+
+    def _room(self, extra_bytes: int) -> bool:
+        """Whether the current chunk can take extra_bytes more (and one more row)"""
+        if self.rows_per_file and self.rows >= self.rows_per_file:
+            return False
+        if self.max_bytes and self.bytes + extra_bytes + len(self.footer) > self.max_bytes:
+            return False
+        return True
+
+    def _ensure_room(self, extra_bytes: int):
+        if self.outfile is None:
+            self._open()
+        elif self.has_content and not self._room(extra_bytes):
+            self._close()
+            self._open()
+        self.has_content = True
+
+    def add_statement(self, statement: str):
+        """Add a statement that is kept whole (counts as no data rows)"""
+        if self.trailer_table is not None:
+            if self._uses_table(statement, self.trailer_table):
+                # Stays with the COPY before it, and is repeated in the chunks it was cut from
+                self._write(statement)
+                self.trailer.append(statement)
+                return
+            self._end_trailer()
+
+        self._ensure_room(len(statement.encode('utf-8')))
+        self._write(statement)
+        match = CREATE_TEMP_TABLE.match(statement[len(leading_comments(statement)):])
+        if match:
+            table = table_key(match.group(1))
+            self.temp_tables[table] = statement
+            self.chunk_temp_tables.add(table)
+
+    def begin_copy(self, statement: str):
+        """Start a COPY ... FROM STDIN statement; its data follows via add_copy_data()"""
+        self._end_trailer()
+        match = COPY_TARGET.search(statement)
+        table = table_key(match.group(1)) if match else None
+        self._ensure_room(len(statement.encode('utf-8')))
+        self.copy_header = statement
+        self.copy_table = table if table in self.temp_tables else None
+        self._start_copy()
+
+    def _start_copy(self):
+        if self.copy_table is not None and self.copy_table not in self.chunk_temp_tables:
+            self._write(self.temp_tables[self.copy_table])
+            self.chunk_temp_tables.add(self.copy_table)
+        self._write(self.copy_header)
+        self.copy_rows = 0
+
+    def add_copy_data(self, text: str) -> int:
+        """Add COPY data lines, starting a new chunk between lines when full; returns the line count"""
+        end_bytes = len(COPY_END_LINE)
+        lines = 0
+        start = 0
+        while start < len(text):
+            end = text.find('\n', start)
+            end = len(text) if end == -1 else end + 1
+            line = text[start:end]
+            size = len(line.encode('utf-8'))
+            if self.copy_rows and not self._room(size + end_bytes):
+                self._cut_copy()
+            self.outfile.write(line)
+            self.bytes += size
+            self.rows += 1
+            self.copy_rows += 1
+            lines += 1
+            start = end
+        return lines
+
+    def _cut_copy(self):
+        self._write(COPY_END_LINE)
+        if self.copy_table is None:
+            self._close()
+        else:
+            # COMMIT would drop the temp table before its rows are merged
+            self._close(footer=False)
+            self.awaiting.append(len(self.files) - 1)
+        self._open()
+        self.has_content = True
+        self._start_copy()
+
+    def end_copy(self, text: str):
+        """Finish the current COPY with its '\\.' line"""
+        self._write(text)
+        if self.copy_table is not None:
+            self.trailer_table = self.copy_table
+            self.trailer = []
+        self.copy_header = None
+        self.copy_table = None
+
+    @staticmethod
+    def _uses_table(statement: str, table: str) -> bool:
+        return re.search(rf'(?<![\w$"]){re.escape(table)}(?![\w$"])', statement, re.IGNORECASE) is not None
+
+    def _end_trailer(self):
+        """Append the statements after a temp table's COPY, and COMMIT, to the chunks it was cut from"""
+        if self.trailer_table is None:
+            return
+        text = ''.join(self.trailer) + self.footer
+        size = len(text.encode('utf-8'))
+        for index in self.awaiting:
+            path, rows, chunk_bytes = self.files[index]
+            with open_stream(path, 'a', compression=self.compression,
+                             level=self.compression_level) as f:
+                f.write(text)
+            self.files[index] = (path, rows, chunk_bytes + size)
+        self.awaiting = []
+        self.trailer_table = None
+        self.trailer = []
+
+    def add_insert(self, prefix: str, rows: List[str], separator: str, suffix: str):
+        """Add an INSERT's rows, re-cutting the statement at chunk boundaries"""
+        overhead = len(prefix.encode('utf-8')) + len(suffix.encode('utf-8'))
+        separator_bytes = len(separator.encode('utf-8'))
+        i = 0
+        while i < len(rows):
+            self._ensure_room(overhead + len(rows[i].encode('utf-8')))
+            taken = []
+            size = overhead
+            while i < len(rows):
+                row_bytes = len(rows[i].encode('utf-8')) + (separator_bytes if taken else 0)
+                if taken and not self._room_for_rows(len(taken) + 1, size + row_bytes):
+                    break
+                taken.append(rows[i])
+                size += row_bytes
+                i += 1
+            self._write(prefix + separator.join(taken) + suffix)
+            self.rows += len(taken)
+
+    def _room_for_rows(self, count: int, size: int) -> bool:
+        if self.rows_per_file and self.rows + count > self.rows_per_file:
+            return False
+        if self.max_bytes and self.bytes + size + len(self.footer) > self.max_bytes:
+            return False
+        return True
+
+    def finish(self) -> List[Tuple[Path, int, int]]:
+        """Close the last chunk and rename all chunks to *_part_NN_of_MM.sql[.gz|.zst]"""
+        self._end_trailer()
+        self._close()
+        total = len(self.files)
+        width = max(2, len(str(total)))
+        final = []
+        for number, (path, rows, size) in enumerate(self.files, 1):
+            target = self.output_dir / f"{self.prefix}_part_{number:0{width}d}_of_{total:0{width}d}{self.suffix}"
+            path.replace(target)
+            final.append((target, rows, size))
+        return final
+
+
+def split_sql_file(input_file: str, output_dir: str, rows_per_file: Optional[int] = 500,
+                   max_bytes: Optional[int] = None, prefix: str = 'fruits_veg',
+                   compression: Optional[str] = None, compression_level: Optional[int] = None,
+                   metrics: Optional[Metrics] = None):
     """
     Split SQL file into smaller chunks
 
     Args:
         input_file: Path to the input SQL file
         output_dir: Directory to write the output files
-        rows_per_file: Number of data rows per output file
+        rows_per_file: Maximum number of data rows per output file (None = no limit)
+        max_bytes: Target maximum size of each output file in bytes (None = no limit).
+            A single row larger than this still gets a file of its own.
+        prefix: Output file name prefix (files are <prefix>_part_NN_of_MM.sql)
+        compression: Write chunks as 'gzip' (.sql.gz) or 'zstd' (.sql.zst) files
+        compression_level: Compression level (default: 6 for gzip, 3 for zstd)
+        metrics: Stage timings and counters of the run go here (see
+            pipeline_metrics.py)
+
+    A gzip or zstd compressed input file is detected and streamed.
     """
     input_path = Path(input_file)
+    if not input_path.exists():
+        print(f"Error: SQL file not found: {input_file}")
+        sys.exit(1)
+
+    input_compression = detect_compression(input_path)
+    try:
+        check_compression(input_compression)
+        check_compression(compression)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    print(f"Reading SQL from: {input_file}")
+    print(f"Reading SQL from: {input_file}" +
+          (f" ({input_compression})" if input_compression else ""))
     print(f"Output directory: {output_dir}")
-    print(f"Rows per file: {rows_per_file}")
+    if compression:
+        print(f"Chunk compression: {compression}")
+    if rows_per_file:
+        print(f"Rows per file: {rows_per_file}")
+    if max_bytes:
+        print(f"Max bytes per file: {max_bytes}")
     print("-" * 60)
 
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    if metrics is None:
+        metrics = Metrics('split_sql')
+    metrics.count('bytes_read', input_path.stat().st_size)
 
-    # Split by INSERT statements
-    parts = content.split('INSERT INTO simple_ingredients')
-    header = parts[0]  # Contains BEGIN and comments
+    writer = None
+    statements = 0
+    insert_statements = 0
+    total_rows = 0
+    copy_statements = 0
+    copy_rows = 0
 
-    # Each part after the first is an INSERT statement
-    insert_statements = parts[1:]
+    with open_stream(input_path, 'r', compression=input_compression) as f:
+        for kind, statement in metrics.timed(iter_sql_items(f), 'read'):
+            if kind != STATEMENT:
+                with metrics.stage('write'):
+                    if kind == COPY_DATA:
+                        copy_rows += writer.add_copy_data(statement)
+                    else:
+                        writer.end_copy(statement)
+                continue
 
-    print(f"Found {len(insert_statements)} INSERT statements")
+            if writer is None:
+                # Comments before the first statement become every chunk's header
+                header = leading_comments(statement)
+                writer = ChunkWriter(output_path, prefix, header, rows_per_file, max_bytes,
+                                     compression, compression_level)
+                statement = statement[len(header):]
 
-    # Calculate number of output files needed
-    num_files = (len(insert_statements) + rows_per_file - 1) // rows_per_file
+            if leading_keyword(statement) in TRANSACTION_KEYWORDS:
+                continue
 
-    for file_num in range(num_files):
-        start_idx = file_num * rows_per_file
-        end_idx = min(start_idx + rows_per_file, len(insert_statements))
+            statements += 1
+            if is_copy_from_stdin(statement):
+                copy_statements += 1
+                with metrics.stage('write'):
+                    writer.begin_copy(statement)
+                continue
 
-        output_file = output_path / f"fruits_veg_part_{file_num + 1:02d}_of_{num_files:02d}.sql"
+            with metrics.stage('split'):
+                split = split_insert_rows(statement)
+            with metrics.stage('write'):
+                if split:
+                    insert_statements += 1
+                    total_rows += len(split[1])
+                    writer.add_insert(*split)
+                else:
+                    writer.add_statement(statement)
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            # Write header
-            f.write(header)
+    if writer is None or not writer.files:
+        print("No statements found")
+        return
 
-            # Write INSERT statements for this chunk
-            for i in range(start_idx, end_idx):
-                f.write('INSERT INTO simple_ingredients')
-                f.write(insert_statements[i])
+    with metrics.stage('write'):
+        files = writer.finish()
+    metrics.count('statements', statements)
+    metrics.count('insert_statements', insert_statements)
+    metrics.count('rows', total_rows)
+    metrics.count('copy_statements', copy_statements)
+    metrics.count('copy_rows', copy_rows)
+    metrics.count('files', len(files))
+    metrics.count('bytes_written', sum(path.stat().st_size for path, _, _ in files))
 
-            # Write footer
-            f.write("\nCOMMIT;\n")
-
-        print(f"Created: {output_file.name} ({end_idx - start_idx} batches)")
+    print(f"Found {insert_statements} INSERT statements ({total_rows} rows), "
+          f"{copy_statements} COPY statements ({copy_rows} rows) "
+          f"and {statements - insert_statements - copy_statements} other statements")
+    for path, rows, size in files:
+        print(f"Created: {path.name} ({rows} rows, {size} bytes)")
 
+    num_files = len(files)
     print("-" * 60)
     print(f"Split complete! Created {num_files} files")
-    print(f"\nTo run in Supabase:")
-    print(f"1. Open each file (fruits_veg_part_01_of_{num_files:02d}.sql, etc.)")
-    print(f"2. Copy and paste into Supabase SQL editor")
-    print(f"3. Run each file in order")
+    if copy_statements:
+        # The SQL editor cannot feed COPY ... FROM STDIN its inline data
+        print(f"\nThe files hold COPY data; run each with psql -f, or apply them "
+              f"concurrently (resumable):")
+    elif not compression:
+        print(f"\nTo run in Supabase:")
+        print(f"1. Open each file ({files[0][0].name}, etc.)")
+        print(f"2. Copy and paste into Supabase SQL editor")
+        print(f"3. Run each file in order")
+        print(f"\nOr apply them concurrently (resumable):")
+    else:
+        print(f"\nApply them concurrently (resumable):")
+    print(f"  python apply_sql_shards.py {output_dir} --dsn $DATABASE_URL --jobs 4")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python split_sql_file.py <input_sql_file> [output_dir] [rows_per_file]")
-        print("\nExample:")
-        print("  python split_sql_file.py fruits_veg_ingredients.sql /tmp/split_sql 500")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Split a large SQL file into smaller chunks for the Supabase SQL editor",
+        epilog="Example:\n  python split_sql_file.py fruits_veg_ingredients.sql /tmp/split_sql 500\n"
+               "  python split_sql_file.py fruits_veg_ingredients.sql /tmp/split_sql --max-bytes 900K\n"
+               "  python split_sql_file.py full_export.sql.zst /tmp/split_sql 5000 --compress gzip",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('input_file', help="Input SQL file")
+    parser.add_argument('output_dir', nargs='?', default='./split_sql',
+                        help="Directory for the chunk files (default: ./split_sql)")
+    parser.add_argument('rows_per_file', nargs='?', type=int,
+                        help="Data rows per output file (default: 500 unless --max-bytes is set)")
+    parser.add_argument('--max-bytes', type=parse_size,
+                        help="Target maximum size per output file, e.g. 900K or 2M")
+    parser.add_argument('--prefix', default='fruits_veg',
+                        help="Output file name prefix (default: fruits_veg)")
+    parser.add_argument('--compress', choices=sorted(SUFFIXES),
+                        help="Write chunks compressed (.sql.gz or .sql.zst)")
+    parser.add_argument('--compression-level', type=int,
+                        help="Compression level (default: 6 for gzip, 3 for zstd)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
 
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else './split_sql'
-    rows_per_file = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    rows_per_file = args.rows_per_file
+    if rows_per_file is None and args.max_bytes is None:
+        rows_per_file = 500
 
-    split_sql_file(input_file, output_dir, rows_per_file)
+    metrics = Metrics.from_args('split_sql', args)
+    split_sql_file(args.input_file, args.output_dir, rows_per_file,
+                   max_bytes=args.max_bytes, prefix=args.prefix,
+                   compression=args.compress, compression_level=args.compression_level,
+                   metrics=metrics)
+    report(metrics, args.metrics)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Persistent HTTP Response Cache for the USDA Fetcher
+Stores FoodData Central responses in a SQLite file so re-runs and offline
+iterations on portion extraction replay from disk instead of spending the
+hourly API quota.
+
+Entries are keyed by endpoint plus normalised query parameters (the API key
+is dropped, parameters are sorted and search text is case- and
+whitespace-folded). An entry younger than the TTL is served without a
+request; an older one is revalidated with If-None-Match / If-Modified-Since,
+and a 304 refreshes it for another TTL. When the stored bodies exceed the
+size limit, the least recently used entries are evicted.
+
+Usage:
+    python3 usda_response_cache.py .usda_response_cache.sqlite          # stats
+    python3 usda_response_cache.py .usda_response_cache.sqlite --purge-expired
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+DEFAULT_CACHE_PATH = '.usda_response_cache.sqlite'
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Parameters that identify the caller rather than the response
+IGNORED_PARAMS = {'api_key'}
+# Free-text parameters the API matches case-insensitively
+FOLDED_PARAMS = {'query'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+    def json(self):
+        return json.loads(self.body)
+
+    def revalidation_headers(self) -> dict:
+        """Conditional request headers for a stale entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def normalize_params(params) -> list:
+    """
+    Canonical (name, value) pairs for a dict or list of query parameters:
+    ignored names dropped, free text folded, repeated names' values sorted
+    """
+    items = params.items() if isinstance(params, dict) else params
+    pairs = []
+    for name, value in items:
+        if name in IGNORED_PARAMS or value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            item = str(item)
+            if name in FOLDED_PARAMS:
+                item = ' '.join(item.lower().split())
+            pairs.append((name, item))
+    return sorted(pairs)
+
+
+def cache_key(endpoint: str, params=None) -> str:
+    """Cache key for an endpoint path (e.g. /foods/search) and its parameters"""
+    canonical = json.dumps([endpoint.rstrip('/'), normalize_params(params or [])],
+                           separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed store of response bodies with TTL, validators and LRU
+    eviction by total size. Bodies are kept zlib-compressed.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, clock=time.time):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Cached response for key (fresh or stale), or None"""
+        row = self.conn.execute(
+            "SELECT body, etag, last_modified, fetched FROM responses WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        body, etag, last_modified, fetched = row
+        now = self.clock()
+        fresh = now - fetched < self.ttl
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale += 1
+        self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        return CachedResponse(zlib.decompress(body), etag, last_modified, fresh)
+
+    def put(self, key: str, url: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None):
+        """Store a 200 response body, then evict down to the size limit"""
+        data = zlib.compress(body)
+        now = self.clock()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, url, body, etag, last_modified, fetched, accessed, size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, data, etag, last_modified, now, now, len(data)))
+        self.stores += 1
+        self._evict()
+        self.conn.commit()
+
+    def refresh(self, key: str):
+        """Mark an entry fresh again after a 304 Not Modified"""
+        now = self.clock()
+        self.conn.execute("UPDATE responses SET fetched = ?, accessed = ? WHERE key = ?",
+                          (now, now, key))
+        self.conn.commit()
+        self.revalidated += 1
+
+    def _evict(self):
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so a full cache is not evicting on every store
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed")
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def purge_expired(self) -> int:
+        """Delete entries older than the TTL; returns how many were removed"""
+        cursor = self.conn.execute("DELETE FROM responses WHERE fetched < ?",
+                                   (self.clock() - self.ttl,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def total_bytes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def entries(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def summary(self) -> str:
+        return (f"Cache: {self.hits} hits, {self.revalidated} revalidated, "
+                f"{self.misses} misses, {self.stores} stored, {self.evictions} evicted "
+                f"({self.entries()} entries, {self.total_bytes() / (1024 * 1024):.1f} MB)")
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Inspect or prune the USDA fetcher's response cache",
+        epilog="Example:\n  python3 usda_response_cache.py .usda_response_cache.sqlite --purge-expired",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('cache_file', nargs='?', default=DEFAULT_CACHE_PATH,
+                        help=f"Cache file (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--ttl-hours', type=float, default=DEFAULT_TTL / 3600,
+                        help=f"Entry lifetime for --purge-expired (default: {DEFAULT_TTL // 3600})")
+    parser.add_argument('--purge-expired', action='store_true',
+                        help="Delete entries older than the TTL")
+    args = parser.parse_args()
+
+    if not Path(args.cache_file).exists():
+        print(f"Error: Cache file not found: {args.cache_file}")
+        sys.exit(1)
+
+    cache = ResponseCache(args.cache_file, ttl=args.ttl_hours * 3600)
+    try:
+        if args.purge_expired:
+            print(f"Purged {cache.purge_expired()} expired entries")
+        oldest, newest = cache.conn.execute(
+            "SELECT MIN(fetched), MAX(fetched) FROM responses").fetchone()
+        print(f"Entries: {cache.entries()}")
+        print(f"Size: {cache.total_bytes() / (1024 * 1024):.1f} MB")
+        if oldest is not None:
+            print(f"Oldest: {time.strftime('%Y-%m-%d %H:%M', time.localtime(oldest))}")
+            print(f"Newest: {time.strftime('%Y-%m-%d %H:%M', time.localtime(newest))}")
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Local Stub of the USDA FoodData Central API
+Serves deterministic mock search results so fetch-usda-food-categories.py can
+be exercised without an API key, network access or spending the real quota.
+
+The stub enforces an hourly request limit the way api.data.gov does: every
+response carries X-RateLimit-Limit / X-RateLimit-Remaining, and requests over
+the limit get HTTP 429 with Retry-After. --window shrinks the "hour" so rate
+limiting can be tested in seconds. On exit it reports how many requests were
+served, how many were rejected, and the busiest window seen.
+
+Search results leave out foodPortions, as the real API's do; the details
+from /food/{fdcId} and the multi-ID /foods?fdcIds=... include them and
+describe the same foods the searches returned.
+
+Responses carry an ETag and Last-Modified; a matching If-None-Match or
+If-Modified-Since gets 304 Not Modified, as the response cache expects.
+
+Usage:
+    python3 usda_stub_server.py --port 8089 --requests-per-hour 1000
+    python3 fetch-usda-food-categories.py --async --base-url http://127.0.0.1:8089/fdc/v1
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmark_pipeline import generate_usda_foods
+
+API_PREFIX = '/fdc/v1'
+# Most ids the /foods endpoint accepts per request
+MAX_FDC_IDS = 20
+# The mock data never changes, so every response was "last modified" at start-up
+LAST_MODIFIED = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime())
+
+
+class RateWindow:
+    """Sliding-window request counter shared by all handler threads"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+        self.served = 0
+        self.rejected = 0
+        self.busiest = 0
+
+    def admit(self) -> tuple:
+        """Count a request; returns (allowed, remaining, seconds until a slot frees)"""
+        now = time.monotonic()
+        with self.lock:
+            while self.times and self.times[0] <= now - self.window:
+                self.times.popleft()
+            if len(self.times) >= self.limit:
+                self.rejected += 1
+                return False, 0, self.times[0] + self.window - now
+            self.times.append(now)
+            self.served += 1
+            self.busiest = max(self.busiest, len(self.times))
+            return True, self.limit - len(self.times), 0.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handles /fdc/v1/foods/search, /fdc/v1/foods and /fdc/v1/food/{fdcId}"""
+
+    server_version = 'USDAStub/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body, headers: dict = None):
+        data = json.dumps(body).encode('utf-8')
+        if status == 200:
+            etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+            headers = dict(headers or {}, ETag=etag)
+            headers['Last-Modified'] = LAST_MODIFIED
+            if (self.headers.get('If-None-Match') == etag
+                    or self.headers.get('If-Modified-Since') == LAST_MODIFIED):
+                self.server.not_modified += 1
+                self.send_response(304)
+                for name, value in headers.items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        server = self.server
+
+        if not params.get('api_key'):
+            self._send_json(403, {'error': {'code': 'API_KEY_MISSING'}})
+            return
+
+        allowed, remaining, retry_after = server.rate.admit()
+        headers = {'X-RateLimit-Limit': server.rate.limit, 'X-RateLimit-Remaining': remaining}
+        if not allowed:
+            headers['Retry-After'] = max(1, round(retry_after))
+            self._send_json(429, {'error': {'code': 'OVER_RATE_LIMIT'}}, headers)
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._send_json(503, {'error': 'Service Unavailable'}, headers)
+            return
+
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        if path == '/foods/search':
+            self._send_json(200, self._search(params), headers)
+        elif path == '/foods':
+            fdc_ids = [value for values in params.get('fdcIds', [])
+                       for value in values.split(',') if value.strip()]
+            if not fdc_ids or len(fdc_ids) > MAX_FDC_IDS or not all(
+                    value.strip().isdigit() for value in fdc_ids):
+                self._send_json(400, {'error': f'fdcIds must list 1-{MAX_FDC_IDS} ids'}, headers)
+                return
+            server.detail_foods += len(fdc_ids)
+            self._send_json(200, [self._food(int(value)) for value in fdc_ids], headers)
+        elif path.startswith('/food/') and path[len('/food/'):].isdigit():
+            food = self._food(int(path[len('/food/'):]))
+            self._send_json(200, food, headers)
+        else:
+            self._send_json(404, {'error': 'Not Found'}, headers)
+
+    def _search(self, params: dict) -> dict:
+        query = params.get('query', [''])[0]
+        page_size = min(int(params.get('pageSize', ['50'])[0]), 200)
+        page_number = max(int(params.get('pageNumber', ['1'])[0]), 1)
+
+        foods = self._query_foods(query)
+        data_types = params.get('dataType')
+        if data_types:
+            foods = [food for food in foods if food['dataType'] in data_types]
+        total = len(foods)
+        page = foods[(page_number - 1) * page_size:page_number * page_size]
+
+        return {
+            'totalHits': total,
+            'currentPage': page_number,
+            'totalPages': max(1, -(-total // page_size)),
+            'foodSearchCriteria': {'query': query, 'pageSize': page_size,
+                                   'pageNumber': page_number},
+            'foods': [{name: value for name, value in food.items() if name != 'foodPortions'}
+                      for food in page],
+        }
+
+    def _query_foods(self, query: str) -> list:
+        # Each query gets its own stable block of fdcIds and foods
+        seed = zlib.crc32(query.lower().encode('utf-8'))
+        first_id = 1_000_000 + (seed % 10_000) * 1000
+        with self.server.lock:
+            foods = self.server.query_foods.get(first_id)
+            if foods is None:
+                foods = generate_usda_foods(self.server.foods_per_query, seed, first_id=first_id)
+                self.server.query_foods[first_id] = foods
+        return foods
+
+    def _food(self, fdc_id: int) -> dict:
+        first_id = fdc_id - (fdc_id - 1_000_000) % 1000
+        foods = self.server.query_foods.get(first_id)
+        if foods is not None and fdc_id - first_id < len(foods):
+            return foods[fdc_id - first_id]
+        return generate_usda_foods(1, fdc_id, first_id=fdc_id)[0]
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8089, requests_per_hour: int = 1000,
+                window: float = 3600.0, foods_per_query: int = 100, latency: float = 0.0,
+                fail_rate: float = 0.0, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Build a stub server (call serve_forever() on it, or run it in a thread)
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port; see server.server_address)
+        requests_per_hour: Requests allowed per window
+        window: Length of the rate-limit window in seconds (default: one hour)
+        foods_per_query: Search hits for every query (fewer when filtered by dataType)
+        latency: Seconds each response is delayed
+        fail_rate: Fraction of requests answered with HTTP 503
+        verbose: Log every request
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.rate = RateWindow(requests_per_hour, window)
+    server.foods_per_query = foods_per_query
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.verbose = verbose
+    server.not_modified = 0
+    server.detail_foods = 0
+    server.query_foods = {}
+    server.lock = threading.Lock()
+    return server
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="Serve a local stub of the USDA FoodData Central API",
+        epilog="Example:\n  python3 usda_stub_server.py --requests-per-hour 60 --window 6\n"
+               "  python3 fetch-usda-food-categories.py KEY --async --requests-per-hour 36000 "
+               "--base-url http://127.0.0.1:8089/fdc/v1",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--host', default='127.0.0.1', help="Bind address (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8089, help="Port (default: 8089)")
+    parser.add_argument('--requests-per-hour', type=int, default=1000,
+                        help="Requests allowed per window (default: 1000)")
+    parser.add_argument('--window', type=float, default=3600.0,
+                        help="Rate-limit window in seconds (default: 3600)")
+    parser.add_argument('--foods-per-query', type=int, default=100,
+                        help="Search hits per query (default: 100)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds to delay each response (default: 0)")
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with 503 (default: 0)")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.requests_per_hour, args.window,
+                         args.foods_per_query, args.latency, args.fail_rate, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"USDA stub listening on http://{host}:{port}{API_PREFIX}")
+    print(f"Rate limit: {args.requests_per_hour} requests per {args.window:g}s")
+    print("-" * 60)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        rate = server.rate
+        print("-" * 60)
+        print(f"Requests served: {rate.served}")
+        print(f"Requests rate limited: {rate.rejected}")
+        print(f"Not modified (304): {server.not_modified}")
+        print(f"Foods detailed via /foods: {server.detail_foods}")
+        print(f"Busiest window: {rate.busiest}/{rate.limit}")
+
+
+if __name__ == '__main__':
+    main()